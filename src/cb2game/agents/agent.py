@@ -33,6 +33,39 @@ class Agent(ABC):
         """
         ...
 
+    def choose_actions(
+        self,
+        game_states: List[GameState],
+        action_masks: Optional[List[Optional[List[bool]]]] = None,
+    ) -> List[Action]:
+        """Chooses the next action in each of several games at once.
+
+        Used to step many games in lockstep (e.g. eval with batch_size > 1).
+        Each game state is from a different game. Returns one action per game
+        state, in order. action_masks, if provided, has one mask per game state.
+
+        Override this to run inference on all of the games in one batch. By
+        default, calls choose_action() once per game state. Agents which keep
+        state between calls must keep it per game (e.g. keyed by instruction
+        UUID) to be batched. See supports_batching().
+        """
+        if action_masks is None:
+            action_masks = [None] * len(game_states)
+        return [
+            self.choose_action(game_state, action_mask)
+            for game_state, action_mask in zip(game_states, action_masks)
+        ]
+
+    def supports_batching(self) -> bool:
+        """Whether choose_actions() may be called with states from several games.
+
+        True if the agent overrides choose_actions(). Agents which use the
+        default choose_actions() and keep no state between calls (or keep it
+        per game) should override this to return True. Otherwise, callers play
+        one game at a time, as interleaving games would mix their state.
+        """
+        return type(self).choose_actions is not Agent.choose_actions
+
     @abstractmethod
     def role(self) -> Role:
         """Returns the role of the agent."""
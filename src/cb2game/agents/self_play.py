@@ -0,0 +1,398 @@
+""" Headless, high-throughput self-play between a leader and a follower agent.
+
+local_agent_pair.PlayGame() plays one game at a time through an EndpointPair.
+Each GameEndpoint.step() goes through a LocalSocket, which steps the game's
+state machine when it sends an action and again each time it polls for a reply:
+about nine state machine steps per action.
+
+SelfPlayRunner plays many games at once, in one LocalGameCoordinator. After an
+agent acts, the game's state machine is stepped exactly once, and its messages
+are handed straight to both players' GameEndpoints. The endpoints still track
+the game state that agents see, so observations are the same as through an
+EndpointPair. Each round, every game waiting on the leader gets its action from
+one Agent.choose_actions() call, and likewise for the follower.
+
+Games are recorded to the database (record="db"), to event archives
+(record="archive", see server/event_archive.py), or not at all (record="none").
+RunSelfPlay() splits games between worker processes, and reports games/s and
+steps/s (agent actions per second).
+
+Usage:
+    python3 -m cb2game.agents.self_play --num_games=1000 --num_workers=4 --record=archive --archive_prefix=self_play_
+"""
+import logging
+import multiprocessing as mp
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+import fire
+import numpy as np
+
+import cb2game.server.db_tools.db_utils as db_utils
+from cb2game.agents.agent import Agent
+from cb2game.agents.config import (
+    AgentConfigData,
+    LoadAgentFromConfig,
+    ReadAgentConfigOrDie,
+)
+from cb2game.pyclient.endpoint_pair import EndpointPair
+from cb2game.pyclient.game_endpoint import GameState, Role
+from cb2game.pyclient.local_game_coordinator import LocalGameCoordinator
+from cb2game.server.config.config import Config, ReadConfigOrDie, SetGlobalConfig
+from cb2game.server.db_writer import GetDatabaseWriter
+from cb2game.server.event_archive import EventArchiveWriter
+from cb2game.server.schemas import base
+from cb2game.server.schemas.defaults import ListDefaultTables
+from cb2game.server.schemas.event import Event
+
+logger = logging.getLogger(__name__)
+
+# How games are recorded. See the top of this file.
+RECORD_NONE = "none"
+RECORD_DB = "db"
+RECORD_ARCHIVE = "archive"
+
+DEFAULT_LEADER_CONFIG = AgentConfigData("cb2game.agents.simple_leader.SimpleLeader", {})
+DEFAULT_FOLLOWER_CONFIG = AgentConfigData(
+    "cb2game.agents.simple_follower.SimpleFollower",
+    {"default_action": "INSTRUCTION_DONE"},
+)
+
+
+@dataclass
+class SelfPlayStats:
+    games: int = 0
+    # Agent actions.
+    steps: int = 0
+    # State machine steps, including steps where no agent acted.
+    ticks: int = 0
+    duration_s: float = 0.0
+    scores: List[int] = field(default_factory=list)
+
+    def games_per_s(self) -> float:
+        return self.games / self.duration_s if self.duration_s > 0 else 0.0
+
+    def steps_per_s(self) -> float:
+        return self.steps / self.duration_s if self.duration_s > 0 else 0.0
+
+    def merge(self, other: "SelfPlayStats"):
+        """Adds the counts from another runner. Durations don't add up, as runners run in parallel."""
+        self.games += other.games
+        self.steps += other.steps
+        self.ticks += other.ticks
+        self.scores.extend(other.scores)
+
+
+# pylint: disable=protected-access
+class _SelfPlayGame(object):
+    """One game, played headlessly by a SelfPlayRunner."""
+
+    def __init__(self, coordinator: LocalGameCoordinator, log_to_db: bool):
+        self.game_name = coordinator.CreateGame(log_to_db=log_to_db)
+        self._driver = coordinator._state_machine_driver(self.game_name)
+        self.state_machine = self._driver.state_machine()
+        endpoint_pair = EndpointPair(coordinator, self.game_name)
+        endpoint_pair.initialize()
+        self._endpoints = {
+            Role.LEADER: endpoint_pair.leader(),
+            Role.FOLLOWER: endpoint_pair.follower(),
+        }
+        for endpoint in self._endpoints.values():
+            # Initialization leaves any messages after the first tick in the
+            # socket. From here on, messages are delivered by tick().
+            received = endpoint.socket.received_messages
+            while len(received) > 0:
+                endpoint._handle_message(received.popleft())
+        self.steps = 0
+        self.ticks = 0
+
+    def over(self) -> bool:
+        return self._endpoints[Role.LEADER].over()
+
+    def score(self) -> int:
+        return self._endpoints[Role.LEADER].score()
+
+    def waiting_on(self) -> Optional[Role]:
+        """The role whose agent acts next, or None if neither can act yet."""
+        turn = self._endpoints[Role.LEADER].turn_state.turn
+        if turn in self._endpoints and self._endpoints[turn]._can_act():
+            return turn
+        return None
+
+    def observe(self, role: Role) -> GameState:
+        endpoint = self._endpoints[role]
+        state = endpoint._state()
+        # Like GameEndpoint.step(), live feedback is only observed once.
+        endpoint.live_feedback = []
+        return state
+
+    def act(self, role: Role, action):
+        endpoint = self._endpoints[role]
+        message, _ = action.message_to_server(endpoint.player_actor)
+        messages = [message] if message is not None else []
+        # Replies to pings, if any.
+        messages.extend(endpoint.queued_messages)
+        endpoint.queued_messages = []
+        if len(messages) > 0:
+            self._driver.drain_messages(endpoint.player_id, messages)
+        self.steps += 1
+        self.tick()
+
+    def tick(self):
+        """Steps the state machine once, and delivers its messages to both players."""
+        self._driver.step()
+        self.ticks += 1
+        for endpoint in self._endpoints.values():
+            messages = []
+            self._driver.fill_messages(endpoint.player_id, messages)
+            for message in messages:
+                endpoint._handle_message(message)
+
+
+# pylint: enable=protected-access
+
+
+class _GameArchiver(object):
+    """Moves finished games' events from an in-memory database into an event archive."""
+
+    def __init__(self, path: str):
+        self._path = path
+        self._writer = EventArchiveWriter()
+
+    def add(self, game_record):
+        events = (
+            Event.select()
+            .where(Event.game == game_record.id)
+            .order_by(Event.server_time)
+        )
+        for event in events:
+            self._writer.append(event)
+        # Events are most of a game's footprint. The game row is kept, so that
+        # sqlite doesn't reuse its ID for a later game in the same archive.
+        Event.delete().where(Event.game == game_record.id).execute()
+
+    def write(self):
+        self._writer.write(self._path)
+        logger.info(f"Wrote {len(self._writer)} events to {self._path}")
+
+
+class SelfPlayRunner(object):
+    """Plays many games at once between two agents, without rendering or sockets.
+
+    See the top of this file. Games are recorded according to record. In
+    RECORD_ARCHIVE mode, this process must use an in-memory database (see
+    SetupRecording()), and events are written to archive_path by play().
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        leader_agent: Agent,
+        follower_agent: Agent,
+        parallel_games: int = 16,
+        record: str = RECORD_NONE,
+        archive_path: str = "",
+    ):
+        if record not in [RECORD_NONE, RECORD_DB, RECORD_ARCHIVE]:
+            raise ValueError(f"Unknown record mode: {record}")
+        if record == RECORD_ARCHIVE and not archive_path:
+            raise ValueError("archive_path is required to record to an archive.")
+        for agent in [leader_agent, follower_agent]:
+            if parallel_games > 1 and not agent.supports_batching():
+                raise ValueError(
+                    f"Agent {type(agent).__name__} doesn't support batching. Use parallel_games=1."
+                )
+        self._coordinator = LocalGameCoordinator(
+            config, render_leader=False, render_follower=False
+        )
+        self._agents = {Role.LEADER: leader_agent, Role.FOLLOWER: follower_agent}
+        self._parallel_games = parallel_games
+        self._record = record
+        self._archiver = (
+            _GameArchiver(archive_path) if record == RECORD_ARCHIVE else None
+        )
+
+    def play(self, num_games: int) -> SelfPlayStats:
+        """Plays num_games games, parallel_games at a time."""
+        stats = SelfPlayStats()
+        start = time.perf_counter()
+        games = []
+        started = 0
+        while len(games) < min(self._parallel_games, num_games):
+            games.append(self._new_game())
+            started += 1
+        while len(games) > 0:
+            waiting = {Role.LEADER: [], Role.FOLLOWER: []}
+            for game in games:
+                role = game.waiting_on()
+                if role is None:
+                    game.tick()
+                else:
+                    waiting[role].append(game)
+            for role, role_games in waiting.items():
+                if len(role_games) == 0:
+                    continue
+                actions = self._agents[role].choose_actions(
+                    [game.observe(role) for game in role_games]
+                )
+                for game, action in zip(role_games, actions):
+                    game.act(role, action)
+
+            finished = [game for game in games if game.over()]
+            if len(finished) == 0:
+                continue
+            # Runs the end-of-game bookkeeping (e.g. recording the final score).
+            self._coordinator.Cleanup()
+            for game in finished:
+                games.remove(game)
+                stats.games += 1
+                stats.steps += game.steps
+                stats.ticks += game.ticks
+                stats.scores.append(game.score())
+                if self._archiver is not None:
+                    self._archiver.add(game.state_machine.game_record())
+                if started < num_games:
+                    games.append(self._new_game())
+                    started += 1
+        self._coordinator.ForceCleanAll()
+        if self._archiver is not None:
+            self._archiver.write()
+        if self._record == RECORD_DB:
+            GetDatabaseWriter().flush()
+        stats.duration_s = time.perf_counter() - start
+        return stats
+
+    def _new_game(self):
+        return _SelfPlayGame(self._coordinator, self._record != RECORD_NONE)
+
+
+def SetupRecording(config: Config, record: str):
+    """Connects this process to the database games are recorded to, if any.
+
+    Archived games are recorded to an in-memory database first.
+    """
+    if record == RECORD_DB:
+        db_utils.ConnectToDatabase(config)
+    elif record == RECORD_ARCHIVE:
+        base.SetDatabaseForTesting()
+        base.ConnectDatabase()
+        base.CreateTablesIfNotExists(ListDefaultTables())
+
+
+def _PlayInWorker(
+    config: Config,
+    leader_config: AgentConfigData,
+    follower_config: AgentConfigData,
+    num_games: int,
+    parallel_games: int,
+    record: str,
+    archive_path: str,
+) -> SelfPlayStats:
+    SetGlobalConfig(config)
+    SetupRecording(config, record)
+    runner = SelfPlayRunner(
+        config,
+        LoadAgentFromConfig(leader_config),
+        LoadAgentFromConfig(follower_config),
+        parallel_games,
+        record,
+        archive_path,
+    )
+    return runner.play(num_games)
+
+
+def RunSelfPlay(
+    config: Config,
+    leader_config: AgentConfigData = DEFAULT_LEADER_CONFIG,
+    follower_config: AgentConfigData = DEFAULT_FOLLOWER_CONFIG,
+    num_games: int = 100,
+    num_workers: int = 0,
+    parallel_games: int = 16,
+    record: str = RECORD_NONE,
+    archive_prefix: str = "self_play_",
+) -> SelfPlayStats:
+    """Plays num_games games of self-play, and logs throughput.
+
+    Args:
+        config: Game config.
+        leader_config: Agent to play as leader. Loaded in each worker.
+        follower_config: Agent to play as follower. Loaded in each worker.
+        num_games: Total number of games to play.
+        num_workers: Number of processes to split games between. If 0, games
+            are played in this process.
+        parallel_games: Number of games each process plays at once. Must be
+            1 unless both agents support batching (see
+            Agent.supports_batching()).
+        record: RECORD_NONE, RECORD_DB or RECORD_ARCHIVE.
+        archive_prefix: In RECORD_ARCHIVE mode, each process writes its games
+            to {archive_prefix}{worker index}.npz.
+    """
+    start = time.perf_counter()
+    num_shards = max(num_workers, 1)
+    shards = [
+        (
+            config,
+            leader_config,
+            follower_config,
+            len(shard),
+            parallel_games,
+            record,
+            f"{archive_prefix}{i}.npz" if record == RECORD_ARCHIVE else "",
+        )
+        for i, shard in enumerate(np.array_split(np.arange(num_games), num_shards))
+        if len(shard) > 0
+    ]
+    if num_workers == 0:
+        shard_stats = [_PlayInWorker(*shard) for shard in shards]
+    else:
+        # Spawn, so workers don't inherit database connections.
+        with mp.get_context("spawn").Pool(num_workers) as pool:
+            shard_stats = pool.starmap(_PlayInWorker, shards)
+    stats = SelfPlayStats()
+    for shard_stat in shard_stats:
+        stats.merge(shard_stat)
+    stats.duration_s = time.perf_counter() - start
+    logger.info(
+        f"Played {stats.games} games ({stats.steps} steps, {stats.ticks} ticks) in {stats.duration_s:.2f}s. "
+        f"{stats.games_per_s():.2f} games/s, {stats.steps_per_s():.1f} steps/s. "
+        f"Mean score: {np.mean(stats.scores) if stats.scores else 0:.2f}"
+    )
+    return stats
+
+
+def main(
+    config_filepath: str = "",
+    leader_config: str = "",
+    follower_config: str = "",
+    num_games: int = 100,
+    num_workers: int = 0,
+    parallel_games: int = 16,
+    record: str = RECORD_NONE,
+    archive_prefix: str = "self_play_",
+):
+    logging.basicConfig(level=logging.INFO)
+    if config_filepath == "":
+        config = Config()
+        logger.warning(
+            f"No config was provided. Using default database located at: {config.database_path()}"
+        )
+    else:
+        config = ReadConfigOrDie(config_filepath)
+    SetGlobalConfig(config)
+    RunSelfPlay(
+        config,
+        ReadAgentConfigOrDie(leader_config) if leader_config else DEFAULT_LEADER_CONFIG,
+        ReadAgentConfigOrDie(follower_config)
+        if follower_config
+        else DEFAULT_FOLLOWER_CONFIG,
+        num_games,
+        num_workers,
+        parallel_games,
+        record,
+        archive_prefix,
+    )
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
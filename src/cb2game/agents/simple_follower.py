@@ -15,6 +15,10 @@ from cb2game.pyclient.game_endpoint import Action, GameState
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of instructions with pending actions. Instructions that were
+# never finished (e.g. the game ended first) are forgotten, oldest first.
+MAX_PENDING_INSTRUCTIONS = 1024
+
 
 @dataclass
 class SimpleFollowerConfig(DataClassJSONMixin):
@@ -30,13 +34,21 @@ class SimpleFollowerConfig(DataClassJSONMixin):
 class SimpleFollower(Agent):
     def __init__(self, config: SimpleFollowerConfig):
         self.instructions_processed = set()
-        self.actions = []
+        # Pending actions, by instruction UUID. Keeping them per instruction
+        # lets choose_actions() interleave games (each game's active
+        # instruction has a different UUID).
+        self.actions = {}
         self.config = config
 
     # OVERRIDES role
     def role(self) -> Role:
         return Role.FOLLOWER
 
+    # OVERRIDES supports_batching
+    def supports_batching(self) -> bool:
+        # Pending actions are kept per instruction.
+        return True
+
     # OVERRIDES choose_action
     def choose_action(self, game_state: GameState, action_mask=None) -> Action:
         """Chooses an action to take, given a game state.
@@ -50,20 +62,29 @@ class SimpleFollower(Agent):
         This corresponds with simple follower actions, which the follower will then immediately take. "Random" results in a random action, from [left, forward, right, back].
         """
         (map, cards, turn_state, instructions, actors, feedback) = game_state
+        # Drop pending actions for instructions which were cancelled (or
+        # completed by someone else).
+        for instruction in instructions:
+            if instruction.completed or instruction.cancelled:
+                self.actions.pop(instruction.uuid, None)
+        active_instruction = _get_active_instruction(instructions)
+        if active_instruction is None:
+            logger.info(
+                f"No active instruction available. Invalid state. Taking NoopAction."
+            )
+            return Action.NoopAction()
+        if active_instruction.uuid not in self.actions:
+            while len(self.actions) >= MAX_PENDING_INSTRUCTIONS:
+                del self.actions[next(iter(self.actions))]
+        actions = self.actions.setdefault(active_instruction.uuid, [])
         # If no pending actions, parse them from the active instruction.
-        if len(self.actions) == 0:
-            active_instruction = _get_active_instruction(instructions)
-            if active_instruction is None:
-                logger.info(
-                    f"No active instruction available. Invalid state. Taking NoopAction."
-                )
-                return Action.NoopAction()
-            self.actions.extend(_actions_from_instruction(active_instruction.text))
-            self.actions.append(Action.InstructionDone(active_instruction.uuid))
+        if len(actions) == 0:
+            actions.extend(_actions_from_instruction(active_instruction.text))
+            actions.append(Action.InstructionDone(active_instruction.uuid))
             self.instructions_processed.add(active_instruction.uuid)
 
         # Check actions again, in case none were parsed from the instruction.
-        if len(self.actions) == 0:
+        if len(actions) == 0:
             logger.info(
                 f"Ran out of commands to follow. Choosing {self.config.default_action}."
             )
@@ -73,8 +94,9 @@ class SimpleFollower(Agent):
             return Action(default_action_code)
 
         # Return the next action.
-        action = self.actions[0]
-        self.actions.pop(0)
+        action = actions.pop(0)
+        if len(actions) == 0:
+            del self.actions[active_instruction.uuid]
         return action
 
 
@@ -5,12 +5,11 @@ automated self-play with a simple_follower and simple_leader, but the data would
 not be very diverse.
 """
 import logging
-from collections import deque
 from dataclasses import dataclass
 
 from cb2game.agents.agent import Agent, Role
 from cb2game.pyclient.game_endpoint import Action, GameState
-from cb2game.server.routing_utils import get_instruction_to_location
+from cb2game.server.routing_utils import FindPath, get_instruction_to_location
 
 logger = logging.getLogger(__name__)
 
@@ -30,6 +29,11 @@ class SimpleLeader(Agent):
     def role(self) -> Role:
         return Role.LEADER
 
+    # OVERRIDES supports_batching
+    def supports_batching(self) -> bool:
+        # choose_action() is stateless.
+        return True
+
     # OVERRIDES choose_action
     def choose_action(self, game_state: GameState, action_mask=None) -> Action:
         """Chooses an action to take, given a game state.
@@ -162,34 +166,7 @@ def _get_next_card(cards, follower):
 
 
 def _find_path_to_card(card, follower, map, cards):
-    start_location = follower.location()
-    end_location = card.prop_info.location
-    location_queue = deque()
-    location_queue.append((start_location, [start_location]))
-    card_locations = set([card.prop_info.location for card in cards])
-    if start_location in card_locations:
-        card_locations.remove(start_location)
-    if end_location in card_locations:
-        card_locations.remove(end_location)
-    visited_locations = set()
-    while len(location_queue) > 0:
-        current_location, current_path = location_queue.popleft()
-        if current_location in visited_locations:
-            continue
-        if current_location in card_locations:
-            continue
-        visited_locations.add(current_location)
-        if current_location == end_location:
-            return current_path
-        tile = map.tile_at(current_location)
-        for neighbor in tile.cell.coord.neighbors():
-            if tile.cell.boundary.get_edge_between(tile.cell.coord, neighbor):
-                continue
-            neighbor_tile = map.tile_at(neighbor)
-            if neighbor_tile.cell.boundary.get_edge_between(neighbor, tile.cell.coord):
-                continue
-            location_queue.append((neighbor, current_path + [neighbor]))
-    return None
+    return FindPath(map, cards, follower.location(), card.prop_info.location)
 
 
 def _has_instruction_available(instructions):
@@ -0,0 +1,90 @@
+"""Unit tests for the Agent interface and SimpleFollower's per-instruction queues."""
+import unittest
+
+from cb2game.agents.agent import Agent
+from cb2game.agents.simple_follower import SimpleFollower, SimpleFollowerConfig
+from cb2game.pyclient.game_endpoint import Action, GameState, Role
+from cb2game.server.messages.objective import ObjectiveMessage
+
+
+def _GameState(instructions):
+    return GameState(None, [], None, instructions, [None, None], [])
+
+
+def _Instruction(text, uuid, **kwargs):
+    return ObjectiveMessage(Role.LEADER, text, uuid, **kwargs)
+
+
+class _CountingAgent(Agent):
+    """Returns one Forwards() per call, and counts calls."""
+
+    def __init__(self):
+        self.calls = []
+
+    def choose_action(self, game_state, action_mask=None):
+        self.calls.append((game_state, action_mask))
+        return Action.Forwards()
+
+    def role(self):
+        return Role.FOLLOWER
+
+
+class _BatchedAgent(_CountingAgent):
+    def choose_actions(self, game_states, action_masks=None):
+        return [Action.Left() for _ in game_states]
+
+
+class AgentTest(unittest.TestCase):
+    def test_default_choose_actions_calls_choose_action(self):
+        agent = _CountingAgent()
+        states = [_GameState([]), _GameState([])]
+        actions = agent.choose_actions(states, [None, [True]])
+        self.assertEqual(actions, [Action.Forwards(), Action.Forwards()])
+        self.assertEqual(agent.calls, [(states[0], None), (states[1], [True])])
+        self.assertEqual(len(agent.choose_actions(states)), 2)
+
+    def test_supports_batching(self):
+        self.assertFalse(_CountingAgent().supports_batching())
+        self.assertTrue(_BatchedAgent().supports_batching())
+        self.assertTrue(SimpleFollower(SimpleFollowerConfig()).supports_batching())
+
+
+class SimpleFollowerTest(unittest.TestCase):
+    def setUp(self):
+        self.follower = SimpleFollower(SimpleFollowerConfig())
+
+    def test_interleaved_instructions(self):
+        a = _GameState([_Instruction("forward, forward", "a")])
+        b = _GameState([_Instruction("left", "b")])
+        actions = [self.follower.choose_actions([a, b]) for _ in range(3)]
+        self.assertEqual(
+            actions,
+            [
+                [Action.Forwards(), Action.Left()],
+                [Action.Forwards(), Action.InstructionDone("b")],
+                # "b" isn't marked done in its game state, so it's reparsed.
+                [Action.InstructionDone("a"), Action.Left()],
+            ],
+        )
+        # Finished queues are removed.
+        self.assertEqual(list(self.follower.actions), ["b"])
+
+    def test_cancelled_instruction_dropped(self):
+        self.follower.choose_action(
+            _GameState([_Instruction("forward, forward, forward", "a")])
+        )
+        self.assertIn("a", self.follower.actions)
+        action = self.follower.choose_action(
+            _GameState(
+                [
+                    _Instruction("forward, forward, forward", "a", cancelled=True),
+                    _Instruction("right", "b"),
+                ]
+            )
+        )
+        self.assertEqual(action, Action.Right())
+        self.assertNotIn("a", self.follower.actions)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,90 @@
+"""Tests for the headless self-play runner."""
+import os
+import pathlib
+import random
+import tempfile
+import unittest
+
+import numpy as np
+
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = ""  # Hide pygame welcome message
+
+from cb2game.agents.config import LoadAgentFromConfig
+from cb2game.agents.local_agent_pair import PlayGame
+from cb2game.agents.self_play import (
+    DEFAULT_FOLLOWER_CONFIG,
+    DEFAULT_LEADER_CONFIG,
+    RECORD_ARCHIVE,
+    SelfPlayRunner,
+    SetupRecording,
+)
+from cb2game.pyclient.local_game_coordinator import LocalGameCoordinator
+from cb2game.server.config.config import Config, SetGlobalConfig
+from cb2game.server.event_archive import EventArchive
+from cb2game.server.schemas.event import Event, EventType
+
+NUMBER_OF_GAMES = 3
+
+
+class SelfPlayRunnerTest(unittest.TestCase):
+    def setUp(self):
+        self.config = Config(comment="Self-play runner test.")
+        SetGlobalConfig(self.config)
+
+    def agents(self):
+        return (
+            LoadAgentFromConfig(DEFAULT_LEADER_CONFIG),
+            LoadAgentFromConfig(DEFAULT_FOLLOWER_CONFIG),
+        )
+
+    def test_matches_endpoint_pair(self):
+        random.seed(0)
+        np.random.seed(0)
+        coordinator = LocalGameCoordinator(self.config)
+        leader, follower = self.agents()
+        expected_scores = [
+            PlayGame(coordinator, leader, follower, log_to_db=False)[0]
+            for _ in range(NUMBER_OF_GAMES)
+        ]
+
+        random.seed(0)
+        np.random.seed(0)
+        runner = SelfPlayRunner(self.config, *self.agents(), parallel_games=1)
+        stats = runner.play(NUMBER_OF_GAMES)
+        self.assertEqual(stats.scores, expected_scores)
+        self.assertEqual(stats.games, NUMBER_OF_GAMES)
+        self.assertGreaterEqual(stats.ticks, stats.steps)
+
+    def test_unbatched_agent_rejected(self):
+        leader, follower = self.agents()
+        follower.supports_batching = lambda: False
+        with self.assertRaises(ValueError):
+            SelfPlayRunner(self.config, leader, follower, parallel_games=2)
+        SelfPlayRunner(self.config, leader, follower, parallel_games=1)
+
+    def test_archive(self):
+        with tempfile.TemporaryDirectory() as directory:
+            archive_path = pathlib.Path(directory, "self_play.npz")
+            SetupRecording(self.config, RECORD_ARCHIVE)
+            runner = SelfPlayRunner(
+                self.config,
+                *self.agents(),
+                parallel_games=2,
+                record=RECORD_ARCHIVE,
+                archive_path=str(archive_path),
+            )
+            stats = runner.play(NUMBER_OF_GAMES)
+            archive = EventArchive(archive_path)
+            events = list(archive)
+        self.assertEqual(stats.games, NUMBER_OF_GAMES)
+        self.assertEqual(len(archive.game_ids()), NUMBER_OF_GAMES)
+        self.assertEqual(
+            sum(event.type == EventType.INITIAL_STATE for event in events),
+            NUMBER_OF_GAMES,
+        )
+        # Archived events are removed from the in-memory database.
+        self.assertEqual(Event.select().count(), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -18,7 +18,7 @@ import cb2game.server.state as state
 from cb2game.pyclient.endpoint_pair import EndpointPair
 from cb2game.pyclient.local_game_coordinator import LocalGameCoordinator
 from cb2game.pyclient.remote_client import RemoteClient
-from cb2game.server.map_provider import MAP_HEIGHT, MAP_WIDTH
+from cb2game.server.config.map_config import MapConfig
 from cb2game.server.messages.rooms import Role
 
 
@@ -85,6 +85,111 @@ class AuxiliaryInfo:
 
 DEFAULT_MAX_INSTRUCTION_LENGTH = 1000  # Chars.
 
+# Size of observation spaces. Observations are the size of the game's map.
+MAP_HEIGHT = MapConfig().map_height
+MAP_WIDTH = MapConfig().map_width
+INT16_MAX = int(np.iinfo(np.int16).max)
+
+
+# Observation of an actor the observer can't see (the follower only sees
+# actors in its field of view).
+MISSING_ACTOR = {
+    "location": np.full((2,), -1, dtype=np.int16),
+    "rotation": np.full((1,), -1, dtype=np.int16),
+}
+for _array in MISSING_ACTOR.values():
+    _array.flags.writeable = False
+
+# Instruction UUIDs are hex strings.
+UUID_CHARSET = "0123456789abcdef"
+UUID_LENGTH = 32
+
+
+def ActorObservation(actor):
+    if actor is None:
+        return MISSING_ACTOR
+    return {
+        "location": np.array(actor.location().to_offset_coordinates(), dtype=np.int16),
+        "rotation": np.array([actor.heading_degrees()], dtype=np.int16),
+    }
+
+
+def InstructionObservations(instructions):
+    """Returns the "instructions" observation: one dict per instruction."""
+    return [
+        {
+            "text": instruction.text,
+            "uuid": instruction.uuid,
+            "completed": int(instruction.completed),
+            "cancelled": int(instruction.cancelled),
+        }
+        for instruction in instructions
+    ]
+
+
+def FeedbackObservation(feedback):
+    """Returns the "feedback" observation: the latest live feedback since the last step."""
+    if len(feedback) == 0:
+        return live_feedback.FeedbackType.NONE.value
+    return feedback[-1].value
+
+
+def CardObservations(props, rows, cols):
+    """Returns the "cards" observation: (rows, cols) arrays of card attributes."""
+    cards = [p for p in props if p.prop_type == prop.PropType.CARD]
+    locations = [p.prop_info.location.to_offset_coordinates() for p in cards]
+    values = {
+        "counts": [p.card_init.count for p in cards],
+        "colors": [p.card_init.color.value for p in cards],
+        "border_colors": [
+            ColorEnumFromColor(p.prop_info.border_color).value for p in cards
+        ],
+        "shapes": [p.card_init.shape.value for p in cards],
+        "selected": [p.card_init.selected for p in cards],
+    }
+    card_rows = [row for row, _ in locations]
+    card_cols = [col for _, col in locations]
+    observation = {}
+    for name, channel_values in values.items():
+        channel = np.zeros((rows, cols), dtype=np.int8)
+        channel[card_rows, card_cols] = channel_values
+        observation[name] = channel
+    return observation
+
+
+class MapObservationCache(object):
+    """Builds the "map" observation, as (rows, cols) arrays.
+
+    Maps only change between steps when the map does (or, for the follower,
+    when its view does). The arrays are built from the map's grid (see
+    MapUpdate.grid()), and reused while the grid is the same. They're shared
+    between observations, so they're read-only.
+    """
+
+    def __init__(self):
+        self._grid = None
+        self._map = None
+
+    def map(self, map_update):
+        grid = map_update.grid()
+        if grid is self._grid:
+            return self._map
+        has_tile = grid.tile_index >= 0
+        map = {
+            "asset_ids": np.where(
+                has_tile, grid.asset_ids, assets.AssetId.NONE.value
+            ).astype(np.int16),
+            "boundaries": np.where(has_tile, grid.edges, -1).astype(np.int8),
+            "orientations": grid.rotations.copy(),
+            "heights": grid.heights.astype(np.float32),
+            "layers": grid.layers.astype(np.int8),
+        }
+        for array in map.values():
+            array.flags.writeable = False
+        self._grid = grid
+        self._map = map
+        return map
+
 
 class CerealBar2Env(gym.Env):
     metadata = {"render_modes": ["human", "headless"], "render_fps": 4}
@@ -197,6 +302,7 @@ class CerealBar2Env(gym.Env):
             self.game_info.server_url = server_url
             self.server_queue_type = server_queue_type
 
+        # Actors the observer can't see are MISSING_ACTOR (all -1).
         self.observation_space = spaces.Dict(
             {
                 "actors": spaces.Dict(
@@ -204,12 +310,12 @@ class CerealBar2Env(gym.Env):
                         "leader": spaces.Dict(
                             {
                                 "location": spaces.Box(
-                                    low=np.array([0, 0]),
+                                    low=np.array([-1, -1]),
                                     high=np.array([MAP_HEIGHT, MAP_WIDTH]),
                                     dtype=np.int16,
                                 ),
                                 "rotation": spaces.Box(
-                                    low=np.array([0]),
+                                    low=np.array([-1]),
                                     high=np.array([360]),
                                     dtype=np.int16,
                                 ),
@@ -218,12 +324,12 @@ class CerealBar2Env(gym.Env):
                         "follower": spaces.Dict(
                             {
                                 "location": spaces.Box(
-                                    low=np.array([0, 0]),
+                                    low=np.array([-1, -1]),
                                     high=np.array([MAP_HEIGHT, MAP_WIDTH]),
                                     dtype=np.int16,
                                 ),
                                 "rotation": spaces.Box(
-                                    low=np.array([0]),
+                                    low=np.array([-1]),
                                     high=np.array([360]),
                                     dtype=np.int16,
                                 ),
@@ -233,20 +339,23 @@ class CerealBar2Env(gym.Env):
                 ),
                 "map": spaces.Dict(
                     {
+                        # AssetId.NONE where there's no tile.
                         "asset_ids": spaces.Box(
                             low=0,
-                            high=int(assets.AssetId.EMPTY_TILE.value),
-                            shape=[MAP_HEIGHT, MAP_WIDTH],
+                            high=int(assets.AssetId.NONE.value),
+                            shape=(MAP_HEIGHT, MAP_WIDTH),
                             dtype=np.int16,
                         ),
+                        # Bitmask of hex.Edges, or -1 where there's no tile.
                         "boundaries": spaces.Box(
-                            low=0,
-                            high=int(hex.HexBoundary.MAX_VAL),
-                            shape=np.array([MAP_HEIGHT, MAP_WIDTH]),
+                            low=-1,
+                            high=(1 << len(hex.Edges)) - 1,
+                            shape=(MAP_HEIGHT, MAP_WIDTH),
                             dtype=np.int8,
                         ),
+                        # Tile rotation in degrees. May be negative.
                         "orientations": spaces.Box(
-                            low=0,
+                            low=-360,
                             high=360,
                             shape=(MAP_HEIGHT, MAP_WIDTH),
                             dtype=np.int16,
@@ -259,7 +368,7 @@ class CerealBar2Env(gym.Env):
                         ),
                         "layers": spaces.Box(
                             low=0,
-                            high=255,
+                            high=127,
                             shape=(MAP_HEIGHT, MAP_WIDTH),
                             dtype=np.int8,
                         ),
@@ -267,57 +376,61 @@ class CerealBar2Env(gym.Env):
                 ),
                 "cards": spaces.Dict(
                     {
-                        "counts": spaces.Box(
-                            low=0, high=3, shape=(MAP_HEIGHT, MAP_WIDTH), dtype=np.int8
+                        "counts": spaces.MultiDiscrete(
+                            np.full((MAP_HEIGHT, MAP_WIDTH), 4), dtype=np.int8
                         ),
-                        "colors": spaces.Box(
-                            low=0,
-                            high=int(card.Color.MAX.value),
-                            shape=(MAP_HEIGHT, MAP_WIDTH),
+                        "colors": spaces.MultiDiscrete(
+                            np.full((MAP_HEIGHT, MAP_WIDTH), card.Color.MAX.value),
                             dtype=np.int8,
                         ),
-                        "border_colors": spaces.Box(
-                            low=0,
-                            high=int(card.Color.MAX.value),
-                            shape=(MAP_HEIGHT, MAP_WIDTH),
+                        "border_colors": spaces.MultiDiscrete(
+                            np.full((MAP_HEIGHT, MAP_WIDTH), card.Color.MAX.value),
                             dtype=np.int8,
                         ),
-                        "shapes": spaces.Box(
-                            low=0,
-                            high=int(card.Shape.MAX.value),
-                            shape=(MAP_HEIGHT, MAP_WIDTH),
+                        "shapes": spaces.MultiDiscrete(
+                            np.full((MAP_HEIGHT, MAP_WIDTH), card.Shape.MAX.value),
                             dtype=np.int8,
                         ),
-                        "selected": spaces.Box(
-                            low=0,
-                            high=1,
-                            shape=(MAP_HEIGHT, MAP_WIDTH),
-                            dtype=np.int8,
+                        "selected": spaces.MultiDiscrete(
+                            np.full((MAP_HEIGHT, MAP_WIDTH), 2), dtype=np.int8
                         ),
                     }
                 ),
                 "instructions": spaces.Sequence(
-                    spaces.Text(
-                        max_length=max_instruction_length,
-                        min_length=0,
-                        charset=string.printable,
+                    spaces.Dict(
+                        {
+                            "text": spaces.Text(
+                                max_length=max_instruction_length,
+                                min_length=0,
+                                charset=string.printable,
+                            ),
+                            "uuid": spaces.Text(
+                                max_length=UUID_LENGTH,
+                                min_length=0,
+                                charset=UUID_CHARSET,
+                            ),
+                            "completed": spaces.Discrete(2),
+                            "cancelled": spaces.Discrete(2),
+                        }
                     )
                 ),
                 "turn_state": spaces.Dict(
                     {
+                        # A Role value.
                         "role": spaces.Discrete(state.Role.MAX.value),
                         "moves_remaining": spaces.Box(
-                            low=0, high=65536, shape=(1,), dtype=np.int16
+                            low=0, high=INT16_MAX, shape=(1,), dtype=np.int16
                         ),
                         "turns_remaining": spaces.Box(
-                            low=0, high=65536, shape=(1,), dtype=np.int16
+                            low=0, high=INT16_MAX, shape=(1,), dtype=np.int16
                         ),
                         "score": spaces.Box(
-                            low=0, high=65536, shape=(1,), dtype=np.int16
+                            low=0, high=INT16_MAX, shape=(1,), dtype=np.int16
                         ),
                     }
                 ),
-                # Feedback is either positive, negative, or none.
+                # The latest live feedback (a FeedbackType value): positive,
+                # negative, or none.
                 "feedback": spaces.Discrete(live_feedback.FeedbackType.MAX.value),
             }
         )
@@ -344,6 +457,8 @@ class CerealBar2Env(gym.Env):
         # Start with leader turn.
         self.action_space = self.lead_action_space
 
+        self._observations = MapObservationCache()
+
     def reset(self):
         """Initializes the environment to the initial state.
 
@@ -371,83 +486,17 @@ class CerealBar2Env(gym.Env):
         else:
             leader = None
             follower = actors[0]
-        leader_state = None
-        if leader != None:
-            leader_state = {
-                "location": leader.location().to_offset_coordinates(),
-                "rotation": leader.heading_degrees(),
-            }
         actors = {
-            "leader": leader_state,
-            "follower": {
-                "location": follower.location().to_offset_coordinates(),
-                "rotation": follower.heading_degrees(),
-            },
-        }
-        asset_ids = [
-            [assets.AssetId.NONE for _ in range(map_update.cols)]
-            for _ in range(map_update.rows)
-        ]
-        boundaries = [
-            [-1 for _ in range(map_update.cols)] for _ in range(map_update.rows)
-        ]
-        orientations = [
-            [0 for _ in range(map_update.cols)] for _ in range(map_update.rows)
-        ]
-        heights = [[0 for _ in range(map_update.cols)] for _ in range(map_update.rows)]
-        layers = [[0 for _ in range(map_update.cols)] for _ in range(map_update.rows)]
-        for tile in map_update.tiles:
-            row, col = tile.cell.coord.to_offset_coordinates()
-            asset_ids[row][col] = tile.asset_id
-            boundaries[row][col] = tile.cell.boundary.edges
-            orientations[row][col] = tile.rotation_degrees
-            heights[row][col] = tile.cell.height
-            layers[row][col] = tile.cell.layer
-        map = {
-            "asset_ids": asset_ids,
-            "boundaries": boundaries,
-            "orientations": orientations,
-            "heights": heights,
-            "layers": layers,
-        }
-        card_counts = [
-            [0 for _ in range(map_update.cols)] for _ in range(map_update.rows)
-        ]
-        card_colors = [
-            [card.Color.NONE for _ in range(map_update.cols)]
-            for _ in range(map_update.rows)
-        ]
-        border_colors = [
-            [card.Color.NONE for _ in range(map_update.cols)]
-            for _ in range(map_update.rows)
-        ]
-        card_shapes = [
-            [card.Shape.NONE for _ in range(map_update.cols)]
-            for _ in range(map_update.rows)
-        ]
-        card_selected = [
-            [False for _ in range(map_update.cols)] for _ in range(map_update.rows)
-        ]
-        for p in props:
-            if p.prop_type == prop.PropType.CARD:
-                (row, col) = p.prop_info.location.to_offset_coordinates()
-                card_counts[row][col] = p.card_init.count
-                card_colors[row][col] = p.card_init.color
-                border_colors[row][col] = ColorEnumFromColor(p.prop_info.border_color)
-                card_shapes[row][col] = p.card_init.shape
-                card_selected[row][col] = p.card_init.selected
-        cards = {
-            "counts": card_counts,
-            "colors": card_colors,
-            "border_colors": border_colors,
-            "shapes": card_shapes,
-            "selected": card_selected,
+            "leader": ActorObservation(leader),
+            "follower": ActorObservation(follower),
         }
+        map = self._observations.map(map_update)
+        cards = CardObservations(props, map_update.rows, map_update.cols)
         openai_turn_state = {
-            "role": turn_state.turn,
-            "moves_remaining": [turn_state.moves_remaining],
-            "turns_remaining": [turn_state.turns_left],
-            "score": [turn_state.score],
+            "role": turn_state.turn.value,
+            "moves_remaining": np.array([turn_state.moves_remaining], dtype=np.int16),
+            "turns_remaining": np.array([turn_state.turns_left], dtype=np.int16),
+            "score": np.array([turn_state.score], dtype=np.int16),
         }
         action_mask = self.game.action_mask()
         aux_info = AuxiliaryInfo(
@@ -466,9 +515,9 @@ class CerealBar2Env(gym.Env):
                 "actors": actors,
                 "map": map,
                 "cards": cards,
-                "instructions": instructions,
+                "instructions": InstructionObservations(instructions),
                 "turn_state": openai_turn_state,
-                "feedback": feedback,
+                "feedback": FeedbackObservation(feedback),
             },
             turn_state.score,
             turn_state.game_over,
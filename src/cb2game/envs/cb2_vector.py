@@ -0,0 +1,246 @@
+""" Runs many local CB2 games at once, as a gymnasium VectorEnv.
+
+    Each game is a CerealBar2Env (see cb2.py) in LOCAL mode. Games are hosted
+    by a LocalGameCoordinator, either in this process or sharded across worker
+    subprocesses (one coordinator per worker). Finished games are replaced by
+    new ones automatically.
+
+    ```
+        env = CerealBar2VectorEnv(config, num_envs=16, num_workers=4)
+        observations, infos = env.reset()
+        while True:
+            actions = [agent(observation) for observation in ...]
+            observations, rewards, terminated, truncated, infos = env.step(actions)
+        env.close()
+    ```
+"""
+import logging
+import multiprocessing as mp
+import traceback
+from typing import List, Optional
+
+import numpy as np
+from gymnasium.vector import VectorEnv
+
+from cb2game.envs.cb2 import CerealBar2Env, EnvMode
+from cb2game.pyclient.local_game_coordinator import LocalGameCoordinator
+from cb2game.server.config.config import Config, SetGlobalConfig
+
+logger = logging.getLogger(__name__)
+
+
+def StackObservations(observations):
+    """Stacks a list of CerealBar2Env observations, one per game.
+
+    Arrays and integers (the turn's role, feedback) are stacked along a new
+    leading axis. Instructions become a tuple with one entry per game. This
+    matches gymnasium's batch_space() of CerealBar2Env.observation_space.
+    """
+    first = observations[0]
+    if isinstance(first, dict):
+        return {
+            key: StackObservations([value[key] for value in observations])
+            for key in first
+        }
+    if isinstance(first, np.ndarray):
+        return np.stack(observations)
+    if isinstance(first, (int, np.integer)):
+        return np.array(observations, dtype=np.int64)
+    return tuple(observations)
+
+
+class _LocalGames(object):
+    """A batch of local games, hosted by one LocalGameCoordinator.
+
+    Results are per game, unstacked. When a game ends, a new one is started in
+    its place, following the gymnasium VectorEnv convention: the new game's
+    observation is returned, and the final observation and info are put in the
+    info dict (under "final_observation" and "final_info").
+    """
+
+    def __init__(self, config: Config, num_games: int, log_to_db: bool = False):
+        self._coordinator = LocalGameCoordinator(config)
+        self._log_to_db = log_to_db
+        self._envs = [
+            CerealBar2Env(EnvMode.LOCAL, game_coordinator=self._coordinator)
+            for _ in range(num_games)
+        ]
+
+    def reset(self):
+        self._coordinator.ForceCleanAll()
+        return [self._reset(env) for env in self._envs]
+
+    def step(self, actions):
+        results = []
+        for env, action in zip(self._envs, actions):
+            observation, reward, terminated, truncated, info = env.step(action)
+            if terminated or truncated:
+                self._coordinator.Cleanup()
+                final_observation, final_info = observation, info
+                observation, info = self._reset(env)
+                info = {
+                    **info,
+                    "final_observation": final_observation,
+                    "final_info": final_info,
+                }
+            results.append((observation, reward, terminated, truncated, info))
+        return results
+
+    def close(self):
+        self._coordinator.ForceCleanAll()
+
+    def _reset(self, env):
+        game_name = self._coordinator.CreateGame(log_to_db=self._log_to_db)
+        env.game_name = game_name
+        env.game_info.game_name = game_name
+        observation, _, _, _, info = env.reset()
+        return observation, info
+
+
+def _Worker(pipe, config, num_games, log_to_db):
+    """Subprocess main loop. Runs commands from CerealBar2VectorEnv on a shard of games."""
+    SetGlobalConfig(config)
+    games = _LocalGames(config, num_games, log_to_db)
+    while True:
+        command, data = pipe.recv()
+        if command == "close":
+            games.close()
+            pipe.close()
+            return
+        try:
+            if command == "reset":
+                result = games.reset()
+            elif command == "step":
+                result = games.step(data)
+            else:
+                raise ValueError(f"Unknown command: {command}")
+            pipe.send((True, result))
+        except Exception:
+            pipe.send((False, traceback.format_exc()))
+
+
+class CerealBar2VectorEnv(VectorEnv):
+    """Runs num_envs local CB2 games, with batched reset() and step().
+
+    step() takes one action per game, for whichever role's turn it is in that
+    game (like CerealBar2Env.step()). Observations are stacked with
+    StackObservations(), and are members of observation_space (the batched
+    CerealBar2Env space). Rewards, terminated and truncated are arrays, and
+    infos follow the gymnasium VectorEnv convention (a dict of arrays, with a
+    boolean "_key" mask for each key).
+
+    If num_workers is 0, all games run in this process, in one
+    LocalGameCoordinator. Otherwise games are split evenly between num_workers
+    subprocesses, which step their games in parallel.
+    """
+
+    def __init__(
+        self,
+        config: Config,
+        num_envs: int,
+        num_workers: int = 0,
+        log_to_db: bool = False,
+        context: Optional[str] = None,
+    ):
+        """Creates the environment.
+
+        Args:
+            config: Game config. Sent to each worker, if there are any.
+            num_envs: Number of games to run at once.
+            num_workers: Number of subprocesses to shard games across. 0 runs
+                games in this process.
+            log_to_db: If true, games are recorded in the database.
+            context: Multiprocessing start method for workers (e.g. "spawn").
+                Uses the platform default if None.
+        """
+        template = CerealBar2Env(EnvMode.LOCAL)
+        super().__init__(num_envs, template.observation_space, template.action_space)
+        if num_workers > num_envs:
+            raise ValueError(
+                f"More workers ({num_workers}) than environments ({num_envs})."
+            )
+        self._games = None
+        self._pipes = []
+        self._processes = []
+        self._shard_sizes = []
+        self._actions = None
+        if num_workers == 0:
+            self._games = _LocalGames(config, num_envs, log_to_db)
+            return
+        ctx = mp.get_context(context)
+        for shard in np.array_split(np.arange(num_envs), num_workers):
+            parent_pipe, child_pipe = ctx.Pipe()
+            process = ctx.Process(
+                target=_Worker,
+                args=(child_pipe, config, len(shard), log_to_db),
+                daemon=True,
+            )
+            process.start()
+            child_pipe.close()
+            self._pipes.append(parent_pipe)
+            self._processes.append(process)
+            self._shard_sizes.append(len(shard))
+
+    def reset_async(self, seed=None, options=None):
+        """Starts a new game in every slot. Games are random, so seed is ignored."""
+        for pipe in self._pipes:
+            pipe.send(("reset", None))
+
+    def reset_wait(self, seed=None, options=None):
+        if self._games is not None:
+            results = self._games.reset()
+        else:
+            results = self._receive()
+        infos = {}
+        for i, (_, info) in enumerate(results):
+            infos = self._add_info(infos, info, i)
+        return StackObservations([observation for observation, _ in results]), infos
+
+    def step_async(self, actions):
+        if len(actions) != self.num_envs:
+            raise ValueError(f"Expected {self.num_envs} actions, got {len(actions)}.")
+        self._actions = list(actions)
+        start = 0
+        for pipe, size in zip(self._pipes, self._shard_sizes):
+            pipe.send(("step", self._actions[start : start + size]))
+            start += size
+
+    def step_wait(self):
+        if self._games is not None:
+            results = self._games.step(self._actions)
+        else:
+            results = self._receive()
+        self._actions = None
+        observations, rewards, terminated, truncated, infos = [], [], [], [], {}
+        for i, (observation, reward, done, cut, info) in enumerate(results):
+            observations.append(observation)
+            rewards.append(reward)
+            terminated.append(done)
+            truncated.append(cut)
+            infos = self._add_info(infos, info, i)
+        return (
+            StackObservations(observations),
+            np.array(rewards, dtype=np.float64),
+            np.array(terminated, dtype=bool),
+            np.array(truncated, dtype=bool),
+            infos,
+        )
+
+    def close_extras(self, **kwargs):
+        if self._games is not None:
+            self._games.close()
+        for pipe in self._pipes:
+            pipe.send(("close", None))
+            pipe.close()
+        for process in self._processes:
+            process.join()
+
+    def _receive(self) -> List:
+        """Collects per-game results from every worker, in game order."""
+        results = []
+        for pipe in self._pipes:
+            success, result = pipe.recv()
+            if not success:
+                raise RuntimeError(f"CB2 vector env worker failed:\n{result}")
+            results.extend(result)
+        return results
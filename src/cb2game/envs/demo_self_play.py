@@ -2,7 +2,6 @@
 import logging
 import threading
 import time
-from collections import deque
 
 import fire
 import gymnasium as gym
@@ -18,6 +17,7 @@ from cb2game.server.config.config import ReadConfigOrDie
 from cb2game.server.hex import HecsCoord
 from cb2game.server.messages.map_update import MapUpdate
 from cb2game.server.messages.prop import PropUpdate
+from cb2game.server.routing_utils import FindPath
 from cb2game.server.util import PackageRoot
 
 logger = logging.getLogger(__name__)
@@ -59,14 +59,14 @@ def card_collides(cards, new_card):
 
 def get_active_instruction(instructions):
     for instruction in instructions:
-        if not instruction.completed and not instruction.cancelled:
+        if not instruction["completed"] and not instruction["cancelled"]:
             return instruction
     return None
 
 
 def has_instruction_available(instructions):
     for instruction in instructions:
-        if not instruction.completed and not instruction.cancelled:
+        if not instruction["completed"] and not instruction["cancelled"]:
             return True
     return False
 
@@ -74,7 +74,7 @@ def has_instruction_available(instructions):
 def get_next_card(observation):
     (_, follower) = observation["actors"]["leader"], observation["actors"]["follower"]
     distance_to_follower = lambda c: c.prop_info.location.distance_to(
-        HecsCoord.from_offset(follower["location"][0], follower["location"][1])
+        HecsCoord.from_offset(*follower["location"].tolist())
     )
     selected_cards = []
     prop_update = PropUpdate.from_gym_state(observation)
@@ -93,36 +93,12 @@ def get_next_card(observation):
 
 
 def find_path_to_card(card, follower, map, cards):
-    start_location = HecsCoord.from_offset(
-        follower["location"][0], follower["location"][1]
+    return FindPath(
+        map,
+        cards,
+        HecsCoord.from_offset(*follower["location"].tolist()),
+        card.prop_info.location,
     )
-    end_location = card.prop_info.location
-    location_queue = deque()
-    location_queue.append((start_location, [start_location]))
-    card_locations = set([card.prop_info.location for card in cards])
-    if start_location in card_locations:
-        card_locations.remove(start_location)
-    if end_location in card_locations:
-        card_locations.remove(end_location)
-    visited_locations = set()
-    while len(location_queue) > 0:
-        current_location, current_path = location_queue.popleft()
-        if current_location in visited_locations:
-            continue
-        if current_location in card_locations:
-            continue
-        visited_locations.add(current_location)
-        if current_location == end_location:
-            return current_path
-        tile = map.tile_at(current_location)
-        for neighbor in tile.cell.coord.neighbors():
-            if tile.cell.boundary.get_edge_between(tile.cell.coord, neighbor):
-                continue
-            neighbor_tile = map.tile_at(neighbor)
-            if neighbor_tile.cell.boundary.get_edge_between(neighbor, tile.cell.coord):
-                continue
-            location_queue.append((neighbor, current_path + [neighbor]))
-    return None
 
 
 def get_instruction_for_card(card, observation, game_endpoint=None):
@@ -140,7 +116,7 @@ def get_instruction_for_card(card, observation, game_endpoint=None):
     game_vis = game_endpoint.visualization() if game_endpoint else None
     if game_vis is not None:
         game_vis.set_trajectory([(coord, 0) for coord in path])
-    heading = follower["rotation"] - 60
+    heading = int(follower["rotation"][0]) - 60
     instructions = []
     for idx, location in enumerate(path):
         next_location = path[idx + 1] if idx + 1 < len(path) else None
@@ -187,7 +163,7 @@ class PathfindingLeader(threading.Thread):
 
     def get_action(self, observation):
         turn_state = observation["turn_state"]
-        if turn_state["role"] != Role.LEADER:
+        if Role(turn_state["role"]) != Role.LEADER:
             return Action.NoopAction()
         if has_instruction_available(observation["instructions"]):
             # If the follower already has something to do, just end the turn.
@@ -221,16 +197,16 @@ class NaiveFollower(threading.Thread):
             active_instruction = get_active_instruction(instructions)
             actions = []
             if active_instruction is not None:
-                actions = actions_from_instruction(active_instruction.text)
+                actions = actions_from_instruction(active_instruction["text"])
             else:
                 raise Exception(f"No active instruction. Instructions: {instructions}")
             if len(actions) == 0:
                 actions = [Action.RandomMovementAction() for _ in range(5)]
             self.actions.extend(actions)
             if active_instruction is not None:
-                self.actions.append(Action.InstructionDone(active_instruction.uuid))
-                self.instructions_processed.add(active_instruction.uuid)
-                self.instructions_processed.add(active_instruction.uuid)
+                self.actions.append(Action.InstructionDone(active_instruction["uuid"]))
+                self.instructions_processed.add(active_instruction["uuid"])
+                self.instructions_processed.add(active_instruction["uuid"])
         if len(self.actions) > 0:
             action = self.actions[0]
             self.actions.pop(0)
@@ -258,7 +234,7 @@ def PlayGame(coordinator, log_to_db: bool = True):
         turn_state = observation["turn_state"]
         if done:
             break
-        if turn_state["role"] == Role.LEADER:
+        if Role(turn_state["role"]) == Role.LEADER:
             # This fails here... this demo is not working yet. OpenAI GYM is a WIP.
             leader_action = leader_agent.get_action(observation)
             logger.info(f"Leader step({leader_action})")
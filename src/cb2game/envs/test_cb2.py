@@ -0,0 +1,58 @@
+"""Unit tests for CerealBar2Env observations."""
+import os
+import unittest
+
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = ""  # Hide pygame welcome message
+
+from cb2game.envs.cb2 import MISSING_ACTOR, CerealBar2Env, EnvMode
+from cb2game.pyclient.game_endpoint import Action
+from cb2game.pyclient.local_game_coordinator import LocalGameCoordinator
+from cb2game.server.config.config import Config, SetGlobalConfig
+from cb2game.server.messages.rooms import Role
+
+
+class CerealBar2EnvTest(unittest.TestCase):
+    def setUp(self):
+        config = Config()
+        SetGlobalConfig(config)
+        self.coordinator = LocalGameCoordinator(config)
+        self.env = CerealBar2Env(
+            EnvMode.LOCAL,
+            game_name=self.coordinator.CreateGame(log_to_db=False),
+            game_coordinator=self.coordinator,
+        )
+
+    def tearDown(self):
+        self.coordinator.ForceCleanAll()
+
+    def test_observations_in_space(self):
+        space = self.env.observation_space
+        observation, *_ = self.env.reset()
+        self.assertTrue(space.contains(observation))
+        self.assertEqual(observation["turn_state"]["role"], Role.LEADER.value)
+
+        actions = [
+            Action.SendInstruction("forward, left"),
+            Action.EndTurn(),
+            Action.Forwards(),
+            Action.Left(),
+        ]
+        for action in actions:
+            observation, *_ = self.env.step(action)
+            self.assertTrue(space.contains(observation), f"After {action}")
+        self.assertEqual(observation["turn_state"]["role"], Role.FOLLOWER.value)
+        (instruction,) = observation["instructions"]
+        self.assertEqual(instruction["text"], "forward, left")
+        self.assertEqual(instruction["completed"], 0)
+
+        observation, *_ = self.env.step(Action.InstructionDone(instruction["uuid"]))
+        self.assertTrue(space.contains(observation))
+        self.assertEqual(observation["instructions"][0]["completed"], 1)
+
+    def test_missing_actor_in_space(self):
+        actor_space = self.env.observation_space["actors"]["leader"]
+        self.assertTrue(actor_space.contains(MISSING_ACTOR))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+"""Unit tests for CerealBar2VectorEnv."""
+import os
+import unittest
+
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = ""  # Hide pygame welcome message
+
+from cb2game.envs.cb2 import CerealBar2Env, EnvMode
+from cb2game.envs.cb2_vector import CerealBar2VectorEnv
+from cb2game.pyclient.game_endpoint import Action
+from cb2game.server.config.config import Config, SetGlobalConfig
+from cb2game.server.messages.rooms import Role
+
+NUM_ENVS = 2
+# More than enough steps for every game to run out of turns.
+MAX_STEPS = 100
+
+
+def _ChooseAction(observations, i):
+    """Gives each leader turn one instruction, which the follower marks done."""
+    pending = [
+        instruction
+        for instruction in observations["instructions"][i]
+        if not instruction["completed"] and not instruction["cancelled"]
+    ]
+    if Role(observations["turn_state"]["role"][i]) == Role.LEADER:
+        return Action.EndTurn() if pending else Action.SendInstruction("forward")
+    return Action.InstructionDone(pending[0]["uuid"])
+
+
+class CerealBar2VectorEnvTest(unittest.TestCase):
+    def setUp(self):
+        self.config = Config()
+        SetGlobalConfig(self.config)
+        self.env = CerealBar2VectorEnv(self.config, num_envs=NUM_ENVS, num_workers=0)
+
+    def tearDown(self):
+        self.env.close()
+
+    def test_reset_step_and_auto_reset(self):
+        space = self.env.observation_space
+        single_space = CerealBar2Env(EnvMode.LOCAL).observation_space
+        observations, _ = self.env.reset()
+        self.assertTrue(space.contains(observations))
+        self.assertEqual(
+            list(observations["turn_state"]["role"]), [Role.LEADER.value] * NUM_ENVS
+        )
+        initial_turns = observations["turn_state"]["turns_remaining"].copy()
+
+        for _ in range(MAX_STEPS):
+            actions = [_ChooseAction(observations, i) for i in range(NUM_ENVS)]
+            observations, rewards, terminated, truncated, infos = self.env.step(actions)
+            self.assertTrue(space.contains(observations))
+            self.assertEqual(rewards.shape, (NUM_ENVS,))
+            if terminated.any():
+                break
+        self.assertTrue(terminated.any(), "No game ended.")
+
+        self.assertEqual(list(infos["_final_observation"]), list(terminated))
+        for i in terminated.nonzero()[0]:
+            final_observation = infos["final_observation"][i]
+            self.assertTrue(single_space.contains(final_observation))
+            self.assertEqual(final_observation["turn_state"]["turns_remaining"], 0)
+            # The finished game was replaced by a fresh one.
+            self.assertEqual(
+                observations["turn_state"]["turns_remaining"][i], initial_turns[i]
+            )
+            self.assertEqual(len(observations["instructions"][i]), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
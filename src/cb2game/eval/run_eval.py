@@ -1,7 +1,11 @@
+import functools
+import json
 import logging
+import multiprocessing as mp
+import os
 import time
 from datetime import datetime, timedelta
-from typing import List
+from typing import List, Optional
 
 import fire
 from tqdm import tqdm
@@ -24,9 +28,12 @@ from cb2game.server.lobby_consts import LobbyInfo, LobbyType
 from cb2game.server.messages.objective import ObjectiveMessage
 from cb2game.server.messages.prop import PropType
 from cb2game.server.messages.turn_state import TurnState
+from cb2game.server.scenario_cache import InitScenarioCache
 from cb2game.server.scenario_util import (
+    GameEvents,
     GameStateFromScenario,
-    ReconstructScenarioFromEvent,
+    InstructionSnapshot,
+    InstructionSnapshots,
 )
 from cb2game.server.schemas import base
 from cb2game.server.schemas.event import Event, EventType
@@ -48,75 +55,362 @@ def SwitchToDatabase(db):
     base.ConnectDatabase()
 
 
-def follower_eval_start(instruction: Event) -> Event:
-    first_follower_move = (
-        Event.select()
-        .where(
-            (Event.type == EventType.ACTION) & (Event.parent_event_id == instruction.id)
+def CompareCardSelections(a: List[Card], b: List[Card]) -> bool:
+    selected_ids_a = set([card.id for card in a if card.selected])
+    selected_ids_b = set([card.id for card in b if card.selected])
+    return selected_ids_a == selected_ids_b
+
+
+def InitPythonLogging():
+    log_format = "[%(asctime)s] %(name)s %(levelname)s [%(module)s:%(funcName)s:%(lineno)d] %(message)s"
+    logging.basicConfig(level=logging.INFO, format=log_format)
+    logging.getLogger("peewee").setLevel(logging.INFO)
+
+
+class InstructionEvaluator(object):
+    """Evaluates an agent on recorded instructions, one local game each.
+
+    Each instruction is replayed from the database in a fresh game, in this
+    evaluator's LocalGameCoordinator.
+    """
+
+    def __init__(self, agent: Agent, config: Config):
+        self._agent = agent
+        # This object will help us launch local games.
+        self._coordinator = LocalGameCoordinator(
+            config,
+            render_leader=False,
+            render_follower=False,
         )
-        .order_by(Event.server_time)
-        .first()
-    )
-    if first_follower_move is None:
-        logger.info("No follower move found.")
-        return None
-    event_before = (
-        Event.select()
-        .where(
-            (Event.game == first_follower_move.game)
-            & (Event.server_time < first_follower_move.server_time)
+        self._eval_lobby = OpenLobby(
+            LobbyInfo(
+                name="eval virtual lobby",
+                type=LobbyType.OPEN,
+                comment="Ephemeral lobby used for eval runs.",
+                game_capacity=1,
+                sound_clip_volume=0,
+            )
         )
-        .order_by(Event.server_time.desc())
-        .first()
-    )
-    return event_before
 
+    def evaluate(self, snapshots: List[InstructionSnapshot]) -> List:
+        """Runs the agent on instructions, given their InstructionSnapshots.
 
-def final_follower_move(instruction: Event) -> Event:
-    last_follower_move = (
-        Event.select()
-        .where(
-            (Event.type == EventType.ACTION) & (Event.parent_event_id == instruction.id)
+        Each instruction gets its own local game. The games are stepped in
+        lockstep: each step, the agent chooses an action in every game whose
+        eval isn't done yet, in one call to Agent.choose_actions().
+
+        Returns a list of (evaluation, ok), one per snapshot. evaluation is
+        None if the instruction can't be evaluated (e.g. it was cancelled). ok
+        is false if evaluation raised an exception. An exception while
+        stepping the games fails every instruction in the batch.
+
+        Raises ValueError if there's more than one snapshot, but the agent
+        doesn't support batching (see Agent.supports_batching()).
+        """
+        if len(snapshots) > 1 and not self._agent.supports_batching():
+            raise ValueError(
+                f"Agent {type(self._agent).__name__} doesn't support batching. Evaluate one instruction at a time."
+            )
+        outcomes = [None] * len(snapshots)
+        # Index in snapshots -> _Rollout.
+        rollouts = {}
+        try:
+            for i, snapshot in enumerate(snapshots):
+                try:
+                    rollout = self._start(snapshot)
+                except Exception as e:
+                    _LogEvalException(snapshot, e)
+                    outcomes[i] = (None, False)
+                    continue
+                if rollout is None:
+                    outcomes[i] = (None, True)
+                else:
+                    rollouts[i] = rollout
+            try:
+                self._run(list(rollouts.values()))
+            except RateLimitException:
+                logger.info(f"Rate limit error. Waiting 60 seconds.")
+                time.sleep(60)
+                for i, rollout in rollouts.items():
+                    outcomes[i] = (rollout.rate_limit_evaluation(), True)
+                return outcomes
+            except Exception as e:
+                for i in rollouts:
+                    _LogEvalException(snapshots[i], e)
+                    outcomes[i] = (None, False)
+                return outcomes
+        finally:
+            # Each instruction gets a new game. Don't keep old ones around.
+            self._coordinator.ForceCleanAll()
+
+        for i, rollout in rollouts.items():
+            try:
+                outcomes[i] = (rollout.score(), True)
+            except Exception as e:
+                _LogEvalException(snapshots[i], e)
+                outcomes[i] = (None, False)
+        return outcomes
+
+    def _start(self, snapshot: InstructionSnapshot):
+        """Creates a local game at the start of an instruction's eval.
+
+        Returns a _Rollout, or None if the instruction can't be evaluated.
+        """
+        agent = self._agent
+        coordinator = self._coordinator
+        instruction = snapshot.instruction
+        objective = ObjectiveMessage.from_json(instruction.data)
+        logger.info(
+            f"Evaluating agent {type(agent).__name__} on instruction {instruction.id}"
         )
-        .order_by(Event.server_time.desc())
-        .first()
-    )
-    if last_follower_move is None:
-        # No follower move found. Just get the INSTRUCTION_DONE event. Return null if
-        # that doesn't exist either (instruction cancelled or game ended).
-        instruction_complete_event = (
-            Event.select()
-            .where(
-                (Event.type == EventType.INSTRUCTION_DONE)
-                & (Event.parent_event_id == instruction.id)
+        logger.info(f"Instruction text: {objective.text}")
+        if snapshot.start_event is None or snapshot.end_event is None:
+            logger.info(
+                "Skipping instruction. Invalid start or end states. This could be due to the instruction being cancelled or the game ending."
             )
-            .first()
+            return None
+
+        # Create a local game to run the eval.
+        start_scenario, err = snapshot.start
+        if start_scenario is None:
+            raise ValueError(f"Failed to reconstruct eval start: {err}")
+        game_name = coordinator.CreateGameFromScenario(
+            start_scenario, log_to_db=False, lobby=self._eval_lobby
         )
-        return instruction_complete_event
-
-    # Get the event after this one.
-    event_after = (
-        Event.select()
-        .where(
-            (Event.game == last_follower_move.game)
-            & (Event.server_time > last_follower_move.server_time)
+        # Due to a known bug (now patched) where TURN_STATE events were not
+        # being logged, we need to force the current turn state to be at the
+        # beginning of the follower's turn, with full moves and time.
+        state_machine = coordinator._state_machine_driver(
+            game_name
+        ).state_machine()  # pylint: disable=protected-access
+        state_machine._send_turn_state(
+            TurnState(  # pylint: disable=protected-access
+                Role.FOLLOWER,
+                FOLLOWER_MOVES_PER_TURN,
+                1,  # As long as next turn isn't game over.
+                datetime.utcnow() + timedelta(seconds=FOLLOWER_SECONDS_PER_TURN),
+                datetime.utcnow(),
+                0,  # Let's start each eval with a score of zero.
+                0,
+                False,
+                0,
+            )
+        )
+        endpoint_pair = EndpointPair(coordinator, game_name)
+        endpoint_pair.initialize()
+        game_state = endpoint_pair.initial_state()
+
+        if game_state.turn_state.turn != agent.role():
+            logger.error(
+                f"Agent role {agent.role()} does not match turn eval run state {game_state.turn_state.turn}"
+            )
+            return None
+        return _Rollout(snapshot, endpoint_pair, game_state)
+
+    def _run(self, rollouts):
+        """Steps the rollouts' games in lockstep, until the agent's turn is over in each."""
+        role = self._agent.role()
+        # We check for this before each step because the game state may change
+        # in the middle of the turn.
+        running = [rollout for rollout in rollouts if rollout.running(role)]
+        while len(running) > 0:
+            actions = self._agent.choose_actions(
+                [rollout.game_state for rollout in running]
+            )
+            for rollout, action in zip(running, actions):
+                rollout.step(action)
+            running = [rollout for rollout in running if rollout.running(role)]
+
+
+class _Rollout(object):
+    """An instruction being evaluated, in its own local game."""
+
+    def __init__(
+        self,
+        snapshot: InstructionSnapshot,
+        endpoint_pair: EndpointPair,
+        game_state,
+    ):
+        self.snapshot = snapshot
+        self.endpoint_pair = endpoint_pair
+        self.game_state = game_state
+        self.agent_actions = []
+
+    def running(self, role: Role) -> bool:
+        # If the turn is over, then the eval for this instruction is done.
+        return not self.endpoint_pair.over() and self.game_state.turn_state.turn == role
+
+    def step(self, action):
+        self.game_state = self.endpoint_pair.step(action)
+        self.agent_actions.append(str(action))
+
+    def score(self) -> InstructionEvaluation:
+        """Compares the agent's final game state to the recorded one."""
+        logger.info(f"Agent actions: {self.agent_actions}")
+        # Now we have the agent's completed game state. We must compare it to
+        # the baseline. Fetch the final game state after this instruction was
+        # completed in the baseline game in the database.
+        final_scenario, err = self.snapshot.end
+        if final_scenario is None:
+            raise ValueError(f"Failed to reconstruct eval end: {err}")
+        final_baseline_state = GameStateFromScenario(final_scenario)
+
+        # Compare the final game state to the human game state. See if the card
+        # selections and scores match.
+        final_agent_props = self.game_state.props
+        final_agent_cards = [
+            Card.FromProp(prop)
+            for prop in final_agent_props
+            if prop.prop_type == PropType.CARD
+        ]
+        final_agent_score = self.game_state.turn_state.score
+        final_baseline_props = final_baseline_state.props
+        final_baseline_cards = [
+            Card.FromProp(prop)
+            for prop in final_baseline_props
+            if prop.prop_type == PropType.CARD
+        ]
+        final_baseline_score = final_baseline_state.turn_state.score
+        card_selections_match = CompareCardSelections(
+            final_agent_cards, final_baseline_cards
+        )
+        passed_instruction_eval = card_selections_match and (
+            final_agent_score >= final_baseline_score
+        )
+        return InstructionEvaluation(
+            instruction_uuid=self.snapshot.instruction.short_code,
+            agent_actions=str(self.agent_actions),
+            event_uuid=self.snapshot.start_event.id.hex,
+            success=passed_instruction_eval,
         )
-        .order_by(Event.server_time)
-        .first()
-    )
-    return event_after
 
+    def rate_limit_evaluation(self) -> InstructionEvaluation:
+        return InstructionEvaluation(
+            instruction_uuid=self.snapshot.instruction.short_code,
+            agent_actions=str(self.agent_actions),
+            event_uuid=self.snapshot.start_event.id.hex,
+            success=False,
+            error="Rate limit error. Waiting 60 seconds.",
+        )
 
-def CompareCardSelections(a: List[Card], b: List[Card]) -> bool:
-    selected_ids_a = set([card.id for card in a if card.selected])
-    selected_ids_b = set([card.id for card in b if card.selected])
-    return selected_ids_a == selected_ids_b
 
+def _LogEvalException(snapshot: InstructionSnapshot, e: Exception):
+    # Log the exception, with stack trace and instruction ID.
+    logger.error(f"Exception in eval for instruction {snapshot.instruction.id}.")
+    logger.error(e, exc_info=True)
 
-def InitPythonLogging():
-    log_format = "[%(asctime)s] %(name)s %(levelname)s [%(module)s:%(funcName)s:%(lineno)d] %(message)s"
-    logging.basicConfig(level=logging.INFO, format=log_format)
-    logging.getLogger("peewee").setLevel(logging.INFO)
+
+def EvaluateGame(
+    evaluator: InstructionEvaluator, game_id, instruction_ids, batch_size: int = 1
+):
+    """Evaluates instructions from one game. The game's events are read once.
+
+    Instructions are evaluated batch_size at a time, in lockstep (see
+    InstructionEvaluator.evaluate()).
+
+    Returns a list of (instruction_id, evaluation, ok), one per instruction.
+    evaluation is None if the instruction was skipped. ok is false if
+    evaluation raised an exception, in which case the instruction isn't
+    checkpointed (so a resumed run retries it).
+    """
+    try:
+        snapshots = InstructionSnapshots(GameEvents(game_id), set(instruction_ids))
+    except Exception as e:
+        logger.error(f"Exception reading game {game_id} for eval.")
+        logger.error(e, exc_info=True)
+        return [(instruction_id, None, False) for instruction_id in instruction_ids]
+    outcomes = []
+    for start in range(0, len(instruction_ids), batch_size):
+        batch = instruction_ids[start : start + batch_size]
+        batch_outcomes = evaluator.evaluate([snapshots[i] for i in batch])
+        for instruction_id, (evaluation, ok) in zip(batch, batch_outcomes):
+            outcomes.append((instruction_id, evaluation, ok))
+    return outcomes
+
+
+# Per-process evaluator, for eval worker processes. See _InitEvalWorker().
+_worker_evaluator = None
+
+
+def _InitEvalWorker(config: Config, agent_config: AgentConfigData):
+    global _worker_evaluator
+    InitPythonLogging()
+    base.SetDatabaseReadOnly(config)
+    base.ConnectDatabase()
+    InitScenarioCache(config)
+    _worker_evaluator = InstructionEvaluator(LoadAgentFromConfig(agent_config), config)
+
+
+def _EvaluateInWorker(game_instructions, batch_size=1):
+    return EvaluateGame(_worker_evaluator, *game_instructions, batch_size=batch_size)
+
+
+class EvalCheckpoint(object):
+    """Streams per-instruction results to a JSON lines file, so evals can resume.
+
+    The first line records the eval run ID. Each following line is one
+    evaluated instruction: {"instruction": <event ID>, "evaluation": <an
+    InstructionEvaluation dict, or null if skipped>}.
+    """
+
+    def __init__(self, path: str):
+        self._path = path
+        self.eval_id = None
+        # Event ID hex -> InstructionEvaluation (or None, if skipped).
+        self.evaluations = {}
+        if path and os.path.exists(path):
+            self._load()
+
+    def _load(self):
+        with open(self._path, "r") as f:
+            lines = [line for line in f if line.strip()]
+        if len(lines) == 0:
+            return
+        self.eval_id = json.loads(lines[0])["eval_id"]
+        valid_lines = lines[:1]
+        for line in lines[1:]:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                # The last line may be partially written if the run was killed.
+                logger.warning(f"Ignoring malformed checkpoint line: {line!r}")
+                continue
+            valid_lines.append(line)
+            evaluation = entry["evaluation"]
+            self.evaluations[entry["instruction"]] = (
+                InstructionEvaluation.from_dict(evaluation)
+                if evaluation is not None
+                else None
+            )
+        if len(valid_lines) < len(lines):
+            # Drop malformed lines, so new results start on a line of their own.
+            with open(self._path, "w") as f:
+                f.writelines(line.rstrip("\n") + "\n" for line in valid_lines)
+        logger.info(
+            f"Resuming eval {self.eval_id} from {self._path}. {len(self.evaluations)} instructions done."
+        )
+
+    def start(self, eval_id: str):
+        """Records the eval ID, if this is a new checkpoint."""
+        if not self._path or self.eval_id is not None:
+            return
+        self.eval_id = eval_id
+        with open(self._path, "w") as f:
+            f.write(json.dumps({"eval_id": eval_id}) + "\n")
+
+    def done(self, instruction_id) -> bool:
+        return instruction_id.hex in self.evaluations
+
+    def record(self, instruction_id, evaluation: Optional[InstructionEvaluation]):
+        self.evaluations[instruction_id.hex] = evaluation
+        if not self._path:
+            return
+        entry = {
+            "instruction": instruction_id.hex,
+            "evaluation": evaluation.to_dict() if evaluation is not None else None,
+        }
+        with open(self._path, "a") as f:
+            f.write(json.dumps(entry) + "\n")
 
 
 def RunEval(
@@ -126,6 +420,9 @@ def RunEval(
     limit: int = -1,
     # Optional information about the agent that will be saved in the eval JSON output.
     agent_config: AgentConfigData = None,
+    num_workers: int = 0,
+    checkpoint_path: str = "",
+    batch_size: int = 1,
 ):
     """Runs an eval against the given agent.
 
@@ -138,6 +435,17 @@ def RunEval(
         output_prefix: The prefix to use for the output file.
         limit: The maximum number of instructions to evaluate. If -1, no limit.
         server_config_path: The path to the server config file.
+        num_workers: If > 0, instructions are sharded across this many worker
+            processes. Each loads its own agent from agent_config, and opens
+            the database read-only.
+        checkpoint_path: If set, each instruction's result is appended to this
+            file as it completes. Rerunning with the same checkpoint skips
+            instructions which are already done, and keeps the same eval ID.
+        batch_size: Number of instructions from the same game to evaluate at
+            once. Their games are stepped in lockstep, and the agent chooses
+            actions for all of them with one call to Agent.choose_actions().
+            Must be 1 unless the agent supports batching (see
+            Agent.supports_batching()).
     """
     if server_config_path == "":
         config = Config()
@@ -147,19 +455,42 @@ def RunEval(
     else:
         config = ReadServerConfigOrDie(server_config_path)
 
+    if agent.role() == Role.LEADER:
+        # Leader eval not yet supported.
+        logger.info(f"Leader eval not yet supported.")
+        return
+
+    if num_workers > 0 and agent_config is None:
+        raise ValueError("agent_config is required to load agents in eval workers.")
+
+    if batch_size < 1:
+        raise ValueError(f"batch_size must be at least 1. Got {batch_size}.")
+    if batch_size > 1 and not agent.supports_batching():
+        raise ValueError(
+            f"Agent {type(agent).__name__} doesn't support batching. Use batch_size=1."
+        )
+
     base.SetDatabase(config)
     base.ConnectDatabase()
+    # Repeated evals on the same instructions load scenarios from the cache.
+    InitScenarioCache(config)
 
     games = ListGames()
     game_ids = [game.id for game in games]
-    instructions = Event.select().where(
+    instructions = Event.select(Event.id, Event.game).where(
         (Event.type == EventType.INSTRUCTION_SENT) & (Event.game_id << game_ids)
     )
 
     if limit >= 0:
         instructions = instructions.limit(limit)
 
-    if instructions.count() == 0:
+    instruction_ids = []
+    # Game ID -> IDs of its instructions. Each game's events are read once.
+    game_instructions = {}
+    for instruction in instructions:
+        instruction_ids.append(instruction.id)
+        game_instructions.setdefault(instruction.game_id, []).append(instruction.id)
+    if len(instruction_ids) == 0:
         print("No instructions found.")
         return
 
@@ -171,153 +502,56 @@ def RunEval(
         agent_role=agent.role(),
         server_config=config.to_json(),
     )
-    # This object will help us launch local games.
-    coordinator = LocalGameCoordinator(
-        config,
-        render_leader=False,
-        render_follower=False,
-    )
-
-    eval_lobby = OpenLobby(
-        LobbyInfo(
-            name="eval virtual lobby",
-            type=LobbyType.OPEN,
-            comment="Ephemeral lobby used for eval runs.",
-            game_capacity=1,
-            sound_clip_volume=0,
+    checkpoint = EvalCheckpoint(checkpoint_path)
+    if checkpoint.eval_id is not None:
+        eval_run.id = checkpoint.eval_id
+    checkpoint.start(eval_run.id)
+
+    todo = [
+        (game_id, [i for i in ids if not checkpoint.done(i)])
+        for game_id, ids in game_instructions.items()
+    ]
+    todo = [(game_id, ids) for game_id, ids in todo if len(ids) > 0]
+    if num_workers > 0:
+        # Workers get their own DB connections. Spawn, so sqlite connections
+        # aren't inherited.
+        base.CloseDatabase()
+        pool = mp.get_context("spawn").Pool(
+            num_workers,
+            initializer=_InitEvalWorker,
+            initargs=(config, agent_config),
         )
-    )
-
-    agent_instructions_passed = []
-    results = []
-    for instruction in tqdm(instructions):
-        try:
-            objective = ObjectiveMessage.from_json(instruction.data)
-            logger.info(
-                f"Evaluating agent {agent_config.type} on instruction {instruction.id}"
-            )
-            logger.info(f"Instruction text: {objective.text}")
-            if agent.role() == Role.LEADER:
-                # Leader eval not yet supported.
-                logger.info(f"Leader eval not yet supported.")
-                return
-            elif agent.role() == Role.FOLLOWER:
-                eval_start_event = follower_eval_start(instruction)
-                final_baseline_state = final_follower_move(instruction)
-                if eval_start_event is None or final_baseline_state is None:
-                    logger.info(
-                        "Skipping instruction. Invalid start or end states. This could be due to the instruction being cancelled or the game ending."
-                    )
-                    continue
-
-            # Create a local game to run the eval.
-            game_name = coordinator.CreateGameFromDatabase(
-                eval_start_event.id.hex, log_to_db=False, lobby=eval_lobby
-            )
-            # Due to a known bug (now patched) where TURN_STATE events were not
-            # being logged, we need to force the current turn state to be at the
-            # beginning of the follower's turn, with full moves and time.
-            state_machine = coordinator._state_machine_driver(
-                game_name
-            ).state_machine()  # pylint: disable=protected-access
-            state_machine._send_turn_state(
-                TurnState(  # pylint: disable=protected-access
-                    Role.FOLLOWER,
-                    FOLLOWER_MOVES_PER_TURN,
-                    1,  # As long as next turn isn't game over.
-                    datetime.utcnow() + timedelta(seconds=FOLLOWER_SECONDS_PER_TURN),
-                    datetime.utcnow(),
-                    0,  # Let's start each eval with a score of zero.
-                    0,
-                    False,
-                    0,
-                )
-            )
-            endpoint_pair = EndpointPair(coordinator, game_name)
-            endpoint_pair.initialize()
-            game_state = endpoint_pair.initial_state()
-
-            if game_state.turn_state.turn != agent.role():
-                logger.error(
-                    f"Agent role {agent.role()} does not match turn eval run state {game_state.turn_state.turn}"
-                )
-                continue
-
-            # Keep running until the current turn is over. We check for this inside
-            # the loop because the game state may change in the middle of the loop.
-            agent_actions = []
-            while not endpoint_pair.over():
-                # If the turn is over, then the eval for this instruction is done.
-                if game_state.turn_state.turn != agent.role():
-                    break
-                action = agent.choose_action(game_state)
-                game_state = endpoint_pair.step(action)
-                agent_actions.append(str(action))
-
-            logger.info(f"Agent actions: {agent_actions}")
-
-            # Now we have the agent's completed game state. We must compare it to
-            # the baseline. Fetch the final game state after this instruction was
-            # completed in the baseline game in the database.
-            final_scenario, err = ReconstructScenarioFromEvent(final_baseline_state.id)
-            final_baseline_state = GameStateFromScenario(final_scenario)
-
-            # Compare the final game state to the human game state. See if the card
-            # selections and scores match.
-            final_agent_props = game_state.props
-            final_agent_cards = [
-                Card.FromProp(prop)
-                for prop in final_agent_props
-                if prop.prop_type == PropType.CARD
-            ]
-            final_agent_score = game_state.turn_state.score
-            final_baseline_props = final_baseline_state.props
-            final_baseline_cards = [
-                Card.FromProp(prop)
-                for prop in final_baseline_props
-                if prop.prop_type == PropType.CARD
-            ]
-            final_baseline_score = final_baseline_state.turn_state.score
-            card_selections_match = CompareCardSelections(
-                final_agent_cards, final_baseline_cards
-            )
-            passed_instruction_eval = card_selections_match and (
-                final_agent_score >= final_baseline_score
-            )
-            if passed_instruction_eval:
-                agent_instructions_passed.append(instruction.id)
-            results.append(
-                InstructionEvaluation(
-                    instruction_uuid=instruction.short_code,
-                    agent_actions=str(agent_actions),
-                    event_uuid=eval_start_event.id.hex,
-                    success=passed_instruction_eval,
-                )
-            )
-        except RateLimitException:
-            logger.info(f"Rate limit error. Waiting 60 seconds.")
-            results.append(
-                InstructionEvaluation(
-                    instruction_uuid=instruction.short_code,
-                    agent_actions=str(agent_actions),
-                    event_uuid=eval_start_event.id.hex,
-                    success=False,
-                    error="Rate limit error. Waiting 60 seconds.",
-                )
-            )
-            time.sleep(60)
-            continue
-        except Exception as e:
-            # Log the exception, with stack trace and instruction ID.
-            logger.error(
-                f"Exception in eval run {eval_run.id} for instruction {instruction.id}."
-            )
-            logger.error(e, exc_info=True)
-            break
+        game_outcomes = pool.imap_unordered(
+            functools.partial(_EvaluateInWorker, batch_size=batch_size), todo
+        )
+    else:
+        pool = None
+        evaluator = InstructionEvaluator(agent, config)
+        game_outcomes = (
+            EvaluateGame(evaluator, *game, batch_size=batch_size) for game in todo
+        )
+    try:
+        with tqdm(total=sum(len(ids) for _, ids in todo)) as progress:
+            for outcomes in game_outcomes:
+                for instruction_id, evaluation, ok in outcomes:
+                    if ok:
+                        checkpoint.record(instruction_id, evaluation)
+                progress.update(len(outcomes))
+    finally:
+        if pool is not None:
+            pool.terminate()
+
+    # Results are in instruction order, regardless of which worker ran them.
+    results = [
+        checkpoint.evaluations[i.hex]
+        for i in instruction_ids
+        if checkpoint.evaluations.get(i.hex) is not None
+    ]
+    passed = [result for result in results if result.success]
 
     # Save results to JSON file. See eval/eval_schema.py for the schema.
     eval_run.percent_passed = (
-        (100 * len(agent_instructions_passed) / len(results)) if len(results) > 0 else 0
+        (100 * len(passed) / len(results)) if len(results) > 0 else 0
     )
     eval_run.total_instructions = len(results)
     eval_run.instruction_evals = results
@@ -329,7 +563,7 @@ def RunEval(
     logger.info(f"Eval run {eval_run.id} complete.")
     if len(results) > 0:
         logger.info(
-            f"Instructions passed: {len(agent_instructions_passed)}. ({100 * len(agent_instructions_passed) / len(results)}%)"
+            f"Instructions passed: {len(passed)}. ({100 * len(passed) / len(results)}%)"
         )
     logger.info(f"Total instructions: {len(results)}")
 
@@ -339,6 +573,9 @@ def main(
     output_prefix: str = "eval_",
     server_config: str = "",
     limit: int = -1,
+    num_workers: int = 0,
+    checkpoint: str = "",
+    batch_size: int = 1,
 ):
     InitPythonLogging()
     agent_config_data = ReadAgentConfigOrDie(agent_config)
@@ -349,6 +586,9 @@ def main(
         server_config,
         limit,
         agent_config_data,
+        num_workers,
+        checkpoint,
+        batch_size,
     )
 
 
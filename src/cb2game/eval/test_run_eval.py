@@ -0,0 +1,140 @@
+"""Unit tests for eval checkpoints and lockstep instruction evaluation."""
+import os
+import random
+import tempfile
+import unittest
+import uuid
+
+import numpy as np
+
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = ""  # Hide pygame welcome message
+
+from cb2game.agents.agent import Agent
+from cb2game.agents.config import AgentConfigData, LoadAgentFromConfig
+from cb2game.agents.local_agent_pair import PlayGame
+from cb2game.eval.eval_schema import InstructionEvaluation
+from cb2game.eval.run_eval import EvalCheckpoint, InstructionEvaluator
+from cb2game.pyclient.game_endpoint import Action, Role
+from cb2game.pyclient.local_game_coordinator import LocalGameCoordinator
+from cb2game.server.config.config import Config, SetGlobalConfig
+from cb2game.server.scenario_util import GameEvents, InstructionSnapshots
+from cb2game.server.schemas.base import (
+    ConnectDatabase,
+    CreateTablesIfNotExists,
+    SetDatabaseForTesting,
+)
+from cb2game.server.schemas.defaults import ListDefaultTables
+from cb2game.server.schemas.game import Game
+
+
+class EvalCheckpointTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "checkpoint.jsonl")
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_resume(self):
+        evaluated, skipped, todo = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        evaluation = InstructionEvaluation("abc", "['FORWARDS']", "def", True)
+        checkpoint = EvalCheckpoint(self.path)
+        checkpoint.start("eval-id")
+        checkpoint.record(evaluated, evaluation)
+        checkpoint.record(skipped, None)
+        # Simulate a run killed halfway through writing a line.
+        with open(self.path, "a") as f:
+            f.write('{"instruction": "')
+
+        resumed = EvalCheckpoint(self.path)
+        resumed.start("another-eval-id")
+        self.assertEqual(resumed.eval_id, "eval-id")
+        self.assertTrue(resumed.done(evaluated))
+        self.assertTrue(resumed.done(skipped))
+        self.assertFalse(resumed.done(todo))
+        self.assertEqual(resumed.evaluations[evaluated.hex], evaluation)
+        self.assertIsNone(resumed.evaluations[skipped.hex])
+
+        resumed.record(todo, evaluation)
+        self.assertEqual(len(EvalCheckpoint(self.path).evaluations), 3)
+
+    def test_no_path(self):
+        checkpoint = EvalCheckpoint("")
+        checkpoint.start("eval-id")
+        checkpoint.record(uuid.uuid4(), None)
+        self.assertEqual(len(checkpoint.evaluations), 1)
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+
+class _DoneFollower(Agent):
+    """Marks every instruction done. Doesn't declare batching support."""
+
+    def choose_action(self, game_state, action_mask=None):
+        (_, _, _, instructions, _, _) = game_state
+        active = [i for i in instructions if not i.completed and not i.cancelled]
+        return Action.InstructionDone(active[0].uuid)
+
+    def role(self):
+        return Role.FOLLOWER
+
+
+def _SimpleFollower():
+    return LoadAgentFromConfig(
+        AgentConfigData(
+            "cb2game.agents.simple_follower.SimpleFollower",
+            {"default_action": "INSTRUCTION_DONE"},
+        )
+    )
+
+
+class InstructionEvaluatorTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.config = Config()
+        SetGlobalConfig(cls.config)
+        SetDatabaseForTesting()
+        ConnectDatabase()
+        CreateTablesIfNotExists(ListDefaultTables())
+        # Card spawns are drawn from numpy's RNG. Seed both so that the
+        # recorded game doesn't depend on which tests ran before.
+        random.seed(0)
+        np.random.seed(0)
+        leader = LoadAgentFromConfig(
+            AgentConfigData("cb2game.agents.simple_leader.SimpleLeader", {})
+        )
+        PlayGame(
+            LocalGameCoordinator(cls.config), leader, _SimpleFollower(), log_to_db=True
+        )
+        game = Game.select().order_by(Game.id.desc()).get()
+        cls.snapshots = list(InstructionSnapshots(GameEvents(game.id)).values())
+
+    def evaluate(self, agent, batch_size):
+        evaluator = InstructionEvaluator(agent, self.config)
+        outcomes = []
+        for start in range(0, len(self.snapshots), batch_size):
+            outcomes.extend(
+                evaluator.evaluate(self.snapshots[start : start + batch_size])
+            )
+        return outcomes
+
+    def test_lockstep_matches_serial(self):
+        self.assertGreater(len(self.snapshots), 4)
+        random.seed(1)
+        serial = self.evaluate(_SimpleFollower(), 1)
+        random.seed(1)
+        lockstep = self.evaluate(_SimpleFollower(), 4)
+        self.assertEqual(lockstep, serial)
+        self.assertTrue(all(ok for _, ok in serial))
+        self.assertTrue(any(evaluation.success for evaluation, _ in serial))
+
+    def test_unbatched_agent_rejected(self):
+        evaluator = InstructionEvaluator(_DoneFollower(), self.config)
+        with self.assertRaises(ValueError):
+            evaluator.evaluate(self.snapshots[:2])
+        outcomes = evaluator.evaluate(self.snapshots[:1])
+        self.assertEqual(len(outcomes), 1)
+        self.assertTrue(outcomes[0][1])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,15 @@
 """ This class defines a set of helper methods to mask game state from the follower's perspective. """
 import dataclasses
+import functools
 import logging
+import math
 from collections import deque
 
+import numpy as np
+
 from cb2game.server.actor import Actor
 from cb2game.server.config.config import Config
+from cb2game.server.hex import HecsCoord
 from cb2game.server.messages.map_update import MapUpdate
 
 logger = logging.getLogger(__name__)
@@ -22,8 +27,8 @@ FOLLOWER_FOV = 96.5
 UNITY_COORDINATES_SCALE = 3.46
 
 
-def VisibleCoordinates(follower_actor, config):
-    """Given an actor, returns all HecsCoords that are visible to that actor."""
+def _VisibleCoordinatesFrom(location, follower_actor, fog_end):
+    """BFS for the coordinates visible from location. See VisibleCoordinates()."""
     visible_coords = []
 
     # Get the two neighboring cells to the left and right. Special case them.
@@ -31,7 +36,7 @@ def VisibleCoordinates(follower_actor, config):
     visible_coords.extend(neighbor_coords)
 
     # BFS from the follower's location, find all visible coordinates.
-    next_coords = deque([follower_actor.location()])
+    next_coords = deque([location])
     already_visited = set()
     while len(next_coords) > 0:
         coord = next_coords.popleft()
@@ -40,9 +45,9 @@ def VisibleCoordinates(follower_actor, config):
         already_visited.add(coord)
         if coord in visible_coords:
             continue
-        if (coord != follower_actor.location()) and (
-            not CoordinateInViewingDistance(coord, follower_actor, config.fog_end)
-            or not CoordinateInFov(coord, follower_actor, config)
+        if (coord != location) and (
+            not CoordinateInViewingDistance(coord, follower_actor, fog_end)
+            or not _CoordinateInFov(coord, follower_actor)
         ):
             continue
         visible_coords.append(coord)
@@ -52,6 +57,101 @@ def VisibleCoordinates(follower_actor, config):
     return visible_coords
 
 
+@dataclasses.dataclass(frozen=True)
+class _StencilActor(object):
+    """Stands in for a follower at a canonical location when computing stencils."""
+
+    _location: HecsCoord
+    _heading_degrees: int
+
+    def location(self):
+        return self._location
+
+    def heading_degrees(self):
+        return self._heading_degrees
+
+
+@dataclasses.dataclass(frozen=True)
+class VisibilityStencil(object):
+    """Visibility relative to a follower, as (row, col) offsets from its location.
+
+    Visibility only depends on these offsets, the follower's heading, the
+    parity of the follower's row (see HecsCoord.to_offset_coordinates()) and
+    fog_end. So stencils are computed once, by VisibilityStencilFor().
+
+    bfs_rows, bfs_cols: Coordinates returned by VisibleCoordinates(), in order.
+    visible: Set of offsets for which CoordinateIsVisible() is true.
+    visible_rows, visible_cols: The same offsets, as arrays.
+    """
+
+    bfs_rows: np.ndarray
+    bfs_cols: np.ndarray
+    visible: frozenset
+    visible_rows: np.ndarray
+    visible_cols: np.ndarray
+
+
+@functools.lru_cache(maxsize=256)
+def _Stencil(parity, heading_degrees, fog_end):
+    origin = HecsCoord.from_offset(parity, 0)
+    actor = _StencilActor(origin, heading_degrees)
+    bfs = [
+        coord.to_offset_coordinates()
+        for coord in _VisibleCoordinatesFrom(origin, actor, fog_end)
+    ]
+    bfs_rows = np.array([row - parity for row, _ in bfs], dtype=np.int32)
+    bfs_cols = np.array([col for _, col in bfs], dtype=np.int32)
+
+    # Every visible coordinate is within the viewing distance (or adjacent).
+    view_depth = fog_end / UNITY_COORDINATES_SCALE
+    max_cols = int(math.ceil(view_depth + 0.5)) + 1
+    max_rows = int(math.ceil((view_depth + 0.5) / (math.sqrt(3) / 2))) + 1
+    visible = []
+    for row in range(parity - max_rows, parity + max_rows + 1):
+        for col in range(-max_cols, max_cols + 1):
+            coord = HecsCoord.from_offset(row, col)
+            if _CoordinateIsVisibleFrom(coord, actor, fog_end):
+                visible.append((row - parity, col))
+    visible_rows = np.array([row for row, _ in visible], dtype=np.int32)
+    visible_cols = np.array([col for _, col in visible], dtype=np.int32)
+    for array in (bfs_rows, bfs_cols, visible_rows, visible_cols):
+        array.flags.writeable = False
+    return VisibilityStencil(
+        bfs_rows, bfs_cols, frozenset(visible), visible_rows, visible_cols
+    )
+
+
+def VisibilityStencilFor(follower_actor, fog_end):
+    """Returns the follower's VisibilityStencil, and its (row, col) location."""
+    row, col = follower_actor.location().to_offset_coordinates()
+    return _Stencil(row % 2, follower_actor.heading_degrees(), fog_end), (row, col)
+
+
+def VisibleCoordinates(follower_actor, config):
+    """Given an actor, returns all HecsCoords that are visible to that actor."""
+    stencil, (row, col) = VisibilityStencilFor(follower_actor, config.fog_end)
+    return [
+        HecsCoord.from_offset(row + drow, col + dcol)
+        for drow, dcol in zip(stencil.bfs_rows.tolist(), stencil.bfs_cols.tolist())
+    ]
+
+
+def VisibilityMask(follower_actor, fog_end, rows, cols):
+    """Returns a (rows, cols) boolean array. True where CoordinateIsVisible() is true."""
+    stencil, (row, col) = VisibilityStencilFor(follower_actor, fog_end)
+    visible_rows = stencil.visible_rows + row
+    visible_cols = stencil.visible_cols + col
+    in_map = (
+        (0 <= visible_rows)
+        & (visible_rows < rows)
+        & (0 <= visible_cols)
+        & (visible_cols < cols)
+    )
+    mask = np.zeros((rows, cols), dtype=bool)
+    mask[visible_rows[in_map], visible_cols[in_map]] = True
+    return mask
+
+
 def CoordinateInViewingDistance(coord, follower_actor, fog_end):
     """Returns true if the given coordinate should be visible to the given follower with the given config."""
     view_depth = fog_end / UNITY_COORDINATES_SCALE
@@ -62,6 +162,10 @@ def CoordinateInViewingDistance(coord, follower_actor, fog_end):
 
 
 def CoordinateInFov(coord, follower_actor, config):
+    return _CoordinateInFov(coord, follower_actor)
+
+
+def _CoordinateInFov(coord, follower_actor):
     # There's something wrong with orientation... I have to put - 60 everywhere
     # Actor.heading_degrees() (actor.py) is used.
     follower_orientation = follower_actor.heading_degrees() - 60
@@ -89,6 +193,17 @@ def CoordinateNeighborCells(follower_actor):
 
 
 def CoordinateIsVisible(coord, follower_actor, fog_end):
+    """Returns true if the given coordinate should be visible to the given follower."""
+    stencil, location = VisibilityStencilFor(follower_actor, fog_end)
+    return _InStencil(coord, stencil, location)
+
+
+def _InStencil(coord, stencil, location):
+    row, col = coord.to_offset_coordinates()
+    return (row - location[0], col - location[1]) in stencil.visible
+
+
+def _CoordinateIsVisibleFrom(coord, follower_actor, fog_end):
     # Get the two neighboring cells to the left and right. Special case them.
     if coord in CoordinateNeighborCells(follower_actor):
         return True
@@ -128,24 +243,22 @@ def CensorFollowerMap(map_update, follower_actor, config: Config):
         follower_actor: The follower actor. Used to find the actor's location & heading.
         config: The game configuration. Used to determine follower visibility.
     """
-    config.fog_end / UNITY_COORDINATES_SCALE
-    # There's something wrong with orientation... I have to put - 60 everywhere
-    # Actor.heading_degrees() (actor.py) is used.
-    follower_actor.heading_degrees() - 60
-
-    visible_coords = VisibleCoordinates(follower_actor, config)
-    # MapUpdate.tile_at() makes use of an internal tile cache. Calling it causes
-    # side effects, so don't use a list comprehension here (or you'll recreate
-    # the cache a bunch of times)
-    new_tiles = []
-    for coord in visible_coords:
-        tile = map_update.tile_at(coord)
-        if tile is None:
-            continue
-        new_tiles.append(tile)
+    stencil, (row, col) = VisibilityStencilFor(follower_actor, config.fog_end)
+    grid = map_update.grid()
+    rows = stencil.bfs_rows + row
+    cols = stencil.bfs_cols + col
+    in_map = (0 <= rows) & (rows < grid.rows) & (0 <= cols) & (cols < grid.cols)
+    # Gather in VisibleCoordinates() order, skipping cells without tiles.
+    indices = rows[in_map] * grid.cols + cols[in_map]
+    indices = indices[grid.tile_index.flat[indices] >= 0]
+    new_tiles = [map_update.tiles[i] for i in grid.tile_index.flat[indices].tolist()]
     filtered_map_update = MapUpdate(
         map_update.rows, map_update.cols, new_tiles, map_update.metadata
     )
+    # If the censored map is indexed (e.g. for routing), mask the full map's
+    # grid rather than rebuilding one from tiles. The censored map is rebuilt
+    # on every follower observation, so it isn't added to hex_grid_cache.
+    filtered_map_update.set_grid(functools.partial(grid.masked, indices))
     return filtered_map_update
 
 
@@ -160,9 +273,10 @@ def CensorFollowerProps(props, follower_actor, config):
         follower_actor: The follower actor. Used to find the actor's location & heading.
         config: The game configuration. Used to determine follower visibility.
     """
+    stencil, location = VisibilityStencilFor(follower_actor, config.fog_end)
     new_props = []
     for prop in props:
-        if CoordinateIsVisible(prop.prop_info.location, follower_actor, config.fog_end):
+        if _InStencil(prop.prop_info.location, stencil, location):
             new_props.append(dataclasses.replace(prop))
     return new_props
 
@@ -178,9 +292,10 @@ def CensorActors(actors, follower_actor, config):
         follower_actor: The follower actor. Used to find the actor's location & heading.
         config: The game configuration. Used to determine follower visibility.
     """
+    stencil, location = VisibilityStencilFor(follower_actor, config.fog_end)
     new_actors = []
     for actor in actors:
-        if CoordinateIsVisible(actor.location(), follower_actor, config.fog_end):
+        if _InStencil(actor.location(), stencil, location):
             new_actors.append(
                 Actor(
                     actor.actor_id(),
@@ -28,6 +28,7 @@ from cb2game.pyclient.client_messages import (
     NegativeFeedbackMessage,
     PongMessage,
     PositiveFeedbackMessage,
+    StateSyncRequestMessage,
     TutorialNextStepMessage,
 )
 from cb2game.pyclient.follower_data_masking import (
@@ -40,6 +41,7 @@ from cb2game.server.actor import Actor
 from cb2game.server.config.config import Config
 from cb2game.server.lobby_consts import LobbyInfo
 from cb2game.server.map_tools.visualize import GameDisplay
+from cb2game.server.map_utils import ApplyMapUpdateDiff
 from cb2game.server.messages import action as action_module
 from cb2game.server.messages import message_from_server
 from cb2game.server.messages.action import Action, ActionType
@@ -786,7 +788,7 @@ class GameEndpoint(object):
                 )
             if response.type == message_from_server.MessageType.MAP_UPDATE:
                 logger.debug(f"INIT received map")
-                self.map_update = response.map_update
+                self._handle_map_update(response.map_update)
             if response.type == message_from_server.MessageType.PROP_UPDATE:
                 logger.debug(f"INIT received prop")
                 self._handle_prop_update(response.prop_update)
@@ -858,7 +860,30 @@ class GameEndpoint(object):
                 f"state sync for actor {net_actor.actor_id}. location: {actor.location().to_offset_coordinates()} rotation: {actor.heading_degrees()}"
             )
 
+    def _handle_map_update(self, map_update):
+        # The server may send a delta against our last map (see
+        # RemoteClient's map_deltas option).
+        try:
+            self.map_update = ApplyMapUpdateDiff(self.map_update, map_update)
+        except ValueError as e:
+            logger.warning(f"Unable to apply map update: {e}. Requesting full map.")
+            # Keep the stale tiles until the full map arrives, but drop their
+            # version (the server never sends -1) so that no further deltas are
+            # applied on top of them.
+            if self.map_update is not None:
+                self.map_update = dataclasses.replace(self.map_update, version=-1)
+            self.queued_messages.append(StateSyncRequestMessage())
+            return
+        # Index the map once, here. Routing, action masks and observations
+        # reuse the index (see MapUpdate.grid()).
+        self.map_update.grid()
+
     def _handle_message(self, message):
+        if isinstance(message, list):
+            # Batched frame from the server. Handle messages in order.
+            for batched_message in message:
+                self._handle_message(batched_message)
+            return
         logger.debug(
             f"Received message type {message_from_server.MessageType(message.type)} from server"
         )
@@ -904,10 +929,8 @@ class GameEndpoint(object):
         elif message.type == message_from_server.MessageType.GAME_STATE:
             self.turn_state = message.turn_state
         elif message.type == message_from_server.MessageType.MAP_UPDATE:
-            logger.warning(
-                f"Received map update after game started. This is unexpected."
-            )
-            self.map_update = message.map_update
+            logger.debug(f"Received map update after game started.")
+            self._handle_map_update(message.map_update)
         elif message.type == message_from_server.MessageType.OBJECTIVE:
             self.instructions = message.objectives
         elif message.type == message_from_server.MessageType.PING:
@@ -21,6 +21,7 @@ from cb2game.server.lobby import Lobby
 from cb2game.server.lobby_consts import LobbyInfo, LobbyType
 from cb2game.server.map_tools.visualize import GameDisplay
 from cb2game.server.messages.rooms import Role
+from cb2game.server.messages.scenario import Scenario
 from cb2game.server.messages.tutorials import (
     FOLLOWER_TUTORIAL,
     LEADER_TUTORIAL,
@@ -161,6 +162,23 @@ class LocalGameCoordinator:
         Exactly two agents can join this game with JoinGame().
         Returns the game name.
         """
+        return self._CreateGameFromExistingState(event_uuid, None, log_to_db, lobby)
+
+    def CreateGameFromScenario(
+        self, scenario: Scenario, log_to_db: bool = False, lobby: Lobby = DEFAULT_LOBBY
+    ):
+        """Creates a new game from a scenario reconstructed from a recorded game.
+
+        Like CreateGameFromDatabase(), but takes the scenario directly (e.g.
+        from server/scenario_util.py's InstructionSnapshots()), so it doesn't
+        need to be reconstructed from the database.
+
+        Exactly two agents can join this game with JoinGame().
+        Returns the game name.
+        """
+        return self._CreateGameFromExistingState("", scenario, log_to_db, lobby)
+
+    def _CreateGameFromExistingState(self, event_uuid, scenario, log_to_db, lobby):
         game_name = self._unique_game_name()
         if game_name in self._game_drivers:
             raise Exception(
@@ -175,6 +193,7 @@ class LocalGameCoordinator:
             realtime_actions=False,
             log_to_db=log_to_db,
             lobby=lobby,
+            scenario=scenario,
         )
         assert (
             state_machine is not None
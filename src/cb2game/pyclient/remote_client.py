@@ -1,6 +1,7 @@
 import asyncio
 import logging
 import sys
+from collections import deque
 from datetime import datetime, timedelta
 from enum import Enum
 
@@ -77,16 +78,29 @@ class RemoteClient(object):
         ERROR = 8
         MAX = 9
 
-    def __init__(self, url, render=False, lobby_name="bot-sandbox"):
+    def __init__(
+        self,
+        url,
+        render=False,
+        lobby_name="bot-sandbox",
+        batch_messages=True,
+        map_deltas=True,
+    ):
         """Constructor.
 
         Args:
             url: (str) The URL of the server to connect to. Include http:// or https://!
             render: (bool) Whether to render the game using pygame, for the user to see.
             lobby_name: (str) The name of the lobby to join. Default is bot-sandbox. Please don't join other lobbies unless you have contacted the owners of the server.
+            batch_messages: (bool) Ask the server to send all messages from a tick in a single websocket frame. Servers which don't support this ignore it.
+            map_deltas: (bool) Ask the server to only send changed tiles when the map changes mid-game. Servers which don't support this ignore it.
         """
         self.session = None
         self.ws = None
+        self.batch_messages = batch_messages
+        self.map_deltas = map_deltas
+        # Messages received in a batched frame, but not yet returned by _receive_message().
+        self.pending_messages = deque()
         self.render = render  # Whether to render the game with pygame.
         self.Reset()
         self.url = url
@@ -125,6 +139,10 @@ class RemoteClient(object):
         url = f"{self.url}/player_endpoint?is_bot=true"
         if self.lobby_name != "":
             url += f"&lobby_name={self.lobby_name}"
+        if self.batch_messages:
+            url += "&batch_messages=true"
+        if self.map_deltas:
+            url += "&map_deltas=true"
         logger.info(f"Connecting to {url}...")
         session = aiohttp.ClientSession()
         ws = self.event_loop.run_until_complete(session.ws_connect(url))
@@ -150,6 +168,7 @@ class RemoteClient(object):
             self.event_loop.run_until_complete(self.ws.close())
         self.session = None
         self.ws = None
+        self.pending_messages = deque()
         self.player_role = None
         self.player_id = -1
         self.init_state = RemoteClient.State.BEGIN
@@ -334,6 +353,8 @@ class RemoteClient(object):
         return False, "Disconnected"
 
     def _receive_message(self, timeout=timedelta(minutes=1)):
+        if len(self.pending_messages) > 0:
+            return self.pending_messages.popleft(), ""
         try:
             message = self.event_loop.run_until_complete(
                 self.ws.receive(timeout=timeout.total_seconds())
@@ -355,5 +376,14 @@ class RemoteClient(object):
                 None,
                 f"Unexpected message type: {message.type}. data: {message.data}",
             )
+        if message.data.startswith("["):
+            # Batched frame. Return the first message and queue up the rest.
+            self.pending_messages.extend(
+                message_from_server.MessageFromServer.from_dict(data)
+                for data in orjson.loads(message.data)
+            )
+            if len(self.pending_messages) == 0:
+                return None, "Received empty batch."
+            return self.pending_messages.popleft(), ""
         response = message_from_server.MessageFromServer.from_json(message.data)
         return response, ""
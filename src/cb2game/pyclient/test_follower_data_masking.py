@@ -0,0 +1,76 @@
+"""Unit tests for follower visibility masking."""
+import dataclasses
+import unittest
+
+import numpy as np
+
+from cb2game.pyclient.follower_data_masking import (
+    CensorFollowerMap,
+    CoordinateNeighborCells,
+    VisibilityMask,
+    VisibleCoordinates,
+    _CoordinateIsVisibleFrom,
+)
+from cb2game.server.actor import Actor
+from cb2game.server.config.config import Config
+from cb2game.server.config.map_config import MapConfig
+from cb2game.server.hex import HecsCoord
+from cb2game.server.hex_grid import HexGrid, hex_grid_cache
+from cb2game.server.map_provider import RandomMap
+
+
+class FollowerVisibilityTest(unittest.TestCase):
+    def setUp(self):
+        self.map_update = RandomMap(MapConfig(rng_seed=5))
+        self.config = dataclasses.replace(Config(), fog_end=20)
+
+    def followers(self):
+        for row, col in ((0, 0), (7, 12), (12, 3), (self.map_update.rows - 1, 4)):
+            for heading in range(0, 360, 60):
+                yield Actor(1, 0, 0, HecsCoord.from_offset(row, col), False, heading)
+
+    def test_mask_matches_trig_visibility(self):
+        rows, cols = self.map_update.rows, self.map_update.cols
+        for follower in self.followers():
+            mask = VisibilityMask(follower, self.config.fog_end, rows, cols)
+            for row in range(rows):
+                for col in range(cols):
+                    coord = HecsCoord.from_offset(row, col)
+                    # The stencils behind the mask are built with the trig
+                    # visibility test. Check them against it directly.
+                    self.assertEqual(
+                        mask[row, col],
+                        _CoordinateIsVisibleFrom(coord, follower, self.config.fog_end),
+                    )
+
+    def test_visible_coordinates(self):
+        for follower in self.followers():
+            visible = VisibleCoordinates(follower, self.config)
+            self.assertEqual(visible[:2], CoordinateNeighborCells(follower))
+            self.assertIn(follower.location(), visible)
+            self.assertEqual(len(visible), len(set(visible)))
+
+    def test_censored_map_keeps_visible_tiles_in_order(self):
+        for follower in self.followers():
+            visible = VisibleCoordinates(follower, self.config)
+            censored = CensorFollowerMap(self.map_update, follower, self.config)
+            tile_coords = [tile.cell.coord for tile in censored.tiles]
+            self.assertEqual(
+                tile_coords,
+                [coord for coord in visible if self.map_update.grid().in_map(coord)],
+            )
+
+    def test_censored_map_grid_not_cached(self):
+        self.map_update.grid()
+        cache_size = len(hex_grid_cache)
+        for follower in self.followers():
+            censored = CensorFollowerMap(self.map_update, follower, self.config)
+            grid = censored.grid()
+            expected = HexGrid.from_tiles(censored.rows, censored.cols, censored.tiles)
+            np.testing.assert_array_equal(grid.tile_index, expected.tile_index)
+            np.testing.assert_array_equal(grid.passable, expected.passable)
+        self.assertEqual(len(hex_grid_cache), cache_size)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,5 +1,5 @@
 import logging
-from datetime import datetime
+from datetime import datetime, timedelta
 from queue import Queue
 
 from mashumaro.types import SerializableType
@@ -105,6 +105,16 @@ class Actor(SerializableType, use_annotations=True):
             datetime.utcnow() - self._action_start_timestamp
         ).total_seconds() >= self.peek().duration_s
 
+    def time_until_action_done(self):
+        """Returns a timedelta until the next queued action may be applied.
+
+        Only meaningful for realtime actors with pending actions.
+        """
+        action_end = self._action_start_timestamp + timedelta(
+            seconds=self.peek().duration_s
+        )
+        return action_end - datetime.utcnow()
+
     def ProjectedLocation(self):
         return self._projected_location
 
@@ -396,6 +396,34 @@ class Config(DataClassJSONMixin):
     # should not be public should require this password.
     server_password_sha512: str = ""
 
+    # Where pre-generated maps are stored, so that the map pool survives
+    # restarts. Each map config gets its own subdirectory. map_cache_size is the pool's high watermark. When the pool
+    # drops below map_pool_low_watermark, maps are generated until it's full
+    # again, using map_pool_workers processes.
+    map_pool_directory_suffix: str = "map_pool/"
+    map_pool_low_watermark: int = 100
+    map_pool_workers: int = 2
+    # If set, the map pool loads maps from this map corpus file instead of
+    # generating them. See server/scripts/generate_map_corpus.py.
+    map_corpus_path: str = ""
+
+    # Each game's messages are logged to messages_to_server.jsonl.log and
+    # messages_from_server.jsonl.log in its log directory. message_log_level is
+    # "full", "headers" (direction, player, type and transmit time only) or
+    # "none". At level "full", message_log_sample_rate is the fraction of
+    # messages logged in full. The rest are logged as headers.
+    # message_log_compression is "", "gzip" or "zstd" (requires zstandard).
+    message_log_level: str = "full"
+    message_log_sample_rate: float = 1.0
+    message_log_compression: str = ""
+
+    # Scenarios reconstructed from the database (for evals, preset games, etc)
+    # are cached on disk, so they don't need to be replayed from the game's
+    # events again. scenario_cache_size is the maximum number of scenarios
+    # kept. 0 disables the cache. See server/scenario_cache.py.
+    scenario_cache_directory_suffix: str = "scenario_cache/"
+    scenario_cache_size: int = 10000
+
     # Data path accessors that add the requisite data_prefix.
     def data_directory(self):
         # If data_prefix is None or empty string, use appdirs. Else use the prefix.
@@ -423,6 +451,16 @@ class Config(DataClassJSONMixin):
             self.data_directory(), self.backup_db_path_suffix
         ).expanduser()
 
+    def map_pool_directory(self):
+        return pathlib.Path(
+            self.data_directory(), self.map_pool_directory_suffix
+        ).expanduser()
+
+    def scenario_cache_directory(self):
+        return pathlib.Path(
+            self.data_directory(), self.scenario_cache_directory_suffix
+        ).expanduser()
+
     def exception_directory(self):
         return pathlib.Path(self.data_directory(), self.exception_prefix).expanduser()
 
@@ -0,0 +1,118 @@
+""" Backfills event archives from a CB2 sqlite database.
+
+Writes each batch of games' events to one archive (see server/event_archive.py)
+in the output directory. Archives are named by their first and last game ID.
+To archive only games recorded since the last run, pass --from_game_id.
+
+Usage:
+    python3 -m cb2game.server.db_tools.events_to_archive --db_path=game_data.db --archive_dir=archives/
+"""
+import logging
+import pathlib
+
+import fire
+import orjson
+
+from cb2game.server.event_archive import EventArchive, EventArchiveWriter
+from cb2game.server.schemas import base
+from cb2game.server.schemas.event import Event
+from cb2game.server.schemas.game import Game
+
+logger = logging.getLogger(__name__)
+
+
+def SwitchToDatabase(db):
+    base.SetDatabaseByPath(db)
+    base.ConnectDatabase()
+
+
+def ArchiveGames(game_ids, path, verify=False):
+    writer = EventArchiveWriter()
+    query = (
+        Event.select()
+        .where(Event.game << game_ids)
+        .order_by(Event.game, Event.server_time)
+    )
+    for event in query.iterator():
+        writer.append(event)
+    writer.write(path)
+    archive_bytes = path.stat().st_size
+    logger.info(
+        f"Wrote {len(writer)} events from games {game_ids[0]}-{game_ids[-1]} to {path}. "
+        f"{writer.data_bytes_in} bytes of event data -> {archive_bytes} bytes archived."
+    )
+    if verify:
+        VerifyArchive(path, query)
+    return len(writer), writer.data_bytes_in, archive_bytes
+
+
+def ParsedData(data):
+    if data is None:
+        return None
+    try:
+        return orjson.loads(data)
+    except orjson.JSONDecodeError:
+        return data
+
+
+def VerifyArchive(path, query):
+    """Checks that every event in the archive matches the database."""
+    archive = EventArchive(path)
+    count = 0
+    for archived, event in zip(archive, query.clone().iterator()):
+        # Archived data is compact JSON, so compare parsed values.
+        if (
+            archived.id != event.id
+            or archived.type != event.type
+            or archived.tick != event.tick
+            or archived.parent_event_id != event.parent_event_id
+            or archived.short_code != event.short_code
+            or archived.location != event.location
+            or ParsedData(archived.data) != ParsedData(event.data)
+        ):
+            raise ValueError(f"Archived event {archived.id} differs from database.")
+        count += 1
+    if count != len(archive):
+        raise ValueError(f"Archive {path} has {len(archive)} events, expected {count}.")
+    logger.info(f"Verified {count} events in {path}.")
+
+
+def main(
+    db_path,
+    archive_dir,
+    games_per_archive: int = 500,
+    from_game_id: int = 0,
+    verify: bool = False,
+):
+    logging.basicConfig(level=logging.INFO)
+    SwitchToDatabase(db_path)
+    archive_dir = pathlib.Path(archive_dir)
+    archive_dir.mkdir(parents=True, exist_ok=True)
+    database = base.GetDatabase()
+    with database.connection_context():
+        game_ids = [
+            game.id
+            for game in Game.select(Game.id)
+            .where(Game.id >= from_game_id)
+            .order_by(Game.id)
+        ]
+        logger.info(f"Archiving events from {len(game_ids)} games...")
+        events = data_bytes = archive_bytes = 0
+        for start in range(0, len(game_ids), games_per_archive):
+            batch = game_ids[start : start + games_per_archive]
+            path = archive_dir / f"events_{batch[0]:08d}_{batch[-1]:08d}.npz"
+            batch_events, batch_data_bytes, batch_archive_bytes = ArchiveGames(
+                batch, path, verify
+            )
+            events += batch_events
+            data_bytes += batch_data_bytes
+            archive_bytes += batch_archive_bytes
+    logger.info(
+        f"Archived {events} events. {data_bytes} bytes of event data -> {archive_bytes} bytes."
+    )
+    if game_ids:
+        logger.info(f"To archive later games, pass --from_game_id={game_ids[-1] + 1}")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -19,6 +19,7 @@ import fire
 import cb2game.server.db_tools.db_utils as db_utils
 import cb2game.server.schemas.defaults as defaults_db
 from cb2game.server.config import config
+from cb2game.server.message_log import OpenMessageLog
 from cb2game.server.messages.logs import Direction
 from cb2game.server.messages.message_from_server import MessageType
 from cb2game.server.schemas import base
@@ -94,14 +95,18 @@ def main(
         messages_from_server_file = game_dir / "messages_from_server.jsonl.log"
 
         messages_from_server = []
-        with messages_from_server_file.open() as f:
+        with OpenMessageLog(messages_from_server_file) as f:
             for line in f:
                 try:
                     message = json.loads(line)
                 except json.decoder.JSONDecodeError:
                     logger.warning(f"Could not decode line {line}")
                     continue
-                if message["message_direction"] == Direction.FROM_SERVER.value:
+                # Entries logged as headers only have no message body.
+                if (
+                    message["message_direction"] == Direction.FROM_SERVER.value
+                    and "message_from_server" in message
+                ):
                     messages_from_server.append(message["message_from_server"])
 
         logger.info(f"Found {len(messages_from_server)} messages from server")
@@ -0,0 +1,158 @@
+""" Writes database rows from a background thread, in batched transactions.
+
+Game events are recorded as they happen, from the event loop which runs every
+room. Saving each row synchronously means every SQLite commit (and any lock
+wait) stalls all games at once. Instead, GameRecorder queues rows into a
+DatabaseWriter, which commits them from a dedicated thread. Rows queued close
+together are grouped into one transaction (group commit), and no row waits
+longer than MAX_BATCH_DELAY_S before its transaction starts.
+
+Rows are written in the order they were queued, so a row may reference
+(foreign key) any row queued before it. Call flush() before reading back
+anything that was queued.
+"""
+import atexit
+import logging
+import queue
+import threading
+import time
+
+from cb2game.server.schemas.base import GetDatabase
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of writes per transaction.
+MAX_BATCH_SIZE = 500
+# Maximum time a write waits for more writes to batch with.
+MAX_BATCH_DELAY_S = 0.05
+
+
+class DatabaseWriter(object):
+    """Saves peewee models in the background. See the top of this file."""
+
+    def __init__(self, threaded=True):
+        self._threaded = threaded
+        self._queue = queue.Queue()
+        self._thread = None
+        self._closed = False
+        # Metrics.
+        self.rows_written = 0
+        self.transactions = 0
+        if self._threaded:
+            self._thread = threading.Thread(
+                target=self._run, name="DatabaseWriter", daemon=True
+            )
+            self._thread.start()
+
+    def insert(self, model):
+        """Queues a new row for insertion."""
+        self._put((model, True))
+
+    def save(self, model):
+        """Queues an update of an existing row."""
+        self._put((model, False))
+
+    def flush(self, timeout=None):
+        """Blocks until everything queued so far has been committed.
+
+        Returns False if the timeout expired first.
+        """
+        if not self._threaded or self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def close(self):
+        """Commits everything queued so far and stops the writer thread."""
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        if self._threaded:
+            self._queue.put(None)
+            self._thread.join()
+
+    def _put(self, item):
+        if self._closed or not self._threaded:
+            self._write([item])
+            return
+        self._queue.put(item)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if isinstance(item, threading.Event):
+                # Everything queued before this flush is already committed.
+                item.set()
+                continue
+            batch = [item]
+            deadline = time.monotonic() + MAX_BATCH_DELAY_S
+            while len(batch) < MAX_BATCH_SIZE:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    next_item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                if next_item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(next_item)
+                if isinstance(next_item, threading.Event):
+                    # Someone's waiting on a flush. Don't make them wait longer.
+                    break
+            rows = [item for item in batch if not isinstance(item, threading.Event)]
+            self._write(rows)
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()
+        if self._threaded:
+            GetDatabase().close()
+
+    def _write(self, rows):
+        if len(rows) == 0:
+            return
+        database = GetDatabase()
+        # Connections are per-thread.
+        database.connect(reuse_if_open=True)
+        try:
+            with database.atomic():
+                for model, force_insert in rows:
+                    model.save(force_insert=force_insert)
+        except Exception as e:
+            # Retry individually, so that one bad row doesn't lose the batch.
+            logger.error(f"Batched write of {len(rows)} rows failed: {e}. Retrying.")
+            for model, force_insert in rows:
+                try:
+                    model.save(force_insert=force_insert)
+                except Exception as e:
+                    logger.error(f"Unable to write {type(model).__name__}: {e}")
+        self.rows_written += len(rows)
+        self.transactions += 1
+
+
+# Shared by all game recorders. SQLite only allows one writer at a time anyway.
+database_writer = None
+synchronous_writer = DatabaseWriter(threaded=False)
+
+
+def GetDatabaseWriter():
+    """Returns the shared background writer.
+
+    In-memory databases are per-connection (and so per-thread), so for those
+    this returns a writer which saves synchronously.
+    """
+    global database_writer
+    if GetDatabase().database == ":memory:":
+        return synchronous_writer
+    if database_writer is None:
+        database_writer = DatabaseWriter()
+        atexit.register(database_writer.close)
+    return database_writer
@@ -0,0 +1,602 @@
+""" A compact, columnar archive format for recorded game events.
+
+The game database stores each Event as a row, with its data as pretty-printed
+JSON text. That's convenient to query, but large and slow to scan. A single
+MAP_UPDATE is hundreds of kilobytes of text, and reading a game back means
+parsing JSON for every action.
+
+An event archive stores the same events as columns in one compressed .npz file.
+Fixed-width fields (type, tick, times, location...) are numpy arrays. Map tiles
+and actions, which make up most of a game's data, are stored as fixed-width
+records (TILE_DTYPE and ACTION_DTYPE). All other data is stored as compact
+JSON. Variable-length strings are stored as one buffer plus offsets.
+
+EventArchive reads an archive back as ArchivedEvent objects, which have the
+same fields as schemas.event.Event. Their data is compact JSON which parses to
+the same value as the original. The columns themselves are also available, for
+analyses which don't need to decode every event.
+
+To convert an existing database, see db_tools/events_to_archive.py.
+"""
+import logging
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from enum import IntEnum
+from typing import Iterator, Optional
+
+import numpy as np
+import orjson
+
+from cb2game.server.hex import HecsCoord
+from cb2game.server.schemas.event import Event, EventType
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_VERSION = 1
+
+# Stored in nullable integer columns in place of None.
+NULL_INT = np.iinfo(np.int64).min
+# Stored in place of a UTC offset for naive datetimes.
+NULL_UTC_OFFSET = np.iinfo(np.int16).min
+
+EPOCH = datetime(1970, 1, 1)
+
+
+class DataKind(IntEnum):
+    """How an event's data is stored."""
+
+    NONE = 0
+    # Compact JSON, in the data buffer.
+    JSON = 1
+    # A MapUpdate. Compact JSON with empty tiles, plus a run of tile records.
+    MAP_UPDATE = 2
+    # An Action. One action record.
+    ACTION = 3
+    # Data which isn't valid JSON. Stored verbatim in the data buffer.
+    TEXT = 4
+
+
+# JSON numbers which may be floats or ints are stored as floats. int_fields
+# records which of them were ints, bit i corresponding to the i'th such field.
+TILE_DTYPE = np.dtype(
+    [
+        ("asset_id", "<i2"),
+        ("a", "u1"),
+        ("r", "<i2"),
+        ("c", "<i2"),
+        ("edges", "u1"),
+        ("height", "<f8"),
+        ("layer", "<i2"),
+        ("rotation_degrees", "<i2"),
+        ("int_fields", "u1"),
+    ]
+)
+
+ACTION_DTYPE = np.dtype(
+    [
+        ("id", "<i8"),
+        ("action_type", "u1"),
+        ("animation_type", "u1"),
+        ("a", "u1"),
+        ("r", "<i2"),
+        ("c", "<i2"),
+        ("rotation", "<f8"),
+        ("border_radius", "<f8"),
+        ("border_color", "<f8", (4,)),
+        ("duration_s", "<f8"),
+        ("expiration_us", "<i8"),
+        ("expiration_utc_offset_min", "<i2"),
+        ("has_follower_color", "u1"),
+        ("border_color_follower_pov", "<f8", (4,)),
+        ("int_fields", "<u2"),
+    ]
+)
+
+COLOR_KEYS = ("r", "g", "b", "a")
+
+
+def _EncodeNumbers(values):
+    """Returns values as floats, and a bitmask of which ones were ints."""
+    mask = 0
+    floats = []
+    for i, value in enumerate(values):
+        if type(value) is int:
+            mask |= 1 << i
+        elif type(value) is not float:
+            raise ValueError(f"Expected a number, got {value!r}")
+        floats.append(float(value))
+    return floats, mask
+
+
+def _DecodeNumbers(floats, mask):
+    return [int(value) if mask & (1 << i) else value for i, value in enumerate(floats)]
+
+
+def _EncodeTimestamp(text):
+    """Encodes an ISO timestamp as (microseconds since epoch, UTC offset)."""
+    timestamp = datetime.fromisoformat(text)
+    offset = timestamp.utcoffset()
+    if offset is None:
+        offset_min = NULL_UTC_OFFSET
+    else:
+        offset_min = offset // timedelta(minutes=1)
+        timestamp = timestamp.replace(tzinfo=None) - offset
+    return (timestamp - EPOCH) // timedelta(microseconds=1), offset_min
+
+
+def _DecodeTimestamp(us, offset_min):
+    timestamp = EPOCH + timedelta(microseconds=int(us))
+    if offset_min == NULL_UTC_OFFSET:
+        return timestamp.isoformat()
+    offset = timedelta(minutes=int(offset_min))
+    return (timestamp + offset).replace(tzinfo=timezone(offset)).isoformat()
+
+
+def _EncodeTiles(tiles):
+    records = np.empty(len(tiles), dtype=TILE_DTYPE)
+    for i, tile in enumerate(tiles):
+        cell = tile["cell"]
+        coord = cell["coord"]
+        (height,), int_fields = _EncodeNumbers([cell["height"]])
+        records[i] = (
+            tile["asset_id"],
+            coord["a"],
+            coord["r"],
+            coord["c"],
+            cell["boundary"]["edges"],
+            height,
+            cell["layer"],
+            tile["rotation_degrees"],
+            int_fields,
+        )
+    return records
+
+
+def _DecodeTiles(records):
+    tiles = []
+    for (
+        asset_id,
+        a,
+        r,
+        c,
+        edges,
+        height,
+        layer,
+        rotation_degrees,
+        int_fields,
+    ) in records.tolist():
+        (height,) = _DecodeNumbers([height], int_fields)
+        tiles.append(
+            {
+                "asset_id": asset_id,
+                "cell": {
+                    "coord": {"a": a, "r": r, "c": c},
+                    "boundary": {"edges": edges},
+                    "height": height,
+                    "layer": layer,
+                },
+                "rotation_degrees": rotation_degrees,
+            }
+        )
+    return tiles
+
+
+def _EncodeAction(action):
+    displacement = action["displacement"]
+    follower_color = action["border_color_follower_pov"]
+    numbers = [action["rotation"], action["border_radius"], action["duration_s"]]
+    numbers += [action["border_color"][key] for key in COLOR_KEYS]
+    if follower_color is not None:
+        numbers += [follower_color[key] for key in COLOR_KEYS]
+    floats, int_fields = _EncodeNumbers(numbers)
+    expiration_us, offset_min = _EncodeTimestamp(action["expiration"])
+    record = np.zeros((), dtype=ACTION_DTYPE)
+    record[()] = (
+        action["id"],
+        action["action_type"],
+        action["animation_type"],
+        displacement["a"],
+        displacement["r"],
+        displacement["c"],
+        floats[0],
+        floats[1],
+        floats[3:7],
+        floats[2],
+        expiration_us,
+        offset_min,
+        follower_color is not None,
+        floats[7:11] if follower_color is not None else [0.0] * 4,
+        int_fields,
+    )
+    return record
+
+
+def _DecodeAction(record):
+    (
+        id,
+        action_type,
+        animation_type,
+        a,
+        r,
+        c,
+        rotation,
+        border_radius,
+        border_color,
+        duration_s,
+        expiration_us,
+        offset_min,
+        has_follower_color,
+        follower_color,
+        int_fields,
+    ) = record.tolist()
+    # Sub-array fields are returned as numpy arrays.
+    numbers = [rotation, border_radius, duration_s] + border_color.tolist()
+    if has_follower_color:
+        numbers += follower_color.tolist()
+    numbers = _DecodeNumbers(numbers, int_fields)
+    return {
+        "id": id,
+        "action_type": action_type,
+        "animation_type": animation_type,
+        "displacement": {"a": a, "r": r, "c": c},
+        "rotation": numbers[0],
+        "border_radius": numbers[1],
+        "border_color": dict(zip(COLOR_KEYS, numbers[3:7])),
+        "duration_s": numbers[2],
+        "expiration": _DecodeTimestamp(expiration_us, offset_min),
+        "border_color_follower_pov": dict(zip(COLOR_KEYS, numbers[7:11]))
+        if has_follower_color
+        else None,
+    }
+
+
+def _DatetimeToMicros(value):
+    if value is None:
+        return NULL_INT
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return (value - EPOCH) // timedelta(microseconds=1)
+
+
+def _MicrosToDatetime(value):
+    if value == NULL_INT:
+        return None
+    return EPOCH + timedelta(microseconds=int(value))
+
+
+def _UuidBytes(value):
+    if value is None:
+        # uuid4() never generates the nil UUID.
+        return bytes(16)
+    if not isinstance(value, uuid.UUID):
+        value = uuid.UUID(str(value))
+    return value.bytes
+
+
+def _NullableInt(value):
+    return NULL_INT if value is None else int(value)
+
+
+def _PackStrings(strings):
+    """Packs a list of optional strings into (offsets, buffer, null mask)."""
+    encoded = [b"" if s is None else s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    np.cumsum([len(s) for s in encoded], out=offsets[1:])
+    buffer = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return offsets, buffer, np.array([s is None for s in strings], dtype=bool)
+
+
+@dataclass
+class ArchivedEvent(object):
+    """An event read from an archive. Has the same fields as schemas.event.Event.
+
+    game_id and parent_event_id are IDs, rather than database records. Use
+    to_event() to get an (unsaved) Event record.
+    """
+
+    id: uuid.UUID
+    game_id: int
+    type: int
+    turn_number: Optional[int]
+    tick: int
+    server_time: datetime
+    client_time: Optional[datetime]
+    origin: int
+    role: str
+    parent_event_id: Optional[uuid.UUID]
+    data: Optional[str]
+    short_code: Optional[str]
+    location: Optional[HecsCoord]
+    orientation: Optional[int]
+
+    def to_event(self):
+        return Event(
+            id=self.id,
+            game=self.game_id,
+            type=self.type,
+            turn_number=self.turn_number,
+            tick=self.tick,
+            server_time=self.server_time,
+            client_time=self.client_time,
+            origin=self.origin,
+            role=self.role,
+            parent_event=self.parent_event_id,
+            data=self.data,
+            short_code=self.short_code,
+            location=self.location,
+            orientation=self.orientation,
+        )
+
+
+class EventArchiveWriter(object):
+    """Accumulates events, then writes them to an archive file.
+
+    Accepts schemas.event.Event records or ArchivedEvents.
+    """
+
+    def __init__(self):
+        self._ids = []
+        self._game_ids = []
+        self._types = []
+        self._turn_numbers = []
+        self._ticks = []
+        self._server_times = []
+        self._client_times = []
+        self._origins = []
+        self._role_indices = []
+        self._roles = {}
+        self._parent_ids = []
+        self._short_codes = []
+        self._locations = []
+        self._has_location = []
+        self._orientations = []
+        self._data_kinds = []
+        self._data_text = []
+        self._record_indices = []
+        self._tiles = []
+        self._map_tile_offsets = [0]
+        self._actions = []
+        # Metrics.
+        self.data_bytes_in = 0
+
+    def __len__(self):
+        return len(self._ids)
+
+    def append(self, event):
+        self._ids.append(_UuidBytes(event.id))
+        self._game_ids.append(event.game_id)
+        self._types.append(int(event.type))
+        self._turn_numbers.append(_NullableInt(event.turn_number))
+        self._ticks.append(int(event.tick))
+        self._server_times.append(_DatetimeToMicros(event.server_time))
+        self._client_times.append(_DatetimeToMicros(event.client_time))
+        self._origins.append(int(event.origin))
+        if event.role is None:
+            self._role_indices.append(-1)
+        else:
+            self._role_indices.append(
+                self._roles.setdefault(event.role, len(self._roles))
+            )
+        self._parent_ids.append(_UuidBytes(event.parent_event_id))
+        self._short_codes.append(event.short_code)
+        location = event.location
+        self._has_location.append(location is not None)
+        self._locations.append(
+            (location.a, location.r, location.c) if location is not None else (0, 0, 0)
+        )
+        self._orientations.append(_NullableInt(event.orientation))
+        self._append_data(event.type, event.data)
+
+    def _append_data(self, event_type, data):
+        if data is None:
+            self._append_encoded(DataKind.NONE, None, NULL_INT)
+            return
+        self.data_bytes_in += len(data)
+        try:
+            value = orjson.loads(data)
+        except orjson.JSONDecodeError:
+            self._append_encoded(DataKind.TEXT, data.encode("utf-8"), NULL_INT)
+            return
+        compact = orjson.dumps(value)
+        if event_type == EventType.MAP_UPDATE:
+            if self._append_map_update(value, compact):
+                return
+        elif event_type == EventType.ACTION:
+            if self._append_action(value, compact):
+                return
+        self._append_encoded(DataKind.JSON, compact, NULL_INT)
+
+    def _append_map_update(self, value, compact):
+        try:
+            tiles = _EncodeTiles(value["tiles"])
+            remainder = orjson.dumps(dict(value, tiles=[]))
+            decoded = _SpliceTiles(remainder, _DecodeTiles(tiles))
+        except Exception as e:
+            logger.debug(f"Storing map update as JSON. Unable to encode tiles: {e}")
+            return False
+        # Anything the records can't represent exactly falls back to JSON.
+        if decoded != compact:
+            return False
+        self._tiles.append(tiles)
+        self._map_tile_offsets.append(self._map_tile_offsets[-1] + len(tiles))
+        self._append_encoded(
+            DataKind.MAP_UPDATE, remainder, len(self._map_tile_offsets) - 2
+        )
+        return True
+
+    def _append_action(self, value, compact):
+        try:
+            record = _EncodeAction(value)
+            decoded = orjson.dumps(_DecodeAction(record))
+        except Exception as e:
+            logger.debug(f"Storing action as JSON. Unable to encode action: {e}")
+            return False
+        if decoded != compact:
+            return False
+        self._actions.append(record)
+        self._append_encoded(DataKind.ACTION, None, len(self._actions) - 1)
+        return True
+
+    def _append_encoded(self, kind, text, record_index):
+        self._data_kinds.append(kind)
+        self._data_text.append(text)
+        self._record_indices.append(record_index)
+
+    def write(self, path):
+        """Writes all events appended so far to path (an .npz file)."""
+        n = len(self._ids)
+        short_code_offsets, short_code_bytes, short_code_null = _PackStrings(
+            self._short_codes
+        )
+        data_offsets = np.zeros(n + 1, dtype=np.int64)
+        np.cumsum(
+            [0 if text is None else len(text) for text in self._data_text],
+            out=data_offsets[1:],
+        )
+        data_bytes = np.frombuffer(
+            b"".join(text for text in self._data_text if text is not None),
+            dtype=np.uint8,
+        )
+        roles = sorted(self._roles, key=self._roles.get)
+        with open(path, "wb") as archive_file:
+            np.savez_compressed(
+                archive_file,
+                version=np.array(ARCHIVE_VERSION),
+                id=np.frombuffer(b"".join(self._ids), dtype=np.uint8).reshape(n, 16),
+                game_id=np.array(self._game_ids, dtype=np.int64),
+                type=np.array(self._types, dtype=np.uint8),
+                turn_number=np.array(self._turn_numbers, dtype=np.int64),
+                tick=np.array(self._ticks, dtype=np.int64),
+                server_time=np.array(self._server_times, dtype=np.int64),
+                client_time=np.array(self._client_times, dtype=np.int64),
+                origin=np.array(self._origins, dtype=np.uint8),
+                role_index=np.array(self._role_indices, dtype=np.int16),
+                roles=np.array(roles, dtype=np.str_),
+                parent_event_id=np.frombuffer(
+                    b"".join(self._parent_ids), dtype=np.uint8
+                ).reshape(n, 16),
+                short_code_offsets=short_code_offsets,
+                short_code_bytes=short_code_bytes,
+                short_code_null=short_code_null,
+                location=np.array(self._locations, dtype=np.int32).reshape(n, 3),
+                has_location=np.array(self._has_location, dtype=bool),
+                orientation=np.array(self._orientations, dtype=np.int64),
+                data_kind=np.array(self._data_kinds, dtype=np.uint8),
+                data_offsets=data_offsets,
+                data_bytes=data_bytes,
+                record_index=np.array(self._record_indices, dtype=np.int64),
+                map_tile_offsets=np.array(self._map_tile_offsets, dtype=np.int64),
+                tiles=np.concatenate(self._tiles)
+                if self._tiles
+                else np.empty(0, dtype=TILE_DTYPE),
+                actions=np.array(self._actions, dtype=ACTION_DTYPE),
+            )
+
+
+def _SpliceTiles(remainder, tiles):
+    # rows & cols precede tiles, so the first match is the top-level field.
+    return remainder.replace(b'"tiles":[]', b'"tiles":' + orjson.dumps(tiles), 1)
+
+
+def WriteEventArchive(path, events):
+    """Writes an iterable of events to an archive. Returns the event count."""
+    writer = EventArchiveWriter()
+    for event in events:
+        writer.append(event)
+    writer.write(path)
+    return len(writer)
+
+
+class EventArchive(object):
+    """Reads an archive written by EventArchiveWriter."""
+
+    def __init__(self, path):
+        with np.load(path) as archive:
+            self._columns = {name: archive[name] for name in archive.files}
+        version = int(self._columns["version"])
+        if version != ARCHIVE_VERSION:
+            raise ValueError(
+                f"Unsupported event archive version {version} in {path}. Expected {ARCHIVE_VERSION}."
+            )
+        self._data_bytes = self._columns["data_bytes"].tobytes()
+        self._short_code_bytes = self._columns["short_code_bytes"].tobytes()
+        self._roles = self._columns["roles"].tolist()
+
+    def __len__(self):
+        return len(self._columns["id"])
+
+    def __iter__(self):
+        return self.events()
+
+    def column(self, name):
+        """Returns a column of the archive as a numpy array. See EventArchiveWriter.write."""
+        return self._columns[name]
+
+    def game_ids(self):
+        return np.unique(self._columns["game_id"])
+
+    def events(self, game_id=None, event_types=None) -> Iterator[ArchivedEvent]:
+        """Yields events, in the order they were written.
+
+        Optionally filters by game ID and a list of event types.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if game_id is not None:
+            mask &= self._columns["game_id"] == game_id
+        if event_types is not None:
+            mask &= np.isin(self._columns["type"], [int(t) for t in event_types])
+        for index in np.flatnonzero(mask):
+            yield self.event(index)
+
+    def event(self, index) -> ArchivedEvent:
+        columns = self._columns
+        parent_id = columns["parent_event_id"][index].tobytes()
+        role_index = columns["role_index"][index]
+        short_code = None
+        if not columns["short_code_null"][index]:
+            start, end = columns["short_code_offsets"][index : index + 2]
+            short_code = self._short_code_bytes[start:end].decode("utf-8")
+        location = None
+        if columns["has_location"][index]:
+            location = HecsCoord(*columns["location"][index].tolist())
+        return ArchivedEvent(
+            id=uuid.UUID(bytes=columns["id"][index].tobytes()),
+            game_id=int(columns["game_id"][index]),
+            type=int(columns["type"][index]),
+            turn_number=_NullableValue(columns["turn_number"][index]),
+            tick=int(columns["tick"][index]),
+            server_time=_MicrosToDatetime(columns["server_time"][index]),
+            client_time=_MicrosToDatetime(columns["client_time"][index]),
+            origin=int(columns["origin"][index]),
+            role=self._roles[role_index] if role_index >= 0 else None,
+            parent_event_id=uuid.UUID(bytes=parent_id) if any(parent_id) else None,
+            data=self._data(index),
+            short_code=short_code,
+            location=location,
+            orientation=_NullableValue(columns["orientation"][index]),
+        )
+
+    def _data(self, index):
+        columns = self._columns
+        kind = columns["data_kind"][index]
+        if kind == DataKind.NONE:
+            return None
+        if kind == DataKind.ACTION:
+            record = columns["actions"][columns["record_index"][index]]
+            return orjson.dumps(_DecodeAction(record)).decode("utf-8")
+        start, end = columns["data_offsets"][index : index + 2]
+        text = self._data_bytes[start:end]
+        if kind == DataKind.MAP_UPDATE:
+            map_index = columns["record_index"][index]
+            tile_start, tile_end = columns["map_tile_offsets"][
+                map_index : map_index + 2
+            ]
+            text = _SpliceTiles(
+                text, _DecodeTiles(columns["tiles"][tile_start:tile_end])
+            )
+        return text.decode("utf-8")
+
+
+def _NullableValue(value):
+    return None if value == NULL_INT else int(value)
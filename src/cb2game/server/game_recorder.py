@@ -9,7 +9,9 @@ import orjson
 import cb2game.server.messages.live_feedback as live_feedback
 import cb2game.server.schemas as schemas
 from cb2game.server.card import Card
+from cb2game.server.db_writer import GetDatabaseWriter
 from cb2game.server.hex import HecsCoord
+from cb2game.server.map_payload import MapUpdateDbJson
 from cb2game.server.messages.action import Action
 from cb2game.server.messages.feedback_questions import (
     FeedbackQuestion,
@@ -40,7 +42,7 @@ def EventFromMapUpdate(game, tick: int, map_update):
         turn_number=0,
         tick=tick,
         origin=EventOrigin.SERVER,
-        data=JsonSerialize(map_update),
+        data=MapUpdateDbJson(map_update),
     )
 
 
@@ -323,6 +325,8 @@ class GameRecorder(object):
         self._disabled = disabled
         if self._disabled:
             return
+        # Rows are written in the background. See db_writer.py.
+        self._writer = GetDatabaseWriter()
         self._last_move = None
         self._instruction_number = 1
         self._instruction_queue = Queue()
@@ -339,6 +343,11 @@ class GameRecorder(object):
 
         self._last_follower_move = None
 
+        # Maps from instruction/question UUID to the event which recorded it.
+        # Saves querying the database each time an event references one.
+        self._instruction_events = {}
+        self._question_events = {}
+
     def record(self):
         if self._disabled:
             return None
@@ -350,7 +359,7 @@ class GameRecorder(object):
         if self._disabled:
             return
         self._game_record.number_cards = len(prop_update.props)
-        self._game_record.save()
+        self._writer.save(self._game_record)
 
         if leader is None and follower is None:
             logger.warning(
@@ -360,7 +369,7 @@ class GameRecorder(object):
         initial_state_event = EventFromInitialState(
             self._game_record, tick, leader, follower
         )
-        initial_state_event.save(force_insert=True)
+        self._writer.insert(initial_state_event)
         self.record_map_update(map_update)
         self.record_turn_state(turn_state)
         self.record_prop_update(prop_update)
@@ -372,14 +381,14 @@ class GameRecorder(object):
         if self._disabled:
             return
         event = EventFromMapUpdate(self._game_record, self._tick, map_update)
-        event.save(force_insert=True)
+        self._writer.insert(event)
 
     def record_prop_update(self, prop_update):
         if self._disabled:
             return
         # Record the prop update to the database.
         event = EventFromPropUpdate(self._game_record, self._tick, prop_update)
-        event.save(force_insert=True)
+        self._writer.insert(event)
 
     def record_card_spawn(self, card: Card):
         if self._disabled:
@@ -387,7 +396,7 @@ class GameRecorder(object):
         event = EventFromCardSpawn(
             self._game_record, self._turn_number, self._tick, card
         )
-        event.save(force_insert=True)
+        self._writer.insert(event)
 
     def record_card_selection(self, actor, card: Card):
         if self._disabled:
@@ -406,7 +415,7 @@ class GameRecorder(object):
             card,
             self._last_move,
         )
-        event.save(force_insert=True)
+        self._writer.insert(event)
 
     def record_card_set(self, actor, cards: List[Card], score):
         if self._disabled:
@@ -426,7 +435,7 @@ class GameRecorder(object):
             score,
             self._last_move,
         )
-        event.save(force_insert=True)
+        self._writer.insert(event)
 
     def record_instruction_sent(self, objective):
         if self._disabled:
@@ -434,7 +443,8 @@ class GameRecorder(object):
         event = EventFromInstructionSent(
             self._game_record, self._turn_number, self._tick, objective
         )
-        event.save(force_insert=True)
+        self._instruction_events[objective.uuid] = event
+        self._writer.insert(event)
 
     def record_instruction_activated(self, objective):
         if self._disabled:
@@ -452,7 +462,7 @@ class GameRecorder(object):
             instruction_event,
             objective.uuid,
         )
-        event.save(force_insert=True)
+        self._writer.insert(event)
 
     def record_instruction_complete(self, objective_complete):
         if self._disabled:
@@ -472,7 +482,7 @@ class GameRecorder(object):
             instruction_event,
             objective_complete.uuid,
         )
-        event.save(force_insert=True)
+        self._writer.insert(event)
 
     def record_action(self, action, action_code, position, heading):
         if self._disabled:
@@ -488,7 +498,7 @@ class GameRecorder(object):
             heading,
             action_code,
         )
-        event.save(force_insert=True)
+        self._writer.insert(event)
 
     def record_move(
         self, actor, action: Action, active_instruction, position_before, heading_before
@@ -520,7 +530,7 @@ class GameRecorder(object):
         if actor.role == Role.FOLLOWER:
             self._last_follower_move = event
         self._last_move = event
-        event.save(force_insert=True)
+        self._writer.insert(event)
 
     def record_live_feedback(self, feedback, follower, active_instruction):
         if self._disabled:
@@ -533,7 +543,7 @@ class GameRecorder(object):
             follower,
             self._last_follower_move,
         )
-        event.save(force_insert=True)
+        self._writer.insert(event)
 
     def record_instruction_cancelled(self, objective):
         if self._disabled:
@@ -549,7 +559,7 @@ class GameRecorder(object):
             instruction_event,
             objective.uuid,
         )
-        event.save(force_insert=True)
+        self._writer.insert(event)
 
     def record_start_of_turn(
         self,
@@ -575,7 +585,7 @@ class GameRecorder(object):
         event = EventFromStartOfTurn(
             self._game_record, self._tick, turn_state, short_code
         )
-        event.save(force_insert=True)
+        self._writer.insert(event)
 
     def record_turn_state(self, turn_state, reason=""):
         if self._disabled:
@@ -585,10 +595,10 @@ class GameRecorder(object):
         event = EventFromTurnState(
             self._game_record, self._tick, turn_state, short_code
         )
-        event.save(force_insert=True)
+        self._writer.insert(event)
         self._game_record.score = turn_state.score
         self._game_record.number_turns = turn_state.turn_number
-        self._game_record.save()
+        self._writer.save(self._game_record)
 
     def record_feedback_question(self, feedback_question: FeedbackQuestion):
         if self._disabled:
@@ -599,7 +609,8 @@ class GameRecorder(object):
             self._tick,
             feedback_question,
         )
-        event.save(force_insert=True)
+        self._question_events[feedback_question.uuid] = event
+        self._writer.insert(event)
 
     def record_feedback_response(self, feedback_response: FeedbackResponse):
         if self._disabled:
@@ -617,14 +628,17 @@ class GameRecorder(object):
             question_event,
             feedback_response,
         )
-        event.save(force_insert=True)
+        self._writer.insert(event)
 
     def record_game_over(self):
         if self._disabled:
             return
         self._game_record.completed = True
         self._game_record.end_time = datetime.utcnow()
-        self._game_record.save()
+        self._writer.save(self._game_record)
+        # Everything about the game must be in the database before it's used
+        # to update leaderboards, experience tables, etc.
+        self._writer.flush()
 
     def kvals(self):
         if self._disabled:
@@ -637,7 +651,7 @@ class GameRecorder(object):
         if self._disabled:
             return
         self._game_record.kvals = orjson.dumps(kvals)
-        self._game_record.save()
+        self._writer.save(self._game_record)
 
     def _get_or_create_card_record(self, card):
         if self._disabled:
@@ -674,19 +688,21 @@ class GameRecorder(object):
         return move_code
 
     def _get_event_from_instruction_uuid(self, instruction_uuid):
-        instruction_sent_event_query = Event.select().where(
-            Event.type == EventType.INSTRUCTION_SENT,
-            Event.short_code == instruction_uuid,
-        )
-        if not instruction_sent_event_query.exists():
-            return None
-        return instruction_sent_event_query.get()
+        if instruction_uuid not in self._instruction_events:
+            # Not sent during this game (e.g. loaded from a scenario). Fall back
+            # to the database. The event may still be queued for writing.
+            self._writer.flush()
+            self._instruction_events[instruction_uuid] = Event.get_or_none(
+                Event.type == EventType.INSTRUCTION_SENT,
+                Event.short_code == instruction_uuid,
+            )
+        return self._instruction_events[instruction_uuid]
 
     def _get_event_from_question_uuid(self, question_uuid):
-        question_event_query = Event.select().where(
-            Event.type == EventType.FEEDBACK_QUESTION,
-            Event.short_code == question_uuid,
-        )
-        if not question_event_query.exists():
-            return None
-        return question_event_query.get()
+        if question_uuid not in self._question_events:
+            self._writer.flush()
+            self._question_events[question_uuid] = Event.get_or_none(
+                Event.type == EventType.FEEDBACK_QUESTION,
+                Event.short_code == question_uuid,
+            )
+        return self._question_events[question_uuid]
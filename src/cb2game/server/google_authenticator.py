@@ -15,8 +15,10 @@ from cb2game.server.leaderboard import (
     SetDefaultGoogleUsername,
     UsernameFromHashedGoogleUserId,
 )
+from cb2game.server.messages import message_from_server
 from cb2game.server.messages.google_auth import GoogleAuth, GoogleAuthConfirmation
 from cb2game.server.messages.user_info import UserType
+from cb2game.server.outbox import QueueMessage
 from cb2game.server.remote_table import GetRemote, SetRemote
 from cb2game.server.util import to_thread
 
@@ -25,17 +27,9 @@ logger = logging.getLogger(__name__)
 
 class GoogleAuthenticator:
     def __init__(self):
-        self._auth_confirmations = {}  # ws: GoogleAuthConfirmation
         self._session = requests.session()
         self._cached_session = cachecontrol.CacheControl(self._session)
 
-    def fill_auth_confirmations(self, ws: web.WebSocketResponse):
-        if ws in self._auth_confirmations:
-            responses = self._auth_confirmations[ws]
-            del self._auth_confirmations[ws]
-            return responses
-        return []
-
     async def handle_auth(self, ws: web.WebSocketResponse, auth: GoogleAuth) -> bool:
         """Verifies that the given Google auth token is valid."""
         config = GlobalConfig()
@@ -90,11 +84,17 @@ class GoogleAuthenticator:
             self._queue_auth_failure(ws)
 
     def _queue_auth_success(self, ws):
-        if ws not in self._auth_confirmations:
-            self._auth_confirmations[ws] = []
-        self._auth_confirmations[ws].append(GoogleAuthConfirmation(True))
+        QueueMessage(
+            ws,
+            message_from_server.GoogleAuthConfirmationFromServer(
+                GoogleAuthConfirmation(True)
+            ),
+        )
 
     def _queue_auth_failure(self, ws):
-        if ws not in self._auth_confirmations:
-            self._auth_confirmations[ws] = []
-        self._auth_confirmations[ws].append(GoogleAuthConfirmation(False))
+        QueueMessage(
+            ws,
+            message_from_server.GoogleAuthConfirmationFromServer(
+                GoogleAuthConfirmation(False)
+            ),
+        )
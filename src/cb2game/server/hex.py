@@ -115,7 +115,8 @@ class HecsCoord(DataClassJSONMixin):
         neighbor_index = (int(heading / 60.0)) % 6
         if neighbor_index < 0:
             neighbor_index += 6
-        return self.neighbors()[neighbor_index]
+        # Same order as neighbors().
+        return _NEIGHBOR_FUNCTIONS[neighbor_index](self)
 
     def cartesian(self):
         """Calculate the cartesian coordinates of this Hecs coordinate."""
@@ -132,6 +133,14 @@ class HecsCoord(DataClassJSONMixin):
         """Converts HECS A, R, C coordinates to Hex offset coordinates."""
         return (self.r * 2 + self.a, self.c)
 
+    def packed(self):
+        """Returns this coordinate as a packed int. See PackOffset()."""
+        return PackOffset(self.r * 2 + self.a, self.c)
+
+    @staticmethod
+    def from_packed(packed):
+        return UnpackCoord(packed)
+
     def __hash__(self):
         return hash((self.a, self.r, self.c))
 
@@ -139,6 +148,94 @@ class HecsCoord(DataClassJSONMixin):
         return self.a == other.a and self.r == other.r and self.c == other.c
 
 
+_NEIGHBOR_FUNCTIONS = (
+    HecsCoord.up_right,
+    HecsCoord.right,
+    HecsCoord.down_right,
+    HecsCoord.down_left,
+    HecsCoord.left,
+    HecsCoord.up_left,
+)
+
+# Packed coordinates. Hot loops (movement validation, search) work on ints
+# instead of allocating a HecsCoord per step. Offset coordinates (row, col) are
+# biased to be non-negative and packed into one int:
+#     (row + PACKED_BIAS) << PACKED_BITS | (col + PACKED_BIAS)
+# PACKED_BIAS is even, so the parity of a row can be read from the packed int.
+# Coordinates must be in [-PACKED_BIAS, PACKED_BIAS). Otherwise they would
+# overflow into each other (and alias other coordinates), so PackOffset()
+# raises.
+PACKED_BITS = 16
+PACKED_BIAS = 1 << (PACKED_BITS - 1)
+PACKED_COL_MASK = (1 << PACKED_BITS) - 1
+
+
+def PackOffset(row, col):
+    """Packs offset coordinates. Raises ValueError if they're out of range."""
+    if not (-PACKED_BIAS <= row < PACKED_BIAS and -PACKED_BIAS <= col < PACKED_BIAS):
+        raise ValueError(f"Offset ({row}, {col}) is out of packed coordinate range.")
+    return ((row + PACKED_BIAS) << PACKED_BITS) | (col + PACKED_BIAS)
+
+
+def PackCoord(coord):
+    return coord.packed()
+
+
+def UnpackOffset(packed):
+    """Returns the (row, col) offset coordinates of a packed coordinate."""
+    return (
+        (packed >> PACKED_BITS) - PACKED_BIAS,
+        (packed & PACKED_COL_MASK) - PACKED_BIAS,
+    )
+
+
+def UnpackCoord(packed):
+    row = (packed >> PACKED_BITS) - PACKED_BIAS
+    return HecsCoord(row & 1, row >> 1, (packed & PACKED_COL_MASK) - PACKED_BIAS)
+
+
+PACKED_ORIGIN = PackOffset(0, 0)
+
+
+def PackedAdd(a, b):
+    """HecsCoord.add() for packed coordinates.
+
+    In offset coordinates, rows add. Columns add, plus one if both rows are odd.
+    """
+    return a + b - PACKED_ORIGIN + (((a & b) >> PACKED_BITS) & 1)
+
+
+def PackedNegate(a):
+    """HecsCoord.negate() for packed coordinates. Negates the row, and the column minus one if the row is odd."""
+    return 2 * PACKED_ORIGIN - a - ((a >> PACKED_BITS) & 1)
+
+
+def _PackedNeighborDeltas(parity):
+    origin = HecsCoord.from_offset(parity, 0)
+    return tuple(neighbor.packed() - origin.packed() for neighbor in origin.neighbors())
+
+
+# Indexed by [row parity][direction]. Same order as HecsCoord.neighbors().
+PACKED_NEIGHBOR_DELTAS = (_PackedNeighborDeltas(0), _PackedNeighborDeltas(1))
+
+# Packed displacements of at most one cell (the origin and its neighbors).
+PACKED_UNIT_DISPLACEMENTS = frozenset(
+    [PACKED_ORIGIN] + [PACKED_ORIGIN + delta for delta in PACKED_NEIGHBOR_DELTAS[0]]
+)
+
+
+def PackedNeighbors(packed):
+    """HecsCoord.neighbors() for packed coordinates."""
+    deltas = PACKED_NEIGHBOR_DELTAS[(packed >> PACKED_BITS) & 1]
+    return [packed + delta for delta in deltas]
+
+
+def PackedNeighborAtHeading(packed, heading):
+    """HecsCoord.neighbor_at_heading() for packed coordinates."""
+    neighbor_index = int(heading / 60.0) % 6
+    return packed + PACKED_NEIGHBOR_DELTAS[(packed >> PACKED_BITS) & 1][neighbor_index]
+
+
 @dataclass(frozen=True)
 class Edges(IntEnum):
     UPPER_RIGHT = 0
@@ -0,0 +1,323 @@
+""" An array-backed view of a hex map, for fast neighbor and edge queries.
+
+Tiles are stored as numpy arrays indexed by offset coordinates (row, col). See
+HecsCoord.to_offset_coordinates() in hex.py. Most queries take flat indices
+(row * cols + col), which index the neighbor and edge tables directly.
+
+Neighbor directions are numbered like hex.Edges (UPPER_RIGHT = 0, then
+clockwise), which is also the order of HecsCoord.neighbors().
+"""
+import functools
+import logging
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from cb2game.server.hex import PACKED_BIAS, PACKED_BITS, PACKED_COL_MASK, HecsCoord
+
+logger = logging.getLogger(__name__)
+
+# Number of tile lists to keep grids for. See HexGridCache.
+HEX_GRID_CACHE_SIZE = 64
+
+NUM_DIRECTIONS = 6
+DIRECTIONS = np.arange(NUM_DIRECTIONS)
+OPPOSITE_DIRECTIONS = (DIRECTIONS + 3) % NUM_DIRECTIONS
+
+
+def _NeighborOffsets(parity):
+    """(row, col) displacement of each neighbor, for a cell in a row of the given parity."""
+    origin = HecsCoord.from_offset(parity, 0)
+    offsets = []
+    for neighbor in origin.neighbors():
+        row, col = neighbor.to_offset_coordinates()
+        offsets.append((row - parity, col))
+    return offsets
+
+
+# Indexed by [row % 2][direction].
+NEIGHBOR_OFFSETS = [_NeighborOffsets(0), _NeighborOffsets(1)]
+
+
+@functools.lru_cache(maxsize=16)
+def NeighborTable(rows, cols):
+    """Returns a (rows * cols, 6) array of neighbor flat indices. -1 if off-map.
+
+    Shared between grids of the same size. Don't modify it.
+    """
+    row_indices, col_indices = np.divmod(np.arange(rows * cols), cols)
+    offsets = np.array(NEIGHBOR_OFFSETS)  # (parity, direction, [row, col])
+    parity_offsets = offsets[row_indices % 2]
+    neighbor_rows = row_indices[:, None] + parity_offsets[:, :, 0]
+    neighbor_cols = col_indices[:, None] + parity_offsets[:, :, 1]
+    in_map = (
+        (0 <= neighbor_rows)
+        & (neighbor_rows < rows)
+        & (0 <= neighbor_cols)
+        & (neighbor_cols < cols)
+    )
+    table = np.where(in_map, neighbor_rows * cols + neighbor_cols, -1).astype(np.int32)
+    table.flags.writeable = False
+    return table
+
+
+@functools.lru_cache(maxsize=16)
+def NeighborLists(rows, cols):
+    """NeighborTable(rows, cols) as a tuple of tuples.
+
+    Indexing numpy arrays one element at a time is slower than indexing Python
+    sequences, so scalar queries use this instead.
+    """
+    return tuple(tuple(row) for row in NeighborTable(rows, cols).tolist())
+
+
+class HexGrid(object):
+    """Tile attributes of a map as (rows, cols) arrays.
+
+    tile_index maps each cell to the index of its tile in the list the grid was
+    built from, or -1 if there's no tile there (e.g. in a follower's censored
+    view of the map). Cells without tiles are never passable.
+
+    Two edge tables are kept, each (rows * cols, 6):
+        exits: The cell has a tile and no edge in that direction, and the
+            neighbor has a tile.
+        passable: exits, and the neighbor has no edge in the opposite
+            direction. This is what movement is checked against.
+
+    The grid is a snapshot. If tile boundaries are modified, call
+    set_edges() to update it.
+    """
+
+    def __init__(self, rows, cols):
+        self.rows = rows
+        self.cols = cols
+        self.tile_index = np.full((rows, cols), -1, dtype=np.int32)
+        self.asset_ids = np.full((rows, cols), -1, dtype=np.int16)
+        self.layers = np.zeros((rows, cols), dtype=np.int16)
+        self.heights = np.zeros((rows, cols), dtype=np.float64)
+        self.rotations = np.zeros((rows, cols), dtype=np.int16)
+        # 6-bit mask. Bit i set means an edge in direction i (see hex.Edges).
+        self.edges = np.zeros((rows, cols), dtype=np.uint8)
+        self.neighbors = NeighborTable(rows, cols)
+        # Python sequences of the tables above, for scalar queries. See
+        # NeighborLists().
+        self._neighbor_lists = NeighborLists(rows, cols)
+        # No tiles yet, so nothing is passable. See _update_edge_tables().
+        self.exits = np.zeros((rows * cols, NUM_DIRECTIONS), dtype=bool)
+        self.passable = np.zeros((rows * cols, NUM_DIRECTIONS), dtype=bool)
+        self._exit_lists = None
+        self._passable_lists = None
+
+    @staticmethod
+    def from_tiles(rows, cols, tiles):
+        """Builds a grid from a list of map_update.Tile. Tiles off the grid are ignored."""
+        grid = HexGrid(rows, cols)
+        cells = [tile.cell for tile in tiles]
+        coords = [cell.coord for cell in cells]
+        tile_rows = np.array(
+            [coord.r * 2 + coord.a for coord in coords], dtype=np.int64
+        )
+        tile_cols = np.array([coord.c for coord in coords], dtype=np.int64)
+        in_grid = (
+            (0 <= tile_rows)
+            & (tile_rows < rows)
+            & (0 <= tile_cols)
+            & (tile_cols < cols)
+        )
+        flat = (tile_rows * cols + tile_cols)[in_grid]
+        # If tiles share a cell, the last one wins.
+        _, last = np.unique(flat[::-1], return_index=True)
+        indices = np.flatnonzero(in_grid)[len(flat) - 1 - last]
+        flat = flat[len(flat) - 1 - last]
+        columns = (
+            (grid.asset_ids, [tile.asset_id for tile in tiles]),
+            (grid.layers, [cell.layer for cell in cells]),
+            (grid.heights, [cell.height for cell in cells]),
+            (grid.rotations, [tile.rotation_degrees for tile in tiles]),
+            (grid.edges, [cell.boundary.edges for cell in cells]),
+        )
+        grid.tile_index.flat[flat] = indices
+        for array, values in columns:
+            array.flat[flat] = np.array(values, dtype=array.dtype)[indices]
+        grid._update_edge_tables()
+        return grid
+
+    @staticmethod
+    def from_map_update(map_update):
+        return HexGrid.from_tiles(map_update.rows, map_update.cols, map_update.tiles)
+
+    def masked(self, indices):
+        """Returns a grid with only the tiles at the given flat indices.
+
+        In the new grid, tiles are numbered by their position in indices. Use
+        this to index a subset of a map's tiles (e.g. what a follower can see)
+        without rebuilding the grid from tiles.
+        """
+        grid = HexGrid.__new__(HexGrid)
+        grid.rows = self.rows
+        grid.cols = self.cols
+        grid.tile_index = np.full((self.rows, self.cols), -1, dtype=np.int32)
+        grid.tile_index.flat[indices] = np.arange(len(indices), dtype=np.int32)
+        keep = grid.tile_index >= 0
+        grid.asset_ids = np.where(keep, self.asset_ids, -1).astype(np.int16)
+        grid.layers = np.where(keep, self.layers, 0).astype(np.int16)
+        grid.heights = np.where(keep, self.heights, 0.0)
+        grid.rotations = np.where(keep, self.rotations, 0).astype(np.int16)
+        grid.edges = np.where(keep, self.edges, 0).astype(np.uint8)
+        grid.neighbors = self.neighbors
+        grid._neighbor_lists = self._neighbor_lists
+        grid._update_edge_tables()
+        return grid
+
+    def set_edges(self, edges):
+        """Replaces the edge mask array, and updates the edge tables."""
+        self.edges = np.asarray(edges, dtype=np.uint8).reshape(self.rows, self.cols)
+        self._update_edge_tables()
+
+    def _update_edge_tables(self):
+        present = (self.tile_index >= 0).ravel()
+        edges = self.edges.ravel()
+        safe_neighbors = np.where(self.neighbors >= 0, self.neighbors, 0)
+        neighbor_present = (self.neighbors >= 0) & present[safe_neighbors]
+        own_edge = (edges[:, None] >> DIRECTIONS) & 1 != 0
+        neighbor_edge = (edges[safe_neighbors] >> OPPOSITE_DIRECTIONS) & 1 != 0
+        self.exits = present[:, None] & neighbor_present & ~own_edge
+        self.passable = self.exits & ~neighbor_edge
+        # Built on the first scalar query. See _edge_lists().
+        self._exit_lists = None
+        self._passable_lists = None
+
+    def _edge_lists(self):
+        if self._passable_lists is None:
+            self._exit_lists = self.exits.tolist()
+            self._passable_lists = self.passable.tolist()
+        return self._exit_lists, self._passable_lists
+
+    def size(self):
+        return self.rows * self.cols
+
+    def flat_index(self, coord):
+        """Returns the flat index of a HecsCoord, or -1 if it's off the grid."""
+        row = coord.r * 2 + coord.a
+        col = coord.c
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            return row * self.cols + col
+        return -1
+
+    def packed_flat_index(self, packed):
+        """flat_index() for a packed coordinate. See hex.PackOffset()."""
+        row = (packed >> PACKED_BITS) - PACKED_BIAS
+        col = (packed & PACKED_COL_MASK) - PACKED_BIAS
+        if 0 <= row < self.rows and 0 <= col < self.cols:
+            return row * self.cols + col
+        return -1
+
+    def coord(self, index):
+        return HecsCoord.from_offset(index // self.cols, index % self.cols)
+
+    def in_map(self, coord):
+        return self.flat_index(coord) >= 0
+
+    def has_tile(self, index):
+        return index >= 0 and self.tile_index.flat[index] >= 0
+
+    def neighbors_of(self, index):
+        """Flat indices of the 6 neighbors of a cell, in direction order. -1 if off-map."""
+        return self._neighbor_lists[index]
+
+    def direction_between(self, index, other_index):
+        """Returns the direction from one cell to an adjacent cell, or -1 if they aren't adjacent."""
+        try:
+            return self._neighbor_lists[index].index(other_index)
+        except ValueError:
+            return -1
+
+    def exits_of(self, index):
+        """Neighbors reachable through this cell's own edges (ignoring the neighbor's edges)."""
+        neighbors = self._neighbor_lists[index]
+        exits = (self._exit_lists or self._edge_lists()[0])[index]
+        return [neighbors[d] for d in range(NUM_DIRECTIONS) if exits[d]]
+
+    def passable_neighbors(self, index):
+        """Neighbors which can be moved to from this cell."""
+        neighbors = self._neighbor_lists[index]
+        passable = (self._passable_lists or self._edge_lists()[1])[index]
+        return [neighbors[d] for d in range(NUM_DIRECTIONS) if passable[d]]
+
+    def edge_between(self, a, b):
+        """Returns True if movement between adjacent HecsCoords a and b is blocked.
+
+        Movement off the map, or to or from a cell without a tile, is blocked.
+        Raises ValueError if a and b are on the grid and not adjacent.
+        """
+        return self._edge_between_indices(self.flat_index(a), self.flat_index(b), a, b)
+
+    def packed_edge_between(self, a, b):
+        """edge_between() for packed coordinates. See hex.PackOffset()."""
+        return self._edge_between_indices(
+            self.packed_flat_index(a), self.packed_flat_index(b), a, b
+        )
+
+    def _edge_between_indices(self, index, other_index, a, b):
+        if index < 0 or other_index < 0:
+            return True
+        direction = self.direction_between(index, other_index)
+        if direction < 0:
+            raise ValueError(
+                f"HecsCoords {a}, {b} passed to edge_between are not adjacent."
+            )
+        return not (self._passable_lists or self._edge_lists()[1])[index][direction]
+
+
+class HexGridCache(object):
+    """An LRU of HexGrids, keyed by the identity of the tiles list they index.
+
+    MapUpdates for the same map (copied with dataclasses.replace(), re-stamped
+    with a new version, or returned by MapProvider.map()) share one tiles list,
+    and so share one grid. Like map_payload.MapPayloadCache, entries keep a
+    reference to their tiles, so that id(tiles) stays unique while cached.
+    """
+
+    def __init__(self, max_size=HEX_GRID_CACHE_SIZE):
+        self._max_size = max_size
+        # id(tiles) -> (tiles, grid).
+        self._grids = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, rows, cols, tiles):
+        """Returns the grid for a tiles list, building it on first use."""
+        key = id(tiles)
+        with self._lock:
+            entry = self._grids.get(key, None)
+            if entry is not None and entry[0] is tiles:
+                grid = entry[1]
+                if grid.rows == rows and grid.cols == cols:
+                    self.hits += 1
+                    self._grids.move_to_end(key)
+                    return grid
+            self.misses += 1
+        grid = HexGrid.from_tiles(rows, cols, tiles)
+        self.put(tiles, grid)
+        return grid
+
+    def put(self, tiles, grid):
+        """Sets the grid for a tiles list, for owners of tiles which already have one."""
+        key = id(tiles)
+        with self._lock:
+            self._grids[key] = (tiles, grid)
+            self._grids.move_to_end(key)
+            while len(self._grids) > self._max_size:
+                self._grids.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._grids.clear()
+
+    def __len__(self):
+        return len(self._grids)
+
+
+hex_grid_cache = HexGridCache()
@@ -66,14 +66,15 @@ class MturkLobby(lobby.Lobby):
             if datetime.now() - ts > timedelta(minutes=5):
                 self._follower_queue.popleft()
                 # Queue a room management response to notify the follower that they've been removed from the queue.
-                self._pending_room_management_responses[follower].put(
+                self._queue_room_response(
+                    follower,
                     RoomManagementResponse(
                         RoomResponseType.JOIN_RESPONSE,
                         None,
                         JoinResponse(False, -1, Role.NONE, True),
                         None,
                         None,
-                    )
+                    ),
                 )
 
         # If a general player has been waiting alone for 5m, remove them from the queue.
@@ -82,14 +83,15 @@ class MturkLobby(lobby.Lobby):
             if datetime.now() - ts > timedelta(minutes=5):
                 self._player_queue.popleft()
                 # Queue a room management response to notify the player that they've been removed from the queue.
-                self._pending_room_management_responses[player].put(
+                self._queue_room_response(
+                    player,
                     RoomManagementResponse(
                         RoomResponseType.JOIN_RESPONSE,
                         None,
                         JoinResponse(False, -1, Role.NONE, True),
                         None,
                         None,
-                    )
+                    ),
                 )
 
         # If a leader has been waiting alone for 5m, remove them from the queue.
@@ -98,14 +100,15 @@ class MturkLobby(lobby.Lobby):
             if datetime.now() - ts > timedelta(minutes=5):
                 self._leader_queue.popleft()
                 # Queue a room management response to notify the leader that they've been removed from the queue.
-                self._pending_room_management_responses[leader].put(
+                self._queue_room_response(
+                    leader,
                     RoomManagementResponse(
                         RoomResponseType.JOIN_RESPONSE,
                         None,
                         JoinResponse(False, -1, Role.NONE, True),
                         None,
                         None,
-                    )
+                    ),
                 )
 
         # If there's a leader in the leader queue and a follower in the follower queue, match them.
@@ -1,6 +1,5 @@
 """ A Lobby that's used for replay games. """
 import logging
-from queue import Queue
 from typing import Tuple
 
 from aiohttp import web
@@ -53,23 +52,22 @@ class ReplayLobby(lobby.Lobby):
         self, request: ReplayRequest, ws: web.WebSocketResponse
     ) -> None:
         """Handles a request to join a replay room. In most lobbies, this should be ignored (except lobbies supporting replay)."""
-        if ws not in self._pending_replay_messages:
-            self._pending_replay_messages[ws] = Queue()
-
         if request.type == ReplayRequestType.START_REPLAY:
             if self.lobby_info().is_demo_lobby:
                 self.create_demo(ws)
-                self._pending_replay_messages[ws].put(
+                self._queue_replay_response(
+                    ws,
                     ReplayResponse(
                         ReplayResponseType.REPLAY_STARTED,
-                    )
+                    ),
                 )
                 return
             self.create_replay(ws, request.game_id)
-            self._pending_replay_messages[ws].put(
+            self._queue_replay_response(
+                ws,
                 ReplayResponse(
                     ReplayResponseType.REPLAY_STARTED,
-                )
+                ),
             )
         else:
             logger.warning(
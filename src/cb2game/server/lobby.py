@@ -1,13 +1,11 @@
 import asyncio
 import logging
 import pathlib
-import queue
 import tempfile
 from abc import ABC, abstractmethod
 from collections import deque
 from dataclasses import dataclass
 from datetime import datetime, timedelta
-from queue import Queue
 from typing import List, Tuple
 
 import orjson
@@ -48,6 +46,7 @@ from cb2game.server.messages.tutorials import (
     TutorialResponse,
     TutorialResponseType,
 )
+from cb2game.server.outbox import GetOutbox, QueueMessage
 from cb2game.server.room import Room, RoomType
 from cb2game.server.util import (
     GetCommitHash,
@@ -122,10 +121,6 @@ class Lobby(ABC):
         self._follower_queue = deque()
         self._leader_queue = deque()
         self._base_log_directory = pathlib.Path("/dev/null")
-        self._pending_room_management_responses = {}  # {ws: room_management_response}
-        self._pending_tutorial_messages = {}  # {ws: tutorial_response}
-        self._pending_replay_messages = {}  # {ws: replay_response}
-        self._pending_scenario_messages = {}  # {ws: scenario_response}
         self._matchmaking_exc = None
         self._latency_monitor = LatencyMonitor()
 
@@ -244,10 +239,11 @@ class Lobby(ABC):
                 leave_notice = LeaveRoomNotice(
                     "Other player disconnected, game ending."
                 )
-                self._pending_room_management_responses[socket].put(
+                self._queue_room_response(
+                    socket,
                     RoomManagementResponse(
                         RoomResponseType.LEAVE_NOTICE, None, None, leave_notice
-                    )
+                    ),
                 )
                 del self._remotes[socket]
         self._rooms[room_id].stop()
@@ -333,7 +329,8 @@ class Lobby(ABC):
                             room.id(), follower_id, Role.FOLLOWER
                         )
                         # Tell the follower they've joined a room!
-                        self._pending_room_management_responses[follower].put(
+                        self._queue_room_response(
+                            follower,
                             RoomManagementResponse(
                                 RoomResponseType.JOIN_RESPONSE,
                                 None,
@@ -342,7 +339,7 @@ class Lobby(ABC):
                                 ),
                                 None,
                                 None,
-                            )
+                            ),
                         )
                         continue
                     else:
@@ -381,23 +378,25 @@ class Lobby(ABC):
                         room.id(), follower_id, Role.FOLLOWER
                     )
                     logger.info(f"JOINING ROOM {room.id()} {leader_id} {follower_id}")
-                    self._pending_room_management_responses[leader].put(
+                    self._queue_room_response(
+                        leader,
                         RoomManagementResponse(
                             RoomResponseType.JOIN_RESPONSE,
                             None,
                             JoinResponse(True, 0, Role.LEADER, False, "", room.id()),
                             None,
                             None,
-                        )
+                        ),
                     )
-                    self._pending_room_management_responses[follower].put(
+                    self._queue_room_response(
+                        follower,
                         RoomManagementResponse(
                             RoomResponseType.JOIN_RESPONSE,
                             None,
                             JoinResponse(True, 0, Role.FOLLOWER, False, "", room.id()),
                             None,
                             None,
-                        )
+                        ),
                     )
                     continue
 
@@ -446,23 +445,25 @@ class Lobby(ABC):
                 game_info_log.write(json_str + "\n")
                 game_info_log.close()
 
-                self._pending_room_management_responses[leader].put(
+                self._queue_room_response(
+                    leader,
                     RoomManagementResponse(
                         RoomResponseType.JOIN_RESPONSE,
                         None,
                         JoinResponse(True, 0, Role.LEADER, False, "", game_id),
                         None,
                         None,
-                    )
+                    ),
                 )
-                self._pending_room_management_responses[follower].put(
+                self._queue_room_response(
+                    follower,
                     RoomManagementResponse(
                         RoomResponseType.JOIN_RESPONSE,
                         None,
                         JoinResponse(True, 0, Role.FOLLOWER, False, "", game_id),
                         None,
                         None,
-                    )
+                    ),
                 )
             except Exception as e:
                 logger.exception(e)
@@ -560,10 +561,11 @@ class Lobby(ABC):
                         leave_notice = LeaveRoomNotice(
                             f"Game ended by server due to: {type(room.exception()).__name__}"
                         )
-                        self._pending_room_management_responses[socket].put(
+                        self._queue_room_response(
+                            socket,
                             RoomManagementResponse(
                                 RoomResponseType.LEAVE_NOTICE, None, None, leave_notice
-                            )
+                            ),
                         )
                 self.delete_room(room.id())
             if room.game_time() > timedelta(hours=3):
@@ -575,10 +577,11 @@ class Lobby(ABC):
                         leave_notice = LeaveRoomNotice(
                             "Game ended by server after 3 hours."
                         )
-                        self._pending_room_management_responses[socket].put(
+                        self._queue_room_response(
+                            socket,
                             RoomManagementResponse(
                                 RoomResponseType.LEAVE_NOTICE, None, None, leave_notice
-                            )
+                            ),
                         )
                 self.delete_room(room.id())
 
@@ -597,6 +600,10 @@ class Lobby(ABC):
             room_id, player_id, _ = self._remotes[ws].as_tuple()
             self._rooms[id].remove_player(player_id, ws, disconnected=False)
             del self._remotes[ws]
+            # Let the socket's sender notice that it's no longer in a room.
+            outbox = GetOutbox(ws)
+            if outbox is not None:
+                outbox.wake()
         del self._rooms[id]
 
     def available_room_id(self):
@@ -679,17 +686,16 @@ class Lobby(ABC):
         return room
 
     def handle_tutorial_request(self, tutorial_request, ws):
-        if ws not in self._pending_tutorial_messages:
-            self._pending_tutorial_messages[ws] = Queue()
         if tutorial_request.type == TutorialRequestType.START_TUTORIAL:
             self.create_tutorial(ws, tutorial_request.tutorial_name)
-            self._pending_tutorial_messages[ws].put(
+            self._queue_tutorial_response(
+                ws,
                 TutorialResponse(
                     TutorialResponseType.STARTED,
                     tutorial_request.tutorial_name,
                     None,
                     None,
-                )
+                ),
             )
         else:
             logger.warning(
@@ -702,9 +708,6 @@ class Lobby(ABC):
             logger.info("Scenario request received from non-scenario lobby. Ignoring.")
             return
 
-        if ws not in self._pending_scenario_messages:
-            self._pending_scenario_messages[ws] = Queue()
-
         if scenario_request.type == ScenarioRequestType.ATTACH_TO_SCENARIO:
             room_id = None
             for id, room in self._rooms.items():
@@ -721,20 +724,22 @@ class Lobby(ABC):
             room = self._rooms[room_id]
             player_id = room.add_player(ws, Role.SPECTATOR)
             self._remotes[ws] = SocketInfo(room_id, player_id, Role.SPECTATOR)
-            self._pending_scenario_messages[ws].put(
+            self._queue_scenario_response(
+                ws,
                 ScenarioResponse(
                     ScenarioResponseType.LOADED,
                     None,
-                )
+                ),
             )
-            self._pending_room_management_responses[ws].put(
+            self._queue_room_response(
+                ws,
                 RoomManagementResponse(
                     RoomResponseType.JOIN_RESPONSE,
                     None,
                     JoinResponse(True, -1, Role.SPECTATOR, False, "", room.id()),
                     None,
                     None,
-                )
+                ),
             )
 
     def join_player_queue(self, ws, request: RoomManagementRequest):
@@ -756,14 +761,15 @@ class Lobby(ABC):
         self._player_queue.append(
             (datetime.now(), ws, request.join_game_with_event_uuid)
         )
-        self._pending_room_management_responses[ws].put(
+        self._queue_room_response(
+            ws,
             RoomManagementResponse(
                 RoomResponseType.JOIN_RESPONSE,
                 None,
                 JoinResponse(False, len(self._player_queue), Role.NONE),
                 None,
                 None,
-            )
+            ),
         )
 
     def join_follower_queue(self, ws, request: RoomManagementRequest):
@@ -785,14 +791,15 @@ class Lobby(ABC):
         self._follower_queue.append(
             (datetime.now(), ws, request.join_game_with_event_uuid)
         )
-        self._pending_room_management_responses[ws].put(
+        self._queue_room_response(
+            ws,
             RoomManagementResponse(
                 RoomResponseType.JOIN_RESPONSE,
                 None,
                 JoinResponse(False, len(self._follower_queue), Role.NONE),
                 None,
                 None,
-            )
+            ),
         )
 
     def join_leader_queue(self, ws, request: RoomManagementRequest = None):
@@ -814,25 +821,27 @@ class Lobby(ABC):
         self._leader_queue.append(
             (datetime.now(), ws, request.join_game_with_event_uuid)
         )
-        self._pending_room_management_responses[ws].put(
+        self._queue_room_response(
+            ws,
             RoomManagementResponse(
                 RoomResponseType.JOIN_RESPONSE,
                 None,
                 JoinResponse(False, len(self._leader_queue), Role.NONE),
                 None,
                 None,
-            )
+            ),
         )
 
     def boot_from_queue(self, ws, reason=""):
-        self._pending_room_management_responses[ws].put(
+        self._queue_room_response(
+            ws,
             RoomManagementResponse(
                 RoomResponseType.JOIN_RESPONSE,
                 None,
                 JoinResponse(False, -1, Role.NONE, True, reason),
                 None,
                 None,
-            )
+            ),
         )
 
     def handle_follower_only_join_request(self, request, ws):
@@ -854,32 +863,34 @@ class Lobby(ABC):
             )
         room_id, player_id, _ = self._remotes[ws].as_tuple()
         self.disconnect_socket(ws)
-        self._pending_room_management_responses[ws].put(
+        self._queue_room_response(
+            ws,
             RoomManagementResponse(
                 RoomResponseType.LEAVE_NOTICE,
                 None,
                 None,
                 LeaveRoomNotice("Player requested leave."),
                 None,
-            )
+            ),
         )
 
     def handle_stats_request(self, request, ws):
         total_players = sum([room.number_of_players() for room in self._rooms.values()])
         stats = StatsResponse(len(self._rooms), total_players, len(self._player_queue))
-        self._pending_room_management_responses[ws].put(
-            RoomManagementResponse(RoomResponseType.STATS, stats, None, None, None)
+        self._queue_room_response(
+            ws, RoomManagementResponse(RoomResponseType.STATS, stats, None, None, None)
         )
 
     def handle_map_sample_request(self, request, ws):
-        self._pending_room_management_responses[ws].put(
+        self._queue_room_response(
+            ws,
             RoomManagementResponse(
                 RoomResponseType.MAP_SAMPLE,
                 None,
                 None,
                 None,
                 CachedMapRetrieval().map(),
-            )
+            ),
         )
 
     def remove_socket_from_queue(self, ws):
@@ -938,8 +949,6 @@ class Lobby(ABC):
     def handle_room_request(
         self, request: RoomManagementRequest, ws: web.WebSocketResponse
     ):
-        if not ws in self._pending_room_management_responses:
-            self._pending_room_management_responses[ws] = Queue()
 
         if request.type == RoomRequestType.JOIN:
             self.handle_join_request(request, ws)
@@ -959,55 +968,29 @@ class Lobby(ABC):
             logger.warning(f"Unknown request type: {request.type}")
 
     def drain_message(self, ws):
-        if ws not in self._pending_room_management_responses:
-            self._pending_room_management_responses[ws] = Queue()
-        if not self._pending_room_management_responses[ws].empty():
-            try:
-                management_response = self._pending_room_management_responses[ws].get(
-                    False
-                )
-                logger.debug(
-                    f"Drained Room Management message type {management_response.type} for {ws}."
-                )
-                logger.debug(
-                    f"Remaining messages in queue: {self._pending_room_management_responses[ws].qsize()}"
-                )
-                return message_from_server.RoomResponseFromServer(management_response)
-            except queue.Empty:
-                pass
+        """Pops the next message queued for this socket, or None.
 
-        if ws not in self._pending_tutorial_messages:
-            self._pending_tutorial_messages[ws] = Queue()
-        if not self._pending_tutorial_messages[ws].empty():
-            try:
-                tutorial_response = self._pending_tutorial_messages[ws].get(False)
-                logger.debug(
-                    f"Drained tutorial response type {tutorial_response.type} for {ws}."
-                )
-                return message_from_server.TutorialResponseFromServer(tutorial_response)
-            except queue.Empty:
-                pass
-        if ws not in self._pending_replay_messages:
-            self._pending_replay_messages[ws] = Queue()
-        if not self._pending_replay_messages[ws].empty():
-            try:
-                replay_response = self._pending_replay_messages[ws].get(False)
-                logger.debug(
-                    f"Drained replay response type {replay_response.type} for {ws}."
-                )
-                return message_from_server.ReplayResponseFromServer(replay_response)
-            except queue.Empty:
-                pass
-        if ws not in self._pending_scenario_messages:
-            self._pending_scenario_messages[ws] = Queue()
-        if not self._pending_scenario_messages[ws].empty():
-            try:
-                scenario_response = self._pending_scenario_messages[ws].get(False)
-                logger.info(
-                    f"Drained scenario response type {scenario_response.type} for {ws}."
-                )
-                return message_from_server.ScenarioResponseFromServer(scenario_response)
-            except queue.Empty:
-                pass
+        Messages are normally delivered by the socket's sender coroutine, which
+        awaits on the socket's outbox directly. This is useful for tests and
+        other callers which aren't running a sender.
+        """
+        outbox = GetOutbox(ws)
+        if outbox is None:
+            return None
+        return outbox.get_nowait()
 
-        return None
+    def _queue_room_response(self, ws, response: RoomManagementResponse):
+        logger.debug(f"Queued Room Management message type {response.type} for {ws}.")
+        QueueMessage(ws, message_from_server.RoomResponseFromServer(response))
+
+    def _queue_tutorial_response(self, ws, response: TutorialResponse):
+        logger.debug(f"Queued tutorial response type {response.type} for {ws}.")
+        QueueMessage(ws, message_from_server.TutorialResponseFromServer(response))
+
+    def _queue_replay_response(self, ws, response):
+        logger.debug(f"Queued replay response type {response.type} for {ws}.")
+        QueueMessage(ws, message_from_server.ReplayResponseFromServer(response))
+
+    def _queue_scenario_response(self, ws, response: ScenarioResponse):
+        logger.info(f"Queued scenario response type {response.type} for {ws}.")
+        QueueMessage(ws, message_from_server.ScenarioResponseFromServer(response))
@@ -42,12 +42,16 @@ import cb2game.server.schemas.game as game_db
 import cb2game.server.schemas.mturk as mturk
 from cb2game.server.client_exception_logger import ClientExceptionLogger
 from cb2game.server.config.config import GlobalConfig, InitGlobalConfig
+from cb2game.server.db_writer import GetDatabaseWriter
 from cb2game.server.google_authenticator import GoogleAuthenticator
 from cb2game.server.lobby_consts import IsMturkLobby, LobbyType
 from cb2game.server.lobby_utils import GetLobbies, GetLobby, InitializeLobbies
-from cb2game.server.map_provider import MapGenerationTask, MapPoolSize
+from cb2game.server.map_payload import SerializeWithMapUpdate, map_payload_cache
+from cb2game.server.map_provider import MapGenerationTask, MapPoolMetrics, MapPoolSize
+from cb2game.server.message_log import GetMessageLogWriter
 from cb2game.server.messages import message_from_server, message_to_server
 from cb2game.server.messages.user_info import UserType
+from cb2game.server.outbox import CreateOutbox, DeleteOutbox, GetOutbox, OutboxCount
 from cb2game.server.remote_table import (
     AddRemote,
     DeleteRemote,
@@ -56,9 +60,10 @@ from cb2game.server.remote_table import (
     LogConnectionEvent,
     Remote,
 )
+from cb2game.server.scenario_cache import InitScenarioCache
 from cb2game.server.schemas import base
 from cb2game.server.user_info_fetcher import UserInfoFetcher
-from cb2game.server.util import HEARTBEAT_TIMEOUT_S, password_protected
+from cb2game.server.util import HEARTBEAT_TIMEOUT_S, LatencyMonitor, password_protected
 
 routes = web.RouteTableDef()
 
@@ -73,6 +78,7 @@ logger = logging.getLogger()
 google_authenticator = GoogleAuthenticator()
 user_info_fetcher = UserInfoFetcher()
 client_exception_logger = ClientExceptionLogger()
+event_loop_lag_monitor = LatencyMonitor()
 
 
 async def transmit(ws, message):
@@ -357,7 +363,28 @@ async def Status(request):
     status = {
         "assets": assets_map,
         "map_cache_size": MapPoolSize(),
+        "map_pool": MapPoolMetrics(),
+        "database_writer": {
+            "pending": GetDatabaseWriter().pending(),
+            "rows_written": GetDatabaseWriter().rows_written,
+            "transactions": GetDatabaseWriter().transactions,
+        },
+        "message_log_writer": {
+            "pending": GetMessageLogWriter().pending(),
+            "lines_written": GetMessageLogWriter().lines_written,
+            "lines_dropped": GetMessageLogWriter().lines_dropped,
+        },
+        "map_payload_cache": {
+            "size": len(map_payload_cache),
+            "hits": map_payload_cache.hits,
+            "misses": map_payload_cache.misses,
+        },
         "remotes": remote_infos,
+        "outbox_count": OutboxCount(),
+        "event_loop_lag": {
+            "bucket_latencies": event_loop_lag_monitor.bucket_latencies(),
+            "bucket_timestamps": event_loop_lag_monitor.bucket_timestamps(),
+        },
         "lobbies": {},
     }
     for lobby in lobbies:
@@ -467,6 +494,18 @@ async def ExceptionSaver(lobbies, config):
             logger.exception(e)
 
 
+async def EventLoopLagMonitor(period_s=0.1):
+    """Measures event loop lag: how late a periodic timer fires.
+
+    Lag is accumulated into event_loop_lag_monitor and reported on /status.
+    """
+    while True:
+        start = time.time()
+        await asyncio.sleep(period_s)
+        lag = time.time() - start - period_s
+        event_loop_lag_monitor.accumulate_latency(max(lag, 0))
+
+
 async def DataDownloader(lobbies):
     global download_requested
     global download_status
@@ -1078,54 +1117,80 @@ async def stats(request):
     return web.json_response(json_stats)
 
 
+# How often to ping clients which are in a game.
+PING_PERIOD_S = 10.0
+
+
+def SerializeMessage(message):
+    if (
+        message.type == message_from_server.MessageType.MAP_UPDATE
+        and message.map_update is not None
+    ):
+        # Maps are large and immutable. Reuse the cached serialized tiles.
+        return SerializeWithMapUpdate(
+            dataclasses.replace(message, map_update=None), message.map_update
+        )
+    return orjson.dumps(
+        message,
+        option=orjson.OPT_NAIVE_UTC | orjson.OPT_PASSTHROUGH_DATETIME,
+        default=datetime.isoformat,
+    )
+
+
+def SerializeMessages(messages):
+    """Serializes a list of messages into a single JSON array."""
+    if any(
+        message.type == message_from_server.MessageType.MAP_UPDATE
+        for message in messages
+    ):
+        return b"[" + b",".join(SerializeMessage(m) for m in messages) + b"]"
+    return orjson.dumps(
+        messages,
+        option=orjson.OPT_NAIVE_UTC | orjson.OPT_PASSTHROUGH_DATETIME,
+        default=datetime.isoformat,
+    )
+
+
 async def stream_game_state(request, ws, lobby):
+    """Sends messages to the client as they're pushed to the socket's outbox.
+
+    The lobby, rooms, google authenticator and user info fetcher all push
+    messages into the socket's outbox (created by PlayerEndpoint). This coroutine sleeps until something is
+    queued (or a ping is due), so idle connections don't consume CPU.
+    """
     was_in_room = False
     remote = GetRemote(ws)
     remote.last_ping = datetime.now(timezone.utc)
-    last_loop = time.time()
-    menu_options_updated = False  # Whether the menu options have been transmitted.
-    while not ws.closed:
-        await asyncio.sleep(0)
-        poll_period = time.time() - last_loop
-        if (poll_period) > 0.2:
-            logging.warning(
-                f"Transmit socket for iphash {remote.hashed_ip} port {remote.client_port}, slow poll period of {poll_period}s"
-            )
-        last_loop = time.time()
-        # If not in a room, drain messages from the room manager.
-        message = lobby.drain_message(ws)
-        if message is not None:
-            await transmit_bytes(ws, orjson.dumps(message, option=orjson.OPT_NAIVE_UTC))
-
-        # If the menu options have been updated, send them to the client.
+    outbox = GetOutbox(ws)
+    await transmit_bytes(
+        ws,
+        SerializeMessage(
+            message_from_server.MenuOptionsFromServer(lobby.menu_options(ws))
+        ),
+    )
+    while not ws.closed and not outbox.closed():
+        # Pings are only sent while in a game.
+        timeout = None
+        if was_in_room:
+            since_ping = (datetime.now(timezone.utc) - remote.last_ping).total_seconds()
+            timeout = max(PING_PERIOD_S - since_ping, 0)
+        await outbox.wait(timeout)
+
+        menu_options_updated = True
+        pending = outbox.drain()
+        if remote.batch_messages and len(pending) > 0:
+            # One frame (and one orjson call) for everything queued since the
+            # last send. This is usually all messages from a single tick.
+            await transmit_bytes(ws, SerializeMessages(pending))
+        for message in pending:
+            if not remote.batch_messages:
+                await transmit_bytes(ws, SerializeMessage(message))
+            if message.type == message_from_server.MessageType.GOOGLE_AUTH_CONFIRMATION:
+                # If a user recently authenticated, the menu options may have changed.
+                menu_options_updated = False
         if not menu_options_updated:
-            menu_options_updated = True
             message = message_from_server.MenuOptionsFromServer(lobby.menu_options(ws))
-            # Wait 10ms first,
-            await transmit_bytes(ws, orjson.dumps(message, option=orjson.OPT_NAIVE_UTC))
-
-        # Handle any authentication confirmations.
-        confirmations = google_authenticator.fill_auth_confirmations(ws)
-        if len(confirmations) > 0:
-            # If a user recently authenticated, the menu options may have changed.
-            menu_options_updated = False
-            for confirmation in confirmations:
-                message = message_from_server.GoogleAuthConfirmationFromServer(
-                    confirmation
-                )
-                await transmit_bytes(
-                    ws, orjson.dumps(message, option=orjson.OPT_NAIVE_UTC)
-                )
-
-        # Fill userinfo responses.
-        userinfo_responses = user_info_fetcher.fill_user_infos(ws)
-        if len(userinfo_responses) > 0:
-            for userinfo_response in userinfo_responses:
-                message = message_from_server.UserInfoFromServer(userinfo_response)
-                logger.info(f"message: {message}")
-                await transmit_bytes(
-                    ws, orjson.dumps(message, option=orjson.OPT_NAIVE_UTC)
-                )
+            await transmit_bytes(ws, SerializeMessage(message))
 
         if not lobby.socket_in_room(ws):
             if was_in_room:
@@ -1135,61 +1200,31 @@ async def stream_game_state(request, ws, lobby):
                 await ws.close()
                 return
             continue
-
-        (room_id, player_id, role) = lobby.socket_info(ws).as_tuple()
-        room = lobby.get_room(room_id)
-
-        if room is None:
-            logger.warning(
-                f"Room does not exist but lobby.socket_in_room(ws) returned true."
-            )
-            continue
-
-        if not was_in_room:
-            was_in_room = True
-            # Make sure we drain pending room manager commands here with sleeps to ensure the client has time to switch scenes.
-            # await asyncio.sleep(1.0)
-            message = lobby.drain_message(ws)
-            if message is not None:
-                await transmit_bytes(
-                    ws,
-                    orjson.dumps(
-                        message,
-                        option=orjson.OPT_NAIVE_UTC | orjson.OPT_PASSTHROUGH_DATETIME,
-                        default=datetime.isoformat,
-                    ),
-                )
-            # await asyncio.sleep(1.0)
-            continue
+        was_in_room = True
 
         # Send a ping every 10 seconds.
-        if (datetime.now(timezone.utc) - remote.last_ping).total_seconds() > 10.0:
+        if (
+            datetime.now(timezone.utc) - remote.last_ping
+        ).total_seconds() > PING_PERIOD_S:
             remote.last_ping = datetime.now(timezone.utc)
             await transmit_bytes(
-                ws,
-                orjson.dumps(
-                    message_from_server.PingMessageFromServer(),
-                    option=orjson.OPT_NAIVE_UTC | orjson.OPT_PASSTHROUGH_DATETIME,
-                    default=datetime.isoformat,
-                ),
+                ws, SerializeMessage(message_from_server.PingMessageFromServer())
             )
 
-        out_messages = []
-        if room.fill_messages(player_id, out_messages):
-            for message in out_messages:
-                await transmit_bytes(
-                    ws,
-                    orjson.dumps(
-                        message,
-                        option=orjson.OPT_NAIVE_UTC | orjson.OPT_PASSTHROUGH_DATETIME,
-                        default=datetime.isoformat,
-                    ),
-                )
-
 
 async def receive_agent_updates(request, ws, lobby):
     logger.info(f"receive_agent_updates({request}, {ws}, {lobby})")
     GlobalConfig()
+    try:
+        await _receive_agent_updates(request, ws, lobby)
+    finally:
+        # Wake up the sender so that it notices the connection has closed.
+        outbox = GetOutbox(ws)
+        if outbox is not None:
+            outbox.close()
+
+
+async def _receive_agent_updates(request, ws, lobby):
     async for msg in ws:
         remote = GetRemote(ws)
         if ws.closed:
@@ -1272,6 +1307,12 @@ async def PlayerEndpoint(request):
     is_bot = False
     if "is_bot" in request.query:
         is_bot = request.query["is_bot"] == "true"
+    # Opt-in: clients which pass batch_messages=true receive JSON arrays of
+    # MessageFromServer objects instead of one frame per message.
+    batch_messages = request.query.get("batch_messages", "false") == "true"
+    # Opt-in: clients which pass map_deltas=true are sent tile-level MapUpdate
+    # deltas when the map changes mid-game.
+    map_deltas = request.query.get("map_deltas", "false") == "true"
     if "assignmentId" in request.query:
         # If this is an mturk task, log assignment into to the remote table.
         is_mturk = True
@@ -1314,7 +1355,14 @@ async def PlayerEndpoint(request):
             remote, mturk_id=worker_id, user_type=UserType.MTURK
         )
 
+    if batch_messages:
+        remote = dataclasses.replace(remote, batch_messages=True)
+
+    if map_deltas:
+        remote = dataclasses.replace(remote, map_deltas=True)
+
     AddRemote(ws, remote, assignment)
+    CreateOutbox(ws)
     logger.info(f"Player connected. Type: {repr(remote.user_type)}")
     LogConnectionEvent(remote, "Connected to Server.")
     try:
@@ -1327,6 +1375,7 @@ async def PlayerEndpoint(request):
         logger.info("player disconnected from : " + request.remote)
         LogConnectionEvent(remote, "Disconnected from Server.")
         lobby.disconnect_socket(ws)
+        DeleteOutbox(ws)
         DeleteRemote(ws)
     return ws
 
@@ -1435,6 +1484,7 @@ def InitGameRecording(config):
     base.SetDatabase(config)
     base.ConnectDatabase()
     base.CreateTablesIfNotExists(defaults.ListDefaultTables())
+    InitScenarioCache(config)
 
 
 def CreateDataDirectory(config):
@@ -1490,9 +1540,10 @@ def main(config_filepath=""):
     tasks = asyncio.gather(
         *lobby_coroutines,
         serve(GlobalConfig()),
-        MapGenerationTask(lobbies, GlobalConfig()),
+        MapGenerationTask(GlobalConfig()),
         DataDownloader(lobbies),
         ExceptionSaver(lobbies, GlobalConfig()),
+        EventLoopLagMonitor(),
     )
     loop = asyncio.get_event_loop()
     # loop.set_debug(enabled=True)
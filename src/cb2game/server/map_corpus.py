@@ -0,0 +1,254 @@
+""" A seed-indexed corpus of pre-generated random maps, in one memory-mappable file.
+
+RandomMap() output is determined by MapConfig.rng_seed, so a corpus covers a
+contiguous range of seeds generated with one MapConfig. Each map's tiles are
+stored in row-major order as fixed-width columns (asset ID, edges, layer and
+rotation), one row of each column per map. Coordinates are implied by the
+tile's position, and heights by its layer. Map metadata (cities, lakes...) is
+stored as compact JSON, one entry per map.
+
+File layout:
+    CORPUS_MAGIC
+    uint32 header length, then the header (JSON): version, rows, cols,
+        first_seed, count, map_config and the byte offset of each array.
+    Arrays, each aligned to CORPUS_ALIGNMENT bytes:
+        One (count, rows * cols) array per TILE_COLUMNS entry.
+        metadata_offsets: (count + 1,) int64. Entry i's metadata is
+            metadata[metadata_offsets[i]:metadata_offsets[i + 1]].
+        metadata: uint8, to the end of the file.
+
+MapCorpus memory-maps the file, so loading a map by seed reads only that map's
+rows. To generate a corpus, see scripts/generate_map_corpus.py.
+"""
+import dataclasses
+import logging
+import os
+import pathlib
+
+import numpy as np
+import orjson
+
+from cb2game.server.config.map_config import MapConfig
+from cb2game.server.hex import HecsCoord, HexBoundary, HexCell
+from cb2game.server.map_utils import LayerToHeight
+from cb2game.server.messages.map_update import MapMetadata, MapUpdate, Tile
+
+logger = logging.getLogger(__name__)
+
+CORPUS_MAGIC = b"CB2MAPS\0"
+CORPUS_VERSION = 1
+CORPUS_ALIGNMENT = 64
+
+# (name, dtype) of each per-tile column.
+TILE_COLUMNS = (
+    ("asset_id", "<i2"),
+    ("edges", "u1"),
+    ("layer", "i1"),
+    ("rotation_degrees", "<i2"),
+)
+
+
+def _Align(offset):
+    return -(-offset // CORPUS_ALIGNMENT) * CORPUS_ALIGNMENT
+
+
+def EncodeMap(map_update):
+    """Returns (columns, metadata) for a map. columns maps names in TILE_COLUMNS to arrays.
+
+    Raises ValueError if the map can't be stored exactly (tiles out of
+    row-major order, heights which don't match layers, non-integer fields).
+    """
+    rows, cols = map_update.rows, map_update.cols
+    if len(map_update.tiles) != rows * cols:
+        raise ValueError(
+            f"Map has {len(map_update.tiles)} tiles, expected {rows} * {cols}."
+        )
+    values = {name: [] for name, _ in TILE_COLUMNS}
+    for i, tile in enumerate(map_update.tiles):
+        cell = tile.cell
+        if cell.coord.to_offset_coordinates() != divmod(i, cols):
+            raise ValueError(f"Tile {i} at {cell.coord} is out of row-major order.")
+        if cell.height != LayerToHeight(cell.layer):
+            raise ValueError(f"Tile {i} height doesn't match its layer.")
+        for value in (tile.asset_id, tile.rotation_degrees, cell.layer):
+            if not isinstance(value, int):
+                raise ValueError(f"Tile {i} has a non-integer field: {value!r}")
+        values["asset_id"].append(tile.asset_id)
+        values["edges"].append(cell.boundary.edges)
+        values["layer"].append(cell.layer)
+        values["rotation_degrees"].append(tile.rotation_degrees)
+    columns = {
+        name: np.array(values[name], dtype=dtype) for name, dtype in TILE_COLUMNS
+    }
+    return columns, orjson.dumps(map_update.metadata)
+
+
+class MapCorpusWriter(object):
+    """Writes a corpus of count maps, for seeds first_seed onwards.
+
+    Maps must be appended in seed order. The corpus is written to a temporary
+    file, and moved to path by close() once every map has been appended.
+    """
+
+    def __init__(self, path, map_config: MapConfig, first_seed, count):
+        self.path = pathlib.Path(path)
+        self._temp_path = self.path.with_name(self.path.name + ".tmp")
+        self._rows = map_config.map_height
+        self._cols = map_config.map_width
+        self._count = count
+        self._next = 0
+        header = {
+            "version": CORPUS_VERSION,
+            "rows": self._rows,
+            "cols": self._cols,
+            "first_seed": first_seed,
+            "count": count,
+            "map_config": dataclasses.replace(map_config, rng_seed=None).to_dict(),
+        }
+        # Header size doesn't depend on the offsets' values, as long as they
+        # fit in the placeholder's digits.
+        placeholder = 10**15
+        header["offsets"] = {name: placeholder for name, _ in TILE_COLUMNS}
+        header["offsets"]["metadata_offsets"] = placeholder
+        header["offsets"]["metadata"] = placeholder
+        header_size = len(orjson.dumps(header))
+        offset = _Align(len(CORPUS_MAGIC) + 4 + header_size)
+        for name, dtype in TILE_COLUMNS:
+            header["offsets"][name] = offset
+            offset = _Align(
+                offset + count * self._rows * self._cols * np.dtype(dtype).itemsize
+            )
+        header["offsets"]["metadata_offsets"] = offset
+        offset = _Align(offset + (count + 1) * 8)
+        header["offsets"]["metadata"] = offset
+        header_bytes = orjson.dumps(header).ljust(header_size)
+        self._offsets = header["offsets"]
+        self._metadata_offsets = np.zeros(count + 1, dtype=np.int64)
+
+        self._file = open(self._temp_path, "wb")
+        self._file.write(CORPUS_MAGIC)
+        self._file.write(np.uint32(header_size).tobytes())
+        self._file.write(header_bytes)
+        self._file.truncate(offset)
+
+    def append(self, map_update_or_encoded):
+        """Appends the next map. Takes a MapUpdate, or the output of EncodeMap()."""
+        if self._next >= self._count:
+            raise ValueError(f"Corpus {self.path} already has {self._count} maps.")
+        encoded = map_update_or_encoded
+        if isinstance(encoded, MapUpdate):
+            encoded = EncodeMap(encoded)
+        columns, metadata = encoded
+        if len(columns["asset_id"]) != self._rows * self._cols:
+            raise ValueError(f"Map size doesn't match corpus {self.path}.")
+        for name, dtype in TILE_COLUMNS:
+            row_bytes = self._rows * self._cols * np.dtype(dtype).itemsize
+            self._file.seek(self._offsets[name] + self._next * row_bytes)
+            self._file.write(columns[name].astype(dtype, copy=False).tobytes())
+        end = self._metadata_offsets[self._next] + len(metadata)
+        self._file.seek(self._offsets["metadata"] + self._metadata_offsets[self._next])
+        self._file.write(metadata)
+        self._next += 1
+        self._metadata_offsets[self._next] = end
+
+    def close(self):
+        if self._file is None:
+            return
+        if self._next < self._count:
+            self._file.close()
+            self._file = None
+            self._temp_path.unlink(missing_ok=True)
+            raise ValueError(
+                f"Corpus {self.path} has {self._next} of {self._count} maps. Not saving."
+            )
+        self._file.seek(self._offsets["metadata_offsets"])
+        self._file.write(self._metadata_offsets.tobytes())
+        self._file.close()
+        self._file = None
+        os.replace(self._temp_path, self.path)
+
+
+class MapCorpus(object):
+    """Reads maps from a corpus file by seed. See the top of this file."""
+
+    def __init__(self, path):
+        self.path = pathlib.Path(path)
+        with open(self.path, "rb") as f:
+            if f.read(len(CORPUS_MAGIC)) != CORPUS_MAGIC:
+                raise ValueError(f"{self.path} is not a map corpus.")
+            (header_size,) = np.frombuffer(f.read(4), dtype=np.uint32)
+            header = orjson.loads(f.read(int(header_size)))
+        if header["version"] != CORPUS_VERSION:
+            raise ValueError(
+                f"Map corpus {self.path} has version {header['version']}. Expected {CORPUS_VERSION}."
+            )
+        self.rows = header["rows"]
+        self.cols = header["cols"]
+        self.first_seed = header["first_seed"]
+        self.map_config = MapConfig.from_dict(header["map_config"])
+        self._count = header["count"]
+        offsets = header["offsets"]
+        self._buffer = np.memmap(self.path, dtype=np.uint8, mode="r")
+        self._columns = {
+            name: np.ndarray(
+                (self._count, self.rows * self.cols),
+                dtype=dtype,
+                buffer=self._buffer,
+                offset=offsets[name],
+            )
+            for name, dtype in TILE_COLUMNS
+        }
+        self._metadata_offsets = np.ndarray(
+            (self._count + 1,),
+            dtype=np.int64,
+            buffer=self._buffer,
+            offset=offsets["metadata_offsets"],
+        )
+        self._metadata = self._buffer[offsets["metadata"] :]
+
+    def __len__(self):
+        return self._count
+
+    def __contains__(self, seed):
+        return 0 <= seed - self.first_seed < self._count
+
+    def seeds(self):
+        return range(self.first_seed, self.first_seed + self._count)
+
+    def column(self, name, seed=None):
+        """A (maps, rows * cols) column from TILE_COLUMNS, or one map's row of it."""
+        if seed is None:
+            return self._columns[name]
+        return self._columns[name][self._index(seed)]
+
+    def map_update(self, seed) -> MapUpdate:
+        """Returns the map for a seed, as RandomMap() would generate it."""
+        index = self._index(seed)
+        asset_ids, edges, layers, rotations = (
+            self._columns[name][index].tolist() for name, _ in TILE_COLUMNS
+        )
+        tiles = []
+        for i in range(self.rows * self.cols):
+            r, c = divmod(i, self.cols)
+            tiles.append(
+                Tile(
+                    asset_ids[i],
+                    HexCell(
+                        HecsCoord.from_offset(r, c),
+                        HexBoundary(edges[i]),
+                        LayerToHeight(layers[i]),
+                        layers[i],
+                    ),
+                    rotations[i],
+                )
+            )
+        start, end = self._metadata_offsets[index : index + 2]
+        metadata = MapMetadata.from_dict(
+            orjson.loads(self._metadata[start:end].tobytes())
+        )
+        return MapUpdate(self.rows, self.cols, tiles, metadata)
+
+    def _index(self, seed):
+        if seed not in self:
+            raise KeyError(f"Seed {seed} is not in map corpus {self.path}")
+        return seed - self.first_seed
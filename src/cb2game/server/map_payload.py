@@ -0,0 +1,112 @@
+""" Caches the serialized form of maps.
+
+A game's map doesn't change after it's generated, but it's serialized each time
+it's sent to a player, written to the room's message log, and recorded to the
+database. Tiles make up nearly all of a serialized map. MapUpdate objects for
+the same map (re-stamped with a new version, or shared between scenario rooms)
+share one tiles list, so serialized tiles are cached by the identity of that
+list in a small LRU. The rest of the MapUpdate is small, and is serialized per
+call with the cached tiles spliced in.
+"""
+import dataclasses
+import logging
+from collections import OrderedDict
+from datetime import datetime
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# Number of distinct maps to keep serialized payloads for.
+MAP_PAYLOAD_CACHE_SIZE = 32
+
+WIRE_OPTIONS = orjson.OPT_NAIVE_UTC | orjson.OPT_PASSTHROUGH_DATETIME
+DB_OPTIONS = WIRE_OPTIONS | orjson.OPT_INDENT_2
+
+
+class TilesPayload(object):
+    """Serialized forms of a list of tiles. The DB form is generated lazily."""
+
+    def __init__(self, tiles):
+        # Keep a reference so that id(tiles) stays unique while cached.
+        self.tiles = tiles
+        self.wire = orjson.dumps(tiles, option=WIRE_OPTIONS)
+        self._db = None
+
+    def db(self):
+        """Tiles indented to be nested one level deep in a DB-form MapUpdate."""
+        if self._db is None:
+            self._db = orjson.dumps(self.tiles, option=DB_OPTIONS).replace(
+                b"\n", b"\n  "
+            )
+        return self._db
+
+
+class MapPayloadCache(object):
+    """An LRU of TilesPayload, keyed by tiles list identity."""
+
+    def __init__(self, max_size=MAP_PAYLOAD_CACHE_SIZE):
+        self._max_size = max_size
+        self._payloads = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, tiles):
+        key = id(tiles)
+        payload = self._payloads.get(key, None)
+        if payload is not None and payload.tiles is tiles:
+            self.hits += 1
+            self._payloads.move_to_end(key)
+            return payload
+        self.misses += 1
+        payload = TilesPayload(tiles)
+        self._payloads[key] = payload
+        self._payloads.move_to_end(key)
+        while len(self._payloads) > self._max_size:
+            self._payloads.popitem(last=False)
+        return payload
+
+    def clear(self):
+        self._payloads.clear()
+
+    def __len__(self):
+        return len(self._payloads)
+
+
+map_payload_cache = MapPayloadCache()
+
+
+def MapUpdateWireBytes(map_update):
+    """Returns map_update as compact JSON bytes."""
+    payload = map_payload_cache.get(map_update.tiles)
+    # rows & cols precede tiles, so the first match is the top-level field.
+    return orjson.dumps(
+        dataclasses.replace(map_update, tiles=[]),
+        option=WIRE_OPTIONS,
+        default=datetime.isoformat,
+    ).replace(b'"tiles":[]', b'"tiles":' + payload.wire, 1)
+
+
+def MapUpdateDbJson(map_update):
+    """Returns map_update as indented JSON, as stored in the game database."""
+    payload = map_payload_cache.get(map_update.tiles)
+    return (
+        orjson.dumps(
+            dataclasses.replace(map_update, tiles=[]),
+            option=DB_OPTIONS,
+            default=datetime.isoformat,
+        )
+        .replace(b'"tiles": []', b'"tiles": ' + payload.db(), 1)
+        .decode("utf-8")
+    )
+
+
+def SerializeWithMapUpdate(value, map_update):
+    """Serializes a message (or log entry) containing map_update.
+
+    value must be the containing object with map_update replaced by None, and
+    must have no other "map_update" fields before the one being replaced.
+    """
+    return orjson.dumps(value, option=WIRE_OPTIONS, default=datetime.isoformat).replace(
+        b'"map_update":null', b'"map_update":' + MapUpdateWireBytes(map_update), 1
+    )
@@ -1,25 +1,39 @@
 """ This utility streams a hardcoded map to clients. """
 import asyncio
+import collections
+import concurrent.futures
 import dataclasses
+import functools
+import gzip
+import hashlib
 import itertools
 import logging
 import math
+import multiprocessing
+import os
+import pathlib
 import random
 import sys
+import time
+import uuid
+from collections import deque
 from dataclasses import dataclass
 from enum import Enum
 from queue import Queue
 from typing import List
 
 import numpy as np
+import orjson
 from dataclasses_json import dataclass_json
 
 import cb2game.server.card as card
 import cb2game.server.tutorial_map_data as tutorial_map_data
 from cb2game.server.assets import AssetId, is_snowy
-from cb2game.server.config.config import GlobalConfig
+from cb2game.server.config.config import GlobalConfig, SetGlobalConfig
 from cb2game.server.config.map_config import MapConfig
 from cb2game.server.hex import HecsCoord
+from cb2game.server.hex_grid import DIRECTIONS, HexGrid, NeighborLists, hex_grid_cache
+from cb2game.server.map_corpus import EncodeMap, MapCorpus
 from cb2game.server.map_utils import *
 from cb2game.server.messages.action import Color
 from cb2game.server.messages.map_update import (
@@ -46,17 +60,17 @@ class SearchPoint:
     radius: int
 
 
-def place_city(map, city, map_config):
+def place_city(map, city, map_config, rng: np.random.RandomState):
     """Places a city on the map."""
     # Place the center path tile.
-    map[city.r][city.c] = PathTile(map_config=map_config)
+    map[city.r][city.c] = PathTile(map_config=map_config, rng=rng)
     map_height, map_width = map_config.map_height, map_config.map_width
 
     # Make openings to enter and exit the city.
     connection_points = city_connection_points(city, map_config)
     for point in connection_points:
         r, c = point.to_offset_coordinates()
-        map[r][c] = PathTile(0, map_config)
+        map[r][c] = PathTile(0, map_config, rng=rng)
 
     point_queue = Queue()
     point_queue.put(SearchPoint(city.r, city.c, 0))
@@ -71,17 +85,18 @@ def place_city(map, city, map_config):
             AssetId.GROUND_TILE,
         ] + NatureAssetIds(map_config=map_config):
             if point.radius % 3 == 0:
-                tile_generator = np.random.choice(
+                tile_generator = RandomChoice(
                     [PathTile, GroundTileTree, GroundTileStreetLight],
-                    size=1,
-                    p=[0.3, 0.3, 0.4],
-                )[0]
+                    (0.3, 0.3, 0.4),
+                    rng,
+                )
                 map[point.r][point.c] = tile_generator(
                     rotation_degrees=random.choice([0, 60, 120, 180, 240, 300]),
                     map_config=map_config,
+                    rng=rng,
                 )
             elif point.radius % 3 == 1:
-                map[point.r][point.c] = PathTile(0, map_config)
+                map[point.r][point.c] = PathTile(0, map_config, rng=rng)
             elif point.radius % 3 == 2:
                 coord = HecsCoord.from_offset(point.r, point.c)
                 center = HecsCoord.from_offset(city.r, city.c)
@@ -89,6 +104,7 @@ def place_city(map, city, map_config):
                 map[point.r][point.c] = UrbanHouseTile(
                     rotation_degrees=degrees_to_center,
                     map_config=map_config,
+                    rng=rng,
                 )
         hc = HecsCoord.from_offset(point.r, point.c)
         for neighbor in hc.neighbors():
@@ -119,10 +135,10 @@ def city_connection_points(city, map_config):
     return connections
 
 
-def place_circular_lake(map, lake, map_config):
+def place_circular_lake(map, lake, map_config, rng: np.random.RandomState):
     """Places a lake on the map."""
     # Place the center tile.
-    map[lake.r][lake.c] = WaterTile(map_config=map_config)
+    map[lake.r][lake.c] = WaterTile(map_config=map_config, rng=rng)
 
     map_height, map_width = map_config.map_height, map_config.map_width
     point_queue = Queue()
@@ -144,14 +160,14 @@ def place_circular_lake(map, lake, map_config):
             edge_of_map = r == 0 or c == 0 or r == map_height - 1 or c == map_width - 1
             if map[r][c].asset_id in [AssetId.EMPTY_TILE, AssetId.GROUND_TILE]:
                 if (point.radius == lake.size) or edge_of_map:
-                    map[r][c] = PathTile(map_config=map_config)
+                    map[r][c] = PathTile(map_config=map_config, rng=rng)
                 elif map[r][c].asset_id == AssetId.EMPTY_TILE:
-                    map[r][c] = WaterTile(map_config=map_config)
+                    map[r][c] = WaterTile(map_config=map_config, rng=rng)
             if point.radius < lake.size:
                 point_queue.put(SearchPoint(r, c, point.radius + 1))
 
 
-def place_l_shaped_lake(map, lake, map_config):
+def place_l_shaped_lake(map, lake, map_config, rng: np.random.RandomState):
     r, c = lake.r, lake.c
     # Each lake configuration is a list of smaller lake epicenters. They are combined to make the larger lake.
     lake_configurations = [
@@ -164,33 +180,33 @@ def place_l_shaped_lake(map, lake, map_config):
     for lake in lake_positions:
         if not offset_coord_in_map(map, (lake.r, lake.c)):
             continue
-        place_circular_lake(map, lake, map_config)
+        place_circular_lake(map, lake, map_config, rng)
 
 
-def place_island_lake(map, lake, map_config):
+def place_island_lake(map, lake, map_config, rng: np.random.RandomState):
     r, c = lake.r, lake.c
     lake.size = 2
-    place_circular_lake(map, lake, map_config)
+    place_circular_lake(map, lake, map_config, rng)
     point_queue = Queue()
     point_queue.put(SearchPoint(r, c, 0))
     center = HecsCoord.from_offset(r, c)
-    map[r][c] = np.random.choice(
+    map[r][c] = RandomChoice(
         [GroundTile, RandomNatureTile, GroundTileStreetLight],
-        size=1,
-        p=[0.05, 0.45, 0.5],
-    )[0](map_config=map_config)
+        (0.05, 0.45, 0.5),
+        rng,
+    )(map_config=map_config, rng=rng)
     lr, lc = center.left().to_offset_coordinates()
-    map[lr][lc] = np.random.choice(
+    map[lr][lc] = RandomChoice(
         [GroundTile, RandomNatureTile, GroundTileStreetLight],
-        size=1,
-        p=[0.9, 0.05, 0.05],
-    )[0](map_config=map_config)
+        (0.9, 0.05, 0.05),
+        rng,
+    )(map_config=map_config, rng=rng)
     rr, rc = center.right().to_offset_coordinates()
-    map[rr][rc] = np.random.choice(
+    map[rr][rc] = RandomChoice(
         [GroundTile, RandomNatureTile, GroundTileStreetLight],
-        size=1,
-        p=[0.9, 0.05, 0.05],
-    )[0](map_config=map_config)
+        (0.9, 0.05, 0.05),
+        rng,
+    )(map_config=map_config, rng=rng)
 
     # Each "bridge" consists of two tiles (tile_inner, tile_outer)
     bridge_points = [
@@ -207,16 +223,16 @@ def place_island_lake(map, lake, map_config):
         inner, outer = bridge_points.pop()
         in_r, in_c = inner.to_offset_coordinates()
         out_r, out_c = outer.to_offset_coordinates()
-        map[in_r][in_c] = GroundTile()
-        map[out_r][out_c] = GroundTile()
+        map[in_r][in_c] = GroundTile(rng=rng)
+        map[out_r][out_c] = GroundTile(rng=rng)
 
     for inner, outer in bridge_points:
         in_r, in_c = inner.to_offset_coordinates()
-        map[in_r][in_c] = np.random.choice(
+        map[in_r][in_c] = RandomChoice(
             [GroundTile, RandomNatureTile, GroundTileStreetLight],
-            size=1,
-            p=[0.9, 0.05, 0.05],
-        )[0](map_config=map_config)
+            (0.9, 0.05, 0.05),
+            rng,
+        )(map_config=map_config, rng=rng)
 
 
 def random_lake_type():
@@ -229,7 +245,7 @@ def random_lake_type():
     return lake_type
 
 
-def place_lake(map, lake, map_config):
+def place_lake(map, lake, map_config, rng: np.random.RandomState):
     type = lake.type
     if type == LakeType.RANDOM:
         # Recursive, but guaranteed to terminate.
@@ -239,13 +255,13 @@ def place_lake(map, lake, map_config):
                 "RANDOM lake type cannot be returned from random_lake_type()."
             )
             lake.type = LakeType.REGULAR
-        place_lake(map, lake, map_config, map_config)
+        place_lake(map, lake, map_config, rng)
     elif type == LakeType.L_SHAPED:
-        place_l_shaped_lake(map, lake, map_config)
+        place_l_shaped_lake(map, lake, map_config, rng)
     elif type == LakeType.ISLAND:
-        place_island_lake(map, lake, map_config)
+        place_island_lake(map, lake, map_config, rng)
     elif type == LakeType.REGULAR:
-        place_circular_lake(map, lake, map_config)
+        place_circular_lake(map, lake, map_config, rng)
 
 
 def lake_connection_points(lake, map_config):
@@ -281,7 +297,9 @@ def offset_coord_in_map(map, offset):
     )
 
 
-def place_small_mountain(map, mountain, map_config: MapConfig):
+def place_small_mountain(
+    map, mountain, map_config: MapConfig, rng: np.random.RandomState
+):
     mountain_coords = []
     # MountainTile(rotation_degrees=0)
     # RampToMountain(rotation_degrees=0)
@@ -334,10 +352,14 @@ def place_small_mountain(map, mountain, map_config: MapConfig):
             offset = neighbor.to_offset_coordinates()
             if offset_coord_in_map(map, offset):
                 if map[offset[0]][offset[1]].asset_id == AssetId.EMPTY_TILE:
-                    map[offset[0]][offset[1]] = GroundTile(map_config=map_config)
+                    map[offset[0]][offset[1]] = GroundTile(
+                        map_config=map_config, rng=rng
+                    )
 
 
-def place_medium_mountain(map, mountain, map_config: MapConfig):
+def place_medium_mountain(
+    map, mountain, map_config: MapConfig, rng: np.random.RandomState
+):
     mountain_coords = []
     # MountainTile(rotation_degrees=0)
     # RampToMountain(rotation_degrees=0)
@@ -393,10 +415,14 @@ def place_medium_mountain(map, mountain, map_config: MapConfig):
             offset = neighbor.to_offset_coordinates()
             if offset_coord_in_map(map, offset):
                 if map[offset[0]][offset[1]].asset_id == AssetId.EMPTY_TILE:
-                    map[offset[0]][offset[1]] = GroundTile(map_config=map_config)
+                    map[offset[0]][offset[1]] = GroundTile(
+                        map_config=map_config, rng=rng
+                    )
 
 
-def place_large_mountain(map, mountain, map_config: MapConfig):
+def place_large_mountain(
+    map, mountain, map_config: MapConfig, rng: np.random.RandomState
+):
     mountain_coords = []
     # MountainTile(rotation_degrees=0)
     # RampToMountain(rotation_degrees=0)
@@ -453,16 +479,18 @@ def place_large_mountain(map, mountain, map_config: MapConfig):
             offset = neighbor.to_offset_coordinates()
             if offset_coord_in_map(map, offset):
                 if map[offset[0]][offset[1]].asset_id == AssetId.EMPTY_TILE:
-                    map[offset[0]][offset[1]] = GroundTile(map_config=map_config)
+                    map[offset[0]][offset[1]] = GroundTile(
+                        map_config=map_config, rng=rng
+                    )
 
 
-def place_mountain(map, mountain, map_config: MapConfig):
+def place_mountain(map, mountain, map_config: MapConfig, rng: np.random.RandomState):
     if mountain.type == MountainType.SMALL:
-        place_small_mountain(map, mountain, map_config)
+        place_small_mountain(map, mountain, map_config, rng)
     elif mountain.type == MountainType.MEDIUM:
-        place_medium_mountain(map, mountain, map_config)
+        place_medium_mountain(map, mountain, map_config, rng)
     elif mountain.type == MountainType.LARGE:
-        place_large_mountain(map, mountain, map_config)
+        place_large_mountain(map, mountain, map_config, rng)
     else:
         logger.error(f"Unknown mountain type: {mountain.type}")
 
@@ -501,38 +529,52 @@ def mountain_connection_points(map, mountain):
 def path_find(map, start, end, map_config: MapConfig = MapConfig()):
     """Finds a path of empty or ground tiles from start to end on the map.
 
-    Returns a list of tiles that make up the path.
+    Returns a list of HecsCoords that make up the path, or None if there's no
+    path (or start or end are off the map).
 
     Used for outpost routing.
     """
-    children = Queue()
-    children.put((start, [start]))
-    visited = set()
-    visited.add(start)
-    while not children.empty():
-        (current, path_to_current) = children.get()
-        if current == end:
-            return path_to_current
-        (r, c) = current.to_offset_coordinates()
-        for neighbor in current.neighbors():
-            nr, nc = neighbor.to_offset_coordinates()
-            if nr < 0 or nr >= len(map) or nc < 0 or nc >= len(map[0]):
+    rows, cols = len(map), len(map[0])
+    start_r, start_c = start.to_offset_coordinates()
+    end_r, end_c = end.to_offset_coordinates()
+    if not (0 <= start_r < rows and 0 <= start_c < cols):
+        return None
+    if not (0 <= end_r < rows and 0 <= end_c < cols):
+        return None
+    walkable_assets = set(
+        [
+            AssetId.EMPTY_TILE,
+            AssetId.GROUND_TILE,
+            AssetId.GROUND_TILE_PATH,
+        ]
+        + NatureAssetIds(map_config=map_config)
+    )
+    neighbors = NeighborLists(rows, cols)
+    start_index = start_r * cols + start_c
+    end_index = end_r * cols + end_c
+    # Breadth-first over flat indices (r * cols + c). Paths are rebuilt from
+    # each location's predecessor.
+    predecessors = {start_index: -1}
+    children = deque([start_index])
+    while children:
+        current = children.popleft()
+        if current == end_index:
+            path = []
+            while current >= 0:
+                path.append(HecsCoord.from_offset(current // cols, current % cols))
+                current = predecessors[current]
+            path.reverse()
+            return path
+        for neighbor in neighbors[current]:
+            if neighbor < 0 or neighbor in predecessors:
                 continue
-            neighbor_tile = map[nr][nc]
-            if neighbor_tile.asset_id in [
-                AssetId.EMPTY_TILE,
-                AssetId.GROUND_TILE,
-                AssetId.GROUND_TILE_PATH,
-            ] + NatureAssetIds(map_config=map_config):
-                if neighbor not in visited:
-                    path_to_neighbor = path_to_current + [neighbor]
-                    child_node = (neighbor, path_to_neighbor)
-                    children.put(child_node)
-                    visited.add(neighbor)
+            if map[neighbor // cols][neighbor % cols].asset_id in walkable_assets:
+                predecessors[neighbor] = current
+                children.append(neighbor)
     return None
 
 
-def place_outpost(map, outpost, map_config: MapConfig):
+def place_outpost(map, outpost, map_config: MapConfig, rng: np.random.RandomState):
     """Place tiles at (r, c), (r + 1, c), (r, c + 2), (r + 1, c + 2)"""
     coords = [
         (outpost.r, outpost.c),
@@ -553,7 +595,7 @@ def place_outpost(map, outpost, map_config: MapConfig):
         map[row][col] = tile
 
     # The outpost positioning purposefully leaves out (r, c+1). This is the center. Mark it as PathTile and then path-connect it to nearest features.
-    map[outpost.r + 2][outpost.c] = PathTile(map_config=map_config)
+    map[outpost.r + 2][outpost.c] = PathTile(map_config=map_config, rng=rng)
 
     # Connect the outpost to the nearest features.
     path_to_a = path_find(
@@ -576,7 +618,7 @@ def place_outpost(map, outpost, map_config: MapConfig):
         for coord in path_to_x:
             offset = coord.to_offset_coordinates()
             if offset_coord_in_map(map, offset):
-                map[offset[0]][offset[1]] = PathTile(map_config=map_config)
+                map[offset[0]][offset[1]] = PathTile(map_config=map_config, rng=rng)
 
 
 def RandomMap(map_config: MapConfig):
@@ -587,8 +629,11 @@ def RandomMap(map_config: MapConfig):
     else:
         start_seed = random.randint(0, sys.maxsize)
 
-    # Set the RNG seed.
+    # Set the RNG seed. Tile assets are drawn from a numpy RNG which is local
+    # to this map, so numpy's global RNG is left alone. The map is then
+    # determined by start_seed alone.
     random.seed(start_seed)
+    rng = np.random.RandomState(start_seed % (2**32))
 
     map = []
     for r in range(0, map_config.map_height):
@@ -598,7 +643,7 @@ def RandomMap(map_config: MapConfig):
             row.append(tile)
         map.append(row)
 
-    map_metadata = MapMetadata([], [], [], [], 0, start_seed)
+    map_metadata = MapMetadata([], [], [], [], 0, start_seed=start_seed)
 
     # Generate candidates for feature centers.
     rows = list(range(1, map_config.map_height - 2, 6))
@@ -622,7 +667,7 @@ def RandomMap(map_config: MapConfig):
         city_center = feature_center_candidates.pop()
         city = City(city_center[0], city_center[1], 2)
         cities.append(city)
-        place_city(map, city, map_config)
+        place_city(map, city, map_config, rng)
         map_metadata.cities.append(city)
         new_connection_points = city_connection_points(city, map_config)
         connection_points.extend(new_connection_points)
@@ -643,7 +688,7 @@ def RandomMap(map_config: MapConfig):
         lake = Lake(
             lake_center[0], lake_center[1], random.randint(1, 2), lake_types.pop()
         )
-        place_lake(map, lake, map_config)
+        place_lake(map, lake, map_config, rng)
         map_metadata.lakes.append(lake)
         new_connection_points = lake_connection_points(lake, map_config)
         connection_points.extend(new_connection_points)
@@ -668,9 +713,9 @@ def RandomMap(map_config: MapConfig):
             mountain_center[0],
             mountain_center[1],
             mountain_types.pop(),
-            bool(np.random.choice([True, False], p=[0.3, 0.7])),
+            RandomChoice([True, False], (0.3, 0.7), rng),
         )
-        place_mountain(map, mountain, map_config)
+        place_mountain(map, mountain, map_config, rng)
         map_metadata.mountains.append(mountain)
         new_connection_points = mountain_connection_points(map, mountain)
         connection_points.extend(new_connection_points)
@@ -706,16 +751,16 @@ def RandomMap(map_config: MapConfig):
             second_connection_point,
             [
                 RandomNatureTile(map_config=map_config),
-                UrbanHouseTile(map_config=map_config),
+                UrbanHouseTile(map_config=map_config, rng=rng),
                 RandomNatureTile(map_config=map_config),
             ],
         )
         map_metadata.outposts.append(outpost)
         if random.randint(0, 1) == 0:
             outpost.tiles.append(
-                UrbanHouseTile(rotation_degrees=180, map_config=map_config)
+                UrbanHouseTile(rotation_degrees=180, map_config=map_config, rng=rng)
             )
-        place_outpost(map, outpost, map_config)
+        place_outpost(map, outpost, map_config, rng)
 
     # For each connection point, see if another connection point is nearby. If so, path connect them.
     number_of_entities = ids.num_allocated()
@@ -740,58 +785,60 @@ def RandomMap(map_config: MapConfig):
                     for coord in path_to_j:
                         offset = coord.to_offset_coordinates()
                         if offset_coord_in_map(map, offset):
-                            map[offset[0]][offset[1]] = PathTile(map_config=map_config)
+                            map[offset[0]][offset[1]] = PathTile(
+                                map_config=map_config, rng=rng
+                            )
                     connected[entity_i][entity_j] = 1
                     connected[entity_j][entity_i] = 1
 
     # Fill empty tiles with random ground tiles.
+    rows, cols = map_config.map_height, map_config.map_width
+    neighbors = NeighborLists(rows, cols)
     snow_tiles = set(
         [
-            (r, c)
-            for r in range(map_config.map_height)
-            for c in range(map_config.map_width)
+            r * cols + c
+            for r in range(rows)
+            for c in range(cols)
             if is_snowy(map[r][c].asset_id)
         ]
     )
-    for r in range(0, map_config.map_height):
-        for c in range(0, map_config.map_width):
+    tree_assets = TreeAssetIds(map_config=map_config)
+    for r in range(0, rows):
+        for c in range(0, cols):
             if map[r][c].asset_id == AssetId.EMPTY_TILE:
-                is_near_snow = False
-                hecs = HecsCoord.from_offset(r, c)
-                for neighbor in hecs.neighbors():
-                    neighbor_rc = neighbor.to_offset_coordinates()
-                    if (
-                        offset_coord_in_map(map, neighbor_rc)
-                        and neighbor_rc in snow_tiles
-                    ):
-                        is_near_snow = True
-                        break
-                tile_generator = np.random.choice(
+                is_near_snow = any(
+                    neighbor in snow_tiles for neighbor in neighbors[r * cols + c]
+                )
+                tile_generator = RandomChoice(
                     [GroundTile, RandomNatureTile, GroundTileStreetLight],
-                    size=1,
-                    p=[0.88, 0.10, 0.02],
-                )[0]
-                tile = tile_generator(map_config=map_config)
-                snowify_tile = is_near_snow and tile.asset_id in TreeAssetIds(
-                    map_config=map_config
+                    (0.88, 0.10, 0.02),
+                    rng,
                 )
+                tile = tile_generator(map_config=map_config, rng=rng)
+                snowify_tile = is_near_snow and tile.asset_id in tree_assets
                 map[r][c] = SnowifyTile(tile) if snowify_tile else tile
 
     # Make sure there's at least 23 walkable tiles (2 for spawn points, 21 for card placement).
+    walkable_assets = [
+        AssetId.EMPTY_TILE,
+        AssetId.GROUND_TILE,
+        AssetId.GROUND_TILE_PATH,
+    ]
+    nature_assets = NatureAssetIds(map_config=map_config)
     walkable_tiles = 0
     blocked_nature_tiles = []
-    for r in range(0, map_config.map_height):
-        for c in range(0, map_config.map_width):
-            if is_walkable(map, HecsCoord.from_offset(r, c)):
+    for r in range(0, rows):
+        for c in range(0, cols):
+            if map[r][c].asset_id in walkable_assets:
                 walkable_tiles += 1
-            elif map[r][c].asset_id in NatureAssetIds(map_config=map_config):
+            elif map[r][c].asset_id in nature_assets:
                 blocked_nature_tiles.append(map[r][c])
 
     if walkable_tiles < 23:
         for i in range(23 - walkable_tiles):
             blocked_nature_tile = random.choice(blocked_nature_tiles)
             r, c = blocked_nature_tile.cell.coord.to_offset_coordinates()
-            map[r][c] = GroundTile(map_config=map_config)
+            map[r][c] = GroundTile(map_config=map_config, rng=rng)
             blocked_nature_tiles.remove(blocked_nature_tile)
             walkable_tiles += 1
 
@@ -880,13 +927,11 @@ class MapProvider(object):
         self._tiles = map_update.tiles
         # TODO(sharf): Need to advance id assigner to latest ID (max of tiles, cards, players)
         self._id_assigner = IdAssigner()
-        self._tiles_by_location = {}
-        for i, tile in enumerate(self._tiles):
-            self._tiles_by_location[tile.cell.coord] = i
         self._rows = map_update.rows
         self._cols = map_update.cols
+        self._grid = HexGrid.from_tiles(self._rows, self._cols, self._tiles)
         self._cards = cards
-        self._selected_cards = {}
+        self._init_selection()
         self._card_generator = CardGenerator(self._id_assigner)
 
         # Get fog from server config.
@@ -897,14 +942,16 @@ class MapProvider(object):
 
         self.add_map_boundaries()
         self.add_layer_boundaries()
+        # MapUpdates from map() share self._tiles, and so can share the grid.
+        hex_grid_cache.put(self._tiles, self._grid)
         # Choose spawn tiles for future cards.
-        spaces = FloodFillPartitionTiles(self._tiles)
+        spaces = FloodFillPartitionTiles(self._tiles, self._grid)
         sorted_spaces = sorted(spaces, key=len, reverse=True)
         # Burn IDs for all the existing cards (so they don't get reused).
         for card in self._cards:
             self._id_assigner.alloc()  # Discards a new ID.
             if card.selected:
-                self._selected_cards[card.id] = card
+                self._select(card)
         # Only spawn cards in the largest contiguous region.
         self._map_metadata = map_update.metadata
         self._potential_spawn_tiles = sorted_spaces[0]
@@ -920,6 +967,7 @@ class MapProvider(object):
                 AssetId.SNOWY_MOUNTAIN_TILE,
             ]
         ]
+        self._init_card_spawns()
         # Index cards generated.
         self._cards_by_location = {}
         for generated_card in self._cards:
@@ -947,6 +995,9 @@ class MapProvider(object):
         hardcoded maps (for the tutorial) and custom maps (for scenarios, loaded
         from a file).
 
+        If the map type is RANDOM, map_update may be provided to use a
+        pre-generated random map (see MapPool). Cards are still random.
+
         If the map type is PRESET, then map_update and cards must be provided.
         You can optionally also provide custom_targets, which will define a list
         of card IDs which are the targets for the scenario. Selecting these
@@ -958,8 +1009,12 @@ class MapProvider(object):
             self._custom_targets = set(custom_targets)
         if map_config is None:
             map_config = GlobalConfig().map_config
+        # Set by _init_card_spawns(). Hardcoded maps don't spawn cards.
+        self._spawn_index = None
         if map_type == MapType.RANDOM:
-            map_update = RandomMap(map_config)
+            # A pre-generated random map may be provided (see MapPool).
+            if map_update is None:
+                map_update = RandomMap(map_config)
             self._map_metadata = map_update.metadata
         elif map_type == MapType.HARDCODED:
             map_update = tutorial_map_data.HardcodedMap()
@@ -972,13 +1027,11 @@ class MapProvider(object):
 
         self._id_assigner = IdAssigner()
         self._tiles = map_update.tiles
-        self._tiles_by_location = {}
-        for i, tile in enumerate(self._tiles):
-            self._tiles_by_location[tile.cell.coord] = i
         self._rows = map_update.rows
         self._cols = map_update.cols
+        self._grid = HexGrid.from_tiles(self._rows, self._cols, self._tiles)
         self._cards = []
-        self._selected_cards = {}
+        self._init_selection()
         self._card_generator = CardGenerator(self._id_assigner)
 
         # Initialize fog from server config.
@@ -993,6 +1046,8 @@ class MapProvider(object):
 
         self.add_map_boundaries()
         self.add_layer_boundaries()
+        # MapUpdates from map() share self._tiles, and so can share the grid.
+        hex_grid_cache.put(self._tiles, self._grid)
         if map_type == MapType.HARDCODED:
             self._cards = []
             list(tutorial_map_data.CARDS)
@@ -1008,7 +1063,7 @@ class MapProvider(object):
             # partitions (regions which are blocked off by walls or edges).
             # Then, remove all spaces which aren't in the largest partition as
             # spawn tiles.
-            spaces = FloodFillPartitionTiles(self._tiles)
+            spaces = FloodFillPartitionTiles(self._tiles, self._grid)
             sorted_spaces = sorted(spaces, key=len, reverse=True)
             # Only spawn cards in the largest contiguous region.
             self._map_metadata.num_partitions = len(sorted_spaces)
@@ -1029,6 +1084,7 @@ class MapProvider(object):
                     AssetId.SNOWY_MOUNTAIN_TILE,
                 ]
             ]
+            self._init_card_spawns()
 
             number_of_cards = 21
             number_of_sets = math.ceil(number_of_cards / 3)
@@ -1041,9 +1097,11 @@ class MapProvider(object):
                         break
                     (r, c) = card_spawn_locations.pop()
                     (shape, color, count) = config
-                    self._cards.append(
-                        self._card_generator.generate_card_at(r, c, shape, color, count)
+                    new_card = self._card_generator.generate_card_at(
+                        r, c, shape, color, count
                     )
+                    self._cards.append(new_card)
+                    self._update_spawn_occupancy(new_card, 1)
 
         # Index cards generated.
         self._cards_by_location = {}
@@ -1059,36 +1117,50 @@ class MapProvider(object):
     def id_assigner(self):
         return self._id_assigner
 
-    def choose_card_spawn_locations(self, n):
-        """Returns a list of size n of spawn locations for cards. Does not return a location that is actively occupied by an existing card."""
-        card_spawn_weights = [
-            self.calculate_card_spawn_weight(tile)
-            for tile in self._potential_spawn_tiles
+    def _init_card_spawns(self):
+        """Indexes self._potential_spawn_tiles, and which of them have cards on them."""
+        tiles = self._potential_spawn_tiles
+        self._spawn_weights = np.array(
+            [self.calculate_card_spawn_weight(tile) for tile in tiles], dtype=np.float64
+        )
+        self._spawn_locations = [
+            tile.cell.coord.to_offset_coordinates() for tile in tiles
         ]
+        # Grid flat index -> index in tiles, or -1.
+        self._spawn_index = np.full(self._grid.size(), -1, dtype=np.int32)
+        for i, tile in enumerate(tiles):
+            self._spawn_index[self._grid.flat_index(tile.cell.coord)] = i
+        # Number of cards on each spawn tile.
+        self._spawn_occupancy = np.zeros(len(tiles), dtype=np.int32)
+        for existing_card in self._cards:
+            self._update_spawn_occupancy(existing_card, 1)
+
+    def _update_spawn_occupancy(self, added_card, delta):
+        if self._spawn_index is None:
+            return
+        index = self._grid.flat_index(added_card.location)
+        if index >= 0 and self._spawn_index[index] >= 0:
+            self._spawn_occupancy[self._spawn_index[index]] += delta
 
+    def choose_card_spawn_locations(self, n):
+        """Returns a list of size n of spawn locations for cards. Does not return a location that is actively occupied by an existing card."""
         # Prevents double-placing of a card (spawning a card on top of an existing card)
-        # Yes this is computationally slower than it could be (O(n) instead of ammortized O(c)), but this doesn't happen often.
-        card_locations = set(
-            [card.location.to_offset_coordinates() for card in self._cards]
+        card_spawn_weights = np.where(
+            self._spawn_occupancy > 0, 0.0, self._spawn_weights
         )
-        for i, tile_weight in enumerate(
-            zip(self._potential_spawn_tiles, card_spawn_weights)
-        ):
-            if tile_weight[0].cell.coord.to_offset_coordinates() in card_locations:
-                card_spawn_weights[i] = 0
-
         # Normalize card spawn weights so that they sum to 1.
-        card_spawn_weights = [
-            float(weight) / sum(card_spawn_weights) for weight in card_spawn_weights
-        ]
+        card_spawn_weights /= card_spawn_weights.sum()
 
         if n > len(self._potential_spawn_tiles):
             logger.error("WARNING: Not enough spawn tiles to spawn all cards.")
             n = len(self._potential_spawn_tiles)
-        spawn_tiles = np.random.choice(
-            self._potential_spawn_tiles, size=n, replace=False, p=card_spawn_weights
+        spawn_indices = np.random.choice(
+            len(self._potential_spawn_tiles),
+            size=n,
+            replace=False,
+            p=card_spawn_weights,
         )
-        return [tile.cell.coord.to_offset_coordinates() for tile in spawn_tiles]
+        return [self._spawn_locations[i] for i in spawn_indices.tolist()]
 
     def calculate_card_spawn_weight(self, tile):
         if tile.asset_id == AssetId.GROUND_TILE:
@@ -1104,32 +1176,31 @@ class MapProvider(object):
 
     def add_map_boundaries(self):
         """Adds boundaries to the hex map edges."""
-        for i, t in enumerate(self._tiles):
-            loc = t.cell.coord
-            for n in loc.neighbors():
-                (nr, nc) = n.to_offset_coordinates()
-                # If the neighbor cell is outside the map, add an edge to this cell's boundary.
-                if not (0 <= nr < self._rows and 0 <= nc < self._cols):
-                    self._tiles[i].cell.boundary.set_edge_between(loc, n)
+        # If the neighbor cell is outside the map, add an edge to this cell's boundary.
+        self._add_edges(self._grid.neighbors < 0)
 
     def add_layer_boundaries(self):
         """If two neighboring cells differ in Z-layer, adds an edge between them."""
-        loc_to_tile_index = {}
-        for i, it in enumerate(self._tiles):
-            iloc = it.cell.coord
-            loc_to_tile_index[iloc] = i
-        for i, it in enumerate(self._tiles):
-            iloc = it.cell.coord
-            neighbors = iloc.neighbors()
-            for n in neighbors:
-                if n not in loc_to_tile_index:
-                    continue
-                other_tile_index = loc_to_tile_index[n]
-                other_tile = self._tiles[other_tile_index]
-                if abs(it.cell.layer - other_tile.cell.layer) > 1:
-                    self._tiles[i].cell.boundary.set_edge_between(
-                        iloc, other_tile.cell.coord
-                    )
+        grid = self._grid
+        neighbors = np.maximum(grid.neighbors, 0)
+        layers = grid.layers.ravel()
+        neighbor_has_tile = (grid.neighbors >= 0) & (
+            grid.tile_index.ravel()[neighbors] >= 0
+        )
+        self._add_edges(
+            neighbor_has_tile & (np.abs(layers[:, None] - layers[neighbors]) > 1)
+        )
+
+    def _add_edges(self, new_edges):
+        """Sets edges on tiles, given a (rows * cols, 6) boolean array of edges to set."""
+        grid = self._grid
+        tile_index = grid.tile_index.ravel()
+        new_edges &= (tile_index >= 0)[:, None]
+        old_edges = grid.edges.ravel()
+        edges = old_edges | (new_edges << DIRECTIONS).sum(axis=1).astype(np.uint8)
+        for i in np.flatnonzero(edges != old_edges).tolist():
+            self._tiles[tile_index[i]].cell.boundary.edges = int(edges[i])
+        grid.set_edges(edges)
 
     def cards(self):
         return self._cards
@@ -1139,15 +1210,52 @@ class MapProvider(object):
             return []
         return self._custom_targets
 
+    def _init_selection(self):
+        self._selected_cards = {}
+        # Number of selected cards with each (attribute, value). A selection
+        # collides if any of these are above 1. See selected_cards_collide().
+        self._selected_attributes = collections.Counter()
+        self._selected_collisions = 0
+        # Number of selected cards which aren't custom targets.
+        self._selected_non_targets = 0
+
+    def _select(self, selected_card):
+        if selected_card.id not in self._selected_cards:
+            self._count_selection(selected_card, 1)
+        self._selected_cards[selected_card.id] = selected_card
+
+    def _deselect(self, selected_card):
+        del self._selected_cards[selected_card.id]
+        self._count_selection(selected_card, -1)
+
+    def _count_selection(self, selected_card, delta):
+        for key in (
+            ("shape", selected_card.shape),
+            ("color", selected_card.color),
+            ("count", selected_card.count),
+        ):
+            before = self._selected_attributes[key]
+            after = before + delta
+            self._selected_attributes[key] = after
+            if before <= 1 < after:
+                self._selected_collisions += 1
+            elif after <= 1 < before:
+                self._selected_collisions -= 1
+        if (
+            self._custom_targets is not None
+            and selected_card.id not in self._custom_targets
+        ):
+            self._selected_non_targets += delta
+
     def set_selected(self, card_id, selected):
         for idx, card in enumerate(self._cards):
             if card.id == card_id:
                 self._cards[idx].selected = selected
                 if selected:
                     card.selected = True
-                    self._selected_cards[card_id] = card
+                    self._select(card)
                 else:
-                    del self._selected_cards[card_id]
+                    self._deselect(card)
                 break
 
     def set_color(self, card_id, color):
@@ -1160,6 +1268,7 @@ class MapProvider(object):
         for card in self._cards:
             if card.id == card_id:
                 del self._cards_by_location[card.location]
+                self._update_spawn_occupancy(card, -1)
         self._cards = [card for card in self._cards if card.id != card_id]
 
     def add_random_cards(self, number_of_cards):
@@ -1173,6 +1282,7 @@ class MapProvider(object):
             new_cards.append(new_card)
             self._cards.append(new_card)
             self._cards_by_location[self._cards[-1].location] = self._cards[-1]
+            self._update_spawn_occupancy(new_card, 1)
 
         return new_cards
 
@@ -1191,6 +1301,7 @@ class MapProvider(object):
             new_cards.append(new_card)
             self._cards.append(new_card)
             self._cards_by_location[self._cards[-1].location] = self._cards[-1]
+            self._update_spawn_occupancy(new_card, 1)
 
         return new_cards
 
@@ -1216,21 +1327,9 @@ class MapProvider(object):
         targets are defined, just checks if any non-target cards are selected.
         """
         if self._custom_targets is not None:
-            return any(
-                card.id not in self._custom_targets for card in self.selected_cards()
-            )
-        shapes = set()
-        colors = set()
-        counts = set()
-        for card in self.selected_cards():
-            shapes.add(card.shape)
-            colors.add(card.color)
-            counts.add(card.count)
-        num_cards = len(self.selected_cards())
-        return (
-            not (len(shapes) == len(colors) == len(counts) == num_cards)
-            or len(self.selected_cards()) > 3
-        )
+            return self._selected_non_targets > 0
+        # Cards collide if they share a shape, color or count.
+        return self._selected_collisions > 0 or len(self._selected_cards) > 3
 
     def selected_valid_set(self):
         if self._custom_targets is not None:
@@ -1271,60 +1370,290 @@ class MapProvider(object):
         return PropUpdate([card.prop() for card in self._cards])
 
     def edge_between(self, loc1, loc2):
-        return self._tiles[
-            self._tiles_by_location[loc1]
-        ].cell.boundary.get_edge_between(loc1, loc2) or self._tiles[
-            self._tiles_by_location[loc2]
-        ].cell.boundary.get_edge_between(
-            loc2, loc1
-        )
+        return self._grid.edge_between(loc1, loc2)
 
     def coord_in_map(self, coord):
-        offset_coords = coord.to_offset_coordinates()
-        return (0 <= offset_coords[0] < self._rows) and (
-            0 <= offset_coords[1] < self._cols
-        )
+        return self._grid.in_map(coord)
+
+    def grid(self):
+        return self._grid
 
 
 MAP_POOL_MAXIMUM = 500
-map_pool = []
+# Number of maps kept loaded (as MapProviders) in memory, ready for new games.
+# The rest of the pool stays on disk until needed.
+MAP_POOL_READY_SIZE = 20
+MAP_FILE_SUFFIX = ".json.gz"
+TEMP_FILE_SUFFIX = ".tmp"
+# After consecutive failed map loads or generations, the pool waits before
+# scheduling more work. The delay doubles with each failure, up to the maximum.
+MAP_POOL_BACKOFF_S = 1.0
+MAP_POOL_MAXIMUM_BACKOFF_S = 60.0
+
+
+def MapConfigHash(map_config):
+    """Identifies the maps a MapConfig generates. Names the map pool's subdirectory."""
+    data = orjson.dumps(map_config.to_dict(), option=orjson.OPT_SORT_KEYS)
+    return hashlib.sha256(data).hexdigest()[:16]
+
+
+def _GenerateMapFile(map_config, directory):
+    """Generates a random map and saves it to directory. Runs in a worker process."""
+    start = time.time()
+    map_update = RandomMap(map_config)
+    path = pathlib.Path(directory, f"{uuid.uuid4().hex}{MAP_FILE_SUFFIX}")
+    temp_path = path.with_suffix(TEMP_FILE_SUFFIX)
+    with gzip.open(temp_path, "wb") as f:
+        f.write(orjson.dumps(map_update))
+    # Atomic, so that other processes never see a partially written map.
+    os.replace(temp_path, path)
+    return path, time.time() - start
+
+
+def GenerateEncodedMap(map_config, seed):
+    """Generates the random map for a seed, encoded for a map corpus. Runs in a worker process."""
+    return EncodeMap(RandomMap(dataclasses.replace(map_config, rng_seed=seed)))
+
+
+@functools.lru_cache(maxsize=4)
+def _OpenMapCorpus(path):
+    return MapCorpus(path)
+
+
+def _LoadCorpusMapProvider(config, seed):
+    """Loads a map from the config's map corpus into a MapProvider. Runs in a worker process."""
+    SetGlobalConfig(config)
+    corpus = _OpenMapCorpus(config.map_corpus_path)
+    return MapProvider(
+        MapType.RANDOM, corpus.map_update(seed), map_config=corpus.map_config
+    )
+
+
+def _LoadMapProvider(config, path):
+    """Loads a map from disk into a MapProvider. Runs in a worker process."""
+    SetGlobalConfig(config)
+    with gzip.open(path, "rb") as f:
+        map_update = MapUpdate.from_json(f.read().decode("utf-8"))
+    return MapProvider(MapType.RANDOM, map_update, map_config=config.map_config)
+
+
+class MapPool(object):
+    """A pool of pre-generated random maps, persisted to disk.
+
+    Maps are generated in a process pool and saved as compressed JSON in the
+    config's map pool directory, so the pool survives restarts. Maps are kept
+    in a subdirectory named by MapConfigHash(), so that changing the map config
+    doesn't serve maps generated with the old one. When the number
+    of maps on disk drops below the low watermark, the pool refills up to
+    config.map_cache_size. A few maps are kept loaded in memory so that
+    CachedMapRetrieval() doesn't block on disk or CPU.
+
+    If config.map_corpus_path is set, maps are instead loaded from that map
+    corpus (see map_corpus.py), by random seed, and nothing is generated.
+
+    If loading or generating maps keeps failing (e.g. a bad corpus, or a full
+    disk), the pool backs off instead of retrying immediately. See
+    MAP_POOL_BACKOFF_S.
+    """
+
+    def __init__(self, config):
+        self._config = config
+        self._directory = pathlib.Path(
+            config.map_pool_directory(), MapConfigHash(config.map_config)
+        )
+        self._directory.mkdir(parents=True, exist_ok=True)
+        # Left behind by map generation that was interrupted (e.g. a crash).
+        for temp_path in self._directory.glob(f"*{TEMP_FILE_SUFFIX}"):
+            temp_path.unlink(missing_ok=True)
+        self._corpus = None
+        if config.map_corpus_path:
+            self._corpus = MapCorpus(config.map_corpus_path)
+            if self._corpus.map_config != dataclasses.replace(
+                config.map_config, rng_seed=None
+            ):
+                logger.warning(
+                    f"Map corpus {config.map_corpus_path} was generated with a different map config."
+                )
+            logger.info(
+                f"Loading maps from corpus {config.map_corpus_path} ({len(self._corpus)} maps)"
+            )
+        self._high_watermark = min(config.map_cache_size, MAP_POOL_MAXIMUM)
+        self._low_watermark = min(config.map_pool_low_watermark, self._high_watermark)
+        # Maps on disk which haven't been loaded yet.
+        self._unloaded = deque(sorted(self._directory.glob(f"*{MAP_FILE_SUFFIX}")))
+        self._loading = 0
+        self._generating = 0
+        self._refilling = True
+        self._ready = deque()  # (path, MapProvider)
+        self._executor = None
+        self._wake = None
+        # Number of map loads or generations which failed since the last success.
+        self._failures = 0
+        # Metrics.
+        self.hits = 0
+        self.misses = 0
+        self.maps_generated = 0
+        self.generation_time_s = 0.0
+        logger.info(f"Map pool has {len(self._unloaded)} maps in {self._directory}")
+
+    def size(self):
+        """Total number of maps in the pool, loaded or not."""
+        return len(self._unloaded) + self._loading + len(self._ready)
+
+    def pop(self):
+        """Returns a ready MapProvider, or None if there isn't one."""
+        if len(self._ready) == 0:
+            self.misses += 1
+            self.wake()
+            return None
+        self.hits += 1
+        path, map_provider = self._ready.popleft()
+        if path is not None:
+            path.unlink(missing_ok=True)
+        self.wake()
+        return map_provider
+
+    def wake(self):
+        if self._wake is not None:
+            self._wake.set()
+
+    def metrics(self):
+        return {
+            "size": self.size(),
+            "ready": len(self._ready),
+            "generating": self._generating,
+            "hits": self.hits,
+            "misses": self.misses,
+            "consecutive_failures": self._failures,
+            "maps_generated": self.maps_generated,
+            "mean_generation_time_s": self.generation_time_s
+            / max(self.maps_generated, 1),
+        }
+
+    async def run(self):
+        """Keeps the pool filled. Runs until cancelled."""
+        self._wake = asyncio.Event()
+        self._executor = concurrent.futures.ProcessPoolExecutor(
+            max_workers=self._config.map_pool_workers,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        try:
+            while True:
+                self._wake.clear()
+                if self._failures > 0:
+                    await asyncio.sleep(self._backoff_s())
+                self._schedule()
+                await self._wake.wait()
+        finally:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+
+    def _backoff_s(self):
+        """Delay before scheduling more work, given the consecutive failures."""
+        if self._failures == 0:
+            return 0.0
+        # Cap the exponent, so that the delay can't overflow.
+        doublings = min(self._failures - 1, 16)
+        return min(MAP_POOL_BACKOFF_S * 2**doublings, MAP_POOL_MAXIMUM_BACKOFF_S)
+
+    def _schedule(self):
+        loop = asyncio.get_running_loop()
+        if self._corpus is not None:
+            while len(self._ready) + self._loading < MAP_POOL_READY_SIZE:
+                seed = random.choice(self._corpus.seeds())
+                self._loading += 1
+                future = loop.run_in_executor(
+                    self._executor, _LoadCorpusMapProvider, self._config, seed
+                )
+                future.add_done_callback(functools.partial(self._on_loaded, None))
+            return
+        while (
+            len(self._ready) + self._loading < MAP_POOL_READY_SIZE
+            and len(self._unloaded) > 0
+        ):
+            path = self._unloaded.popleft()
+            self._loading += 1
+            future = loop.run_in_executor(
+                self._executor, _LoadMapProvider, self._config, path
+            )
+            future.add_done_callback(functools.partial(self._on_loaded, path))
+
+        size = self.size() + self._generating
+        if size < self._low_watermark:
+            self._refilling = True
+        if size >= self._high_watermark:
+            self._refilling = False
+        while (
+            self._refilling
+            and self._generating < self._config.map_pool_workers
+            and self.size() + self._generating < self._high_watermark
+        ):
+            self._generating += 1
+            future = loop.run_in_executor(
+                self._executor,
+                _GenerateMapFile,
+                self._config.map_config,
+                self._directory,
+            )
+            future.add_done_callback(self._on_generated)
+
+    def _on_loaded(self, path, future):
+        self._loading -= 1
+        try:
+            self._ready.append((path, future.result()))
+            self._failures = 0
+        except Exception as e:
+            self._failures += 1
+            if path is None:
+                logger.error(f"Unable to load map from corpus. {e}")
+            else:
+                logger.error(f"Unable to load map {path}. Deleting it. {e}")
+                path.unlink(missing_ok=True)
+        self.wake()
+
+    def _on_generated(self, future):
+        self._generating -= 1
+        try:
+            path, generation_time_s = future.result()
+        except Exception as e:
+            self._failures += 1
+            logger.error(f"Map generation failed: {e}")
+        else:
+            self._failures = 0
+            self.maps_generated += 1
+            self.generation_time_s += generation_time_s
+            self._unloaded.append(path)
+        self.wake()
+
+
+map_pool = None
 
 
 def CachedMapRetrieval():
-    global map_pool
-    if len(map_pool) == 0:
+    map_provider = map_pool.pop() if map_pool is not None else None
+    if map_provider is None:
         logger.debug(f"Map pool ran out of cached maps. Generating...")
         config = GlobalConfig()
         if config:
             return MapProvider(MapType.RANDOM, map_config=config.map_config)
         else:
             return MapProvider(MapType.RANDOM)
-
-    else:
-        return map_pool.pop()
+    return map_provider
 
 
 def MapPoolSize():
-    global map_pool
-    return len(map_pool)
+    if map_pool is None:
+        return 0
+    return map_pool.size()
 
 
-async def MapGenerationTask(lobbies, config):
-    while True:
-        # Only generate maps when there are no active games.
-        lobbies_empty = all([len(lobby.room_ids()) == 0 for lobby in lobbies])
-        if not lobbies_empty:
-            await asyncio.sleep(10)
-            continue
+def MapPoolMetrics():
+    if map_pool is None:
+        return {}
+    return map_pool.metrics()
 
-        # Map cache is full, skip.
-        if len(map_pool) >= MAP_POOL_MAXIMUM or len(map_pool) >= config.map_cache_size:
-            await asyncio.sleep(10)
-            continue
 
-        # Add a map to the map cache.
-        config = GlobalConfig()
-        map_pool.append(MapProvider(MapType.RANDOM, map_config=config.map_config))
-        if len(map_pool) % 10 == 0:
-            print(f"Map pool size: {len(map_pool)}")
-        await asyncio.sleep(0.001)
+async def MapGenerationTask(config):
+    """Generates maps in the background, in a process pool."""
+    global map_pool
+    map_pool = MapPool(config)
+    await map_pool.run()
@@ -1,9 +1,10 @@
-import copy
+import bisect
 import dataclasses
+import functools
 import logging
 import random
+from collections import deque
 from enum import Enum
-from queue import Queue
 
 import numpy as np
 
@@ -17,6 +18,7 @@ from cb2game.server.assets import (
 )
 from cb2game.server.config.map_config import MapConfig
 from cb2game.server.hex import HecsCoord, HexBoundary, HexCell
+from cb2game.server.hex_grid import HexGrid
 from cb2game.server.messages.action import Color
 from cb2game.server.messages.map_update import Tile
 
@@ -54,17 +56,55 @@ def SnowifyTile(tile):
     return Tile(SnowifyAssetId(tile.asset_id), tile.cell, tile.rotation_degrees)
 
 
-def ChooseAssetFromTileClass(
-    tile_class: TileClass,
-    map_config: MapConfig = MapConfig(),
-    preference: AssetId = AssetId.NONE,
-):
+@functools.lru_cache(maxsize=128)
+def _ChoiceCdf(p):
+    """Cumulative distribution of p, computed as np.random.choice() does."""
+    cdf = np.asarray(p, dtype=np.float64).cumsum()
+    cdf /= cdf[-1]
+    return cdf.tolist()
+
+
+def RandomChoice(options, p, rng=np.random):
+    """Equivalent to rng.choice(options, p=p), but returns an element of options.
+
+    Draws the same number from rng (a np.random.RandomState, or numpy's global
+    RNG by default) as rng.choice(), so results are identical for a given
+    seed. Much faster for single draws.
+
+    p must be a tuple.
+    """
+    return options[bisect.bisect_right(_ChoiceCdf(p), rng.random_sample())]
+
+
+@functools.lru_cache(maxsize=128)
+def _TileClassAssets(tile_class: TileClass, tile_names):
+    """Returns the allowed assets of a tile class, and their normalized frequencies.
+
+    tile_names must be a tuple.
+    """
     frequencies = {
         asset: frequency
         for asset, frequency in zip(
             AssetsFromTileClass(tile_class), AssetFrequenciesFromTileClass(tile_class)
         )
     }
+    tiles = [AssetId[tile_name] for tile_name in tile_names]
+    for tile in tiles:
+        assert type(tile) == AssetId, f"Invalid tile type: {tile}"
+    tile_frequencies = [frequencies[tile] for tile in tiles]
+    # Normalize frequencies.
+    frequency_sum = sum(tile_frequencies)
+    for i in range(len(tile_frequencies)):
+        tile_frequencies[i] /= frequency_sum
+    return tuple(tiles), tuple(tile_frequencies)
+
+
+def ChooseAssetFromTileClass(
+    tile_class: TileClass,
+    map_config: MapConfig = MapConfig(),
+    preference: AssetId = AssetId.NONE,
+    rng=np.random,
+):
     tile_names = []
     if tile_class == TileClass.GROUND_TILES:
         tile_names = map_config.ground_tiles
@@ -86,18 +126,11 @@ def ChooseAssetFromTileClass(
         tile_names = map_config.water_tiles
     else:
         logger.error(f"Invalid tile class: {tile_class}")
-    tiles = [AssetId[tile_name] for tile_name in tile_names]
-    for tile in tiles:
-        assert type(tile) == AssetId, f"Invalid tile type: {tile}"
+    tiles, tile_frequencies = _TileClassAssets(tile_class, tuple(tile_names))
     # Preference is used only if it is specified in the config.
     if preference != AssetId.NONE and preference in tiles:
         return preference
-    tile_frequencies = [frequencies[tile] for tile in tiles]
-    # Normalize frequencies.
-    frequency_sum = sum(tile_frequencies)
-    for i in range(len(tile_frequencies)):
-        tile_frequencies[i] /= frequency_sum
-    asset_id = int(np.random.choice(tiles, p=tile_frequencies))
+    asset_id = int(RandomChoice(tiles, tile_frequencies, rng))
     assert type(asset_id) == int, f"Invalid asset_id type: {asset_id}"
     return asset_id
 
@@ -106,9 +139,12 @@ def GroundTile(
     rotation_degrees=0,
     map_config: MapConfig = MapConfig(),
     preference: AssetId = AssetId.NONE,
+    rng=np.random,
 ):
     """Creates a single tile of ground."""
-    asset_id = ChooseAssetFromTileClass(TileClass.GROUND_TILES, map_config, preference)
+    asset_id = ChooseAssetFromTileClass(
+        TileClass.GROUND_TILES, map_config, preference, rng
+    )
     return Tile(
         asset_id,
         HexCell(
@@ -139,9 +175,12 @@ def WaterTile(
     rotation_degrees=0,
     map_config: MapConfig = MapConfig(),
     preference: AssetId = AssetId.NONE,
+    rng=np.random,
 ):
     """Creates a single tile of Water."""
-    asset_id = ChooseAssetFromTileClass(TileClass.WATER_TILES, map_config, preference)
+    asset_id = ChooseAssetFromTileClass(
+        TileClass.WATER_TILES, map_config, preference, rng
+    )
     return Tile(
         asset_id,
         HexCell(
@@ -158,9 +197,12 @@ def PathTile(
     rotation_degrees=0,
     map_config: MapConfig = MapConfig(),
     preference: AssetId = AssetId.NONE,
+    rng=np.random,
 ):
     """Creates a single tile of Path."""
-    asset_id = ChooseAssetFromTileClass(TileClass.PATH_TILES, map_config, preference)
+    asset_id = ChooseAssetFromTileClass(
+        TileClass.PATH_TILES, map_config, preference, rng
+    )
     return Tile(
         asset_id,
         HexCell(
@@ -177,9 +219,12 @@ def GroundTileStone(
     rotation_degrees=0,
     map_config: MapConfig = MapConfig(),
     preference: AssetId = AssetId.NONE,
+    rng=np.random,
 ):
     """Creates a single tile of rocky ground."""
-    asset_id = ChooseAssetFromTileClass(TileClass.STONE_TILES, map_config, preference)
+    asset_id = ChooseAssetFromTileClass(
+        TileClass.STONE_TILES, map_config, preference, rng
+    )
     return Tile(
         asset_id,
         HexCell(
@@ -241,9 +286,12 @@ def GroundTileTree(
     rotation_degrees=0,
     map_config: MapConfig = MapConfig(),
     preference: AssetId = AssetId.NONE,
+    rng=np.random,
 ):
     """Creates a single tile of ground with a tree on it."""
-    asset_id = ChooseAssetFromTileClass(TileClass.TREE_TILES, map_config, preference)
+    asset_id = ChooseAssetFromTileClass(
+        TileClass.TREE_TILES, map_config, preference, rng
+    )
     return Tile(
         asset_id,
         HexCell(
@@ -277,8 +325,14 @@ def NatureAssetIds(map_config: MapConfig = MapConfig()):
     return [AssetId[name] for name in asset_names]
 
 
-def RandomNatureTile(rotation_degrees=0, map_config: MapConfig = MapConfig()):
-    """Creates a single tile of nature. Nature tiles are trees, rocks, foliage, etc."""
+def RandomNatureTile(
+    rotation_degrees=0, map_config: MapConfig = MapConfig(), rng=np.random
+):
+    """Creates a single tile of nature. Nature tiles are trees, rocks, foliage, etc.
+
+    The asset is drawn from Python's random module. rng is accepted so that
+    this can be used interchangeably with the other random tile functions.
+    """
     return Tile(
         random.choice(NatureAssetIds(map_config=map_config)),
         HexCell(
@@ -423,10 +477,11 @@ def UrbanHouseTile(
     rotation_degrees=0,
     map_config: MapConfig = MapConfig(),
     preference: AssetId = AssetId.NONE,
+    rng=np.random,
 ):
     """Creates a random house tile (like GroundTileHouse type=HouseType.RANDOM, but with a distribution meant for cities."""
     asset_id = ChooseAssetFromTileClass(
-        TileClass.URBAN_HOUSE_TILES, map_config, preference
+        TileClass.URBAN_HOUSE_TILES, map_config, preference, rng
     )
     return Tile(
         asset_id,
@@ -444,10 +499,11 @@ def GroundTileStreetLight(
     rotation_degrees=0,
     map_config: MapConfig = MapConfig(),
     preference: AssetId = AssetId.NONE,
+    rng=np.random,
 ):
     """Creates a single tile of ground with a street light."""
     asset_id = ChooseAssetFromTileClass(
-        TileClass.STREETLIGHT_TILES, map_config, preference
+        TileClass.STREETLIGHT_TILES, map_config, preference, rng
     )
     return Tile(
         asset_id,
@@ -583,47 +639,103 @@ def RampToMountain(rotation_degrees=0, snowy=False):
 
 
 # Tile boundaries must prevent leaving the map, or undefined behavior will occur.
-def FloodFillPartitionTiles(tiles):
-    tile_by_loc = {}
-    for tile in tiles:
-        tile_by_loc[tile.cell.coord] = tile
+def FloodFillPartitionTiles(tiles, grid=None):
+    """Partitions tiles into regions which are connected by open edges.
 
-    unvisited_tiles = set(tiles)
-    visited_tiles = set()
-    tile_queue = Queue()
+    A neighbor is connected if the tile's own boundary has no edge towards it.
+    grid is an optional HexGrid built from tiles.
+    """
+    if grid is None:
+        rows = 1 + max(
+            (tile.cell.coord.to_offset_coordinates()[0] for tile in tiles), default=0
+        )
+        cols = 1 + max(
+            (tile.cell.coord.to_offset_coordinates()[1] for tile in tiles), default=0
+        )
+        grid = HexGrid.from_tiles(rows, cols, tiles)
+    tile_index = grid.tile_index.ravel().tolist()
+
+    visited = [False] * grid.size()
+    tile_queue = deque()
     partitions = []
 
-    while len(unvisited_tiles) > 0:
-        tile = unvisited_tiles.pop()
-        tile_queue.put(tile)
+    # Partitions are started from tiles in set iteration order (which is the
+    # order set.pop() returns them in). Partition order determines where cards
+    # spawn, so it's kept stable.
+    for tile in set(tiles):
+        start = grid.flat_index(tile.cell.coord)
+        if visited[start]:
+            continue
+        tile_queue.append(start)
         partition = []
         # Do a floodfill to create a partition on the map from this tile.
-        while not tile_queue.empty():
-            tile = tile_queue.get()
-            if tile in visited_tiles:
+        while len(tile_queue) > 0:
+            index = tile_queue.popleft()
+            if visited[index]:
                 continue
-            partition.append(tile)
-            if tile in unvisited_tiles:
-                unvisited_tiles.remove(tile)
-            visited_tiles.add(tile)
-            coord = tile.cell.coord
-            boundary = tile.cell.boundary
+            partition.append(tiles[tile_index[index]])
+            visited[index] = True
             # Add all neighbors that aren't blocked by an edge.
-            for neighbor in coord.neighbors():
-                if neighbor not in tile_by_loc:
-                    continue
-                if neighbor in visited_tiles:
-                    continue
-                if not boundary.get_edge_between(coord, neighbor):
-                    tile_queue.put(tile_by_loc[neighbor])
+            for neighbor in grid.exits_of(index):
+                if not visited[neighbor]:
+                    tile_queue.append(neighbor)
         partitions.append(partition)
     return partitions
 
 
 def CensorMapForFollower(map_update, follower):
-    """Censors information from a map that the follower isn't supposed to have."""
-    map_update_clone = copy.deepcopy(map_update)
-    return map_update_clone
+    """Censors information from a map that the follower isn't supposed to have.
+
+    Nothing is currently censored, so this returns map_update itself. Maps are
+    shared between players and must not be modified in-place.
+    """
+    return map_update
+
+
+def DiffMapUpdate(base_map, map_update):
+    """Returns a delta MapUpdate which transforms base_map into map_update.
+
+    The delta has all of map_update's non-tile fields, but only contains the
+    tiles which were added or changed. Deltas can't remove tiles, so if the map
+    dimensions differ or any of base_map's tiles are missing from map_update,
+    returns map_update unchanged (a full update).
+    """
+    if base_map.rows != map_update.rows or base_map.cols != map_update.cols:
+        return map_update
+    changed_tiles = []
+    if base_map.tiles is not map_update.tiles:
+        base_tiles = {tile.cell.coord: tile for tile in base_map.tiles}
+        new_coords = set()
+        for tile in map_update.tiles:
+            coord = tile.cell.coord
+            new_coords.add(coord)
+            if base_tiles.get(coord, None) != tile:
+                changed_tiles.append(tile)
+        if any(coord not in new_coords for coord in base_tiles):
+            return map_update
+    return dataclasses.replace(
+        map_update, tiles=changed_tiles, base_version=base_map.version
+    )
+
+
+def ApplyMapUpdateDiff(base_map, map_update):
+    """Applies a MapUpdate to a cached map, returning the full updated map.
+
+    If map_update is a full update, it's returned as-is. Raises ValueError if
+    map_update is a delta against a different version than base_map.
+    """
+    if map_update.base_version is None:
+        return map_update
+    if base_map is None or base_map.version != map_update.base_version:
+        raise ValueError(
+            f"Map delta against version {map_update.base_version}, but cached map is version {base_map.version if base_map else None}."
+        )
+    tiles = {tile.cell.coord: tile for tile in base_map.tiles}
+    for tile in map_update.tiles:
+        tiles[tile.cell.coord] = tile
+    return dataclasses.replace(
+        map_update, tiles=list(tiles.values()), base_version=None
+    )
 
 
 def AddCardCovers(prop_update, follower=None):
@@ -0,0 +1,233 @@
+""" Writes per-game JSONL message logs from a background thread.
+
+Each room logs every message to and from its players. Writing those lines from
+the event loop means a slow disk stalls every game. Instead, rooms queue lines
+into MessageLogs, and one shared MessageLogWriter thread writes them through
+large buffers, optionally compressed with gzip or zstd.
+
+If the disk falls far enough behind that MAX_PENDING_LINES lines are queued,
+new lines are dropped (and counted) rather than blocking the game.
+
+Log verbosity is set by the message_log_level and message_log_sample_rate
+config fields. See LogLevel below.
+"""
+import atexit
+import gzip
+import io
+import logging
+import pathlib
+import queue
+import threading
+from enum import Enum
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# Bytes buffered per log file before writing to disk.
+MESSAGE_LOG_BUFFER_SIZE = 1 << 20
+# Lines queued before new lines are dropped.
+MAX_PENDING_LINES = 200000
+GZIP_LEVEL = 6
+ZSTD_LEVEL = 3
+
+COMPRESSION_SUFFIXES = {"": "", "gzip": ".gz", "zstd": ".zst"}
+
+
+class LogLevel(Enum):
+    # Don't log messages.
+    NONE = 0
+    # Log each message's direction, player, type and transmit time.
+    HEADERS = 1
+    # Log whole messages (or a sample of them, with headers for the rest).
+    FULL = 2
+
+
+def LogLevelFromName(name):
+    try:
+        return LogLevel[name.upper()]
+    except KeyError:
+        logger.error(f"Unknown message log level {name}. Logging full messages.")
+        return LogLevel.FULL
+
+
+def MessageLogPath(path, compression=""):
+    """Returns the path a log is written to, including the compression suffix."""
+    return pathlib.Path(str(path) + COMPRESSION_SUFFIXES[compression])
+
+
+def OpenMessageLog(path):
+    """Opens a message log for reading as text, whichever compression it was written with.
+
+    path is the uncompressed log path (e.g. .../messages_from_server.jsonl.log).
+    """
+    for compression in COMPRESSION_SUFFIXES:
+        log_path = MessageLogPath(path, compression)
+        if not log_path.exists():
+            continue
+        if compression == "gzip":
+            return gzip.open(log_path, "rt")
+        if compression == "zstd":
+            if zstandard is None:
+                raise RuntimeError(f"Reading {log_path} requires zstandard.")
+            return io.TextIOWrapper(zstandard.open(log_path, "rb"))
+        return log_path.open("r")
+    raise FileNotFoundError(f"No message log at {path}")
+
+
+class MessageLog(object):
+    """A log file written by a MessageLogWriter. Lines are bytes, newline-terminated."""
+
+    def __init__(self, writer, path, compression=""):
+        if compression not in COMPRESSION_SUFFIXES:
+            logger.error(
+                f"Unknown message log compression {compression}. Not compressing."
+            )
+            compression = ""
+        if compression == "zstd" and zstandard is None:
+            logger.error(
+                "zstandard isn't installed. Compressing message logs with gzip."
+            )
+            compression = "gzip"
+        self.path = MessageLogPath(path, compression)
+        self._writer = writer
+        self._compression = compression
+        self._closed = False
+        # Only accessed by the writer thread.
+        self._raw = None
+        self._file = None
+
+    def write(self, line):
+        if self._closed:
+            return
+        self._writer._put((self, line))
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._writer._put((self, None))
+
+    def _write(self, line):
+        if self._file is None:
+            self._open()
+        self._file.write(line)
+
+    def _open(self):
+        self._raw = open(self.path, "wb", buffering=MESSAGE_LOG_BUFFER_SIZE)
+        if self._compression == "gzip":
+            self._file = gzip.GzipFile(
+                fileobj=self._raw, mode="wb", compresslevel=GZIP_LEVEL
+            )
+        elif self._compression == "zstd":
+            self._file = zstandard.ZstdCompressor(level=ZSTD_LEVEL).stream_writer(
+                self._raw, closefd=False
+            )
+        else:
+            self._file = self._raw
+
+    def _close(self):
+        if self._file is None:
+            return
+        if self._file is not self._raw:
+            self._file.close()
+        self._raw.close()
+
+
+class MessageLogWriter(object):
+    """Writes MessageLogs from a background thread. See the top of this file."""
+
+    def __init__(self, threaded=True):
+        self._threaded = threaded
+        self._queue = queue.Queue()
+        self._thread = None
+        self._closed = False
+        # Logs with an open file. Only accessed by the writer thread.
+        self._open_logs = set()
+        # Metrics.
+        self.lines_written = 0
+        self.lines_dropped = 0
+        if self._threaded:
+            self._thread = threading.Thread(
+                target=self._run, name="MessageLogWriter", daemon=True
+            )
+            self._thread.start()
+
+    def open(self, path, compression=""):
+        return MessageLog(self, path, compression)
+
+    def flush(self, timeout=None):
+        """Blocks until everything queued so far has been written (to buffers).
+
+        Close a log before reading it back.
+
+        Returns False if the timeout expired first.
+        """
+        if not self._threaded or self._closed:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def pending(self):
+        return self._queue.qsize()
+
+    def close(self):
+        """Writes everything queued so far, closes all logs and stops the writer thread."""
+        if self._closed:
+            return
+        self.flush()
+        self._closed = True
+        if self._threaded:
+            self._queue.put(None)
+            self._thread.join()
+        for log in list(self._open_logs):
+            self._handle((log, None))
+
+    def _put(self, item):
+        if self._closed or not self._threaded:
+            self._handle(item)
+            return
+        log, line = item
+        if line is not None and self._queue.qsize() >= MAX_PENDING_LINES:
+            self.lines_dropped += 1
+            return
+        self._queue.put(item)
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            if isinstance(item, threading.Event):
+                item.set()
+                continue
+            self._handle(item)
+
+    def _handle(self, item):
+        log, line = item
+        try:
+            if line is None:
+                self._open_logs.discard(log)
+                log._close()
+            else:
+                self._open_logs.add(log)
+                log._write(line)
+                self.lines_written += 1
+        except (OSError, ValueError) as e:
+            logger.error(f"Unable to write message log {log.path}: {e}")
+
+
+# Shared by all rooms.
+message_log_writer = None
+
+
+def GetMessageLogWriter():
+    global message_log_writer
+    if message_log_writer is None:
+        message_log_writer = MessageLogWriter()
+        atexit.register(message_log_writer.close)
+    return message_log_writer
@@ -36,6 +36,19 @@ class LogEntry(DataClassJSONMixin):
     message_to_server: mts.MessageToServer = field(default_factory=mts.MessageToServer)
 
 
+@dataclass(frozen=True)
+class LogEntryHeader(DataClassJSONMixin):
+    """Logged in place of a LogEntry when message bodies aren't logged."""
+
+    message_direction: Direction
+    player_id: int
+    # Value of the message's MessageType (which differs by direction).
+    message_type: int
+    transmit_time: datetime = field(
+        metadata={"deserialize": "pendulum", "serialize": pass_through}
+    )
+
+
 @dataclass(frozen=True)
 class GameInfo(DataClassJSONMixin):
     start_time: datetime = field(
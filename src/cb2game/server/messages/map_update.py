@@ -3,9 +3,11 @@ from dataclasses import dataclass, field
 from enum import Enum
 from typing import List, Optional
 
+import numpy as np
 from mashumaro.mixins.json import DataClassJSONMixin
 
 from cb2game.server.hex import HecsCoord, HexBoundary, HexCell
+from cb2game.server.hex_grid import hex_grid_cache
 from cb2game.server.messages.action import Color
 from cb2game.server.messages.prop import Prop, PropUpdate
 
@@ -99,27 +101,33 @@ class MapUpdate(DataClassJSONMixin):
     fog_end: Optional[int] = None
     # Used in custom scenarios to tint the map.
     color_tint: Color = Color(0, 0, 0, 0)
+    # Incremented by the server each time the game's map changes. Clients which
+    # accept map deltas cache the last map they received by version.
+    version: int = 0
+    # If set, this is a delta against map version base_version, and tiles only
+    # contains the tiles which changed since then. See map_utils.DiffMapUpdate.
+    base_version: Optional[int] = None
+
+    # Not a dataclass field, so it isn't serialized or copied. See set_grid().
+    _grid = None
 
     @staticmethod
     def from_gym_state(observation):
         """Converts a gym space to a MapUpdate."""
         map_space = observation["map"]
-        rows, cols = len(map_space["asset_ids"]), len(map_space["asset_ids"][0])
+        # Observations hold numpy arrays (or nested lists). Convert to Python values.
+        asset_ids, boundaries, heights, layers, orientations = (
+            np.asarray(map_space[name]).tolist()
+            for name in ("asset_ids", "boundaries", "heights", "layers", "orientations")
+        )
+        rows, cols = len(asset_ids), len(asset_ids[0])
         tiles = []
         for r in range(rows):
             for c in range(cols):
                 coord = HecsCoord.from_offset(r, c)
-                boundary = HexBoundary(map_space["boundaries"][r][c])
-                height = map_space["heights"][r][c]
-                layer = map_space["layers"][r][c]
-                cell = HexCell(coord, boundary, height, layer)
-                tiles.append(
-                    Tile(
-                        map_space["asset_ids"][r][c],
-                        cell,
-                        map_space["orientations"][r][c],
-                    )
-                )
+                boundary = HexBoundary(boundaries[r][c])
+                cell = HexCell(coord, boundary, heights[r][c], layers[r][c])
+                tiles.append(Tile(asset_ids[r][c], cell, orientations[r][c]))
         prop_update = PropUpdate.from_gym_state(observation)
         return MapUpdate(rows, cols, tiles, None, prop_update.props)
 
@@ -129,35 +137,50 @@ class MapUpdate(DataClassJSONMixin):
         Assumes they are adjacent, else undefined behavior.
 
         Returns true if there is an edge (obstacle) between the two coordinates.
+        If either tile is off-map, returns that there is an edge.
         """
-        tile_a = self.tile_at(hecs_a)
-        tile_b = self.tile_at(hecs_b)
-        # If either tile is off-map, return that there is an edge.
-        if tile_a is None or tile_b is None:
-            logger.info(f"NONE: {tile_a} {tile_b}")
-            return True
-        bound_a = tile_a.cell.boundary
-        bound_b = tile_b.cell.boundary
-        return bound_a.get_edge_between(hecs_a, hecs_b) or bound_b.get_edge_between(
-            hecs_b, hecs_a
-        )
+        return self.grid().edge_between(hecs_a, hecs_b)
 
-    def tile_at(self, r, c):
-        """Returns the tile at the given row and column."""
-        location = HecsCoord.from_offset(r, c)
-        self.tile_at(location)
+    def grid(self):
+        """Returns the indexed view of this map's tiles: a HexGrid. See server/hex_grid.py.
+
+        Built on first use, and shared by MapUpdates with the same tiles list
+        (see HexGridCache), unless one was given with set_grid(). Don't modify
+        tiles afterwards.
+        """
+        if self._grid is not None:
+            if callable(self._grid):
+                self._grid = self._grid()
+            return self._grid
+        return hex_grid_cache.get(self.rows, self.cols, self.tiles)
+
+    def set_grid(self, grid):
+        """Sets this map's grid, without adding it to hex_grid_cache.
+
+        For short-lived maps derived from another map's grid (e.g. a follower's
+        censored view, see follower_data_masking.py). grid may also be a
+        function which returns the grid. It's called on first use. Copies made
+        with dataclasses.replace() don't keep the grid.
+        """
+        self._grid = grid
 
     def tile_at(self, hecs: HecsCoord):
-        self._refresh_tile_cache(hecs)
-        if hecs not in self._tile_cache:
+        """Returns the tile at the given HECS coordinate, or None if there isn't one."""
+        grid = self.grid()
+        index = grid.flat_index(hecs)
+        if index < 0:
+            return None
+        return self._tile(grid, index)
+
+    def tile_at_offset(self, row, col):
+        """Returns the tile at the given row and column, or None if there isn't one."""
+        grid = self.grid()
+        if not (0 <= row < grid.rows and 0 <= col < grid.cols):
+            return None
+        return self._tile(grid, row * grid.cols + col)
+
+    def _tile(self, grid, index):
+        tile_index = grid.tile_index.flat[index]
+        if tile_index < 0:
             return None
-        return self._tile_cache[hecs]
-
-    def _refresh_tile_cache(self, hecs: HecsCoord):
-        if hasattr(self, "_tile_cache"):
-            if hecs in self._tile_cache:
-                return  # Cache up to date.
-            return
-        self._tile_cache = {}
-        for tile in self.tiles:
-            self._tile_cache[tile.cell.coord] = tile
+        return self.tiles[tile_index]
@@ -2,6 +2,7 @@ from dataclasses import dataclass, field
 from enum import Enum
 from typing import List, Optional
 
+import numpy as np
 from mashumaro.mixins.json import DataClassJSONMixin
 
 import cb2game.server.card_enums as card_enums
@@ -64,30 +65,33 @@ class PropUpdate(DataClassJSONMixin):
         """Returns a PropUpdate from a given gym prop state."""
         props = []
         cards = observation["cards"]
-        rows, cols = len(cards["counts"]), len(cards["counts"][0])
+        # Observations hold numpy arrays (or nested lists). Convert to Python values.
+        counts, colors, border_colors, shapes, selected = (
+            np.asarray(cards[name]).tolist()
+            for name in ("counts", "colors", "border_colors", "shapes", "selected")
+        )
+        rows, cols = len(counts), len(counts[0])
         # Only requirement for the card ID is that each ID is unique.
         card_id = 0
         for i in range(rows):
             for j in range(cols):
-                count = cards["counts"][i][j]
+                count = counts[i][j]
                 if count == 0:
                     continue
                 location = HecsCoord.from_offset(i, j)
                 rotation = 0
-                border_color = card_enums.Color.BLUE
-                color = cards["colors"][i][j]
-                border_color = cards["border_colors"][i][j]
-                shape = cards["shapes"][i][j]
-                selected = cards["selected"][i][j]
                 prop_info = GenericPropInfo(
                     location=location,
                     rotation_degrees=rotation,
                     collide=False,
                     border_radius=0,
-                    border_color=border_color,
+                    border_color=card_enums.Color(border_colors[i][j]),
                 )
                 card_init = CardConfig(
-                    color=color, shape=shape, count=count, selected=selected
+                    color=card_enums.Color(colors[i][j]),
+                    shape=card_enums.Shape(shapes[i][j]),
+                    count=count,
+                    selected=bool(selected[i][j]),
                 )
                 prop = Prop(
                     id=card_id,
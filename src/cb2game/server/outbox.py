@@ -0,0 +1,130 @@
+""" Per-socket queues of outgoing messages.
+
+Each connected websocket has an Outbox, created when the socket connects and
+deleted when it disconnects. Subsystems which generate messages for
+a client (lobbies, rooms, google auth, user info) push MessageFromServer
+objects into the socket's outbox, and the socket's sender coroutine (see
+stream_game_state() in server/main.py) awaits on it. This means idle
+connections cost nothing until a message is actually queued for them.
+"""
+import asyncio
+import logging
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+# A table of outboxes for active websocket connections. Maps from
+# aiohttp.WebSocketResponse to Outbox (defined below).
+outbox_table = {}
+
+
+class Outbox(object):
+    """A FIFO of MessageFromServer objects for one websocket."""
+
+    def __init__(self):
+        self._messages = deque()
+        # Created on first await. asyncio primitives must be created on the
+        # loop that awaits them, and outboxes may be created outside of one.
+        self._ready = None
+        self._closed = False
+        self._woken = False
+
+    def put(self, message):
+        """Queues a message and wakes up the sender, if it's waiting."""
+        if self._closed:
+            logger.debug(f"Dropping message type {message.type} for closed outbox.")
+            return
+        self._messages.append(message)
+        if self._ready is not None:
+            self._ready.set()
+
+    def get_nowait(self):
+        """Returns the next message, or None if the outbox is empty."""
+        if len(self._messages) == 0:
+            return None
+        return self._messages.popleft()
+
+    def drain(self):
+        """Returns all pending messages, emptying the outbox."""
+        messages = list(self._messages)
+        self._messages.clear()
+        return messages
+
+    def wake(self):
+        """Wakes up the sender without queueing a message.
+
+        Used to notify the sender of socket state changes (e.g. being removed
+        from a room) which don't come with a message of their own.
+        """
+        self._woken = True
+        if self._ready is not None:
+            self._ready.set()
+
+    async def wait(self, timeout=None):
+        """Waits until a message is available, the outbox is closed or woken.
+
+        Returns True if messages are available. Returns False on timeout,
+        wake() or if the outbox was closed.
+        """
+        if self._ready is None:
+            self._ready = asyncio.Event()
+        while len(self._messages) == 0 and not self._closed and not self._woken:
+            self._ready.clear()
+            try:
+                await asyncio.wait_for(self._ready.wait(), timeout)
+            except asyncio.TimeoutError:
+                return False
+        self._woken = False
+        return len(self._messages) > 0
+
+    def close(self):
+        """Drops any pending messages and wakes up the sender so it can exit."""
+        self._closed = True
+        self._messages.clear()
+        if self._ready is not None:
+            self._ready.set()
+
+    def closed(self):
+        return self._closed
+
+    def __len__(self):
+        return len(self._messages)
+
+
+def CreateOutbox(web_socket_response):
+    """Creates and returns the outbox for a newly connected websocket."""
+    outbox = Outbox()
+    outbox_table[web_socket_response] = outbox
+    return outbox
+
+
+def GetOutbox(web_socket_response):
+    """Returns the outbox for a websocket, or None if it has none.
+
+    Doesn't create an outbox. Sockets only have one between CreateOutbox()
+    and DeleteOutbox() (see PlayerEndpoint in main.py).
+    """
+    return outbox_table.get(web_socket_response, None)
+
+
+def QueueMessage(web_socket_response, message):
+    """Puts a message in the websocket's outbox.
+
+    Messages for unknown sockets (e.g. ones which disconnected while the
+    message was being prepared) are dropped.
+    """
+    outbox = GetOutbox(web_socket_response)
+    if outbox is None:
+        logger.debug(f"Dropping message type {message.type} for unknown socket.")
+        return
+    outbox.put(message)
+
+
+def DeleteOutbox(web_socket_response):
+    outbox = outbox_table.pop(web_socket_response, None)
+    if outbox is not None:
+        outbox.close()
+
+
+def OutboxCount():
+    return len(outbox_table)
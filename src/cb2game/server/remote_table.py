@@ -85,6 +85,12 @@ class Remote:
     time_offset: float = 0.0
     latency: float = 0.0
     uuid: str = ""
+    # If true, the client negotiated batched frames on connect (see
+    # PlayerEndpoint in main.py). All messages drained from the socket's outbox
+    # at once are sent as a single JSON array frame.
+    batch_messages: bool = False
+    # If true, the client caches maps by version and accepts MapUpdate deltas.
+    map_deltas: bool = False
 
     def __str__(self):
         return f"m5sum hashed ip: {self.hashed_ip}, bytes (up/down): {self.bytes_up}/{self.bytes_down}, last message (up/down): {self.last_message_up}/{self.last_message_down}, time_offset: {self.time_offset}, latency: {self.latency}"
@@ -1,8 +1,10 @@
 import asyncio
+import dataclasses
 import hashlib
 import logging
 import os
 import pathlib
+import random
 from datetime import datetime
 from enum import Enum
 
@@ -14,14 +16,19 @@ import cb2game.server.schemas.mturk as mturk_db
 from cb2game.server.config.config import GlobalConfig
 from cb2game.server.demo_state import DemoState
 from cb2game.server.lobby_consts import IsGoogleLobby, IsMturkLobby
+from cb2game.server.map_payload import SerializeWithMapUpdate
+from cb2game.server.message_log import GetMessageLogWriter, LogLevel, LogLevelFromName
 from cb2game.server.messages.logs import (
+    Direction,
     LogEntryFromIncomingMessage,
     LogEntryFromOutgoingMessage,
+    LogEntryHeader,
 )
 from cb2game.server.messages.rooms import Role
 from cb2game.server.messages.scenario import Scenario
 from cb2game.server.messages.tutorials import RoleFromTutorialName
 from cb2game.server.messages.user_info import UserType
+from cb2game.server.outbox import QueueMessage
 from cb2game.server.remote_table import GetRemote
 from cb2game.server.replay_state import ReplayState
 from cb2game.server.scenario_state import ScenarioState
@@ -62,6 +69,7 @@ class Room(object):
         self._max_players = max_players
         self._players = []
         self._player_endpoints = []
+        self._player_sockets = {}  # Player ID -> websocket.
         self._id = game_id
         self._room_type = room_type
         self._game_record = game_record
@@ -115,6 +123,7 @@ class Room(object):
         self._state_machine_driver = StateMachineDriver(
             game_state, self._id, self._lobby
         )
+        self._state_machine_driver.set_message_listener(self._push_messages)
         if self._room_type not in [
             RoomType.PRESET_GAME,
             RoomType.REPLAY,
@@ -122,34 +131,43 @@ class Room(object):
         ]:
             self._game_record.save()
         self._update_loop = None
-        if self._room_type == RoomType.PRESET_GAME:
-            # Create a dummy log directory for the game that ignores all writes.
-            self._log_directory = pathlib.Path(os.devnull)
-            # Create a dummy file object that ignores all bytes.
-            self._messages_from_server_log = open(os.devnull, "w")
-            self._messages_to_server_log = open(os.devnull, "w")
-        elif self._room_type in [RoomType.REPLAY, RoomType.DEMO]:
+        server_config = GlobalConfig()
+        self._messages_from_server_log = None
+        self._messages_to_server_log = None
+        self._message_log_level = LogLevel.FULL
+        self._message_log_sample_rate = 1.0
+        message_log_compression = ""
+        if server_config is not None:
+            self._message_log_level = LogLevelFromName(server_config.message_log_level)
+            self._message_log_sample_rate = server_config.message_log_sample_rate
+            message_log_compression = server_config.message_log_compression
+        if self._room_type in [
+            RoomType.PRESET_GAME,
+            RoomType.REPLAY,
+            RoomType.DEMO,
+        ]:
             # Create a dummy log directory for the game that ignores all writes.
             self._log_directory = pathlib.Path(os.devnull)
-            # Create a dummy file object that ignores all bytes.
-            self._messages_from_server_log = open(os.devnull, "w")
-            self._messages_to_server_log = open(os.devnull, "w")
+            self._message_log_level = LogLevel.NONE
         else:
             log_directory = pathlib.Path(game_record.log_directory)
             if not os.path.exists(log_directory):
                 logger.warning(
                     "Provided log directory does not exist. Game will not be recorded."
                 )
+                self._message_log_level = LogLevel.NONE
                 return
             self._log_directory = log_directory
-            messages_from_server_path = pathlib.Path(
-                self._log_directory, "messages_from_server.jsonl.log"
+            # Logs are written from a background thread.
+            log_writer = GetMessageLogWriter()
+            self._messages_from_server_log = log_writer.open(
+                pathlib.Path(self._log_directory, "messages_from_server.jsonl.log"),
+                message_log_compression,
             )
-            self._messages_from_server_log = messages_from_server_path.open("w")
-            messages_to_server_path = pathlib.Path(
-                self._log_directory, "messages_to_server.jsonl.log"
+            self._messages_to_server_log = log_writer.open(
+                pathlib.Path(self._log_directory, "messages_to_server.jsonl.log"),
+                message_log_compression,
             )
-            self._messages_to_server_log = messages_to_server_path.open("w")
 
         # Write the current server config to the log_directory as config.json.
         if self._room_type not in [
@@ -158,7 +176,6 @@ class Room(object):
             RoomType.DEMO,
         ]:
             with open(pathlib.Path(self._log_directory, "config.json"), "w") as f:
-                server_config = GlobalConfig()
                 if server_config is not None:
                     f.write(orjson.dumps(server_config).decode("utf-8"))
 
@@ -178,6 +195,12 @@ class Room(object):
         state_machine = self._state_machine_driver.state_machine()
         id = state_machine.create_actor(role)
         remote = GetRemote(ws)
+        if (
+            remote is not None
+            and remote.map_deltas
+            and hasattr(state_machine, "enable_map_deltas")
+        ):
+            state_machine.enable_map_deltas(id)
 
         # Fetch the leader and follower user information.
         if remote != None and self._room_type not in [
@@ -232,6 +255,8 @@ class Room(object):
             logger.warning(f"Starting room without remote IP/Port/Google information.")
         self._players.append(id)
         self._player_endpoints.append(ws)
+        self._player_sockets[id] = ws
+        self._state_machine_driver.wake()
         return id
 
     def remove_player(self, id, ws, disconnected=False):
@@ -242,11 +267,13 @@ class Room(object):
             )
             return
         self._players.remove(id)
+        self._player_sockets.pop(id, None)
         if ws in self._player_endpoints:
             self._player_endpoints.remove(ws)
         self._state_machine_driver.state_machine().free_actor(id)
         if disconnected:
             self._state_machine_driver.state_machine().mark_player_disconnected(id)
+        self._state_machine_driver.wake()
 
     def player_endpoints(self):
         return self._player_endpoints
@@ -261,13 +288,30 @@ class Room(object):
         self._state_machine_driver.drain_messages(id, messages)
         # Log messages
         for message in messages:
-            log_message = orjson.dumps(
-                LogEntryFromIncomingMessage(id, message),
+            logger.info(f"Received message type {message.type} for player {id}.")
+            if self._message_log_level == LogLevel.NONE:
+                continue
+            if self._log_message_body():
+                entry = LogEntryFromIncomingMessage(id, message)
+            else:
+                entry = LogEntryHeader(
+                    Direction.TO_SERVER, id, message.type.value, message.transmit_time
+                )
+            log_bytes = orjson.dumps(
+                entry,
                 option=orjson.OPT_NAIVE_UTC | orjson.OPT_PASSTHROUGH_DATETIME,
                 default=datetime.isoformat,
-            ).decode("utf-8")
-            self._messages_to_server_log.write(log_message + "\n")
-            logger.info(f"Received message type {message.type} for player {id}.")
+            )
+            self._messages_to_server_log.write(log_bytes + b"\n")
+
+    def _log_message_body(self):
+        """Whether the next logged message should be logged in full."""
+        if self._message_log_level != LogLevel.FULL:
+            return False
+        return (
+            self._message_log_sample_rate >= 1
+            or random.random() < self._message_log_sample_rate
+        )
 
     def start(self):
         if self._update_loop is not None:
@@ -293,13 +337,14 @@ class Room(object):
             return RuntimeError("stopped Room that is not running.")
         logging.info(f"Room /{self.id()} ending game.")
         self._state_machine_driver.end_game()
-        if not os.path.exists(self._log_directory):
+        if self._messages_from_server_log is None:
             return
         self._messages_from_server_log.close()
         self._messages_to_server_log.close()
 
     def set_scenario(self, scenario: Scenario):
         self._state_machine_driver.state_machine().set_scenario(scenario)
+        self._state_machine_driver.wake()
 
     def done(self):
         if not self._initialized:
@@ -314,9 +359,11 @@ class Room(object):
 
     def desync(self, id):
         self._state_machine_driver.state_machine().desync(id)
+        self._state_machine_driver.wake()
 
     def desync_all(self):
         self._state_machine_driver.state_machine().desync_all()
+        self._state_machine_driver.wake()
 
     def is_full(self):
         """Returns True if the room is full."""
@@ -358,14 +405,35 @@ class Room(object):
             return False
         out_messages.extend(messages)
 
+        if self._message_log_level == LogLevel.NONE:
+            return True
         for message in messages:
             try:
-                log_bytes = orjson.dumps(
-                    LogEntryFromOutgoingMessage(player_id, message),
-                    option=orjson.OPT_NAIVE_UTC | orjson.OPT_PASSTHROUGH_DATETIME,
-                    default=datetime.isoformat,
-                ).decode("utf-8")
-                self._messages_from_server_log.write(log_bytes + "\n")
+                if not self._log_message_body():
+                    log_bytes = orjson.dumps(
+                        LogEntryHeader(
+                            Direction.FROM_SERVER,
+                            player_id,
+                            message.type.value,
+                            message.transmit_time,
+                        ),
+                        option=orjson.OPT_NAIVE_UTC | orjson.OPT_PASSTHROUGH_DATETIME,
+                        default=datetime.isoformat,
+                    )
+                elif message.map_update is not None:
+                    log_bytes = SerializeWithMapUpdate(
+                        LogEntryFromOutgoingMessage(
+                            player_id, dataclasses.replace(message, map_update=None)
+                        ),
+                        message.map_update,
+                    )
+                else:
+                    log_bytes = orjson.dumps(
+                        LogEntryFromOutgoingMessage(player_id, message),
+                        option=orjson.OPT_NAIVE_UTC | orjson.OPT_PASSTHROUGH_DATETIME,
+                        default=datetime.isoformat,
+                    )
+                self._messages_from_server_log.write(log_bytes + b"\n")
             except TypeError:
                 logger.info(f"Error with message {message}")
                 while True:
@@ -374,6 +442,16 @@ class Room(object):
                     sys.exit(1)
         return True
 
+    def _push_messages(self, player_id):
+        """Moves pending messages for a player into their socket's outbox."""
+        ws = self._player_sockets.get(player_id, None)
+        if ws is None:
+            return
+        messages = []
+        if self.fill_messages(player_id, messages):
+            for message in messages:
+                QueueMessage(ws, message)
+
     def id(self):
         """Returns the room id."""
         return self._id
@@ -1,44 +1,166 @@
-"""A set of utilities for pathfinding and routing in CB2 maps."""
+"""A set of utilities for pathfinding and routing in CB2 maps.
+
+All routing goes through RoutingTables. A RoutingTable holds breadth-first
+search trees over one map, one per start location, computed on first use.
+Cards are obstacles: paths never pass through a card, but may end on one. When
+cards move, only trees which reached a changed location are recomputed.
+
+Tables are cached by map contents (see GetRoutingTable), so bots which route
+to every card each turn share one table per map. Bots should route with
+FindPath().
+"""
 import logging
-from collections import deque
+import threading
+from collections import OrderedDict
+
+import numpy as np
 
 from cb2game.server.hex import HecsCoord
 
 logger = logging.getLogger(__name__)
 
+# Number of maps to keep routing tables for.
+ROUTING_TABLE_CACHE_SIZE = 16
 
-def find_path_to_card(location: HecsCoord, follower, map, cards):
-    start_location = follower.location()
-    end_location = location
-    location_queue = deque()
-    location_queue.append((start_location, [start_location]))
-    card_locations = set([card.prop_info.location for card in cards])
-    if start_location in card_locations:
-        card_locations.remove(start_location)
-    if end_location in card_locations:
-        card_locations.remove(end_location)
-    visited_locations = set()
-    while len(location_queue) > 0:
-        current_location, current_path = location_queue.popleft()
-        if current_location in visited_locations:
-            continue
-        if current_location in card_locations:
-            continue
-        visited_locations.add(current_location)
-        if current_location == end_location:
-            return current_path
-        tile = map.tile_at(current_location)
-        for neighbor in tile.cell.coord.neighbors():
-            if tile.cell.boundary.get_edge_between(tile.cell.coord, neighbor):
-                continue
-            neighbor_tile = map.tile_at(neighbor)
-            # This can happen if routing on a follower view with limited map visibility.
-            if neighbor_tile is None:
-                continue
-            if neighbor_tile.cell.boundary.get_edge_between(neighbor, tile.cell.coord):
+# Predecessor of unreached cells.
+UNREACHED = -2
+# Predecessor of the start cell.
+START = -1
+
+
+class RoutingTable(object):
+    """Shortest paths between locations on a map. See the top of this file."""
+
+    def __init__(self, grid):
+        self._grid = grid
+        self._obstacles = frozenset()
+        # Start flat index -> (predecessors, distances) lists, indexed by flat index.
+        self._trees = {}
+        self.lock = threading.Lock()
+        # Metrics.
+        self.searches = 0
+
+    def grid(self):
+        return self._grid
+
+    def set_obstacles(self, locations):
+        """Sets the locations paths can't pass through (e.g. cards)."""
+        obstacles = frozenset(self._grid.flat_index(location) for location in locations)
+        changed = obstacles ^ self._obstacles
+        if len(changed) == 0:
+            return
+        self._obstacles = obstacles
+        # Drop search trees which reached a changed cell.
+        for start in list(self._trees):
+            predecessors, _ = self._trees[start]
+            if any(predecessors[index] != UNREACHED for index in changed if index >= 0):
+                del self._trees[start]
+
+    def path(self, start: HecsCoord, end: HecsCoord):
+        """Returns the shortest path from start to end (inclusive), or None if there isn't one."""
+        tree = self._tree(start)
+        end_index = self._grid.flat_index(end)
+        if tree is None or end_index < 0:
+            return None
+        predecessors, _ = tree
+        if predecessors[end_index] == UNREACHED:
+            return None
+        path = []
+        index = end_index
+        while index != START:
+            path.append(self._grid.coord(index))
+            index = predecessors[index]
+        path.reverse()
+        return path
+
+    def distance(self, start: HecsCoord, end: HecsCoord):
+        """Returns the number of steps from start to end, or -1 if it's unreachable."""
+        tree = self._tree(start)
+        end_index = self._grid.flat_index(end)
+        if tree is None or end_index < 0:
+            return -1
+        return tree[1][end_index]
+
+    def distances_from(self, start: HecsCoord):
+        """Returns a (rows, cols) array of steps from start to each cell. -1 if unreachable."""
+        tree = self._tree(start)
+        if tree is None:
+            return np.full((self._grid.rows, self._grid.cols), -1, dtype=np.int32)
+        return np.array(tree[1], dtype=np.int32).reshape(
+            self._grid.rows, self._grid.cols
+        )
+
+    def _tree(self, start):
+        start_index = self._grid.flat_index(start)
+        if start_index < 0:
+            return None
+        tree = self._trees.get(start_index, None)
+        if tree is None:
+            tree = self._search(start_index)
+            self._trees[start_index] = tree
+        return tree
+
+    def _search(self, start_index):
+        self.searches += 1
+        grid = self._grid
+        obstacles = self._obstacles
+        predecessors = [UNREACHED] * grid.size()
+        distances = [-1] * grid.size()
+        predecessors[start_index] = START
+        distances[start_index] = 0
+        # Breadth-first. The queue grows as it's iterated over.
+        queue = [start_index]
+        for current in queue:
+            # Obstacles can be reached, but not passed through.
+            if current in obstacles and current != start_index:
                 continue
-            location_queue.append((neighbor, current_path + [neighbor]))
-    return None
+            distance = distances[current] + 1
+            for neighbor in grid.passable_neighbors(current):
+                if predecessors[neighbor] == UNREACHED:
+                    predecessors[neighbor] = current
+                    distances[neighbor] = distance
+                    queue.append(neighbor)
+        return predecessors, distances
+
+
+routing_tables = OrderedDict()
+routing_tables_lock = threading.Lock()
+
+
+def GetRoutingTable(map):
+    """Returns the shared RoutingTable for a map.
+
+    Tables are keyed by the map's walkable edges, so MapUpdates with the same
+    tiles (e.g. rebuilt from each observation) share a table. Hold the table's
+    lock while setting obstacles and querying it. FindPath() does this.
+    """
+    grid = map.grid()
+    key = (grid.rows, grid.cols, grid.passable.tobytes())
+    with routing_tables_lock:
+        table = routing_tables.get(key, None)
+        if table is None:
+            table = RoutingTable(grid)
+            routing_tables[key] = table
+            while len(routing_tables) > ROUTING_TABLE_CACHE_SIZE:
+                routing_tables.popitem(last=False)
+        routing_tables.move_to_end(key)
+    return table
+
+
+def FindPath(map, cards, start: HecsCoord, end: HecsCoord):
+    """Returns the shortest path from start to end which doesn't pass through a card.
+
+    The path is a list of HecsCoords, including start and end. Returns None if
+    there's no path.
+    """
+    table = GetRoutingTable(map)
+    with table.lock:
+        table.set_obstacles(card.prop_info.location for card in cards)
+        return table.path(start, end)
+
+
+def find_path_to_card(location: HecsCoord, follower, map, cards):
+    return FindPath(map, cards, follower.location(), location)
 
 
 def get_instruction_to_location(
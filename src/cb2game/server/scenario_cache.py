@@ -0,0 +1,220 @@
+""" A disk cache of scenarios reconstructed from the game database.
+
+Reconstructing the scenario at an event means replaying the game's events up to
+it (see scenario_util.py). Evals of different agents on the same instructions
+reconstruct the same scenarios over and over, so they're saved as compressed
+JSON, one file per event.
+
+Scenario files are named by a hash of the event ID and the database file's
+identity (path, size and modification time, including its write-ahead log). If
+the database changes, lookups stop matching the old files, which age out of
+the cache.
+
+Maps make up nearly all of a scenario, and every scenario in a game has the
+same map. So maps are stored separately, named by a hash of their contents, and
+each scenario file refers to its map by that hash. Recently loaded maps are
+kept in memory. Scenarios loaded from the cache share the tiles list of their
+map (like copies made with dataclasses.replace()), so the map is parsed,
+indexed and serialized once per game rather than once per scenario.
+
+The cache holds at most config.scenario_cache_size files (scenarios and maps),
+and evicts the least recently used ones first. Each process keeps its own index
+of the directory, built when the cache is opened. Processes sharing a directory
+may briefly exceed the size limit, and can evict each other's files (which just
+become misses).
+"""
+import dataclasses
+import gzip
+import hashlib
+import logging
+import os
+import pathlib
+import uuid
+from collections import OrderedDict
+from typing import Optional
+
+import orjson
+
+from cb2game.server.messages.map_update import MapUpdate
+from cb2game.server.messages.scenario import Scenario
+
+logger = logging.getLogger(__name__)
+
+SCENARIO_FILE_SUFFIX = ".json.gz"
+MAP_FILE_SUFFIX = ".map.json.gz"
+# Number of parsed maps to keep in memory.
+LOADED_MAP_CACHE_SIZE = 8
+
+
+def DatabaseFingerprint(db_path) -> str:
+    """Identifies the current contents of an sqlite database file.
+
+    Changes whenever the database is written to. In WAL mode, writes go to the
+    -wal file until they're checkpointed into the main file.
+    """
+    path = pathlib.Path(db_path).expanduser().resolve()
+    stat = path.stat()
+    wal_path = path.with_name(path.name + "-wal")
+    wal_size = wal_path.stat().st_size if wal_path.exists() else 0
+    return f"{path}:{stat.st_size}:{stat.st_mtime_ns}:{wal_size}"
+
+
+class ScenarioCache(object):
+    """An LRU of serialized scenarios on disk, keyed by event ID."""
+
+    def __init__(self, directory, db_path, max_size):
+        self._directory = pathlib.Path(directory).expanduser()
+        self._directory.mkdir(parents=True, exist_ok=True)
+        self._db_path = db_path
+        self._max_size = max_size
+        # File names (scenarios and maps), least recently used first.
+        paths = sorted(
+            self._directory.glob(f"*{SCENARIO_FILE_SUFFIX}"),
+            key=lambda path: path.stat().st_mtime_ns,
+        )
+        self._files = OrderedDict((path.name, None) for path in paths)
+        # Map hash -> MapUpdate.
+        self._maps = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._evict()
+        logger.info(f"Scenario cache has {len(self._files)} files in {self._directory}")
+
+    def get(self, event_id) -> Optional[Scenario]:
+        """Returns the cached scenario at an event, or None."""
+        name = self._scenario_file_name(event_id)
+        try:
+            data = orjson.loads(self._read(name))
+            map_update = self._load_map(data["map"])
+            scenario = Scenario.from_dict(data["scenario"])
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except Exception as e:
+            logger.warning(f"Unable to load cached scenario {name}. Deleting it. {e}")
+            self._delete(name)
+            self.misses += 1
+            return None
+        self.hits += 1
+        if map_update is not None:
+            # Share the tiles list with other scenarios from the same map.
+            scenario = dataclasses.replace(
+                scenario, map=dataclasses.replace(map_update)
+            )
+        return scenario
+
+    def put(self, event_id, scenario: Scenario):
+        map_key = None
+        if scenario.map is not None:
+            map_data = orjson.dumps(scenario.map)
+            map_key = hashlib.sha256(map_data).hexdigest()
+            if map_key + MAP_FILE_SUFFIX not in self._files:
+                self._write(map_key + MAP_FILE_SUFFIX, map_data)
+        data = orjson.dumps(
+            {"map": map_key, "scenario": dataclasses.replace(scenario, map=None)}
+        )
+        self._write(self._scenario_file_name(event_id), data)
+
+    def clear(self):
+        for name in self._files:
+            (self._directory / name).unlink(missing_ok=True)
+        self._files.clear()
+        self._maps.clear()
+
+    def __len__(self):
+        return len(self._files)
+
+    def _scenario_file_name(self, event_id) -> str:
+        if not isinstance(event_id, uuid.UUID):
+            event_id = uuid.UUID(str(event_id))
+        key = f"{DatabaseFingerprint(self._db_path)}:{event_id.hex}"
+        return hashlib.sha256(key.encode("utf-8")).hexdigest() + SCENARIO_FILE_SUFFIX
+
+    def _load_map(self, map_key) -> Optional[MapUpdate]:
+        if map_key is None:
+            return None
+        map_update = self._maps.get(map_key, None)
+        if map_update is not None:
+            self._touch(map_key + MAP_FILE_SUFFIX)
+        else:
+            data = self._read(map_key + MAP_FILE_SUFFIX)
+            map_update = MapUpdate.from_dict(orjson.loads(data))
+            self._maps[map_key] = map_update
+        self._maps.move_to_end(map_key)
+        while len(self._maps) > LOADED_MAP_CACHE_SIZE:
+            self._maps.popitem(last=False)
+        return map_update
+
+    def _read(self, name) -> bytes:
+        try:
+            with gzip.open(self._directory / name, "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            self._files.pop(name, None)
+            raise
+        self._touch(name)
+        return data
+
+    def _write(self, name, data: bytes):
+        path = self._directory / name
+        temp_path = path.with_name(f"{name}.{os.getpid()}.tmp")
+        with gzip.open(temp_path, "wb") as f:
+            f.write(data)
+        # Atomic, so that other processes never see a partially written file.
+        os.replace(temp_path, path)
+        self._files[name] = None
+        self._files.move_to_end(name)
+        self._evict()
+
+    def _touch(self, name):
+        # File modification times order the LRU across restarts.
+        os.utime(self._directory / name)
+        self._files[name] = None
+        self._files.move_to_end(name)
+
+    def _delete(self, name):
+        (self._directory / name).unlink(missing_ok=True)
+        self._files.pop(name, None)
+
+    def _evict(self):
+        while len(self._files) > self._max_size:
+            name, _ = self._files.popitem(last=False)
+            (self._directory / name).unlink(missing_ok=True)
+            if name.endswith(MAP_FILE_SUFFIX):
+                self._maps.pop(name[: -len(MAP_FILE_SUFFIX)], None)
+
+
+scenario_cache = None
+
+
+def InitScenarioCache(config):
+    """Opens the scenario cache for config's database. Disabled if config.scenario_cache_size is 0."""
+    global scenario_cache
+    if config.scenario_cache_size <= 0:
+        scenario_cache = None
+        return
+    scenario_cache = ScenarioCache(
+        config.scenario_cache_directory(),
+        config.database_path(),
+        config.scenario_cache_size,
+    )
+
+
+def CachedScenario(event_id) -> Optional[Scenario]:
+    """Returns the cached scenario at an event, or None if there isn't one."""
+    if scenario_cache is None:
+        return None
+    try:
+        return scenario_cache.get(event_id)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Scenario cache lookup failed for event {event_id}. {e}")
+        return None
+
+
+def CacheScenario(event_id, scenario: Scenario):
+    if scenario_cache is None:
+        return
+    try:
+        scenario_cache.put(event_id, scenario)
+    except (OSError, ValueError) as e:
+        logger.warning(f"Unable to cache scenario for event {event_id}. {e}")
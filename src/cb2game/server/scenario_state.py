@@ -98,6 +98,9 @@ class ScenarioState(object):
     def scenario_id(self):
         return self._scenario_id
 
+    def enable_map_deltas(self, actor_id):
+        self._state.enable_map_deltas(actor_id)
+
     def mark_player_disconnected(self, id):
         self._state.mark_player_disconnected(id)
 
@@ -119,6 +122,9 @@ class ScenarioState(object):
     def update(self):
         self._state.update()
 
+    def time_until_next_update(self):
+        return self._state.time_until_next_update()
+
     def _find_player_of_role(self, role: Role):
         for player_id in self._state.player_ids():
             if self._state.player_role(player_id) == role:
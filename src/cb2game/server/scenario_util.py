@@ -1,12 +1,14 @@
 """ Utilities used for working with scenarios and game data."""
+import itertools
 import logging
+from dataclasses import dataclass
 from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
 
 import orjson
 
 import cb2game.server.messages.action as action_module
 import cb2game.server.messages.objective as objective
-import cb2game.server.schemas.game as game_db
 from cb2game.pyclient.game_endpoint import GameState
 from cb2game.server.actor import Actor
 from cb2game.server.card import Card
@@ -16,6 +18,7 @@ from cb2game.server.messages.rooms import Role
 from cb2game.server.messages.scenario import Scenario
 from cb2game.server.messages.state_sync import StateSync
 from cb2game.server.messages.turn_state import TurnState, TurnUpdate
+from cb2game.server.scenario_cache import CachedScenario, CacheScenario
 from cb2game.server.schemas.event import Event, EventOrigin, EventType
 from cb2game.server.schemas.util import InitialState
 
@@ -35,194 +38,212 @@ def TurnDuration(role):
     )
 
 
-def ReconstructScenarioFromEvent(event_uuid: str) -> Scenario:
-    """Looks up a given event in the database.
-
-    Returns:
-        A tuple of (Scenario, None) if the scenario was found, or (None, error_message) if not.
+class ScenarioBuilder(object):
+    """Integrates a game's events into a Scenario, one event at a time.
 
+    Events must be applied in server_time order. scenario() then returns the
+    game's state as of the last applied event, the same as
+    ReconstructScenarioFromEvent() would for that event. Snapshots can be
+    taken at any point, so a game only needs to be read once (see
+    ScenarioSnapshots()).
     """
-    # Get the event matching this UUID, make sure it's unique.
-    event_query = (
-        Event.select().join(game_db.Game).where(Event.id == event_uuid).limit(1)
-    )
-    if event_query.count() != 1:
-        return (
-            None,
-            f"1 Event {event_uuid} not found. ({event_query.count()} found)",
-        )
-    event = event_query.get()
-    game_record = event.game
-
-    # Get all events from the same game that happened before this event.
-    game_events = (
-        Event.select()
-        .where(Event.game == game_record, Event.server_time <= event.server_time)
-        .order_by(Event.server_time)
-    )
 
-    # Get the game map.
-    map_event = game_events.where(Event.type == EventType.MAP_UPDATE).get()
-    map_update = MapUpdate.from_json(map_event.data)
+    def __init__(self):
+        self._map_data = None
+        self._cards_by_loc = {}
+        self._turn_state_data = None
+        # Data of INSTRUCTION_SENT events, by event ID.
+        self._sent_instructions = {}
+        # Data of instructions which haven't been completed or cancelled.
+        self._instructions = []
+        self._instruction_error = None
+        self._initial_state_count = 0
+        self._leader = None
+        self._follower = None
+        # Moves before the initial state, if any. Applied once it arrives.
+        self._pending_moves = []
+        self._move_error = None
 
-    card_events = game_events.where(
-        Event.type
-        << [
+    def apply(self, event: Event):
+        if event.type == EventType.MAP_UPDATE:
+            if self._map_data is None:
+                self._map_data = orjson.loads(event.data)
+        elif event.type in [
             EventType.CARD_SET,
             EventType.CARD_SPAWN,
             EventType.CARD_SELECT,
             EventType.PROP_UPDATE,
-        ]
-    ).order_by(Event.server_time)
+        ]:
+            self._apply_card_event(event)
+        elif event.type in [EventType.TURN_STATE, EventType.START_OF_TURN]:
+            self._turn_state_data = event.data
+        elif event.type in [
+            EventType.INSTRUCTION_SENT,
+            EventType.INSTRUCTION_ACTIVATED,
+            EventType.INSTRUCTION_CANCELLED,
+            EventType.INSTRUCTION_DONE,
+        ]:
+            if self._instruction_error is None:
+                self._instruction_error = self._apply_instruction_event(event)
+        elif event.type == EventType.INITIAL_STATE:
+            self._initial_state_count += 1
+            if self._initial_state_count == 1:
+                self._apply_initial_state(InitialState.from_json(event.data))
+        elif event.type == EventType.ACTION:
+            if self._leader is None:
+                self._pending_moves.append(event)
+            else:
+                self._apply_move(event)
+
+    def scenario(self):
+        """Returns (Scenario, None), or (None, error_message) if the events so far are invalid."""
+        if self._map_data is None:
+            return None, "Map update not found."
+        if self._instruction_error is not None:
+            return None, self._instruction_error
+        if self._initial_state_count != 1:
+            return (
+                None,
+                f"Single initial state event not found. ({self._initial_state_count} found)",
+            )
+        if self._move_error is not None:
+            return None, self._move_error
+
+        # Filter out cleared cards.
+        cards = [card for card in self._cards_by_loc.values() if card is not None]
+        logger.debug(f"Detected {len(cards)} cards in the game. at this point.")
 
-    # Integrate all prop, cardset and card spawn events up to the given event, to get the current card state
-    cards = []
-    cards_by_loc = {}
-    for event in card_events:
+        if self._turn_state_data is None:
+            # Initial turn.
+            turn_state = TurnUpdate(
+                Role.LEADER,
+                LEADER_MOVES_PER_TURN,
+                6,
+                datetime.utcnow()
+                + TurnDuration(Role.LEADER),  # pylint: disable=protected-access
+                datetime.utcnow(),
+                0,
+                0,
+                0,
+            )
+        else:
+            turn_state = TurnState.from_json(self._turn_state_data)
+
+        state_sync_msg = StateSync(
+            2, [self._leader.state(), self._follower.state()], -1, Role.NONE
+        )
+        # Messages are parsed for each snapshot, so that scenarios don't share
+        # mutable state.
+        return (
+            Scenario(
+                "",
+                MapUpdate.from_dict(self._map_data),
+                PropUpdate(props=[card.prop() for card in cards]),
+                turn_state,
+                [
+                    objective.ObjectiveMessage.from_json(data)
+                    for data in self._instructions
+                ],
+                state_sync_msg,
+            ),
+            None,
+        )
+
+    def has_turn_state(self) -> bool:
+        """False if no turn state was recorded yet.
+
+        scenario() then starts a new leader turn, timed from when it's called,
+        so the scenario shouldn't be cached.
+        """
+        return self._turn_state_data is not None
+
+    def _apply_card_event(self, event: Event):
+        # Integrate all prop, cardset and card spawn events, to get the current card state.
         if event.type == EventType.CARD_SET:
             data = orjson.loads(event.data)
             set_cards = [Card.from_dict(card) for card in data["cards"]]
             # Clear cards that were in the set
             for card in set_cards:
-                cards_by_loc[card.location] = None
-        if event.type == EventType.CARD_SPAWN:
+                self._cards_by_loc[card.location] = None
+        elif event.type == EventType.CARD_SPAWN:
             data = orjson.loads(event.data)
             card = Card.from_dict(data)
-            cards_by_loc[card.location] = card
-        if event.type == EventType.CARD_SELECT:
+            self._cards_by_loc[card.location] = card
+        elif event.type == EventType.CARD_SELECT:
             card = Card.from_json(event.data)
-            cards_by_loc[card.location] = card
+            self._cards_by_loc[card.location] = card
         elif event.type == EventType.PROP_UPDATE:
             # Regen props from the prop update
             prop_update = PropUpdate.from_json(event.data)
-            cards = [
-                Card.FromProp(prop)
-                for prop in prop_update.props
-                if prop.prop_type == PropType.CARD
-            ]
-            cards_by_loc = {}
-            for card in cards:
-                cards_by_loc[card.location] = card
-
-    cards = cards_by_loc.values()
-    # Filter out None values
-    cards = [card for card in cards if card is not None]
-    logger.debug(f"Detected {len(cards)} cards in the game. at this point.")
-
-    turn_record_query = game_events.where(
-        Event.type << [EventType.TURN_STATE, EventType.START_OF_TURN],
-    ).order_by(Event.server_time.desc())
-    turn_state = None
-    if turn_record_query.count() == 0:
-        # Initial turn.
-        turn_state = TurnUpdate(
-            Role.LEADER,
-            LEADER_MOVES_PER_TURN,
-            6,
-            datetime.utcnow()
-            + TurnDuration(Role.LEADER),  # pylint: disable=protected-access
-            datetime.utcnow(),
-            0,
-            0,
-            0,
-        )
-    else:
-        turn_record = turn_record_query.first()
-        turn_state = TurnState.from_json(turn_record.data)
-
-    # Integrate all instruction events up to the given event, to get the current instruction state
-    instruction_list = []
-    instruction_events = game_events.where(
-        Event.type
-        << [
-            EventType.INSTRUCTION_SENT,
-            EventType.INSTRUCTION_ACTIVATED,
-            EventType.INSTRUCTION_CANCELLED,
-            EventType.INSTRUCTION_DONE,
-        ]
-    ).order_by(Event.server_time)
-    instruction_list = []
-    for event in instruction_events:
+            self._cards_by_loc = {}
+            for prop in prop_update.props:
+                if prop.prop_type == PropType.CARD:
+                    card = Card.FromProp(prop)
+                    self._cards_by_loc[card.location] = card
+
+    def _apply_instruction_event(self, event: Event):
+        """Returns an error message if the event doesn't match the instruction list."""
         if event.type == EventType.INSTRUCTION_SENT:
-            instruction_list.append(objective.ObjectiveMessage.from_json(event.data))
+            self._sent_instructions[event.id] = event.data
+            self._instructions.append(event.data)
+            return None
+        parent_data = self._sent_instructions.get(event.parent_event_id)
+        if parent_data is None:
+            parent_data = event.parent_event.data
+        instruction = objective.ObjectiveMessage.from_json(parent_data)
+        head = (
+            objective.ObjectiveMessage.from_json(self._instructions[0])
+            if len(self._instructions) > 0
+            else None
+        )
         if event.type == EventType.INSTRUCTION_ACTIVATED:
-            parent_instruction_event = event.parent_event
-            instruction = objective.ObjectiveMessage.from_json(
-                parent_instruction_event.data
-            )
-            if instruction_list[0].uuid != instruction.uuid:
-                return (
-                    None,
-                    f"Activated instruction {instruction.uuid} not found in instruction list.",
-                )
-        if event.type == EventType.INSTRUCTION_CANCELLED:
-            parent_instruction_event = event.parent_event
-            instruction = objective.ObjectiveMessage.from_json(
-                parent_instruction_event.data
-            )
-            try:
-                if instruction_list[0].uuid != instruction.uuid:
-                    return (
-                        None,
-                        f"Cancelled instruction {event.data} not found in instruction list.",
-                    )
-            except IndexError:
-                # Print the list of instructions.
+            if head is None or head.uuid != instruction.uuid:
+                return f"Activated instruction {instruction.uuid} not found in instruction list."
+        elif event.type == EventType.INSTRUCTION_CANCELLED:
+            if head is None:
                 logger.debug(
                     f"Instruction list is empty. ================ cancelled: {instruction.uuid}"
                 )
-                for instruction in instruction_list:
-                    logger.debug(f"Instruction: {instruction.uuid}")
-                # raise e
-            if len(instruction_list) > 0:
-                logger.debug(f"Cancelled: {instruction_list[0].uuid}")
-                # Delete the instruction from the list.
-                instruction_list = instruction_list[1:]
-        if event.type == EventType.INSTRUCTION_DONE:
-            parent_instruction_event = event.parent_event
-            instruction = objective.ObjectiveMessage.from_json(
-                parent_instruction_event.data
-            )
-            # Make sure this instruction is at the head of the list.
-            if instruction_list[0].uuid != instruction.uuid:
+                return None
+            if head.uuid != instruction.uuid:
                 return (
-                    None,
-                    f"Done instruction {event.data} not found in instruction list.",
+                    f"Cancelled instruction {event.data} not found in instruction list."
                 )
+            logger.debug(f"Cancelled: {head.uuid}")
             # Delete the instruction from the list.
-            instruction_list = instruction_list[1:]
+            self._instructions = self._instructions[1:]
+        elif event.type == EventType.INSTRUCTION_DONE:
+            # Make sure this instruction is at the head of the list.
+            if head is None or head.uuid != instruction.uuid:
+                return f"Done instruction {event.data} not found in instruction list."
+            # Delete the instruction from the list.
+            self._instructions = self._instructions[1:]
+        return None
 
-    initial_state_event = game_events.where(
-        Event.type == EventType.INITIAL_STATE,
-    )
-    if initial_state_event.count() != 1:
-        return (
-            None,
-            f"Single initial state event not found. ({initial_state_event.count()} found)",
+    def _apply_initial_state(self, initial_state: InitialState):
+        self._leader = Actor(
+            21,
+            0,
+            Role.LEADER,
+            initial_state.leader_position,
+            False,
+            initial_state.leader_rotation_degrees,
         )
-    initial_state_event = initial_state_event.get()
-    initial_state = InitialState.from_json(initial_state_event.data)
-
-    leader = Actor(
-        21,
-        0,
-        Role.LEADER,
-        initial_state.leader_position,
-        False,
-        initial_state.leader_rotation_degrees,
-    )
-    follower = Actor(
-        22,
-        0,
-        Role.FOLLOWER,
-        initial_state.follower_position,
-        False,
-        initial_state.follower_rotation_degrees,
-    )
+        self._follower = Actor(
+            22,
+            0,
+            Role.FOLLOWER,
+            initial_state.follower_position,
+            False,
+            initial_state.follower_rotation_degrees,
+        )
+        for move in self._pending_moves:
+            self._apply_move(move)
+        self._pending_moves = []
 
-    moves = game_events.where(Event.type == EventType.ACTION)
-    logger.debug(f"Found {moves.count()} moves before event {event_uuid}")
-    for move in moves:
+    def _apply_move(self, move: Event):
+        if self._move_error is not None:
+            return
         action = action_module.Action.from_json(move.data)
         if action.action_type not in [
             action_module.ActionType.INIT,
@@ -230,28 +251,181 @@ def ReconstructScenarioFromEvent(event_uuid: str) -> Scenario:
             action_module.ActionType.ROTATE,
             action_module.ActionType.TRANSLATE,
         ]:
-            continue
+            return
         if move.origin == EventOrigin.LEADER:
-            leader.add_action(action)
-            leader.step()
+            self._leader.add_action(action)
+            self._leader.step()
         elif move.origin == EventOrigin.FOLLOWER:
-            follower.add_action(action)
-            follower.step()
+            self._follower.add_action(action)
+            self._follower.step()
         else:
-            return None, f"Unknown event origin: {move.origin}"
-    state_sync_msg = StateSync(2, [leader.state(), follower.state()], -1, Role.NONE)
+            self._move_error = f"Unknown event origin: {move.origin}"
 
-    return (
-        Scenario(
-            "",
-            map_update,
-            PropUpdate(props=[card.prop() for card in cards]),
-            turn_state,
-            instruction_list,
-            state_sync_msg,
-        ),
-        None,
-    )
+
+def GameEvents(game_id, until: datetime = None):
+    """Returns a game's events in order, optionally up to (and including) a time."""
+    query = Event.select().where(Event.game == game_id)
+    if until is not None:
+        query = query.where(Event.server_time <= until)
+    return list(query.order_by(Event.server_time))
+
+
+def ScenarioSnapshots(events: List[Event], event_ids) -> Dict:
+    """Reconstructs scenarios at many events of a game, in a single pass.
+
+    Args:
+        events: All of a game's events, in server_time order (see GameEvents()).
+        event_ids: IDs of the events to take snapshots at.
+
+    Returns:
+        A dict from event ID to (Scenario, error), as
+        ReconstructScenarioFromEvent() would return for that event.
+    """
+    snapshots = {}
+    event_ids = set(event_ids)
+    for event_id in list(event_ids):
+        scenario = CachedScenario(event_id)
+        if scenario is not None:
+            snapshots[event_id] = (scenario, None)
+            event_ids.remove(event_id)
+    builder = ScenarioBuilder()
+    # Like ReconstructScenarioFromEvent(), a snapshot includes every event at
+    # the same server_time, so events are applied a timestamp at a time.
+    for _, same_time in itertools.groupby(events, key=lambda e: e.server_time):
+        if len(event_ids) == 0:
+            break
+        same_time = list(same_time)
+        for event in same_time:
+            builder.apply(event)
+        snapshot_ids = [event.id for event in same_time if event.id in event_ids]
+        if len(snapshot_ids) == 0:
+            continue
+        for event_id in snapshot_ids:
+            # Scenarios aren't shared between snapshots.
+            snapshots[event_id] = builder.scenario()
+            event_ids.remove(event_id)
+            scenario, _ = snapshots[event_id]
+            if scenario is not None and builder.has_turn_state():
+                CacheScenario(event_id, scenario)
+    return snapshots
+
+
+@dataclass
+class InstructionSnapshot:
+    """Scenarios at the start and end of the follower's moves for an instruction.
+
+    start_event and end_event are the events eval starts and ends at: the
+    event just before the follower's first move for the instruction, and the
+    event just after its last move (or the instruction's INSTRUCTION_DONE
+    event, if the follower didn't move). Either is None if the instruction
+    wasn't followed (e.g. it was cancelled, or the game ended).
+
+    start and end are (Scenario, error) for those events, or None.
+    """
+
+    instruction: Event
+    start_event: Optional[Event] = None
+    end_event: Optional[Event] = None
+    start: Optional[Tuple[Optional[Scenario], Optional[str]]] = None
+    end: Optional[Tuple[Optional[Scenario], Optional[str]]] = None
+
+
+def InstructionSnapshots(events: List[Event], instruction_ids=None) -> Dict:
+    """Finds every instruction's InstructionSnapshot, in a single pass over a game.
+
+    Args:
+        events: All of a game's events, in server_time order (see GameEvents()).
+        instruction_ids: If provided, only snapshots for these INSTRUCTION_SENT
+            event IDs are returned.
+
+    Returns:
+        A dict from INSTRUCTION_SENT event ID to InstructionSnapshot.
+    """
+    # Index of the first event at each event's server_time, and of the first
+    # event after it.
+    first_at_time = [0] * len(events)
+    first_after_time = [len(events)] * len(events)
+    for i in range(1, len(events)):
+        same_time = events[i].server_time == events[i - 1].server_time
+        first_at_time[i] = first_at_time[i - 1] if same_time else i
+    for i in range(len(events) - 2, -1, -1):
+        same_time = events[i].server_time == events[i + 1].server_time
+        first_after_time[i] = first_after_time[i + 1] if same_time else i + 1
+
+    snapshots = {}
+    first_moves = {}
+    last_moves = {}
+    done_events = {}
+    for i, event in enumerate(events):
+        if event.type == EventType.INSTRUCTION_SENT:
+            if instruction_ids is None or event.id in instruction_ids:
+                snapshots[event.id] = InstructionSnapshot(event)
+        elif event.type == EventType.ACTION and event.parent_event_id is not None:
+            first_moves.setdefault(event.parent_event_id, i)
+            last_moves[event.parent_event_id] = i
+        elif event.type == EventType.INSTRUCTION_DONE:
+            done_events.setdefault(event.parent_event_id, event)
+
+    for instruction_id, snapshot in snapshots.items():
+        if instruction_id not in first_moves:
+            # No follower move found. Eval ends at the INSTRUCTION_DONE event,
+            # but has no start.
+            snapshot.end_event = done_events.get(instruction_id)
+            continue
+        # The last event before the first move.
+        start = first_at_time[first_moves[instruction_id]] - 1
+        if start >= 0:
+            snapshot.start_event = events[start]
+        # The first event after the last move.
+        end = first_after_time[last_moves[instruction_id]]
+        if end < len(events):
+            snapshot.end_event = events[end]
+
+    boundaries = [
+        event.id
+        for snapshot in snapshots.values()
+        for event in (snapshot.start_event, snapshot.end_event)
+        if event is not None
+    ]
+    scenarios = ScenarioSnapshots(events, boundaries)
+    for snapshot in snapshots.values():
+        if snapshot.start_event is not None:
+            snapshot.start = scenarios[snapshot.start_event.id]
+        if snapshot.end_event is not None:
+            snapshot.end = scenarios[snapshot.end_event.id]
+    return snapshots
+
+
+def ReconstructScenarioFromEvent(event_uuid: str) -> Scenario:
+    """Looks up a given event in the database.
+
+    To reconstruct scenarios at many events in a game, use ScenarioSnapshots()
+    or InstructionSnapshots() instead. They read the game once.
+
+    Scenarios are cached on disk, if the scenario cache is enabled (see
+    scenario_cache.py).
+
+    Returns:
+        A tuple of (Scenario, None) if the scenario was found, or (None, error_message) if not.
+
+    """
+    scenario = CachedScenario(event_uuid)
+    if scenario is not None:
+        return (scenario, None)
+
+    # Get the event matching this UUID.
+    event = Event.get_or_none(Event.id == event_uuid)
+    if event is None:
+        return (None, f"1 Event {event_uuid} not found. (0 found)")
+
+    # Integrate all events from the same game that happened before this event.
+    builder = ScenarioBuilder()
+    for game_event in GameEvents(event.game_id, until=event.server_time):
+        builder.apply(game_event)
+    scenario, err = builder.scenario()
+    if scenario is not None and builder.has_turn_state():
+        CacheScenario(event.id, scenario)
+    return scenario, err
 
 
 def GameStateFromScenario(scenario: Scenario) -> GameState:
@@ -7,6 +7,11 @@ logger = logging.getLogger(__name__)
 
 database = SqliteExtDatabase(None)
 
+# Pragmas which only affect the connection itself, and so are safe to set on a
+# read-only connection. Others (e.g. journal_mode=wal) write to the database
+# file, which fails on read-only connections to databases not already set up.
+READ_ONLY_PRAGMAS = frozenset(["cache_size", "foreign_keys", "mmap_size", "temp_store"])
+
 
 class BaseModel(Model):
     class Meta:
@@ -39,6 +44,25 @@ def SetDataConfig(data_config):
     )
 
 
+def SetDatabaseReadOnly(config):
+    """Like SetDatabase(), but the connection can't write to the database.
+
+    Used by processes which only read recorded games (e.g. eval workers).
+    Only pragmas in READ_ONLY_PRAGMAS are applied.
+    """
+    data_config = config.data_config()
+    pragmas = [
+        (name, value)
+        for name, value in data_config.sqlite_pragmas
+        if name in READ_ONLY_PRAGMAS
+    ]
+    database.init(
+        f"file:{data_config.sqlite_db_path}?mode=ro",
+        uri=True,
+        pragmas=pragmas,
+    )
+
+
 def SetDatabaseForTesting():
     database.init(":memory:")
 
@@ -227,3 +227,8 @@ class Event(BaseModel):
     # location *before* the action occurred.  For live feedback, this is the
     # follower orientation during the live feedback.
     orientation = IntegerField(null=True)
+
+    class Meta:
+        # Events are looked up by type & short code (e.g. the INSTRUCTION_SENT
+        # event for an instruction UUID) by analysis and scenario tools.
+        indexes = ((("type", "short_code"), False),)
@@ -0,0 +1,80 @@
+"""Measures the card set-completion path of MapProvider.
+
+Each iteration does what a game does when a set is completed: checks the
+selection, spawns a new unique set, deselects the completed cards and removes
+them. Also measures selected_cards_collide(), which game state checks several
+times a tick.
+
+Usage:
+    python3 -m cb2game.server.scripts.card_spawn_benchmark --sets=2000
+"""
+import logging
+import random
+import time
+
+import fire
+import numpy as np
+
+from cb2game.server.config.map_config import MapConfig
+from cb2game.server.map_provider import MapProvider, MapType, RandomMap
+
+
+def SelectUniqueSet(map_provider):
+    """Finds a valid set among the map's cards and selects it. Returns the card IDs."""
+    cards = map_provider.cards()
+    for i, a in enumerate(cards):
+        for j, b in enumerate(cards[i + 1 :], i + 1):
+            for c in cards[j + 1 :]:
+                group = (a, b, c)
+                if (
+                    len(set(card.shape for card in group)) == 3
+                    and len(set(card.color for card in group)) == 3
+                    and len(set(card.count for card in group)) == 3
+                ):
+                    for card in group:
+                        map_provider.set_selected(card.id, True)
+                    return [card.id for card in group]
+    return []
+
+
+def CompleteSet(map_provider, card_ids):
+    if not map_provider.selected_valid_set():
+        return False
+    map_provider.add_random_unique_set()
+    for card_id in card_ids:
+        map_provider.set_selected(card_id, False)
+        map_provider.remove_card(card_id)
+    return True
+
+
+def main(sets=2000, collide_checks=100000, seed=0):
+    logging.basicConfig(level=logging.WARNING)
+    random.seed(seed)
+    np.random.seed(seed)
+    map_provider = MapProvider(MapType.RANDOM, RandomMap(MapConfig(rng_seed=seed)))
+
+    completion_time = 0.0
+    completed = 0
+    for _ in range(sets):
+        card_ids = SelectUniqueSet(map_provider)
+        start = time.perf_counter()
+        if CompleteSet(map_provider, card_ids):
+            completed += 1
+        completion_time += time.perf_counter() - start
+    print(
+        f"Set completion: {completed} sets, "
+        f"{1e6 * completion_time / max(completed, 1):.1f}us per set."
+    )
+
+    # Leave two cards of a valid set selected, as mid-set during a game.
+    card_ids = SelectUniqueSet(map_provider)
+    map_provider.set_selected(card_ids[-1], False)
+    start = time.perf_counter()
+    for _ in range(collide_checks):
+        map_provider.selected_cards_collide()
+    duration = time.perf_counter() - start
+    print(f"selected_cards_collide: {1e9 * duration / collide_checks:.0f}ns per check.")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
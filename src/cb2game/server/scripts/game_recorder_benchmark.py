@@ -0,0 +1,91 @@
+"""Measures how much database recording adds to state machine tick latency.
+
+Simulates a number of concurrent games recording moves into a fresh on-disk
+sqlite database. Each simulated tick, every game records a few moves, and every
+so often a turn state. Reports the latency of each tick (the time the event
+loop would be blocked by recording). Compares synchronous saves against the
+background DatabaseWriter.
+
+Usage:
+    python3 -m cb2game.server.scripts.game_recorder_benchmark --games=20
+"""
+import logging
+import pathlib
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import fire
+
+import cb2game.server.db_writer as db_writer
+import cb2game.server.schemas.game as game_db
+from cb2game.server.game_recorder import GameRecorder
+from cb2game.server.hex import HecsCoord
+from cb2game.server.messages.action import Walk
+from cb2game.server.messages.rooms import Role
+from cb2game.server.messages.turn_state import TurnUpdate
+from cb2game.server.schemas.base import (
+    CloseDatabase,
+    ConnectDatabase,
+    CreateTablesIfNotExists,
+    SetDatabaseByPath,
+)
+from cb2game.server.schemas.defaults import ListDefaultTables
+from cb2game.server.schemas.event import Event
+
+
+def Measure(name, threaded, games, ticks, moves_per_tick):
+    directory = tempfile.mkdtemp()
+    SetDatabaseByPath(pathlib.Path(directory, "benchmark.db"))
+    ConnectDatabase()
+    CreateTablesIfNotExists(ListDefaultTables())
+    writer = db_writer.DatabaseWriter(threaded=threaded)
+    db_writer.database_writer = writer
+    recorders = [GameRecorder(game_db.Game()) for _ in range(games)]
+    action = Walk(1, HecsCoord(0, 1, 0))
+    turn_state = TurnUpdate(
+        Role.LEADER,
+        10,
+        6,
+        datetime.utcnow() + timedelta(seconds=60),
+        datetime.utcnow(),
+        0,
+        0,
+        0,
+    )
+    latencies = []
+    start = time.time()
+    for tick in range(ticks):
+        tick_start = time.perf_counter()
+        for recorder in recorders:
+            recorder.record_tick(tick)
+            for _ in range(moves_per_tick):
+                recorder.record_action(action, "MF", HecsCoord(0, 0, 0), 0)
+            if tick % 20 == 0:
+                recorder.record_turn_state(turn_state, "benchmark")
+        latencies.append(time.perf_counter() - tick_start)
+    for recorder in recorders:
+        recorder.record_game_over()
+    duration = time.time() - start
+    writer.close()
+    rows = Event.select().count()
+    CloseDatabase()
+
+    latencies_ms = sorted(1000 * x for x in latencies)
+    p99 = latencies_ms[int(0.99 * (len(latencies_ms) - 1))]
+    print(
+        f"{name:>12}: {rows} events in {duration:.2f}s. "
+        f"Tick latency mean/p50/p99/max: {statistics.mean(latencies_ms):.3f}/"
+        f"{latencies_ms[len(latencies_ms) // 2]:.3f}/{p99:.3f}/{latencies_ms[-1]:.3f}ms"
+    )
+
+
+def main(games=20, ticks=500, moves_per_tick=2):
+    logging.basicConfig(level=logging.WARNING)
+    Measure("synchronous", False, games, ticks, moves_per_tick)
+    Measure("background", True, games, ticks, moves_per_tick)
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,75 @@
+"""Generates a seed-indexed map corpus (see map_corpus.py) in a process pool.
+
+Maps are generated with the map config from the given server config, for seeds
+first_seed to first_seed + count - 1. The server's map pool, self-play and eval
+can then load maps by seed from the corpus (set map_corpus_path in the server
+config, or use map_corpus.MapCorpus directly).
+
+Usage:
+    python3 -m cb2game.server.scripts.generate_map_corpus \\
+        --output=maps.cb2maps --first_seed=0 --count=100000
+"""
+import concurrent.futures
+import dataclasses
+import functools
+import logging
+import multiprocessing
+import os
+import time
+
+import fire
+import orjson
+
+from cb2game.server.config.config import Config, ReadConfigOrDie
+from cb2game.server.map_corpus import MapCorpus, MapCorpusWriter
+from cb2game.server.map_provider import GenerateEncodedMap, RandomMap
+
+logger = logging.getLogger(__name__)
+
+
+def main(
+    output,
+    first_seed=0,
+    count=1000,
+    config_path="",
+    workers=None,
+    chunksize=16,
+    verify=False,
+):
+    logging.basicConfig(level=logging.INFO)
+    config = ReadConfigOrDie(config_path) if config_path else Config()
+    map_config = config.map_config
+    workers = workers or os.cpu_count()
+    writer = MapCorpusWriter(output, map_config, first_seed, count)
+    start = time.time()
+    with concurrent.futures.ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        generate = functools.partial(GenerateEncodedMap, map_config)
+        seeds = range(first_seed, first_seed + count)
+        # Results arrive in seed order.
+        for i, encoded in enumerate(executor.map(generate, seeds, chunksize=chunksize)):
+            writer.append(encoded)
+            if (i + 1) % 1000 == 0:
+                logger.info(
+                    f"Generated {i + 1}/{count} maps. {(i + 1) / (time.time() - start):.1f} maps/s"
+                )
+    writer.close()
+    duration = time.time() - start
+    size_mb = writer.path.stat().st_size / 1e6
+    logger.info(
+        f"Wrote {count} maps to {writer.path} ({size_mb:.1f}MB) in {duration:.1f}s. "
+        f"{count / duration:.1f} maps/s with {workers} workers."
+    )
+    if verify:
+        # Regenerates every map in this process, so it's slow.
+        corpus = MapCorpus(output)
+        for seed in corpus.seeds():
+            expected = RandomMap(dataclasses.replace(map_config, rng_seed=seed))
+            if orjson.dumps(corpus.map_update(seed)) != orjson.dumps(expected):
+                raise ValueError(f"Map for seed {seed} doesn't match the corpus.")
+        logger.info(f"Verified {len(corpus)} maps.")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,153 @@
+"""Micro-benchmarks of HecsCoord arithmetic against packed coordinates.
+
+Each line compares an operation on HecsCoords with the same operation on
+packed ints (see PackOffset() in hex.py), including a movement validity check
+like State._valid_action() and a breadth-first search over a map.
+
+Usage:
+    python3 -m cb2game.server.scripts.hex_benchmark --iterations=200000
+"""
+import logging
+import math
+import random
+import time
+from collections import deque
+
+import fire
+
+from cb2game.server.hex import (
+    PACKED_UNIT_DISPLACEMENTS,
+    HecsCoord,
+    PackedAdd,
+    PackedNeighborAtHeading,
+    PackedNeighbors,
+)
+
+
+def Measure(function, inputs):
+    """Returns the mean time per call, in microseconds."""
+    start = time.perf_counter()
+    for item in inputs:
+        function(*item)
+    duration = time.perf_counter() - start
+    return 1e6 * duration / len(inputs)
+
+
+def Compare(name, coord_function, coord_inputs, packed_function, packed_inputs):
+    coord_us = Measure(coord_function, coord_inputs)
+    packed_us = Measure(packed_function, packed_inputs)
+    print(
+        f"{name}: HecsCoord {coord_us:.2f}us, packed {packed_us:.2f}us "
+        f"({coord_us / packed_us:.1f}x)."
+    )
+
+
+def CoordMoveIsValid(location, heading, displacement):
+    """The movement check in State._valid_action(), on HecsCoords (minus walls)."""
+    cartesian = displacement.cartesian()
+    if math.sqrt(cartesian[0] ** 2 + cartesian[1] ** 2) > 1.001:
+        return False
+    destination = HecsCoord.add(location, displacement)
+    forward = location.neighbor_at_heading(heading)
+    backward = location.neighbor_at_heading(heading + 180)
+    return destination in [forward, backward]
+
+
+def PackedMoveIsValid(location, heading, displacement):
+    if displacement not in PACKED_UNIT_DISPLACEMENTS:
+        return False
+    destination = PackedAdd(location, displacement)
+    return destination == PackedNeighborAtHeading(
+        location, heading
+    ) or destination == PackedNeighborAtHeading(location, heading + 180)
+
+
+def CoordSearch(start, in_map):
+    visited = {start}
+    queue = deque([start])
+    while queue:
+        for neighbor in queue.popleft().neighbors():
+            if neighbor not in visited and in_map(neighbor):
+                visited.add(neighbor)
+                queue.append(neighbor)
+    return len(visited)
+
+
+def PackedSearch(start, cells):
+    visited = {start}
+    queue = deque([start])
+    while queue:
+        for neighbor in PackedNeighbors(queue.popleft()):
+            if neighbor not in visited and neighbor in cells:
+                visited.add(neighbor)
+                queue.append(neighbor)
+    return len(visited)
+
+
+def main(iterations=200000, rows=25, cols=25, searches=50, seed=0):
+    logging.basicConfig(level=logging.WARNING)
+    rng = random.Random(seed)
+    coords = [
+        HecsCoord.from_offset(rng.randrange(rows), rng.randrange(cols))
+        for _ in range(iterations)
+    ]
+    others = [
+        HecsCoord.from_offset(rng.randrange(rows), rng.randrange(cols))
+        for _ in range(iterations)
+    ]
+    headings = [rng.randrange(6) * 60 for _ in range(iterations)]
+    displacements = [rng.choice(HecsCoord.origin().neighbors()) for _ in coords]
+    packed = [coord.packed() for coord in coords]
+    packed_others = [coord.packed() for coord in others]
+    packed_displacements = [coord.packed() for coord in displacements]
+
+    Compare(
+        "add",
+        HecsCoord.add,
+        list(zip(coords, others)),
+        PackedAdd,
+        list(zip(packed, packed_others)),
+    )
+    Compare(
+        "neighbors",
+        HecsCoord.neighbors,
+        [(coord,) for coord in coords],
+        PackedNeighbors,
+        [(p,) for p in packed],
+    )
+    Compare(
+        "neighbor_at_heading",
+        HecsCoord.neighbor_at_heading,
+        list(zip(coords, headings)),
+        PackedNeighborAtHeading,
+        list(zip(packed, headings)),
+    )
+    Compare(
+        "hash",
+        hash,
+        [(coord,) for coord in coords],
+        hash,
+        [(p,) for p in packed],
+    )
+    Compare(
+        "move validation",
+        CoordMoveIsValid,
+        list(zip(coords, headings, displacements)),
+        PackedMoveIsValid,
+        list(zip(packed, headings, packed_displacements)),
+    )
+    cells = set(
+        HecsCoord.from_offset(row, col) for row in range(rows) for col in range(cols)
+    )
+    packed_cells = set(coord.packed() for coord in cells)
+    Compare(
+        f"{rows}x{cols} search",
+        CoordSearch,
+        [(coords[i], cells.__contains__) for i in range(searches)],
+        PackedSearch,
+        [(packed[i], packed_cells) for i in range(searches)],
+    )
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
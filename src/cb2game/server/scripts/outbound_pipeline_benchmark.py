@@ -0,0 +1,104 @@
+"""Measures the cost of idle client connections on the server's event loop.
+
+Simulates a number of connected, idle websockets (in the lobby, not in a game)
+and reports per-connection CPU usage and event-loop lag. Compares the
+push-based sender in main.stream_game_state() against the previous sender,
+which polled the lobby, google authenticator and user info fetcher in a loop
+with asyncio.sleep(0).
+
+Usage:
+    python3 -m cb2game.server.scripts.outbound_pipeline_benchmark --sockets=250
+"""
+import asyncio
+import logging
+import statistics
+import time
+
+import fire
+
+import cb2game.server.main as server_main
+from cb2game.server.config.config import Config, SetGlobalConfig
+from cb2game.server.lobbies.open_lobby import OpenLobby
+from cb2game.server.lobby_consts import LobbyInfo, LobbyType
+from cb2game.server.outbox import CreateOutbox, DeleteOutbox, GetOutbox
+from cb2game.server.remote_table import DeleteRemote, Remote, SetRemote
+
+
+class FakeWebSocket(object):
+    """Stands in for aiohttp.web.WebSocketResponse. Discards sent data."""
+
+    def __init__(self):
+        self.closed = False
+        self.frames_sent = 0
+
+    async def send_str(self, data):
+        self.frames_sent += 1
+
+    async def close(self):
+        self.closed = True
+
+
+async def PollingSender(ws, lobby):
+    """The original sender loop, minus the in-room logic (sockets are idle)."""
+    while not ws.closed:
+        await asyncio.sleep(0)
+        GetOutbox(ws).drain()  # Stands in for lobby.drain_message().
+        lobby.socket_in_room(ws)
+
+
+async def PushSender(ws, lobby):
+    await server_main.stream_game_state(None, ws, lobby)
+
+
+async def MeasureLag(duration_s, period_s=0.01):
+    """Returns a list of event loop lag samples, in seconds."""
+    samples = []
+    end = time.time() + duration_s
+    while time.time() < end:
+        start = time.time()
+        await asyncio.sleep(period_s)
+        samples.append(max(time.time() - start - period_s, 0))
+    return samples
+
+
+async def Run(sender, number_sockets, duration_s):
+    lobby = OpenLobby(LobbyInfo("Benchmark Lobby", LobbyType.OPEN, "Benchmark"))
+    sockets = [FakeWebSocket() for _ in range(number_sockets)]
+    for ws in sockets:
+        SetRemote(ws, Remote("benchmark", 0, 0, 0, time.time(), time.time(), None, ws))
+        CreateOutbox(ws)
+    tasks = [asyncio.create_task(sender(ws, lobby)) for ws in sockets]
+    await asyncio.sleep(0.5)
+    cpu_start = time.process_time()
+    wall_start = time.time()
+    lag_samples = await MeasureLag(duration_s)
+    cpu_time = time.process_time() - cpu_start
+    wall_time = time.time() - wall_start
+    for ws in sockets:
+        ws.closed = True
+        DeleteOutbox(ws)
+        DeleteRemote(ws)
+    await asyncio.gather(*tasks)
+    return cpu_time, wall_time, lag_samples
+
+
+def Measure(name, sender, number_sockets, duration_s):
+    cpu_time, wall_time, lag = asyncio.run(Run(sender, number_sockets, duration_s))
+    lag_ms = sorted(1000 * x for x in lag)
+    p99 = lag_ms[int(0.99 * (len(lag_ms) - 1))]
+    print(
+        f"{name:>8}: {number_sockets} sockets. "
+        f"CPU per connection: {100 * cpu_time / wall_time / number_sockets:.4f}% of a core. "
+        f"Event loop lag mean/p99/max: {statistics.mean(lag_ms):.2f}/{p99:.2f}/{lag_ms[-1]:.2f}ms"
+    )
+
+
+def main(sockets=250, duration_s=5.0):
+    logging.basicConfig(level=logging.WARNING)
+    SetGlobalConfig(Config(comment="Outbound pipeline benchmark"))
+    Measure("polling", PollingSender, sockets, duration_s)
+    Measure("push", PushSender, sockets, duration_s)
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -0,0 +1,84 @@
+"""Measures the CPU cost of idle game rooms.
+
+Runs a number of idle two-player games (nobody sends any messages) under a
+single event loop and reports process CPU time per room. Compares the
+event-driven StateMachineDriver against the previous busy-polling loop, which
+stepped every room and then yielded with asyncio.sleep(0).
+
+Usage:
+    python3 -m cb2game.server.scripts.state_machine_driver_benchmark --rooms=50
+"""
+import asyncio
+import logging
+import time
+
+import fire
+
+from cb2game.server.config.config import Config, SetGlobalConfig
+from cb2game.server.lobbies.open_lobby import OpenLobby
+from cb2game.server.lobby_consts import LobbyInfo, LobbyType
+from cb2game.server.messages.rooms import Role
+from cb2game.server.state import State
+from cb2game.server.state_machine_driver import StateMachineDriver
+
+
+class PollingStateMachineDriver(StateMachineDriver):
+    """The original driver loop: step, then yield to the event loop."""
+
+    async def run(self):
+        self._state_machine.start()
+        while not self._state_machine.done():
+            self.step()
+            await asyncio.sleep(0)
+        self._state_machine.on_game_over()
+
+
+def CreateIdleGames(number_rooms, driver_class):
+    lobby = OpenLobby(
+        LobbyInfo("Benchmark Lobby", LobbyType.OPEN, "Benchmark", 40, 1, False)
+    )
+    drivers = []
+    for i in range(number_rooms):
+        state_machine = State(f"bench-{i}", None, log_to_db=False, lobby=lobby)
+        state_machine.create_actor(Role.LEADER)
+        state_machine.create_actor(Role.FOLLOWER)
+        drivers.append(driver_class(state_machine, f"bench-{i}"))
+    return drivers
+
+
+async def RunDrivers(drivers, duration_s):
+    tasks = [asyncio.create_task(driver.run()) for driver in drivers]
+    # Let the rooms initialize and flush their join messages before measuring.
+    await asyncio.sleep(0.5)
+    cpu_start = time.process_time()
+    wall_start = time.time()
+    await asyncio.sleep(duration_s)
+    cpu_time = time.process_time() - cpu_start
+    wall_time = time.time() - wall_start
+    for driver in drivers:
+        driver.end_game()
+    await asyncio.gather(*tasks)
+    return cpu_time, wall_time
+
+
+def Measure(name, number_rooms, duration_s, driver_class):
+    drivers = CreateIdleGames(number_rooms, driver_class)
+    cpu_time, wall_time = asyncio.run(RunDrivers(drivers, duration_s))
+    print(
+        f"{name:>8}: {number_rooms} rooms, {cpu_time:.3f}s CPU over {wall_time:.2f}s. "
+        f"CPU per room: {100 * cpu_time / wall_time / number_rooms:.4f}% of a core."
+    )
+    return cpu_time
+
+
+def main(rooms=50, duration_s=5.0):
+    logging.basicConfig(level=logging.WARNING)
+    SetGlobalConfig(Config(comment="StateMachineDriver benchmark"))
+    polling_cpu = Measure("polling", rooms, duration_s, PollingStateMachineDriver)
+    event_cpu = Measure("event", rooms, duration_s, StateMachineDriver)
+    if event_cpu > 0:
+        print(f"Idle CPU reduction: {polling_cpu / event_cpu:.1f}x")
+
+
+if __name__ == "__main__":
+    fire.Fire(main)
@@ -1,6 +1,5 @@
 import dataclasses
 import logging
-import math
 import queue
 import uuid
 from collections import deque
@@ -20,7 +19,13 @@ from cb2game.server.actor import Actor
 from cb2game.server.assets import AssetId
 from cb2game.server.card import Card, CardSelectAction, SetCompletionActions
 from cb2game.server.game_recorder import GameRecorder
-from cb2game.server.hex import HecsCoord
+from cb2game.server.hex import (
+    PACKED_UNIT_DISPLACEMENTS,
+    HecsCoord,
+    PackedAdd,
+    PackedNeighborAtHeading,
+    UnpackOffset,
+)
 from cb2game.server.map_provider import CachedMapRetrieval, MapProvider, MapType
 from cb2game.server.messages import (
     live_feedback,
@@ -73,6 +78,7 @@ class State(object):
         realtime_actions: bool = False,
         lobby: "server.Lobby" = None,
         log_to_db: bool = False,
+        scenario: Scenario = None,
     ):
         """Initialize the game from a given event.
 
@@ -80,12 +86,17 @@ class State(object):
         from a given event UUID in the database. This is used locally for
         training. See pyclient/local_game_coordinator.py for usage.
 
+        If scenario is provided, it's used instead of reconstructing the
+        scenario at event_uuid (e.g. a snapshot from
+        scenario_util.InstructionSnapshots()).
+
         Returns: (state_machine: State, failure_reason: str = "")
 
         If return value state_machine is none, the reason for failure is in failure_reason.
         """
-        scenario, err = scenario_util.ReconstructScenarioFromEvent(event_uuid)
-        assert scenario is not None, f"Failed to reconstruct scenario: {err}"
+        if scenario is None:
+            scenario, err = scenario_util.ReconstructScenarioFromEvent(event_uuid)
+            assert scenario is not None, f"Failed to reconstruct scenario: {err}"
         s = State(
             room_id,
             None,
@@ -164,6 +175,13 @@ class State(object):
 
         self._map_stale = {}  # Maps from player_id -> bool if their map is stale.
         self._map_update_count = 0
+        # self._map_update, stamped with self._map_version. Re-stamped whenever
+        # self._map_update is replaced (e.g. by a scenario).
+        self._map_version = 0
+        self._versioned_map = None
+        self._versioned_map_source = None
+        self._map_baseline = {}  # player_id -> last MapUpdate sent to player.
+        self._map_deltas = set()  # player_ids which accept map deltas.
 
         self._prop_stale = (
             {}
@@ -296,6 +314,10 @@ class State(object):
     def done(self):
         return self._done
 
+    def game_record(self):
+        """The game's database record, or None if the game isn't recorded."""
+        return self._game_recorder.record()
+
     def player_ids(self):
         return self._actors.keys()
 
@@ -682,6 +704,32 @@ class State(object):
             for id in self._actors:
                 self._ticks[id] = tick_message
 
+    def time_until_next_update(self):
+        """Returns a timedelta until update() next has work to do on its own.
+
+        Used by StateMachineDriver to sleep between steps. This accounts for
+        the turn timer, the follower end-of-turn delay and realtime action
+        animations. Returns None if the state machine is idle until it receives
+        new input (messages, players joining, etc).
+        """
+        if not self._initialized or self._turn_state is None:
+            return None
+        deadlines = []
+        if self._turn_state.turn != Role.PAUSED:
+            deadlines.append(self._turn_state.turn_end - datetime.utcnow())
+        if self._realtime_actions and self._follower_turn_end_timer.running():
+            deadlines.append(self._follower_turn_end_timer.time_remaining())
+        for actor in self._actors.values():
+            if not actor.has_actions():
+                continue
+            if self._realtime_actions:
+                deadlines.append(actor.time_until_action_done())
+            else:
+                deadlines.append(timedelta(seconds=0))
+        if len(deadlines) == 0:
+            return None
+        return min(deadlines)
+
     def tick_count(self):
         """State machine event tick count.
 
@@ -901,6 +949,10 @@ class State(object):
         elif message.type == message_to_server.MessageType.STATE_SYNC_REQUEST:
             logger.debug(f"Sync request recvd. Room: {self._room_id}, Player: {id}")
             self.desync(id)
+            # Clients also request a sync when they can't apply a map delta, so
+            # resend the full map.
+            self._map_stale[id] = True
+            self._map_baseline.pop(id, None)
         elif message.type == message_to_server.MessageType.LIVE_FEEDBACK:
             logger.debug(f"Live feedback recvd. Room: {self._room_id}, Player: {id}")
             self._drain_live_feedback(id, message.live_feedback)
@@ -1151,6 +1203,8 @@ class State(object):
             del self._instructions_stale[actor_id]
         if actor_id in self._turn_history:
             del self._turn_history[actor_id]
+        self._map_baseline.pop(actor_id, None)
+        self._map_deltas.discard(actor_id)
         # We don't free actor IDs. We'll never run out, and
         # keeping them from being re-used makes saving a history of which ID was
         # which role easier. Hence following line is commented:
@@ -1162,6 +1216,14 @@ class State(object):
     def get_actor(self, player_id):
         return self._actors[player_id]
 
+    def enable_map_deltas(self, actor_id):
+        """Send this player tile-level deltas instead of full map updates.
+
+        Only for clients which cache the last map by version (see
+        map_utils.ApplyMapUpdateDiff).
+        """
+        self._map_deltas.add(actor_id)
+
     def desync(self, actor_id):
         self._synced[actor_id] = False
 
@@ -1359,7 +1421,7 @@ class State(object):
 
         self._map_update_count += 1
 
-        map_update = self._map_update
+        map_update = self._versioned_map_update()
 
         if self._actors[actor_id].role() == Role.FOLLOWER:
             map_update = map_utils.CensorMapForFollower(
@@ -1368,8 +1430,22 @@ class State(object):
 
         # Send the latest map and mark as fresh for this player.
         self._map_stale[actor_id] = False
+        baseline = self._map_baseline.get(actor_id, None)
+        self._map_baseline[actor_id] = map_update
+        if actor_id in self._map_deltas and baseline is not None:
+            return map_utils.DiffMapUpdate(baseline, map_update)
         return map_update
 
+    def _versioned_map_update(self):
+        """Returns self._map_update, stamped with its version number."""
+        if self._versioned_map_source is not self._map_update:
+            self._map_version += 1
+            self._versioned_map_source = self._map_update
+            self._versioned_map = dataclasses.replace(
+                self._map_update, version=self._map_version, base_version=None
+            )
+        return self._versioned_map
+
     def _next_prop_update(self, actor_id):
         if not actor_id in self._prop_stale:
             self._prop_stale[actor_id] = True
@@ -1439,32 +1515,31 @@ class State(object):
 
     def _valid_action(self, actor_id, action):
         if action.action_type == ActionType.TRANSLATE:
-            cartesian = action.displacement.cartesian()
-            # Add a small delta for floating point comparison.
-            if math.sqrt(cartesian[0] ** 2 + cartesian[1] ** 2) > 1.001:
+            # Works on packed coordinates, to avoid allocating HecsCoords.
+            try:
+                displacement = action.displacement.packed()
+            except ValueError:
+                logger.debug(f"Invalid action: translation out of range {action}")
+                return False
+            # Equivalent to checking the displacement's length is <= 1.
+            if displacement not in PACKED_UNIT_DISPLACEMENTS:
                 logger.debug(f"Invalid action: translation too large {action}")
                 return False
-            destination = HecsCoord.add(
-                self._actors[actor_id].location(), action.displacement
-            )
-            if self._map_provider.edge_between(
-                self._actors[actor_id].location(), destination
-            ):
+            actor = self._actors[actor_id]
+            location = actor.location().packed()
+            destination = PackedAdd(location, displacement)
+            if self._map_provider.grid().packed_edge_between(location, destination):
                 logger.debug(f"Invalid action: attempts to move through wall {action}")
                 return False
-            forward_location = (
-                self._actors[actor_id]
-                .location()
-                .neighbor_at_heading(self._actors[actor_id].heading_degrees())
+            forward_location = PackedNeighborAtHeading(
+                location, actor.heading_degrees()
             )
-            backward_location = (
-                self._actors[actor_id]
-                .location()
-                .neighbor_at_heading(self._actors[actor_id].heading_degrees() + 180)
+            backward_location = PackedNeighborAtHeading(
+                location, actor.heading_degrees() + 180
             )
-            if destination not in [forward_location, backward_location]:
+            if destination != forward_location and destination != backward_location:
                 logger.debug(
-                    f"Invalid action: attempts to move to {destination.to_offset_coordinates()} which is invalid. Facing: {self._actors[actor_id].heading_degrees()} backward location: {backward_location.to_offset_coordinates()}. exp: {action.expiration}"
+                    f"Invalid action: attempts to move to {UnpackOffset(destination)} which is invalid. Facing: {actor.heading_degrees()} backward location: {UnpackOffset(backward_location)}. exp: {action.expiration}"
                 )
                 return False
         if action.action_type == ActionType.ROTATE:
@@ -1532,11 +1607,15 @@ class State(object):
         self._live_feedback_queue = deque()
         self._preloaded_actors = {}
         # Load in map & props.
-        next_map = self._map_provider.map()
+        # Scenarios loaded into a new State (see InitializeFromExistingState())
+        # don't have a map provider yet, so only fall back to it if needed.
         if scenario.map is not None:
             next_map = scenario.map
-        next_cards = self._map_provider.cards()
-        if scenario.prop_update is not None:
+        else:
+            next_map = self._map_provider.map()
+        if scenario.prop_update is None:
+            next_cards = self._map_provider.cards()
+        else:
             props = scenario.prop_update.props
             cards = [Card.FromProp(prop) for prop in props]
             # Make sure there are no duplicate card IDs.
@@ -1568,7 +1647,10 @@ class State(object):
             self._mark_prop_stale()
         # Load in instructions.
         if scenario.objectives is not None:
-            self._instructions = deque(scenario.objectives)
+            # Copied, as instructions are marked done or cancelled in-place.
+            self._instructions = deque(
+                dataclasses.replace(objective) for objective in scenario.objectives
+            )
             self._mark_instructions_stale()
         # Load in actor states.
         if scenario.actor_state is not None:
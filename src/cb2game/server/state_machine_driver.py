@@ -8,6 +8,20 @@ from cb2game.server.util import exc_info_plus
 
 logger = logging.getLogger(__name__)
 
+# Upper bound on how long an idle room sleeps between steps. The driver is
+# woken explicitly whenever input arrives, so this is only a safety net for
+# state changes that happen without a wake() call.
+MAX_IDLE_PERIOD_S = 1.0
+
+# Poll period for state machines which don't implement
+# time_until_next_update() (and therefore can't tell us when they next need
+# to run).
+FALLBACK_POLL_PERIOD_S = 0.01
+
+# Steps which start later than this past their due time are logged and
+# counted towards the lobby's latency monitor.
+SLOW_STEP_THRESHOLD_S = 0.2
+
 
 class StateMachineDriver(object):
     """
@@ -32,12 +46,41 @@ class StateMachineDriver(object):
         self._exception = None
         self._traceback = None
 
+        # Called with a player ID whenever new messages are queued for them.
+        self._message_listener = None
+
+        # Set whenever the state machine needs to be stepped. Created in run(),
+        # as asyncio primitives must be created on the loop that awaits them.
+        self._wake_event = None
+        # Time at which the earliest unserviced wake() call was made.
+        self._wake_time = None
+
     def state_machine(self):
         return self._state_machine
 
+    def set_message_listener(self, listener):
+        """Registers a callback, listener(player_id), which is invoked after a
+        step whenever new messages are available for that player via
+        fill_messages(). This lets callers push messages out instead of
+        polling."""
+        self._message_listener = listener
+
     def drain_messages(self, id, messages):
         for m in messages:
             self._messages_in.put((id, m))
+        self.wake()
+
+    def wake(self):
+        """Schedules a step of the state machine as soon as possible.
+
+        Call this after any external change to the state machine (incoming
+        messages, players joining or leaving, desyncs). Between wake-ups, run()
+        sleeps until the state machine's next deadline.
+        """
+        if self._wake_time is None:
+            self._wake_time = time.time()
+        if self._wake_event is not None:
+            self._wake_event.set()
 
     def fill_messages(self, player_id, out_messages):
         """Fills out_messages with MessageFromServer objects to send to the
@@ -62,21 +105,35 @@ class StateMachineDriver(object):
 
     async def run(self):
         try:
-            last_loop = time.time()
+            self._wake_event = asyncio.Event()
             latency_monitor = self._lobby.latency_monitor() if self._lobby else None
             self._state_machine.start()  # Initialize the state machine.
+            due_time = time.time()
             while not self._state_machine.done():
+                # Measure how late this step is, relative to the earlier of the
+                # first wake() call and the deadline we were sleeping towards.
+                if self._wake_time is not None:
+                    due_time = min(due_time, self._wake_time)
+                lag = time.time() - due_time
+                if lag > SLOW_STEP_THRESHOLD_S:
+                    logger.warning(f"Game {self._room_id} slow step, {lag}s late")
+                    if latency_monitor:
+                        latency_monitor.accumulate_latency(lag)
+                self._wake_event.clear()
+                self._wake_time = None
                 # Run one iteration of the game loop.
                 self.step()
-                poll_period = time.time() - last_loop
-                if (poll_period) > 0.2:
-                    logging.warn(
-                        f"Game {self._room_id} slow poll period of {poll_period}s"
-                    )
-                    if latency_monitor:
-                        latency_monitor.accumulate_latency(poll_period)
-                last_loop = time.time()
-                await asyncio.sleep(0)
+                if self._state_machine.done():
+                    break
+                timeout = self._time_until_next_step()
+                due_time = time.time() + timeout
+                if timeout <= 0:
+                    await asyncio.sleep(0)
+                    continue
+                try:
+                    await asyncio.wait_for(self._wake_event.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
             self._state_machine.on_game_over()
         except Exception as e:
             logger.exception(f"Error in game {self._room_id}: {e}")
@@ -84,6 +141,20 @@ class StateMachineDriver(object):
             self._traceback = exc_info_plus()
             self.end_game()
 
+    def _time_until_next_step(self):
+        """Returns how long (in seconds) run() may sleep before the next step.
+
+        State machines may implement time_until_next_update(), returning a
+        timedelta until their next timer or animation deadline, or None if
+        they are idle until new input arrives.
+        """
+        if not hasattr(self._state_machine, "time_until_next_update"):
+            return FALLBACK_POLL_PERIOD_S
+        remaining = self._state_machine.time_until_next_update()
+        if remaining is None:
+            return MAX_IDLE_PERIOD_S
+        return min(max(remaining.total_seconds(), 0), MAX_IDLE_PERIOD_S)
+
     def step(self):
         self._process_incoming_messages()
         self._state_machine.update()
@@ -94,6 +165,7 @@ class StateMachineDriver(object):
 
     def end_game(self):
         self._state_machine.end_game()
+        self.wake()
 
     def exception(self):
         return self._exception
@@ -123,3 +195,5 @@ class StateMachineDriver(object):
             if self._state_machine.fill_messages(player_id, out_messages):
                 for message in out_messages:
                     self._messages_out[player_id].put(message)
+                if self._message_listener is not None:
+                    self._message_listener(player_id)
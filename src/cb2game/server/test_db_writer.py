@@ -0,0 +1,66 @@
+"""Unit tests for the background database writer."""
+import pathlib
+import shutil
+import tempfile
+import unittest
+
+import cb2game.server.schemas.game as game_db
+from cb2game.server.db_writer import DatabaseWriter
+from cb2game.server.schemas.base import (
+    CloseDatabase,
+    ConnectDatabase,
+    CreateTablesIfNotExists,
+    SetDatabaseByPath,
+    SetDatabaseForTesting,
+)
+from cb2game.server.schemas.defaults import ListDefaultTables
+from cb2game.server.schemas.event import Event, EventType
+
+
+class DatabaseWriterTest(unittest.TestCase):
+    def setUp(self):
+        # Background writes need an on-disk database. In-memory databases
+        # aren't shared between threads.
+        self.directory = tempfile.mkdtemp()
+        SetDatabaseByPath(pathlib.Path(self.directory, "test.db"))
+        ConnectDatabase()
+        CreateTablesIfNotExists(ListDefaultTables())
+        self.game = game_db.Game()
+        self.game.save()
+        self.writer = DatabaseWriter()
+
+    def tearDown(self):
+        self.writer.close()
+        CloseDatabase()
+        SetDatabaseForTesting()
+        shutil.rmtree(self.directory)
+
+    def test_flush_commits_queued_rows_in_order(self):
+        parent = Event(game=self.game, type=EventType.INSTRUCTION_SENT, tick=0)
+        child = Event(
+            game=self.game,
+            type=EventType.INSTRUCTION_DONE,
+            tick=1,
+            parent_event=parent,
+        )
+        self.writer.insert(parent)
+        self.writer.insert(child)
+        self.assertTrue(self.writer.flush(timeout=5))
+        self.assertEqual(Event.select().count(), 2)
+        self.assertEqual(Event.get(Event.id == child.id).parent_event.id, parent.id)
+
+    def test_save_updates_existing_row(self):
+        self.game.score = 7
+        self.writer.save(self.game)
+        self.writer.flush(timeout=5)
+        self.assertEqual(game_db.Game.get(game_db.Game.id == self.game.id).score, 7)
+
+    def test_close_flushes(self):
+        for tick in range(10):
+            self.writer.insert(Event(game=self.game, type=EventType.ACTION, tick=tick))
+        self.writer.close()
+        self.assertEqual(Event.select().count(), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
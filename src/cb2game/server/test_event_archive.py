@@ -0,0 +1,158 @@
+"""Unit tests for the event archive format."""
+import pathlib
+import shutil
+import tempfile
+import unittest
+import uuid
+from datetime import datetime
+
+import orjson
+
+from cb2game.server.config.map_config import MapConfig
+from cb2game.server.event_archive import DataKind, EventArchive, EventArchiveWriter
+from cb2game.server.game_recorder import JsonSerialize
+from cb2game.server.hex import HecsCoord
+from cb2game.server.map_payload import MapUpdateDbJson
+from cb2game.server.map_provider import RandomMap
+from cb2game.server.messages.action import Color, Walk
+from cb2game.server.schemas.event import Event, EventType
+from cb2game.server.schemas.util import InitialState
+
+
+class EventArchiveTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = pathlib.Path(self.directory, "events.npz")
+        walk = Walk(7, HecsCoord(0, 1, 0))
+        outline = Walk(8, HecsCoord(1, -1, 0))
+        outline = outline.__class__(
+            **dict(
+                outline.__dict__,
+                border_color=Color(1, 0, 0, 1),
+                border_color_follower_pov=Color(0, 0, 1, 0.5),
+            )
+        )
+        map_event = Event(
+            id=uuid.uuid4(),
+            game=3,
+            type=EventType.MAP_UPDATE,
+            turn_number=0,
+            tick=0,
+            server_time=datetime(2023, 5, 1, 12, 0, 0, 123456),
+            origin=1,
+            role="",
+            data=MapUpdateDbJson(RandomMap(MapConfig())),
+        )
+        self.events = [
+            map_event,
+            Event(
+                id=uuid.uuid4(),
+                game=3,
+                type=EventType.INITIAL_STATE,
+                turn_number=None,
+                tick=1,
+                server_time=datetime(2023, 5, 1, 12, 0, 1),
+                origin=3,
+                role="Role.LEADER",
+                data=JsonSerialize(
+                    InitialState(0, 1, HecsCoord(0, 1, 2), 60, HecsCoord(1, 2, 3), 0)
+                ),
+            ),
+            Event(
+                id=uuid.uuid4(),
+                game=3,
+                type=EventType.ACTION,
+                turn_number=2,
+                tick=5,
+                server_time=datetime(2023, 5, 1, 12, 0, 2),
+                origin=2,
+                role="Role.FOLLOWER",
+                parent_event=map_event.id,
+                data=JsonSerialize(walk),
+                short_code="MF",
+                location=HecsCoord(1, 3, 4),
+                orientation=120,
+            ),
+            Event(
+                id=uuid.uuid4(),
+                game=4,
+                type=EventType.ACTION,
+                turn_number=0,
+                tick=0,
+                server_time=datetime(2023, 5, 2),
+                origin=3,
+                role="Role.LEADER",
+                data=JsonSerialize(outline),
+                short_code="",
+            ),
+            Event(
+                id=uuid.uuid4(),
+                game=4,
+                type=EventType.INSTRUCTION_DONE,
+                turn_number=1,
+                tick=3,
+                server_time=datetime(2023, 5, 2),
+                origin=2,
+                role=None,
+                data="not json",
+                short_code="é",
+            ),
+        ]
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        writer = EventArchiveWriter()
+        for event in self.events:
+            writer.append(event)
+        writer.write(self.path)
+        archive = EventArchive(self.path)
+        self.assertEqual(len(archive), len(self.events))
+        self.assertEqual(
+            archive.column("data_kind").tolist(),
+            [
+                DataKind.MAP_UPDATE,
+                DataKind.JSON,
+                DataKind.ACTION,
+                DataKind.ACTION,
+                DataKind.TEXT,
+            ],
+        )
+        for archived, event in zip(archive, self.events):
+            self.assertEqual(archived.id, event.id)
+            self.assertEqual(archived.game_id, event.game_id)
+            self.assertEqual(archived.type, event.type)
+            self.assertEqual(archived.turn_number, event.turn_number)
+            self.assertEqual(archived.tick, event.tick)
+            self.assertEqual(archived.server_time, event.server_time)
+            self.assertEqual(archived.client_time, None)
+            self.assertEqual(archived.origin, event.origin)
+            self.assertEqual(archived.role, event.role)
+            self.assertEqual(archived.parent_event_id, event.parent_event_id)
+            self.assertEqual(archived.short_code, event.short_code)
+            self.assertEqual(archived.location, event.location)
+            self.assertEqual(archived.orientation, event.orientation)
+            if event.data == "not json":
+                self.assertEqual(archived.data, event.data)
+            else:
+                # Compacted, but otherwise byte-for-byte the same JSON.
+                self.assertEqual(
+                    archived.data.encode("utf-8"),
+                    orjson.dumps(orjson.loads(event.data)),
+                )
+            self.assertEqual(archived.to_event().data, archived.data)
+
+    def test_filters(self):
+        writer = EventArchiveWriter()
+        for event in self.events:
+            writer.append(event)
+        writer.write(self.path)
+        archive = EventArchive(self.path)
+        self.assertEqual(archive.game_ids().tolist(), [3, 4])
+        actions = list(archive.events(game_id=4, event_types=[EventType.ACTION]))
+        self.assertEqual([event.id for event in actions], [self.events[3].id])
+
+
+if __name__ == "__main__":
+    unittest.main()
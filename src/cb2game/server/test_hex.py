@@ -0,0 +1,85 @@
+"""Unit tests for packed HECS coordinates."""
+import random
+import unittest
+
+from cb2game.server.hex import (
+    PACKED_BIAS,
+    PACKED_UNIT_DISPLACEMENTS,
+    HecsCoord,
+    PackedAdd,
+    PackedNegate,
+    PackedNeighborAtHeading,
+    PackedNeighbors,
+    PackOffset,
+    UnpackCoord,
+    UnpackOffset,
+)
+
+
+class PackedCoordTest(unittest.TestCase):
+    def setUp(self):
+        rng = random.Random(0)
+        self.coords = [
+            HecsCoord.from_offset(rng.randint(-40, 40), rng.randint(-40, 40))
+            for _ in range(500)
+        ]
+        self.headings = [rng.uniform(-720, 720) for _ in self.coords]
+
+    def test_round_trip(self):
+        for coord in self.coords:
+            self.assertEqual(UnpackCoord(coord.packed()), coord)
+            self.assertEqual(HecsCoord.from_packed(coord.packed()), coord)
+            self.assertEqual(
+                UnpackOffset(coord.packed()), coord.to_offset_coordinates()
+            )
+
+    def test_arithmetic_matches_hecs(self):
+        for a, b in zip(self.coords, reversed(self.coords)):
+            self.assertEqual(UnpackCoord(PackedAdd(a.packed(), b.packed())), a.add(b))
+            self.assertEqual(UnpackCoord(PackedNegate(a.packed())), a.negate())
+
+    def test_neighbors_match_hecs(self):
+        for coord, heading in zip(self.coords, self.headings):
+            packed = coord.packed()
+            self.assertEqual(
+                [UnpackCoord(neighbor) for neighbor in PackedNeighbors(packed)],
+                coord.neighbors(),
+            )
+            self.assertEqual(
+                UnpackCoord(PackedNeighborAtHeading(packed, heading)),
+                coord.neighbors()[int(heading / 60.0) % 6],
+            )
+            self.assertEqual(
+                coord.neighbor_at_heading(heading),
+                coord.neighbors()[int(heading / 60.0) % 6],
+            )
+
+    def test_unit_displacements(self):
+        for coord in self.coords[:50]:
+            cartesian = coord.cartesian()
+            is_unit = (cartesian[0] ** 2 + cartesian[1] ** 2) ** 0.5 <= 1.001
+            self.assertEqual(coord.packed() in PACKED_UNIT_DISPLACEMENTS, is_unit)
+        for neighbor in HecsCoord.origin().neighbors():
+            self.assertIn(neighbor.packed(), PACKED_UNIT_DISPLACEMENTS)
+
+    def test_out_of_range_raises(self):
+        # Would alias the unit displacement HecsCoord(1, 0, 0) if packed.
+        with self.assertRaises(ValueError):
+            HecsCoord(0, 0, 1 << 16).packed()
+        for row, col in (
+            (PACKED_BIAS, 0),
+            (0, PACKED_BIAS),
+            (-PACKED_BIAS - 1, 0),
+            (0, -PACKED_BIAS - 1),
+        ):
+            with self.assertRaises(ValueError):
+                PackOffset(row, col)
+        for row, col in (
+            (-PACKED_BIAS, -PACKED_BIAS),
+            (PACKED_BIAS - 1, PACKED_BIAS - 1),
+        ):
+            self.assertEqual(UnpackOffset(PackOffset(row, col)), (row, col))
+
+
+if __name__ == "__main__":
+    unittest.main()
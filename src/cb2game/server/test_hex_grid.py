@@ -0,0 +1,97 @@
+"""Unit tests for the array-backed hex grid."""
+import dataclasses
+import random
+import unittest
+
+import numpy as np
+
+from cb2game.server.config.map_config import MapConfig
+from cb2game.server.hex import HecsCoord
+from cb2game.server.hex_grid import HexGrid, NeighborTable, hex_grid_cache
+from cb2game.server.map_provider import MapProvider, MapType, RandomMap
+from cb2game.server.messages.map_update import MapUpdate
+
+
+class HexGridTest(unittest.TestCase):
+    def test_neighbor_table_matches_hecs_neighbors(self):
+        rows, cols = 7, 5
+        table = NeighborTable(rows, cols)
+        for row in range(rows):
+            for col in range(cols):
+                coord = HecsCoord.from_offset(row, col)
+                for direction, neighbor in enumerate(coord.neighbors()):
+                    nrow, ncol = neighbor.to_offset_coordinates()
+                    expected = -1
+                    if 0 <= nrow < rows and 0 <= ncol < cols:
+                        expected = nrow * cols + ncol
+                    self.assertEqual(table[row * cols + col, direction], expected)
+
+    def test_edge_between_matches_tile_boundaries(self):
+        random.seed(0)
+        map_update = MapProvider(MapType.RANDOM, RandomMap(MapConfig())).map()
+        # Drop some tiles, as in a follower's view of the map.
+        tiles = [tile for tile in map_update.tiles if random.random() < 0.8]
+        tiles_by_location = {tile.cell.coord: tile for tile in tiles}
+        grid = HexGrid.from_tiles(map_update.rows, map_update.cols, tiles)
+        for tile in tiles:
+            coord = tile.cell.coord
+            for neighbor in coord.neighbors():
+                neighbor_tile = tiles_by_location.get(neighbor, None)
+                if neighbor_tile is None:
+                    expected = True
+                else:
+                    expected = tile.cell.boundary.get_edge_between(
+                        coord, neighbor
+                    ) or neighbor_tile.cell.boundary.get_edge_between(neighbor, coord)
+                self.assertEqual(grid.edge_between(coord, neighbor), expected)
+        with self.assertRaises(ValueError):
+            grid.edge_between(HecsCoord(0, 0, 0), HecsCoord(0, 0, 2))
+
+    def test_off_map_is_blocked(self):
+        grid = HexGrid.from_map_update(RandomMap(MapConfig()))
+        self.assertEqual(grid.flat_index(HecsCoord(0, -1, 0)), -1)
+        self.assertTrue(grid.edge_between(HecsCoord(0, 0, 0), HecsCoord(0, 0, -1)))
+
+
+class MapIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.map_update = MapProvider(
+            MapType.RANDOM, RandomMap(MapConfig(rng_seed=3))
+        ).map()
+
+    def test_grid_is_shared_by_copies(self):
+        grid = self.map_update.grid()
+        self.assertIs(dataclasses.replace(self.map_update, version=2).grid(), grid)
+        tiles = list(self.map_update.tiles)
+        self.assertIsNot(dataclasses.replace(self.map_update, tiles=tiles).grid(), grid)
+
+    def test_tile_at(self):
+        for tile in self.map_update.tiles[:50]:
+            row, col = tile.cell.coord.to_offset_coordinates()
+            self.assertIs(self.map_update.tile_at(tile.cell.coord), tile)
+            self.assertIs(self.map_update.tile_at_offset(row, col), tile)
+        self.assertIsNone(self.map_update.tile_at(HecsCoord(0, -1, 0)))
+        self.assertIsNone(self.map_update.tile_at_offset(0, self.map_update.cols))
+
+    def test_masked_matches_grid_from_tiles(self):
+        random.seed(1)
+        grid = self.map_update.grid()
+        indices = np.array(
+            [i for i in range(grid.size()) if random.random() < 0.3], dtype=np.int64
+        )
+        np.random.default_rng(0).shuffle(indices)
+        tiles = [self.map_update.tiles[i] for i in grid.tile_index.flat[indices]]
+        expected = HexGrid.from_tiles(grid.rows, grid.cols, tiles)
+        masked = grid.masked(indices)
+        for name in ("tile_index", "asset_ids", "layers", "edges", "passable"):
+            np.testing.assert_array_equal(
+                getattr(masked, name), getattr(expected, name)
+            )
+        masked_map_update = MapUpdate(grid.rows, grid.cols, tiles)
+        masked_map_update.set_grid(lambda: masked)
+        self.assertIs(masked_map_update.grid(), masked)
+        self.assertIsNot(hex_grid_cache.get(grid.rows, grid.cols, tiles), masked)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -19,6 +19,7 @@ from cb2game.server.messages.rooms import (
     RoomResponseType,
 )
 from cb2game.server.messages.user_info import UserType
+from cb2game.server.outbox import CreateOutbox
 from cb2game.server.remote_table import AddRemote, Remote
 from cb2game.server.schemas.base import (
     ConnectDatabase,
@@ -72,6 +73,7 @@ class FollowerPilotLobbyTest(unittest.TestCase):
     def register_bot(self, bot_id):
         remote = Remote("", 0, 0, 0, -1, -1, None, None, None, None, None, UserType.BOT)
         AddRemote(bot_id, remote)
+        CreateOutbox(bot_id)
 
     def register_mturk_leader(self, worker_id):
         self.register_mturker(worker_id, WorkerQualLevel.LEADER)
@@ -97,6 +99,7 @@ class FollowerPilotLobbyTest(unittest.TestCase):
             submit_to_url=TEST_TURK_SUBMIT_TO_URL,
         )
         AddRemote(worker_id, remote, assignment)
+        CreateOutbox(worker_id)
 
     def join_request(self):
         return message_to_server.MessageToServer(
@@ -0,0 +1,119 @@
+"""Unit tests for the batched websocket frames sent by main.py."""
+import asyncio
+import os
+import time
+import unittest
+from datetime import datetime, timedelta
+
+import orjson
+
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = ""  # Hide pygame welcome message
+
+import cb2game.server.main as server_main
+import cb2game.server.messages.message_from_server as message_from_server
+from cb2game.pyclient.game_endpoint import GameEndpoint
+from cb2game.server.config.config import Config, SetGlobalConfig
+from cb2game.server.lobbies.open_lobby import OpenLobby
+from cb2game.server.lobby_consts import LobbyInfo, LobbyType
+from cb2game.server.messages.objective import ObjectiveMessage
+from cb2game.server.messages.rooms import Role
+from cb2game.server.messages.turn_state import TurnState
+from cb2game.server.outbox import CreateOutbox, DeleteOutbox
+from cb2game.server.remote_table import DeleteRemote, Remote, SetRemote
+
+
+class FakeWebSocket(object):
+    """Stands in for aiohttp.web.WebSocketResponse. Records sent frames."""
+
+    def __init__(self):
+        self.closed = False
+        self.frames = []
+
+    async def send_str(self, data):
+        self.frames.append(data)
+
+    async def close(self):
+        self.closed = True
+
+
+def _Messages():
+    now = datetime.utcnow()
+    turn_state = TurnState(
+        Role.FOLLOWER, 10, 5, now + timedelta(minutes=1), now, 0, 0, False, 1
+    )
+    objective = ObjectiveMessage(Role.LEADER, "turn left", "abc123")
+    return [
+        message_from_server.GameStateFromServer(turn_state),
+        message_from_server.ObjectivesFromServer([objective]),
+        message_from_server.PingMessageFromServer(),
+    ]
+
+
+class BatchedFramesTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        SetGlobalConfig(Config())
+        self.lobby = OpenLobby(LobbyInfo("Test Lobby", LobbyType.OPEN, "Test"))
+        self.ws = FakeWebSocket()
+        self.outbox = CreateOutbox(self.ws)
+
+    def tearDown(self):
+        DeleteOutbox(self.ws)
+        DeleteRemote(self.ws)
+
+    async def send_frames(self, batch_messages):
+        """Queues _Messages() for the socket and returns the frames sent."""
+        remote = Remote(
+            "test",
+            0,
+            0,
+            0,
+            time.time(),
+            time.time(),
+            None,
+            self.ws,
+            batch_messages=batch_messages,
+        )
+        SetRemote(self.ws, remote)
+        sender = asyncio.create_task(
+            server_main.stream_game_state(None, self.ws, self.lobby)
+        )
+        await asyncio.sleep(0)
+        for message in _Messages():
+            self.outbox.put(message)
+        await asyncio.sleep(0.1)
+        self.ws.closed = True
+        DeleteOutbox(self.ws)
+        await sender
+        # The first frame is always the menu options.
+        return self.ws.frames[1:]
+
+    async def test_unbatched_frames(self):
+        frames = await self.send_frames(batch_messages=False)
+        self.assertEqual(len(frames), 3)
+        for frame, message in zip(frames, _Messages()):
+            decoded = message_from_server.MessageFromServer.from_json(frame)
+            self.assertEqual(decoded.type, message.type)
+
+    async def test_batched_frame(self):
+        (frame,) = await self.send_frames(batch_messages=True)
+        self.assertTrue(frame.startswith("["))
+        # Decoded the same way as RemoteClient._receive_message().
+        messages = [
+            message_from_server.MessageFromServer.from_dict(data)
+            for data in orjson.loads(frame)
+        ]
+        self.assertEqual(
+            [message.type for message in messages],
+            [message.type for message in _Messages()],
+        )
+
+        endpoint = GameEndpoint(None, Config())
+        endpoint._handle_message(messages)
+        self.assertEqual(endpoint.turn_state.turn, Role.FOLLOWER)
+        self.assertEqual(endpoint.turn_state.moves_remaining, 10)
+        self.assertEqual([i.text for i in endpoint.instructions], ["turn left"])
+        self.assertEqual(len(endpoint.queued_messages), 1)  # Pong.
+
+
+if __name__ == "__main__":
+    unittest.main()
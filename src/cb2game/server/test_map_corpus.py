@@ -0,0 +1,51 @@
+"""Unit tests for the seed-indexed map corpus."""
+import dataclasses
+import pathlib
+import shutil
+import tempfile
+import unittest
+
+import orjson
+
+from cb2game.server.config.map_config import MapConfig
+from cb2game.server.map_corpus import MapCorpus, MapCorpusWriter
+from cb2game.server.map_provider import GenerateEncodedMap, RandomMap
+
+
+class MapCorpusTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = pathlib.Path(self.directory, "maps.cb2maps")
+        self.map_config = MapConfig()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        writer = MapCorpusWriter(self.path, self.map_config, 100, 3)
+        writer.append(RandomMap(dataclasses.replace(self.map_config, rng_seed=100)))
+        writer.append(GenerateEncodedMap(self.map_config, 101))
+        writer.append(GenerateEncodedMap(self.map_config, 102))
+        writer.close()
+        corpus = MapCorpus(self.path)
+        self.assertEqual(len(corpus), 3)
+        self.assertEqual(corpus.map_config, self.map_config)
+        for seed in corpus.seeds():
+            expected = RandomMap(dataclasses.replace(self.map_config, rng_seed=seed))
+            self.assertEqual(
+                orjson.dumps(corpus.map_update(seed)), orjson.dumps(expected)
+            )
+        self.assertNotIn(103, corpus)
+        with self.assertRaises(KeyError):
+            corpus.map_update(99)
+
+    def test_incomplete_corpus_isnt_saved(self):
+        writer = MapCorpusWriter(self.path, self.map_config, 0, 2)
+        writer.append(GenerateEncodedMap(self.map_config, 0))
+        with self.assertRaises(ValueError):
+            writer.close()
+        self.assertFalse(self.path.exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""Unit tests for cached map serialization."""
+import dataclasses
+import unittest
+from datetime import datetime
+
+import orjson
+
+from cb2game.server.config.map_config import MapConfig
+from cb2game.server.game_recorder import JsonSerialize
+from cb2game.server.map_payload import (
+    WIRE_OPTIONS,
+    MapPayloadCache,
+    MapUpdateDbJson,
+    MapUpdateWireBytes,
+    SerializeWithMapUpdate,
+    map_payload_cache,
+)
+from cb2game.server.map_provider import RandomMap
+from cb2game.server.messages.message_from_server import MapUpdateFromServer
+
+
+class MapPayloadTest(unittest.TestCase):
+    def setUp(self):
+        self.map_update = dataclasses.replace(RandomMap(MapConfig()), version=2)
+
+    def test_wire_bytes_match_orjson(self):
+        expected = orjson.dumps(
+            self.map_update, option=WIRE_OPTIONS, default=datetime.isoformat
+        )
+        self.assertEqual(MapUpdateWireBytes(self.map_update), expected)
+        # Second call is served from the cache.
+        hits = map_payload_cache.hits
+        self.assertEqual(MapUpdateWireBytes(self.map_update), expected)
+        self.assertEqual(map_payload_cache.hits, hits + 1)
+
+    def test_db_json_matches_json_serialize(self):
+        self.assertEqual(
+            MapUpdateDbJson(self.map_update), JsonSerialize(self.map_update)
+        )
+
+    def test_message_matches_orjson(self):
+        message = MapUpdateFromServer(self.map_update)
+        expected = orjson.dumps(
+            message, option=WIRE_OPTIONS, default=datetime.isoformat
+        )
+        serialized = SerializeWithMapUpdate(
+            dataclasses.replace(message, map_update=None), self.map_update
+        )
+        self.assertEqual(serialized, expected)
+
+    def test_cache_evicts_least_recently_used(self):
+        cache = MapPayloadCache(max_size=2)
+        tiles = [[], [], []]
+        cache.get(tiles[0])
+        cache.get(tiles[1])
+        cache.get(tiles[0])
+        cache.get(tiles[2])
+        self.assertEqual(len(cache), 2)
+        misses = cache.misses
+        cache.get(tiles[0])
+        self.assertEqual(cache.misses, misses)
+        cache.get(tiles[1])
+        self.assertEqual(cache.misses, misses + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
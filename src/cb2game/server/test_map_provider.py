@@ -0,0 +1,194 @@
+"""Unit tests for MapProvider card spawning and set validation, and the map pool."""
+import asyncio
+import dataclasses
+import pathlib
+import random
+import tempfile
+import time
+import unittest
+
+import numpy as np
+
+from cb2game.server.config.config import Config
+from cb2game.server.config.map_config import MapConfig
+from cb2game.server.map_provider import (
+    MAP_FILE_SUFFIX,
+    MAP_POOL_BACKOFF_S,
+    MAP_POOL_MAXIMUM_BACKOFF_S,
+    MapPool,
+    MapProvider,
+    MapType,
+    RandomMap,
+)
+
+
+def _Collide(cards):
+    return len(cards) > 3 or not (
+        len(set(card.shape for card in cards))
+        == len(set(card.color for card in cards))
+        == len(set(card.count for card in cards))
+        == len(cards)
+    )
+
+
+class RandomMapTest(unittest.TestCase):
+    def test_seed_determines_map(self):
+        np.random.seed(1)
+        first = RandomMap(MapConfig(rng_seed=3))
+        np.random.seed(2)
+        second = RandomMap(MapConfig(rng_seed=3))
+        self.assertEqual(first.tiles, second.tiles)
+
+    def test_numpy_global_rng_untouched(self):
+        np.random.seed(0)
+        expected = np.random.random_sample(3)
+        np.random.seed(0)
+        RandomMap(MapConfig(rng_seed=3))
+        np.testing.assert_array_equal(np.random.random_sample(3), expected)
+
+
+class MapProviderCardTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(0)
+        np.random.seed(0)
+        self.map_provider = MapProvider(
+            MapType.RANDOM, RandomMap(MapConfig(rng_seed=0))
+        )
+
+    def test_selection_tracks_collisions(self):
+        rng = random.Random(0)
+        selected = {}
+        for _ in range(500):
+            card = rng.choice(self.map_provider.cards())
+            if card.id in selected:
+                del selected[card.id]
+                self.map_provider.set_selected(card.id, False)
+            else:
+                selected[card.id] = card
+                self.map_provider.set_selected(card.id, True)
+            self.assertEqual(
+                self.map_provider.selected_cards_collide(),
+                _Collide(list(selected.values())),
+            )
+
+    def test_spawns_avoid_cards(self):
+        for _ in range(20):
+            removed = self.map_provider.cards()[0]
+            self.map_provider.remove_card(removed.id)
+            new_cards = self.map_provider.add_random_unique_set()
+            locations = [card.location for card in self.map_provider.cards()]
+            self.assertEqual(len(locations), len(set(locations)))
+            self.assertEqual(len(new_cards), 3)
+
+    def test_custom_targets(self):
+        cards = self.map_provider.cards()
+        map_provider = MapProvider(
+            MapType.PRESET,
+            self.map_provider.map(),
+            cards,
+            custom_targets=[cards[0].id, cards[1].id],
+        )
+        map_provider.set_selected(cards[0].id, True)
+        self.assertFalse(map_provider.selected_cards_collide())
+        map_provider.set_selected(cards[2].id, True)
+        self.assertTrue(map_provider.selected_cards_collide())
+        map_provider.set_selected(cards[2].id, False)
+        map_provider.set_selected(cards[1].id, True)
+        self.assertTrue(map_provider.selected_valid_set())
+
+
+class MapPoolTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.config = Config(
+            name="map_pool_test",
+            data_prefix=self.directory.name,
+            map_cache_size=3,
+            map_pool_low_watermark=2,
+            map_pool_workers=1,
+        )
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def map_files(self, pool):
+        return sorted(pool._directory.glob(f"*{MAP_FILE_SUFFIX}"))
+
+    async def run_until(self, pool, condition, timeout_s=60):
+        """Runs the pool until condition() is true."""
+        task = asyncio.create_task(pool.run())
+        deadline = time.monotonic() + timeout_s
+        try:
+            while not condition():
+                self.assertLess(time.monotonic(), deadline, "Map pool timed out.")
+                await asyncio.sleep(0.05)
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def test_pop_refills(self):
+        pool = MapPool(self.config)
+        await self.run_until(pool, lambda: len(pool._ready) == 3)
+        self.assertEqual(len(self.map_files(pool)), 3)
+
+        # Popping the pool below its low watermark refills it.
+        self.assertIsInstance(pool.pop(), MapProvider)
+        self.assertIsInstance(pool.pop(), MapProvider)
+        self.assertEqual(len(self.map_files(pool)), 1)
+        await self.run_until(pool, lambda: len(pool._ready) == 3)
+        self.assertEqual(len(self.map_files(pool)), 3)
+        self.assertEqual(pool.metrics()["maps_generated"], 5)
+        self.assertEqual(pool.hits, 2)
+
+    async def test_restart_loads_from_disk(self):
+        pool = MapPool(self.config)
+        await self.run_until(pool, lambda: len(self.map_files(pool)) == 3)
+        # Left behind by a map write that was interrupted.
+        pathlib.Path(pool._directory, "interrupted.json.tmp").write_bytes(b"")
+
+        restarted = MapPool(self.config)
+        self.assertEqual(restarted.size(), 3)
+        self.assertEqual(list(restarted._directory.glob("*.tmp")), [])
+        await self.run_until(restarted, lambda: len(restarted._ready) == 3)
+        self.assertEqual(restarted.maps_generated, 0)
+
+        # Maps generated with a different map config aren't reused.
+        other_config = dataclasses.replace(
+            self.config, map_config=MapConfig(map_width=20, map_height=20)
+        )
+        self.assertEqual(MapPool(other_config).size(), 0)
+
+    async def test_corrupt_map_dropped(self):
+        pool = MapPool(self.config)
+        corrupt_path = pathlib.Path(pool._directory, f"corrupt{MAP_FILE_SUFFIX}")
+        corrupt_path.write_bytes(b"not a map")
+        pool = MapPool(self.config)
+        self.assertEqual(pool.size(), 1)
+        await self.run_until(pool, lambda: len(pool._ready) == 3)
+        self.assertFalse(corrupt_path.exists())
+        self.assertEqual(len(self.map_files(pool)), 3)
+        self.assertEqual(pool.metrics()["consecutive_failures"], 0)
+
+    async def test_failures_back_off(self):
+        # Too small to place a map's features, so generation always fails.
+        config = dataclasses.replace(
+            self.config, map_config=MapConfig(map_width=2, map_height=2)
+        )
+        pool = MapPool(config)
+        await self.run_until(pool, lambda: pool._failures >= 2)
+        self.assertEqual(pool._backoff_s(), 2 * MAP_POOL_BACKOFF_S)
+        # Without backoff, generation would be retried immediately.
+        task = asyncio.create_task(pool.run())
+        await asyncio.sleep(MAP_POOL_BACKOFF_S)
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+        self.assertEqual(pool._generating, 0)
+        self.assertEqual(pool._failures, 2)
+        self.assertEqual(pool.maps_generated, 0)
+
+        pool._failures = 100
+        self.assertEqual(pool._backoff_s(), MAP_POOL_MAXIMUM_BACKOFF_S)
+
+
+if __name__ == "__main__":
+    unittest.main()
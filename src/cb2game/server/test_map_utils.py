@@ -0,0 +1,74 @@
+"""Unit tests for map delta encoding and random map generation."""
+import dataclasses
+import unittest
+
+import numpy as np
+import orjson
+
+from cb2game.server.config.map_config import MapConfig
+from cb2game.server.map_provider import RandomMap
+from cb2game.server.map_utils import ApplyMapUpdateDiff, DiffMapUpdate, RandomChoice
+
+
+class MapUpdateDiffTest(unittest.TestCase):
+    def setUp(self):
+        self.base_map = dataclasses.replace(RandomMap(MapConfig()), version=1)
+
+    def test_unchanged_map_has_empty_diff(self):
+        new_map = dataclasses.replace(self.base_map, version=2)
+        delta = DiffMapUpdate(self.base_map, new_map)
+        self.assertEqual(delta.tiles, [])
+        self.assertEqual(delta.base_version, 1)
+        self.assertEqual(ApplyMapUpdateDiff(self.base_map, delta).tiles, new_map.tiles)
+
+    def test_changed_tiles_round_trip(self):
+        tiles = list(self.base_map.tiles)
+        for i in (3, 10):
+            tiles[i] = dataclasses.replace(
+                tiles[i], rotation_degrees=(tiles[i].rotation_degrees + 60) % 360
+            )
+        new_map = dataclasses.replace(self.base_map, tiles=tiles, version=2)
+        delta = DiffMapUpdate(self.base_map, new_map)
+        self.assertEqual(delta.tiles, [tiles[3], tiles[10]])
+        applied = ApplyMapUpdateDiff(self.base_map, delta)
+        self.assertEqual(applied.version, 2)
+        self.assertIsNone(applied.base_version)
+        self.assertEqual(applied.tiles, new_map.tiles)
+
+    def test_removed_tiles_send_full_map(self):
+        tiles = self.base_map.tiles[:-10]
+        new_map = dataclasses.replace(self.base_map, tiles=tiles, version=2)
+        delta = DiffMapUpdate(self.base_map, new_map)
+        self.assertIsNone(delta.base_version)
+        self.assertEqual(delta.tiles, tiles)
+        applied = ApplyMapUpdateDiff(self.base_map, delta)
+        self.assertEqual(applied.tiles, tiles)
+
+    def test_version_mismatch_raises(self):
+        new_map = dataclasses.replace(self.base_map, version=3)
+        delta = DiffMapUpdate(self.base_map, new_map)
+        stale_map = dataclasses.replace(self.base_map, version=0)
+        with self.assertRaises(ValueError):
+            ApplyMapUpdateDiff(stale_map, delta)
+
+
+class RandomMapTest(unittest.TestCase):
+    def test_random_choice_matches_numpy(self):
+        options = ["a", "b", "c"]
+        p = (0.88, 0.10, 0.02)
+        np.random.seed(7)
+        expected = [np.random.choice(options, size=1, p=p)[0] for _ in range(500)]
+        np.random.seed(7)
+        self.assertEqual([RandomChoice(options, p) for _ in range(500)], expected)
+
+    def test_seed_determines_map(self):
+        first = RandomMap(MapConfig(rng_seed=1234))
+        # Disturb the global RNGs between runs.
+        np.random.random_sample(17)
+        second = RandomMap(MapConfig(rng_seed=1234))
+        self.assertEqual(orjson.dumps(first), orjson.dumps(second))
+        self.assertEqual(first.metadata.start_seed, 1234)
+
+
+if __name__ == "__main__":
+    unittest.main()
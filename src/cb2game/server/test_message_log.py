@@ -0,0 +1,48 @@
+"""Unit tests for background message logging."""
+import pathlib
+import shutil
+import tempfile
+import unittest
+
+from cb2game.server.message_log import MessageLogWriter, OpenMessageLog
+
+
+class MessageLogWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.writer = MessageLogWriter()
+
+    def tearDown(self):
+        self.writer.close()
+        shutil.rmtree(self.directory)
+
+    def _round_trip(self, compression):
+        path = pathlib.Path(self.directory, f"messages_{compression}.jsonl.log")
+        log = self.writer.open(path, compression)
+        lines = [f'{{"tick":{i}}}\n'.encode("utf-8") for i in range(1000)]
+        for line in lines:
+            log.write(line)
+        log.close()
+        # Writes after close are ignored.
+        log.write(b"dropped\n")
+        self.assertTrue(self.writer.flush(timeout=5))
+        with OpenMessageLog(path) as f:
+            self.assertEqual(f.read(), b"".join(lines).decode("utf-8"))
+
+    def test_uncompressed(self):
+        self._round_trip("")
+
+    def test_gzip(self):
+        self._round_trip("gzip")
+
+    def test_close_closes_open_logs(self):
+        path = pathlib.Path(self.directory, "messages.jsonl.log")
+        log = self.writer.open(path, "gzip")
+        log.write(b"{}\n")
+        self.writer.close()
+        with OpenMessageLog(path) as f:
+            self.assertEqual(f.read(), "{}\n")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,79 @@
+"""Unit tests for per-socket outboxes."""
+import asyncio
+import unittest
+
+import cb2game.server.messages.message_from_server as message_from_server
+from cb2game.server.messages.google_auth import GoogleAuthConfirmation
+from cb2game.server.outbox import (
+    CreateOutbox,
+    DeleteOutbox,
+    GetOutbox,
+    OutboxCount,
+    QueueMessage,
+)
+
+
+def _Message():
+    return message_from_server.GoogleAuthConfirmationFromServer(
+        GoogleAuthConfirmation(True)
+    )
+
+
+class OutboxTest(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        # Plain objects stand in for websockets. Outboxes only use them as keys.
+        self.ws = object()
+        self.starting_count = OutboxCount()
+
+    def tearDown(self):
+        DeleteOutbox(self.ws)
+
+    def test_queue_and_drain(self):
+        outbox = CreateOutbox(self.ws)
+        self.assertIs(GetOutbox(self.ws), outbox)
+        messages = [_Message(), _Message()]
+        for message in messages:
+            QueueMessage(self.ws, message)
+        self.assertEqual(len(outbox), 2)
+        self.assertEqual(outbox.drain(), messages)
+        self.assertIsNone(outbox.get_nowait())
+
+    def test_lookup_doesnt_create(self):
+        self.assertIsNone(GetOutbox(self.ws))
+        QueueMessage(self.ws, _Message())
+        self.assertIsNone(GetOutbox(self.ws))
+        self.assertEqual(OutboxCount(), self.starting_count)
+
+    def test_message_after_delete_dropped(self):
+        # E.g. a google auth result which arrives after the socket disconnected.
+        outbox = CreateOutbox(self.ws)
+        DeleteOutbox(self.ws)
+        self.assertTrue(outbox.closed())
+        QueueMessage(self.ws, _Message())
+        self.assertIsNone(GetOutbox(self.ws))
+        self.assertEqual(len(outbox), 0)
+        self.assertEqual(OutboxCount(), self.starting_count)
+
+    async def test_wait(self):
+        outbox = CreateOutbox(self.ws)
+        self.assertFalse(await outbox.wait(timeout=0))
+        waiter = asyncio.create_task(outbox.wait())
+        await asyncio.sleep(0)
+        QueueMessage(self.ws, _Message())
+        self.assertTrue(await waiter)
+
+    async def test_wake_and_close(self):
+        outbox = CreateOutbox(self.ws)
+        waiter = asyncio.create_task(outbox.wait())
+        await asyncio.sleep(0)
+        outbox.wake()
+        self.assertFalse(await waiter)
+
+        waiter = asyncio.create_task(outbox.wait())
+        await asyncio.sleep(0)
+        DeleteOutbox(self.ws)
+        self.assertFalse(await waiter)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+"""Unit tests for cached routing tables."""
+import random
+import unittest
+from collections import deque
+
+from cb2game.server.config.map_config import MapConfig
+from cb2game.server.map_provider import MapProvider, MapType, RandomMap
+from cb2game.server.routing_utils import FindPath, GetRoutingTable
+
+
+def _BreadthFirstDistance(map_update, start, end, obstacles):
+    """Uncached reference search, stepping between tiles with no edge between them."""
+    distances = {start: 0}
+    queue = deque([start])
+    while queue:
+        current = queue.popleft()
+        if current == end:
+            return distances[current]
+        if current in obstacles and current != start:
+            continue
+        for neighbor in current.neighbors():
+            if neighbor in distances or map_update.tile_at(neighbor) is None:
+                continue
+            if map_update.get_edge_between(current, neighbor):
+                continue
+            distances[neighbor] = distances[current] + 1
+            queue.append(neighbor)
+    return -1
+
+
+class RoutingTableTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(0)
+        self.provider = MapProvider(MapType.RANDOM, RandomMap(MapConfig()))
+        self.map = self.provider.map()
+        self.cards = self.provider.prop_update().props
+
+    def test_paths_avoid_cards(self):
+        locations = [tile.cell.coord for tile in self.map.tiles]
+        for _ in range(50):
+            cards = random.sample(self.cards, random.randint(0, len(self.cards)))
+            obstacles = set(card.prop_info.location for card in cards)
+            start = random.choice(locations)
+            end = random.choice(locations)
+            path = FindPath(self.map, cards, start, end)
+            expected = _BreadthFirstDistance(self.map, start, end, obstacles)
+            if expected < 0:
+                self.assertIsNone(path)
+                continue
+            self.assertEqual(len(path) - 1, expected)
+            self.assertEqual(path[0], start)
+            self.assertEqual(path[-1], end)
+            for a, b in zip(path, path[1:]):
+                self.assertFalse(self.map.get_edge_between(a, b))
+            for location in path[1:-1]:
+                self.assertNotIn(location, obstacles)
+
+    def test_tables_are_shared_between_copies_of_a_map(self):
+        table = GetRoutingTable(self.map)
+        self.assertIs(GetRoutingTable(self.provider.map()), table)
+        start = self.map.tiles[0].cell.coord
+        distances = table.distances_from(start)
+        self.assertEqual(distances.shape, (self.map.rows, self.map.cols))
+        row, col = start.to_offset_coordinates()
+        self.assertEqual(distances[row, col], 0)
+        searches = table.searches
+        table.distance(start, self.map.tiles[-1].cell.coord)
+        self.assertEqual(table.searches, searches)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+"""Unit tests for the scenario disk cache."""
+import pathlib
+import tempfile
+import unittest
+import uuid
+
+from cb2game.server.config.map_config import MapConfig
+from cb2game.server.map_provider import RandomMap
+from cb2game.server.messages.scenario import Scenario
+from cb2game.server.scenario_cache import ScenarioCache
+
+
+class ScenarioCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.db_path = pathlib.Path(self.directory.name, "game_data.db")
+        self.db_path.write_bytes(b"events")
+        self.cache_directory = pathlib.Path(self.directory.name, "scenario_cache")
+        self.scenario = Scenario("", RandomMap(MapConfig()))
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_round_trip(self):
+        cache = ScenarioCache(self.cache_directory, self.db_path, 10)
+        a, b = uuid.uuid4(), uuid.uuid4()
+        self.assertIsNone(cache.get(a))
+        cache.put(a, self.scenario)
+        cache.put(b.hex, self.scenario)
+        # Both scenarios share one map file.
+        self.assertEqual(len(cache), 3)
+
+        # Reopened, as if by another process.
+        cache = ScenarioCache(self.cache_directory, self.db_path, 10)
+        self.assertEqual(cache.get(str(a)), self.scenario)
+        self.assertEqual(cache.get(b), self.scenario)
+        self.assertIs(cache.get(a).map.tiles, cache.get(b).map.tiles)
+        self.assertEqual((cache.hits, cache.misses), (4, 0))
+
+    def test_database_change_invalidates(self):
+        cache = ScenarioCache(self.cache_directory, self.db_path, 10)
+        event_id = uuid.uuid4()
+        cache.put(event_id, self.scenario)
+        self.db_path.write_bytes(b"more events")
+        self.assertIsNone(cache.get(event_id))
+
+    def test_least_recently_used_evicted(self):
+        cache = ScenarioCache(self.cache_directory, self.db_path, 3)
+        a, b, c = uuid.uuid4(), uuid.uuid4(), uuid.uuid4()
+        cache.put(a, self.scenario)
+        cache.put(b, self.scenario)
+        self.assertIsNotNone(cache.get(a))
+        cache.put(c, self.scenario)
+        self.assertEqual(len(cache), 3)
+        self.assertIsNone(cache.get(b))
+        self.assertIsNotNone(cache.get(a))
+        self.assertIsNotNone(cache.get(c))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,144 @@
+"""Tests reconstructing scenarios from a recorded local game."""
+import os
+import random
+import unittest
+
+os.environ["PYGAME_HIDE_SUPPORT_PROMPT"] = ""  # Hide pygame welcome message
+
+from cb2game.agents.config import AgentConfigData, LoadAgentFromConfig
+from cb2game.agents.local_agent_pair import PlayGame
+from cb2game.pyclient.local_game_coordinator import LocalGameCoordinator
+from cb2game.server.config.config import Config, SetGlobalConfig
+from cb2game.server.scenario_util import (
+    GameEvents,
+    InstructionSnapshots,
+    ReconstructScenarioFromEvent,
+    ScenarioSnapshots,
+)
+from cb2game.server.schemas.base import (
+    ConnectDatabase,
+    CreateTablesIfNotExists,
+    SetDatabaseForTesting,
+)
+from cb2game.server.schemas.defaults import ListDefaultTables
+from cb2game.server.schemas.event import Event, EventType
+from cb2game.server.schemas.game import Game
+
+
+# Eval boundaries as run_eval.py used to find them, one query per instruction.
+def follower_eval_start(instruction: Event) -> Event:
+    first_follower_move = (
+        Event.select()
+        .where(
+            (Event.type == EventType.ACTION) & (Event.parent_event_id == instruction.id)
+        )
+        .order_by(Event.server_time)
+        .first()
+    )
+    if first_follower_move is None:
+        return None
+    return (
+        Event.select()
+        .where(
+            (Event.game == first_follower_move.game)
+            & (Event.server_time < first_follower_move.server_time)
+        )
+        .order_by(Event.server_time.desc())
+        .first()
+    )
+
+
+def final_follower_move(instruction: Event) -> Event:
+    last_follower_move = (
+        Event.select()
+        .where(
+            (Event.type == EventType.ACTION) & (Event.parent_event_id == instruction.id)
+        )
+        .order_by(Event.server_time.desc())
+        .first()
+    )
+    if last_follower_move is None:
+        return (
+            Event.select()
+            .where(
+                (Event.type == EventType.INSTRUCTION_DONE)
+                & (Event.parent_event_id == instruction.id)
+            )
+            .first()
+        )
+    return (
+        Event.select()
+        .where(
+            (Event.game == last_follower_move.game)
+            & (Event.server_time > last_follower_move.server_time)
+        )
+        .order_by(Event.server_time)
+        .first()
+    )
+
+
+class ScenarioSnapshotsTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        config = Config()
+        SetGlobalConfig(config)
+        SetDatabaseForTesting()
+        ConnectDatabase()
+        CreateTablesIfNotExists(ListDefaultTables())
+        random.seed(0)
+        leader = LoadAgentFromConfig(
+            AgentConfigData("cb2game.agents.simple_leader.SimpleLeader", {})
+        )
+        follower = LoadAgentFromConfig(
+            AgentConfigData(
+                "cb2game.agents.simple_follower.SimpleFollower",
+                {"default_action": "INSTRUCTION_DONE"},
+            )
+        )
+        PlayGame(LocalGameCoordinator(config), leader, follower, log_to_db=True)
+        cls.game = Game.select().order_by(Game.id.desc()).get()
+        cls.events = GameEvents(cls.game.id)
+
+    def test_snapshots_match_reconstruction(self):
+        # Before the first turn state, scenarios get a turn state made up at
+        # reconstruction time, which isn't comparable.
+        first_turn_state = next(
+            i for i, e in enumerate(self.events) if e.type == EventType.TURN_STATE
+        )
+        event_ids = [event.id for event in self.events[first_turn_state::5]]
+        snapshots = ScenarioSnapshots(self.events, event_ids)
+        self.assertEqual(set(snapshots), set(event_ids))
+        for event_id in event_ids:
+            self.assertEqual(
+                snapshots[event_id], ReconstructScenarioFromEvent(event_id)
+            )
+
+    def test_instruction_boundaries_match_queries(self):
+        snapshots = InstructionSnapshots(self.events)
+        instructions = [e for e in self.events if e.type == EventType.INSTRUCTION_SENT]
+        self.assertGreater(len(instructions), 0)
+        self.assertEqual(set(snapshots), {e.id for e in instructions})
+        for instruction in instructions:
+            snapshot = snapshots[instruction.id]
+            expected_start = follower_eval_start(instruction)
+            expected_end = final_follower_move(instruction)
+            self.assertEqual(
+                snapshot.start_event.id if snapshot.start_event else None,
+                expected_start.id if expected_start else None,
+            )
+            self.assertEqual(
+                snapshot.end_event.id if snapshot.end_event else None,
+                expected_end.id if expected_end else None,
+            )
+            if snapshot.start_event is not None:
+                self.assertEqual(
+                    snapshot.start, ReconstructScenarioFromEvent(expected_start.id)
+                )
+            if snapshot.end_event is not None:
+                self.assertEqual(
+                    snapshot.end, ReconstructScenarioFromEvent(expected_end.id)
+                )
+
+
+if __name__ == "__main__":
+    unittest.main()
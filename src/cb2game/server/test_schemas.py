@@ -0,0 +1,48 @@
+"""Unit tests for database setup (schemas/base.py)."""
+import pathlib
+import sqlite3
+import tempfile
+import unittest
+
+import peewee
+
+from cb2game.server.config.config import Config
+from cb2game.server.schemas.base import (
+    CloseDatabase,
+    ConnectDatabase,
+    GetDatabase,
+    SetDatabaseReadOnly,
+)
+
+
+class ReadOnlyDatabaseTest(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.config = Config(data_prefix=self.directory.name)
+        path = pathlib.Path(self.config.database_path())
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # A database in the default (rollback) journal mode, like a released dataset.
+        connection = sqlite3.connect(path)
+        connection.execute("CREATE TABLE game (id INTEGER PRIMARY KEY)")
+        connection.execute("INSERT INTO game (id) VALUES (7)")
+        connection.commit()
+        connection.close()
+
+    def tearDown(self):
+        CloseDatabase()
+        self.directory.cleanup()
+
+    def test_reads_non_wal_database(self):
+        SetDatabaseReadOnly(self.config)
+        ConnectDatabase()
+        database = GetDatabase()
+        self.assertEqual(database.execute_sql("SELECT id FROM game").fetchall(), [(7,)])
+        self.assertEqual(
+            database.execute_sql("PRAGMA journal_mode").fetchone()[0], "delete"
+        )
+        with self.assertRaises(peewee.OperationalError):
+            database.execute_sql("INSERT INTO game (id) VALUES (8)")
+
+
+if __name__ == "__main__":
+    unittest.main()
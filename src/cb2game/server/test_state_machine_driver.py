@@ -0,0 +1,87 @@
+"""Unit tests for the event-driven StateMachineDriver."""
+import asyncio
+import unittest
+from datetime import timedelta
+
+from cb2game.server.state_machine_driver import MAX_IDLE_PERIOD_S, StateMachineDriver
+
+
+class FakeStateMachine(object):
+    """Minimal state machine which records how often it was updated."""
+
+    def __init__(self):
+        self.updates = 0
+        self.drained = []
+        self.next_update = None
+        self._done = False
+
+    def start(self):
+        pass
+
+    def update(self):
+        self.updates += 1
+
+    def time_until_next_update(self):
+        return self.next_update
+
+    def drain_messages(self, id, messages):
+        self.drained.extend(messages)
+
+    def fill_messages(self, player_id, out_messages):
+        return False
+
+    def player_ids(self):
+        return []
+
+    def done(self):
+        return self._done
+
+    def end_game(self):
+        self._done = True
+
+    def on_game_over(self):
+        pass
+
+
+class StateMachineDriverTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.state_machine = FakeStateMachine()
+        self.driver = StateMachineDriver(self.state_machine, "test-room")
+        self.task = asyncio.create_task(self.driver.run())
+        # Let the driver run its first step.
+        await asyncio.sleep(0.01)
+
+    async def asyncTearDown(self):
+        self.driver.end_game()
+        await asyncio.wait_for(self.task, 1)
+
+    async def test_idle_room_does_not_spin(self):
+        updates = self.state_machine.updates
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.state_machine.updates, updates)
+
+    async def test_messages_wake_driver(self):
+        updates = self.state_machine.updates
+        self.driver.drain_messages(0, ["message"])
+        await asyncio.sleep(0.01)
+        self.assertEqual(self.state_machine.drained, ["message"])
+        self.assertEqual(self.state_machine.updates, updates + 1)
+
+    async def test_deadline_wakes_driver(self):
+        self.state_machine.next_update = timedelta(seconds=0.05)
+        # Wake the driver so that it picks up the new deadline.
+        self.driver.wake()
+        await asyncio.sleep(0.01)
+        self.state_machine.next_update = None
+        updates = self.state_machine.updates
+        await asyncio.sleep(0.1)
+        self.assertEqual(self.state_machine.updates, updates + 1)
+
+    async def test_end_game_stops_driver(self):
+        self.driver.end_game()
+        await asyncio.wait_for(self.task, MAX_IDLE_PERIOD_S / 2)
+        self.assertTrue(self.task.done())
+
+
+if __name__ == "__main__":
+    unittest.main()
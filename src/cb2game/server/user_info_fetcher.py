@@ -7,22 +7,14 @@ from cb2game.server.leaderboard import (
     LookupUsernameFromMd5sum,
     UsernameFromHashedGoogleUserId,
 )
+from cb2game.server.messages import message_from_server
 from cb2game.server.messages.user_info import UserInfo, UserType
+from cb2game.server.outbox import QueueMessage
 
 logger = logging.getLogger(__name__)
 
 
 class UserInfoFetcher:
-    def __init__(self):
-        self._user_infos = {}  # ws: GoogleAuthConfirmation
-
-    def fill_user_infos(self, ws: web.WebSocketResponse):
-        if ws in self._user_infos:
-            responses = self._user_infos[ws]
-            del self._user_infos[ws]
-            return responses
-        return []
-
     async def handle_userinfo_request(self, ws: web.WebSocketResponse, remote) -> bool:
         """Given a userinfo request, fills in a userinfo response."""
         user_type = remote.user_type
@@ -47,6 +39,4 @@ class UserInfoFetcher:
         self._queue_userinfo(ws, UserInfo(user_name=user_name, user_type=user_type))
 
     def _queue_userinfo(self, ws, userinfo):
-        if ws not in self._user_infos:
-            self._user_infos[ws] = []
-        self._user_infos[ws].append(userinfo)
+        QueueMessage(ws, message_from_server.UserInfoFromServer(userinfo))
@@ -177,6 +177,10 @@ class CountDownTimer(object):
         self._end_time = None
         self._remaining_duration_s = None
 
+    def running(self):
+        """Returns true if the timer has been started and not paused or cleared."""
+        return self._end_time is not None
+
     def time_remaining(self):
         """Returns the remaining time. If the timer is not started, returns 0."""
         if self._end_time is None: